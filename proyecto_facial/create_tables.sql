@@ -36,6 +36,18 @@ CREATE TABLE access_events (
     ProcessedBy     VARCHAR(100)                   -- Servicio que procesó el evento
 );
 
+-- TABLA DE EVENTOS AGREGADOS POR HORA
+-- Mantenida por el EventProcessor en cada lote; el histórico se completa con RollupWorker
+CREATE TABLE access_events_hourly (
+    DeviceIP        VARCHAR(45) NOT NULL,          -- IP del dispositivo
+    AccessResult    VARCHAR(20) NOT NULL,          -- 'SUCCESS', 'FAILED', 'UNKNOWN'...
+    HourStart       DATETIME NOT NULL,             -- Inicio de la hora (EventTime truncado)
+    EventCount      INT NOT NULL DEFAULT 0,        -- Cantidad de eventos en la hora
+    UpdatedAt       DATETIME DEFAULT GETDATE(),    -- Última actualización
+
+    PRIMARY KEY (DeviceIP, AccessResult, HourStart)
+);
+
 -- TABLA DE ESTADO DE DISPOSITIVOS
 CREATE TABLE device_status (
     ID              INT IDENTITY(1,1) PRIMARY KEY,
@@ -53,6 +65,17 @@ CREATE TABLE device_status (
     FOREIGN KEY (DispositivoID) REFERENCES hikvision(DispositivoID)
 );
 
+-- TABLA DE HASH DE ROSTROS POR DISPOSITIVO
+-- Registra el contenido ya subido a cada dispositivo para evitar re-subidas idénticas
+CREATE TABLE device_face_hash (
+    DispositivoID   VARCHAR(50) NOT NULL,          -- Referencia a hikvision.DispositivoID
+    FPID            VARCHAR(50) NOT NULL,          -- ID del rostro en el dispositivo (FacialID)
+    ContentHash     CHAR(40) NOT NULL,             -- SHA-1 de TemplateData + nombre
+    UpdatedAt       DATETIME DEFAULT GETDATE(),    -- Última subida confirmada
+
+    PRIMARY KEY (DispositivoID, FPID)
+);
+
 -- TABLA DE CONFIGURACIÓN DEL SERVICIO
 CREATE TABLE service_config (
     ID              INT IDENTITY(1,1) PRIMARY KEY,
@@ -80,6 +103,9 @@ CREATE INDEX IX_AccessEvents_EventTime ON access_events(EventTime);
 CREATE INDEX IX_AccessEvents_PersonaID ON access_events(PersonaID);
 CREATE INDEX IX_AccessEvents_EmployeeNo ON access_events(EmployeeNo);
 
+-- Índices para access_events_hourly (reportes por rango sin filtrar dispositivo)
+CREATE INDEX IX_AccessEventsHourly_HourStart ON access_events_hourly(HourStart);
+
 -- Índices para device_status
 CREATE INDEX IX_DeviceStatus_DispositivoID ON device_status(DispositivoID);
 CREATE INDEX IX_DeviceStatus_IsOnline ON device_status(IsOnline);
@@ -104,6 +130,7 @@ INSERT INTO service_config (ConfigKey, ConfigValue, Category, Description) VALUE
 ('ENABLE_WEBSOCKET_EVENTS', 'true', 'EVENTS', 'Habilitar eventos por WebSocket'),
 ('EVENT_BUFFER_SIZE', '1000', 'EVENTS', 'Tamaño del buffer de eventos'),
 ('FACE_SYNC_ENABLED', 'true', 'FACIAL', 'Habilitar sincronización facial'),
+('FACE_HASH_SKIP_ENABLED', 'true', 'FACIAL', 'Omitir subida de rostros idénticos ya presentes en el dispositivo'),
 ('AUTO_RETRY_FAILED_TASKS', 'true', 'SYNC', 'Reintentar tareas fallidas automáticamente');
 
 -- ============================================
@@ -167,11 +194,21 @@ AS
 BEGIN
     SET NOCOUNT ON;
     
-    DELETE FROM sync_queue 
-    WHERE Status IN ('COMPLETED', 'FAILED') 
-        AND CompletedAt < DATEADD(DAY, -@DaysOld, GETDATE());
+    DECLARE @Cutoff DATETIME = DATEADD(DAY, -@DaysOld, GETDATE());
+    DECLARE @Deleted INT = 0, @Chunk INT = 1;
+    
+    -- En bloques para no escalar a lock de tabla
+    WHILE @Chunk > 0
+    BEGIN
+        DELETE TOP (1000) FROM sync_queue 
+        WHERE Status IN ('COMPLETED', 'FAILED') 
+            AND CompletedAt < @Cutoff;
+        
+        SET @Chunk = @@ROWCOUNT;
+        SET @Deleted = @Deleted + @Chunk;
+    END;
     
-    SELECT @@ROWCOUNT AS DeletedTasks;
+    SELECT @Deleted AS DeletedTasks;
 END;
 
 -- Procedimiento para registrar evento de acceso
@@ -5,14 +5,19 @@ API Server REST para Facial Sync Service
 Maneja endpoints para sincronización facial con dispositivos Hikvision
 """
 
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS
 import logging
 import threading
 import time
 import json
 from datetime import datetime
-from typing import Dict, Any, Optional
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+from metrics import registry
+from log_reader import read_log
+from stall_watchdog import get_watchdog
 
 class APIServer:
     """Servidor API REST usando Flask"""
@@ -23,6 +28,15 @@ class APIServer:
         self.task_queue = task_queue
         self.config = config
         
+        # Componentes opcionales (ver set_sync_worker / set_provision_worker / set_profiler / set_event_processor / set_rollup_worker / set_retention_worker / set_event_archive)
+        self.sync_worker = None
+        self.provision_worker = None
+        self.profiler = None
+        self.event_processor = None
+        self.rollup_worker = None
+        self.retention_worker = None
+        self.event_archive = None
+        
         # Configuración Flask
         self.app = Flask(__name__)
         CORS(self.app)  # Permitir CORS para requests desde VB6/otros clientes
@@ -41,6 +55,17 @@ class APIServer:
     def setup_routes(self):
         """Configura todas las rutas de la API"""
         
+        # Requests en curso vigilados por el watchdog (HealthWorker)
+        @self.app.before_request
+        def track_request():
+            g.watchdog_key = get_watchdog().track(f"{request.method} {request.path}")
+        
+        @self.app.teardown_request
+        def untrack_request(exc):
+            key = g.pop('watchdog_key', None)
+            if key is not None:
+                get_watchdog().untrack(key)
+        
         # ====================================
         # ENDPOINTS DE SALUD Y ESTADO
         # ====================================
@@ -80,6 +105,24 @@ class APIServer:
                 logging.error(f"Error obteniendo estado: {e}")
                 return jsonify({'error': str(e)}), 500
         
+        @self.app.route('/api/watchdog', methods=['GET'])
+        def get_watchdog_status():
+            """Heartbeats de workers, lag de loops y bloqueos recientes con stack"""
+            try:
+                return jsonify(get_watchdog().get_status())
+            except Exception as e:
+                logging.error(f"Error obteniendo estado del watchdog: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/metrics', methods=['GET'])
+        def get_metrics():
+            """Métricas en formato de exposición de texto de Prometheus"""
+            try:
+                return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+            except Exception as e:
+                logging.error(f"Error generando métricas: {e}")
+                return jsonify({'error': str(e)}), 500
+        
         # ====================================
         # ENDPOINTS DE SINCRONIZACIÓN FACIAL
         # ====================================
@@ -102,9 +145,9 @@ class APIServer:
                 
                 logging.info(f"📸 API: Crear rostro - FacialID: {facial_id}, PersonaID: {persona_id}")
                 
-                # Verificar que el rostro existe en BD
-                facial_data = self.db_manager.get_facial_data(facial_id)
-                if not facial_data:
+                # Verificar que el rostro existe en BD (sin conexión se encola igual y lo valida el worker)
+                facial_data, offline = self._read_facial_data(facial_id)
+                if not facial_data and not offline:
                     return jsonify({'error': f'Rostro facial {facial_id} no encontrado'}), 404
                 
                 # Encolar tarea de sincronización
@@ -116,7 +159,7 @@ class APIServer:
                     'source': 'api'
                 }
                 
-                task_id = self.db_manager.enqueue_sync_task(
+                task_id = self._enqueue_task(
                     task_type='CREATE',
                     facial_id=facial_id,
                     persona_id=persona_id,
@@ -124,17 +167,14 @@ class APIServer:
                     priority=priority
                 )
                 
-                return jsonify({
-                    'success': True,
-                    'message': 'Rostro encolado para sincronización',
-                    'task_id': task_id,
-                    'facial_id': facial_id,
-                    'estimated_devices': len(self.db_manager.get_active_devices())
-                })
+                return self._task_response(
+                    task_id, 'Rostro encolado para sincronización', facial_id=facial_id,
+                    estimated_devices=len(self.db_manager.get_active_devices()) if task_id else None
+                )
                 
             except Exception as e:
                 logging.error(f"Error creando rostro via API: {e}")
-                return jsonify({'error': str(e)}), 500
+                return self._error_response(e)
         
         @self.app.route('/api/face/update', methods=['PUT'])
         def update_face():
@@ -149,38 +189,34 @@ class APIServer:
                 
                 logging.info(f"✏️ API: Actualizar rostro - FacialID: {facial_id}")
                 
-                # Verificar que el rostro existe
-                facial_data = self.db_manager.get_facial_data(facial_id)
-                if not facial_data:
+                # Verificar que el rostro existe (sin conexión se encola igual y lo valida el worker)
+                facial_data, offline = self._read_facial_data(facial_id)
+                if not facial_data and not offline:
                     return jsonify({'error': f'Rostro facial {facial_id} no encontrado'}), 404
+                persona_id = facial_data.get('persona_id') if facial_data else data.get('persona_id')
                 
                 # Encolar tarea de actualización
                 task_data = {
                     'facial_id': facial_id,
-                    'persona_id': facial_data.get('persona_id'),
+                    'persona_id': persona_id,
                     'action': 'update',
                     'timestamp': datetime.now().isoformat(),
                     'source': 'api'
                 }
                 
-                task_id = self.db_manager.enqueue_sync_task(
+                task_id = self._enqueue_task(
                     task_type='UPDATE',
                     facial_id=facial_id,
-                    persona_id=facial_data.get('persona_id'),
+                    persona_id=persona_id,
                     task_data=task_data,
                     priority=data.get('priority', 1)
                 )
                 
-                return jsonify({
-                    'success': True,
-                    'message': 'Rostro encolado para actualización',
-                    'task_id': task_id,
-                    'facial_id': facial_id
-                })
+                return self._task_response(task_id, 'Rostro encolado para actualización', facial_id=facial_id)
                 
             except Exception as e:
                 logging.error(f"Error actualizando rostro via API: {e}")
-                return jsonify({'error': str(e)}), 500
+                return self._error_response(e)
         
         @self.app.route('/api/face/delete', methods=['DELETE'])
         def delete_face():
@@ -196,35 +232,31 @@ class APIServer:
                 logging.info(f"🗑️ API: Eliminar rostro - FacialID: {facial_id}")
                 
                 # Obtener datos del rostro antes de eliminar
-                facial_data = self.db_manager.get_facial_data(facial_id)
+                facial_data, _ = self._read_facial_data(facial_id)
+                persona_id = facial_data.get('persona_id') if facial_data else data.get('persona_id')
                 
                 # Encolar tarea de eliminación (incluso si no existe en BD)
                 task_data = {
                     'facial_id': facial_id,
-                    'persona_id': facial_data.get('persona_id') if facial_data else None,
+                    'persona_id': persona_id,
                     'action': 'delete',
                     'timestamp': datetime.now().isoformat(),
                     'source': 'api'
                 }
                 
-                task_id = self.db_manager.enqueue_sync_task(
+                task_id = self._enqueue_task(
                     task_type='DELETE',
                     facial_id=facial_id,
-                    persona_id=facial_data.get('persona_id') if facial_data else None,
+                    persona_id=persona_id,
                     task_data=task_data,
                     priority=data.get('priority', 1)
                 )
                 
-                return jsonify({
-                    'success': True,
-                    'message': 'Rostro encolado para eliminación',
-                    'task_id': task_id,
-                    'facial_id': facial_id
-                })
+                return self._task_response(task_id, 'Rostro encolado para eliminación', facial_id=facial_id)
                 
             except Exception as e:
                 logging.error(f"Error eliminando rostro via API: {e}")
-                return jsonify({'error': str(e)}), 500
+                return self._error_response(e)
         
         # ====================================
         # ENDPOINTS DE DISPOSITIVOS
@@ -266,6 +298,27 @@ class APIServer:
                 logging.error(f"Error obteniendo estado de dispositivo {device_id}: {e}")
                 return jsonify({'error': str(e)}), 500
         
+        @self.app.route('/api/devices/<device_id>/info', methods=['GET'])
+        def get_device_info(device_id):
+            """Información y capacidades de un dispositivo (snapshot en memoria)"""
+            try:
+                if not self.device_manager:
+                    return jsonify({'error': 'Device manager no disponible'}), 503
+                
+                devices = self.db_manager.get_active_devices()
+                device = next((d for d in devices if d['dispositivo_id'] == device_id), None)
+                
+                if not device:
+                    return jsonify({'error': 'Dispositivo no encontrado'}), 404
+                
+                refresh = request.args.get('refresh', 'false').lower() == 'true'
+                
+                return jsonify(self.device_manager.get_device_info(device, refresh=refresh))
+                
+            except Exception as e:
+                logging.error(f"Error obteniendo info de dispositivo {device_id}: {e}")
+                return jsonify({'error': str(e)}), 500
+        
         @self.app.route('/api/devices/<device_id>/test', methods=['POST'])
         def test_device_connection(device_id):
             """Prueba la conexión a un dispositivo específico"""
@@ -294,6 +347,132 @@ class APIServer:
                 logging.error(f"Error probando dispositivo {device_id}: {e}")
                 return jsonify({'error': str(e)}), 500
         
+        @self.app.route('/api/provision', methods=['GET'])
+        def get_provision_jobs():
+            """Lista los trabajos de aprovisionamiento de esta ejecución"""
+            try:
+                if not self.provision_worker:
+                    return jsonify({'error': 'Provision worker no disponible'}), 503
+                
+                return jsonify({'jobs': self.provision_worker.get_all_jobs()})
+                
+            except Exception as e:
+                logging.error(f"Error listando aprovisionamientos: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/devices/<device_id>/provision', methods=['POST'])
+        def start_device_provision(device_id):
+            """Inicia o reanuda la carga masiva de rostros en un dispositivo"""
+            try:
+                if not self.provision_worker:
+                    return jsonify({'error': 'Provision worker no disponible'}), 503
+                
+                data = request.get_json(silent=True) or {}
+                
+                concurrency = data.get('concurrency')
+                if concurrency is not None and (isinstance(concurrency, bool) or
+                                                not isinstance(concurrency, int) or concurrency < 1):
+                    return jsonify({'error': 'concurrency debe ser un entero positivo'}), 400
+                
+                logging.info(f"📦 API: Aprovisionar dispositivo {device_id}")
+                
+                progress = self.provision_worker.start_job(
+                    device_id,
+                    restart=bool(data.get('restart', False)),
+                    concurrency=concurrency
+                )
+                
+                if progress is None:
+                    return jsonify({'error': 'Dispositivo no encontrado'}), 404
+                
+                return jsonify(progress), 202
+                
+            except Exception as e:
+                logging.error(f"Error aprovisionando dispositivo {device_id}: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/devices/<device_id>/provision', methods=['GET'])
+        def get_device_provision(device_id):
+            """Progreso, rostros/s y ETA del aprovisionamiento de un dispositivo"""
+            try:
+                if not self.provision_worker:
+                    return jsonify({'error': 'Provision worker no disponible'}), 503
+                
+                progress = self.provision_worker.get_job_status(device_id)
+                if progress is None:
+                    return jsonify({'error': 'Sin aprovisionamiento para el dispositivo'}), 404
+                
+                return jsonify(progress)
+                
+            except Exception as e:
+                logging.error(f"Error obteniendo aprovisionamiento de {device_id}: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/devices/<device_id>/provision', methods=['DELETE'])
+        def stop_device_provision(device_id):
+            """Pausa el aprovisionamiento (se reanuda desde el checkpoint)"""
+            try:
+                if not self.provision_worker:
+                    return jsonify({'error': 'Provision worker no disponible'}), 503
+                
+                stopped = self.provision_worker.stop_job(device_id)
+                
+                return jsonify({
+                    'success': stopped,
+                    'device_id': device_id,
+                    'progress': self.provision_worker.get_job_status(device_id)
+                })
+                
+            except Exception as e:
+                logging.error(f"Error deteniendo aprovisionamiento de {device_id}: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        # ====================================
+        # ENDPOINTS DE RECONCILIACIÓN
+        # ====================================
+        
+        @self.app.route('/api/sync/reconcile', methods=['GET'])
+        def get_reconcile_status():
+            """Estado y resultados de la última reconciliación BD <-> dispositivos"""
+            try:
+                if not self.sync_worker:
+                    return jsonify({'error': 'Sync worker no disponible'}), 503
+                
+                return jsonify(self.sync_worker.get_status())
+            
+            except Exception as e:
+                logging.error(f"Error obteniendo estado de reconciliación: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/sync/reconcile', methods=['POST'])
+        def start_reconcile():
+            """Lanza una reconciliación (todos los dispositivos o uno solo)"""
+            try:
+                if not self.sync_worker:
+                    return jsonify({'error': 'Sync worker no disponible'}), 503
+                
+                data = request.get_json(silent=True) or {}
+                device_id = data.get('device_id')
+                
+                logging.info(f"🔍 API: Reconciliación solicitada - Dispositivo: {device_id or 'todos'}")
+                
+                # Ejecutar en segundo plano: puede tardar varios minutos
+                threading.Thread(
+                    target=self.sync_worker.reconcile_all_devices,
+                    args=(device_id,),
+                    daemon=True
+                ).start()
+                
+                return jsonify({
+                    'success': True,
+                    'message': 'Reconciliación iniciada',
+                    'device_id': device_id
+                }), 202
+            
+            except Exception as e:
+                logging.error(f"Error iniciando reconciliación: {e}")
+                return jsonify({'error': str(e)}), 500
+        
         # ====================================
         # ENDPOINTS DE TAREAS
         # ====================================
@@ -362,6 +541,21 @@ class APIServer:
                 limit = int(request.args.get('limit', 100))
                 device_ip = request.args.get('device_ip', None)
                 
+                # Buffer del EventProcessor (cae a la BD si no alcanza)
+                if self.event_processor:
+                    events = [{
+                        'device_ip': event['device_ip'],
+                        'event_type': event['event_type'],
+                        'person_name': event['person_name'],
+                        'access_result': event['access_result'],
+                        'event_time': event['event_time']
+                    } for event in self.event_processor.get_recent_events(limit, device_ip)]
+                    
+                    return jsonify({
+                        'events': events,
+                        'total': len(events)
+                    })
+                
                 query = f"SELECT TOP {limit} DeviceIP, EventType, PersonName, AccessResult, EventTime FROM access_events"
                 params = []
                 
@@ -393,6 +587,104 @@ class APIServer:
                 logging.error(f"Error obteniendo eventos: {e}")
                 return jsonify({'error': str(e)}), 500
         
+        @self.app.route('/api/events/summary', methods=['GET'])
+        def get_event_summary():
+            """Conteos por dispositivo y resultado de las últimas horas (?hours=24)"""
+            try:
+                if not self.event_processor:
+                    return jsonify({'error': 'Event processor no disponible'}), 503
+                
+                hours = request.args.get('hours', 24, type=int)
+                return jsonify(self.event_processor.get_event_summary(hours))
+                
+            except Exception as e:
+                logging.error(f"Error obteniendo resumen de eventos: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/events/report', methods=['GET'])
+        def get_event_report():
+            """Conteos por período en un rango (?start=&end=&device_ip=&group=day|hour|total)"""
+            try:
+                if not self.event_processor:
+                    return jsonify({'error': 'Event processor no disponible'}), 503
+                
+                start = request.args.get('start')
+                if not start:
+                    return jsonify({'error': 'start es requerido (ISO 8601)'}), 400
+                end = request.args.get('end')
+                group_by = request.args.get('group', 'day')
+                
+                report = self.event_processor.get_event_report(
+                    datetime.fromisoformat(start),
+                    datetime.fromisoformat(end) if end else None,
+                    request.args.get('device_ip'),
+                    None if group_by == 'total' else group_by
+                )
+                return jsonify(report)
+                
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            except Exception as e:
+                logging.error(f"Error obteniendo reporte de eventos: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/events/archive', methods=['GET'])
+        def get_archived_events():
+            """Eventos archivados en disco (?start=&end=&employee_no=&device_ip=&limit=)"""
+            try:
+                if not self.event_archive:
+                    return jsonify({'error': 'Archivo de eventos no disponible'}), 503
+                
+                start = request.args.get('start')
+                if not start:
+                    return jsonify({'error': 'start es requerido (ISO 8601)'}), 400
+                end = request.args.get('end')
+                
+                result = self.event_archive.query(
+                    datetime.fromisoformat(start),
+                    datetime.fromisoformat(end) if end else None,
+                    request.args.get('employee_no'),
+                    request.args.get('device_ip'),
+                    min(request.args.get('limit', 1000, type=int), 10000)
+                )
+                return jsonify(result)
+                
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            except Exception as e:
+                logging.error(f"Error consultando archivo de eventos: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/events/archive/status', methods=['GET'])
+        def get_archive_status():
+            """Días archivados, filas y tamaño en disco"""
+            if not self.event_archive:
+                return jsonify({'error': 'Archivo de eventos no disponible'}), 503
+            return jsonify(self.event_archive.get_status())
+        
+        @self.app.route('/api/events/rollup', methods=['GET'])
+        def get_rollup_status():
+            """Estado del backfill de access_events_hourly"""
+            if not self.rollup_worker:
+                return jsonify({'error': 'Rollup worker no disponible'}), 503
+            return jsonify(self.rollup_worker.get_status())
+        
+        @self.app.route('/api/events/rollup/backfill', methods=['POST'])
+        def start_rollup_backfill():
+            """Rehace access_events_hourly desde access_events"""
+            try:
+                if not self.rollup_worker:
+                    return jsonify({'error': 'Rollup worker no disponible'}), 503
+                
+                if not self.rollup_worker.start(force=True):
+                    return jsonify({'error': 'El backfill ya está en curso o está deshabilitado'}), 409
+                
+                return jsonify({'success': True, 'status': self.rollup_worker.get_status()})
+                
+            except Exception as e:
+                logging.error(f"Error iniciando backfill de eventos: {e}")
+                return jsonify({'error': str(e)}), 500
+        
         # ====================================
         # ENDPOINT PARA VB6
         # ====================================
@@ -423,7 +715,7 @@ class APIServer:
                         'source': 'vb6'
                     }
                     
-                    task_id = self.db_manager.enqueue_sync_task(
+                    task_id = self._enqueue_task(
                         task_type=action,
                         facial_id=facial_id,
                         persona_id=persona_id,
@@ -431,16 +723,178 @@ class APIServer:
                         priority=1  # Alta prioridad para VB6
                     )
                     
-                    return jsonify({
-                        'success': True,
-                        'task_id': task_id,
-                        'message': f'Tarea {action} encolada correctamente'
-                    })
+                    return self._task_response(task_id, f'Tarea {action} encolada correctamente')
                 else:
                     return jsonify({'error': f'Acción inválida: {action}'}), 400
                 
             except Exception as e:
                 logging.error(f"Error en VB6 sync: {e}")
+                return self._error_response(e)
+        
+        # ====================================
+        # ENDPOINTS DE BASE DE DATOS
+        # ====================================
+        
+        @self.app.route('/api/db/queries', methods=['GET'])
+        def get_query_statistics():
+            """Tiempos por sentencia normalizada (?sort=total_ms|mean_ms|max_ms|p95_ms|count|errors&limit=)"""
+            try:
+                sort_by = request.args.get('sort', 'total_ms')
+                limit = request.args.get('limit', 50, type=int)
+                return jsonify(self.db_manager.get_query_statistics(sort_by, limit))
+                
+            except Exception as e:
+                logging.error(f"Error obteniendo estadísticas de consultas: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/db/queries', methods=['DELETE'])
+        def reset_query_statistics():
+            """Reinicia los tiempos acumulados por sentencia"""
+            try:
+                self.db_manager.reset_query_statistics()
+                return jsonify({'success': True})
+                
+            except Exception as e:
+                logging.error(f"Error reiniciando estadísticas de consultas: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/db/outbox', methods=['GET'])
+        def get_outbox_status():
+            """Escrituras guardadas localmente mientras SQL Server no responde"""
+            try:
+                return jsonify(self.db_manager.get_outbox_status())
+                
+            except Exception as e:
+                logging.error(f"Error obteniendo estado del outbox: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/retention', methods=['GET'])
+        def get_retention_status():
+            """Ventana de limpieza y progreso por tabla de la última ejecución"""
+            if not self.retention_worker:
+                return jsonify({'error': 'Retention worker no disponible'}), 503
+            return jsonify(self.retention_worker.get_status())
+        
+        @self.app.route('/api/retention/run', methods=['POST'])
+        def run_retention():
+            """Ejecuta la limpieza por retención ahora, fuera de la ventana"""
+            try:
+                if not self.retention_worker:
+                    return jsonify({'error': 'Retention worker no disponible'}), 503
+                
+                if not self.retention_worker.run_now():
+                    return jsonify({'error': 'Ya hay una limpieza en curso'}), 409
+                
+                return jsonify({'success': True, 'status': self.retention_worker.get_status()})
+                
+            except Exception as e:
+                logging.error(f"Error iniciando limpieza por retención: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        # ====================================
+        # ENDPOINTS DE PROFILING
+        # ====================================
+        
+        @self.app.route('/api/profiler', methods=['GET'])
+        def get_profiler_status():
+            """Estado del profiler y funciones con más muestras"""
+            try:
+                if not self.profiler:
+                    return jsonify({'error': 'Profiler no disponible (ENABLE_PROFILING)'}), 503
+                
+                limit = request.args.get('limit', 20, type=int)
+                status = self.profiler.get_status()
+                status['top_functions'] = self.profiler.get_top_functions(limit)
+                return jsonify(status)
+                
+            except Exception as e:
+                logging.error(f"Error obteniendo estado del profiler: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/profiler/start', methods=['POST'])
+        def start_profiler():
+            """Inicia el muestreo (opcional: sample_rate, duration, reset, idle)"""
+            try:
+                if not self.profiler:
+                    return jsonify({'error': 'Profiler no disponible (ENABLE_PROFILING)'}), 503
+                
+                data = request.get_json(silent=True) or {}
+                started = self.profiler.start(
+                    sample_rate=data.get('sample_rate'),
+                    duration=data.get('duration'),
+                    reset=data.get('reset', False),
+                    idle=data.get('idle')
+                )
+                if not started:
+                    return jsonify({'error': 'El profiler ya está ejecutándose'}), 409
+                
+                return jsonify({'success': True, 'status': self.profiler.get_status()})
+                
+            except Exception as e:
+                logging.error(f"Error iniciando profiler: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/profiler/stop', methods=['POST'])
+        def stop_profiler():
+            """Detiene el muestreo conservando los stacks"""
+            try:
+                if not self.profiler:
+                    return jsonify({'error': 'Profiler no disponible (ENABLE_PROFILING)'}), 503
+                
+                self.profiler.stop()
+                return jsonify({'success': True, 'status': self.profiler.get_status()})
+                
+            except Exception as e:
+                logging.error(f"Error deteniendo profiler: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/profiler/collapsed', methods=['GET'])
+        def get_profiler_collapsed():
+            """Stacks colapsados para flamegraph.pl / speedscope (?thread=, ?reset=true)"""
+            try:
+                if not self.profiler:
+                    return jsonify({'error': 'Profiler no disponible (ENABLE_PROFILING)'}), 503
+                
+                collapsed = self.profiler.get_collapsed(request.args.get('thread'))
+                if request.args.get('reset', 'false').lower() == 'true':
+                    self.profiler.reset()
+                
+                return Response(collapsed, content_type='text/plain; charset=utf-8')
+                
+            except Exception as e:
+                logging.error(f"Error obteniendo stacks del profiler: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        # ====================================
+        # ENDPOINT DE LOGS
+        # ====================================
+        
+        @self.app.route('/api/logs', methods=['GET'])
+        def get_logs():
+            """Registros de log paginados desde el final (?file=&level=&since=&until=&before=&limit=)"""
+            try:
+                log_dir = Path(self.config.get('LOG_DIR', 'logs')).resolve()
+                log_file = (log_dir / request.args.get('file', self.config.get('LOG_FILE', 'service.log'))).resolve()
+                
+                # Solo archivos dentro de LOG_DIR
+                if log_file.parent != log_dir or not log_file.is_file():
+                    return jsonify({'error': 'Archivo de log no encontrado'}), 404
+                
+                page = read_log(
+                    str(log_file),
+                    level=request.args.get('level'),
+                    since=request.args.get('since'),
+                    until=request.args.get('until'),
+                    before=request.args.get('before', type=int),
+                    limit=min(request.args.get('limit', 200, type=int), 5000)
+                )
+                page['file'] = log_file.name
+                return jsonify(page)
+                
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            except Exception as e:
+                logging.error(f"Error leyendo logs: {e}")
                 return jsonify({'error': str(e)}), 500
         
         # ====================================
@@ -457,14 +911,96 @@ class APIServer:
                 'endpoints': {
                     'health': '/api/health',
                     'status': '/api/status',
+                    'metrics': '/api/metrics',
+                    'watchdog': '/api/watchdog',
                     'devices': '/api/devices',
                     'tasks': '/api/tasks',
                     'events': '/api/events',
+                    'event_summary': '/api/events/summary',
+                    'event_report': '/api/events/report',
+                    'event_rollup': '/api/events/rollup',
+                    'event_archive': '/api/events/archive',
+                    'db_queries': '/api/db/queries',
+                    'db_outbox': '/api/db/outbox',
+                    'retention': '/api/retention',
+                    'logs': '/api/logs',
+                    'reconcile': '/api/sync/reconcile',
+                    'provision': '/api/provision',
+                    'profiler': '/api/profiler',
                     'vb6_sync': '/api/vb6/sync'
                 },
                 'timestamp': datetime.now().isoformat()
             })
     
+    def _enqueue_task(self, **task) -> Optional[int]:
+        """Encola en el TaskQueue (BD + cola en memoria) o solo en BD si no está disponible"""
+        if self.task_queue:
+            return self.task_queue.enqueue_task(**task)
+        return self.db_manager.enqueue_sync_task(**task)
+    
+    def _outbox_pending(self) -> bool:
+        outbox = getattr(self.db_manager, 'outbox', None)
+        return bool(outbox and outbox.pending)
+    
+    def _read_facial_data(self, facial_id: int) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Lee el rostro de la BD; (None, True) si SQL Server no responde y la tarea puede ir al outbox"""
+        try:
+            return self.db_manager.get_facial_data(facial_id), False
+        except Exception as e:
+            if getattr(self.db_manager, 'outbox', None) and self.db_manager.is_connection_error(e):
+                logging.warning(f"📮 SQL Server no disponible, rostro {facial_id} sin verificar: {e}")
+                return None, True
+            raise
+    
+    def _task_response(self, task_id: Optional[int], message: str, **extra):
+        """Respuesta de una tarea encolada: 202 con queued_offline si quedó en el outbox local"""
+        if task_id:
+            return jsonify({'success': True, 'message': message, 'task_id': task_id, **extra})
+        
+        if self._outbox_pending():
+            return jsonify({
+                'success': True,
+                'queued_offline': True,
+                'message': f'{message} (BD sin conexión: guardada en el outbox local)',
+                **extra
+            }), 202
+        
+        return jsonify({'error': 'No se pudo encolar la tarea'}), 500
+    
+    def _error_response(self, error: Exception):
+        """500, o 503 si SQL Server no responde (p.ej. con el outbox deshabilitado)"""
+        if self.db_manager.is_connection_error(error):
+            return jsonify({'error': 'Base de datos no disponible', 'detail': str(error)}), 503
+        return jsonify({'error': str(error)}), 500
+    
+    def set_sync_worker(self, sync_worker):
+        """Establece referencia al sync worker para los endpoints de reconciliación"""
+        self.sync_worker = sync_worker
+    
+    def set_provision_worker(self, provision_worker):
+        """Establece referencia al provision worker para la carga masiva por dispositivo"""
+        self.provision_worker = provision_worker
+    
+    def set_profiler(self, profiler):
+        """Establece referencia al profiler de muestreo (ENABLE_PROFILING)"""
+        self.profiler = profiler
+    
+    def set_rollup_worker(self, rollup_worker):
+        """Establece referencia al rollup worker (backfill de access_events_hourly)"""
+        self.rollup_worker = rollup_worker
+    
+    def set_retention_worker(self, retention_worker):
+        """Establece referencia al retention worker (limpieza por bloques)"""
+        self.retention_worker = retention_worker
+    
+    def set_event_archive(self, event_archive):
+        """Establece referencia al archivo de eventos en disco (consultas históricas)"""
+        self.event_archive = event_archive
+    
+    def set_event_processor(self, event_processor):
+        """Establece referencia al event processor para servir eventos recientes desde memoria"""
+        self.event_processor = event_processor
+    
     def start(self):
         """Inicia el servidor API"""
         if self.is_running:
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Utilidades comunes de benchmarks para Facial Sync Service
+Percentiles, metadatos del entorno y resultados en JSON comparables entre versiones
+"""
+
+import os
+import sys
+import json
+import platform
+import subprocess
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+def percentiles(samples: List[float], scale: float = 1000.0) -> Dict[str, Optional[float]]:
+    """p50/p95/p99/max de una lista de duraciones en segundos (por defecto en ms)"""
+    if not samples:
+        return {'count': 0, 'p50': None, 'p95': None, 'p99': None, 'max': None, 'mean': None}
+    
+    ordered = sorted(samples)
+    
+    def pick(pct):
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return round(ordered[index] * scale, 3)
+    
+    return {
+        'count': len(ordered),
+        'p50': pick(50),
+        'p95': pick(95),
+        'p99': pick(99),
+        'max': round(ordered[-1] * scale, 3),
+        'mean': round(sum(ordered) / len(ordered) * scale, 3)
+    }
+
+def environment_info() -> Dict[str, Any]:
+    """Datos del entorno para poder comparar resultados entre máquinas y versiones"""
+    commit = None
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=Path(__file__).parent, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        pass
+    
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'git_commit': commit,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+def write_results(name: str, results: Dict[str, Any], output: str = None) -> Path:
+    """Guarda resultados en JSON (por defecto benchmarks/results/<name>_<fecha>.json)"""
+    if output:
+        path = Path(output)
+    else:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        path = RESULTS_DIR / f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    
+    return path
+
+def _flatten(data: Dict[str, Any], prefix: str = '') -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def compare_results(baseline_file: str, results: Dict[str, Any],
+                    threshold_percent: float = 10.0) -> List[str]:
+    """Compara métricas numéricas contra un resultado anterior y lista las variaciones"""
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    
+    old = _flatten({k: v for k, v in baseline.items() if k not in ('environment', 'parameters')})
+    new = _flatten({k: v for k, v in results.items() if k not in ('environment', 'parameters')})
+    
+    lines = []
+    for key in sorted(set(old) & set(new)):
+        if not old[key]:
+            continue
+        change = (new[key] - old[key]) / abs(old[key]) * 100
+        if abs(change) >= threshold_percent:
+            # Throughput sube = mejor; latencias/duraciones suben = peor
+            higher_is_better = key.endswith('per_second')
+            worse = change < 0 if higher_is_better else change > 0
+            marker = '🔴' if worse else '🟢'
+            lines.append(f"{marker} {key}: {old[key]} -> {new[key]} ({change:+.1f}%)")
+    
+    return lines
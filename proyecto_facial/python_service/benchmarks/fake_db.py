@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Base de datos de benchmark para Facial Sync Service
+Reemplazo local (SQLite en memoria) de DatabaseManager con los métodos usados por los pipelines
+"""
+
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Tuple, Any, Optional
+
+SCHEMA = """
+CREATE TABLE face (
+    FacialID INTEGER PRIMARY KEY,
+    TemplateData BLOB,
+    Activo INTEGER DEFAULT 1,
+    PersonaID INTEGER,
+    Nombre TEXT,
+    Apellido TEXT
+);
+CREATE TABLE sync_queue (
+    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    TaskType TEXT NOT NULL,
+    Status TEXT DEFAULT 'PENDING',
+    FacialID INTEGER,
+    PersonaID INTEGER,
+    TaskData TEXT,
+    Priority INTEGER DEFAULT 1,
+    Attempts INTEGER DEFAULT 0,
+    CreatedAt TEXT,
+    ProcessedAt TEXT,
+    CompletedAt TEXT,
+    LastError TEXT
+);
+CREATE TABLE access_events (
+    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    DeviceIP TEXT,
+    EventType TEXT,
+    EventCode TEXT,
+    PersonaID INTEGER,
+    EmployeeNo TEXT,
+    PersonName TEXT,
+    VerifyMode TEXT,
+    AccessResult TEXT,
+    EventTime TEXT,
+    RawData TEXT,
+    ReceivedAt TEXT
+);
+CREATE TABLE access_events_hourly (
+    DeviceIP TEXT,
+    AccessResult TEXT,
+    HourStart TEXT,
+    EventCount INTEGER,
+    PRIMARY KEY (DeviceIP, AccessResult, HourStart)
+);
+CREATE TABLE device_status (
+    DispositivoID TEXT PRIMARY KEY,
+    LastPing TEXT,
+    IsOnline INTEGER,
+    LastError TEXT,
+    ErrorCount INTEGER DEFAULT 0,
+    FaceCount INTEGER DEFAULT 0,
+    Version TEXT,
+    Capabilities TEXT
+);
+CREATE TABLE device_face_hash (
+    DispositivoID TEXT,
+    FPID TEXT,
+    ContentHash TEXT,
+    PRIMARY KEY (DispositivoID, FPID)
+);
+"""
+
+class BenchmarkDatabase:
+    """Sustituto de DatabaseManager sobre SQLite en memoria"""
+    
+    def __init__(self, devices: List[Dict[str, Any]] = None):
+        self.devices = devices or []
+        self.connection = sqlite3.connect(':memory:', check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        
+        # Marcas de tiempo (perf_counter) para medir latencias de punta a punta
+        self.task_enqueued_at: Dict[int, float] = {}
+        self.task_finished_at: Dict[int, float] = {}
+        self.task_final_status: Dict[int, str] = {}
+        self.event_written_at: Dict[str, float] = {}
+    
+    # ====================================
+    # ACCESO GENÉRICO
+    # ====================================
+    
+    def execute_query(self, query: str, params: List = None) -> List[Tuple]:
+        with self.lock:
+            return self.connection.execute(query, params or []).fetchall()
+    
+    def execute_non_query(self, query: str, params: List = None) -> int:
+        with self.lock:
+            cursor = self.connection.execute(query, params or [])
+            self.connection.commit()
+            return cursor.rowcount
+    
+    def execute_scalar(self, query: str, params: List = None) -> Any:
+        rows = self.execute_query(query, params)
+        return rows[0][0] if rows else None
+    
+    def test_connection(self) -> bool:
+        return True
+    
+    # ====================================
+    # ROSTROS Y TAREAS
+    # ====================================
+    
+    def seed_faces(self, count: int, template_size: int = 20000):
+        """Carga rostros activos con plantillas de tamaño realista"""
+        rows = []
+        for facial_id in range(1, count + 1):
+            template = (facial_id.to_bytes(4, 'big') * (template_size // 4 + 1))[:template_size]
+            rows.append((facial_id, b'\xff\xd8' + template, 1, facial_id, f"Nombre{facial_id}", "Bench"))
+        
+        with self.lock:
+            self.connection.executemany(
+                "INSERT INTO face (FacialID, TemplateData, Activo, PersonaID, Nombre, Apellido) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self.connection.commit()
+    
+    def get_facial_data(self, facial_id: int) -> Optional[Dict[str, Any]]:
+        rows = self.execute_query(
+            "SELECT FacialID, TemplateData, Activo, PersonaID, Nombre, Apellido FROM face WHERE FacialID = ?",
+            [facial_id]
+        )
+        if not rows:
+            return None
+        
+        row = rows[0]
+        return {
+            'facial_id': row[0],
+            'template_data': row[1],
+            'activo': row[2],
+            'persona_id': row[3],
+            'nombre': row[4],
+            'apellido': row[5],
+            'linked_persona_id': row[3]
+        }
+    
+    def enqueue_sync_task(self, task_type: str, facial_id: int = None,
+                          persona_id: int = None, task_data: Dict = None,
+                          priority: int = 1) -> int:
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT INTO sync_queue (TaskType, FacialID, PersonaID, TaskData, Priority, CreatedAt) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [task_type, facial_id, persona_id, json.dumps(task_data) if task_data else None,
+                 priority, datetime.now().isoformat()]
+            )
+            self.connection.commit()
+            task_id = cursor.lastrowid
+            self.task_enqueued_at[task_id] = time.perf_counter()
+        
+        return task_id
+    
+    def update_task_status(self, task_id: int, status: str, error: str = None):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE sync_queue SET Status = ?, LastError = ?, "
+                "Attempts = Attempts + CASE WHEN ? = 'PROCESSING' THEN 1 ELSE 0 END WHERE ID = ?",
+                [status, error, status, task_id]
+            )
+            self.connection.commit()
+            
+            if status in ('COMPLETED', 'FAILED'):
+                self.task_finished_at[task_id] = time.perf_counter()
+                self.task_final_status[task_id] = status
+    
+    def get_active_faces_chunk(self, after_facial_id: int = 0, chunk_size: int = 100) -> List[Dict[str, Any]]:
+        rows = self.execute_query(
+            "SELECT FacialID FROM face WHERE Activo = 1 AND FacialID > ? ORDER BY FacialID LIMIT ?",
+            [after_facial_id, chunk_size]
+        )
+        return [self.get_facial_data(row[0]) for row in rows]
+    
+    def get_facial_persona_links(self, after_facial_id: int = 0, facial_ids: List[int] = None) -> List[Tuple[int, int]]:
+        # En la tabla simulada el vínculo está en face (sin perface)
+        if facial_ids:
+            query = f"SELECT FacialID, PersonaID FROM face WHERE PersonaID IS NOT NULL AND FacialID IN ({', '.join('?' for _ in facial_ids)})"
+            params = list(facial_ids)
+        else:
+            query = "SELECT FacialID, PersonaID FROM face WHERE PersonaID IS NOT NULL AND FacialID > ?"
+            params = [after_facial_id]
+        return [(row[0], row[1]) for row in self.execute_query(query + " ORDER BY FacialID", params)]
+    
+    def count_active_faces(self, after_facial_id: int = 0) -> int:
+        return self.execute_scalar(
+            "SELECT COUNT(*) FROM face WHERE Activo = 1 AND FacialID > ?", [after_facial_id]
+        ) or 0
+    
+    def get_open_task_keys(self) -> set:
+        rows = self.execute_query(
+            "SELECT TaskType, FacialID, TaskData FROM sync_queue WHERE Status IN ('PENDING', 'PROCESSING')"
+        )
+        keys = set()
+        for task_type, facial_id, task_data in rows:
+            device_ids = json.loads(task_data).get('device_ids') if task_data else None
+            for device_id in device_ids or [None]:
+                keys.add((task_type, facial_id, device_id))
+        return keys
+    
+    # ====================================
+    # DISPOSITIVOS
+    # ====================================
+    
+    def get_active_devices(self) -> List[Dict[str, Any]]:
+        return [dict(device) for device in self.devices]
+    
+    def update_device_status(self, dispositivo_id: str, is_online: bool,
+                             last_error: str = None, face_count: int = None):
+        self.execute_non_query(
+            "INSERT INTO device_status (DispositivoID, LastPing, IsOnline, LastError, FaceCount) "
+            "VALUES (?, ?, ?, ?, COALESCE(?, 0)) "
+            "ON CONFLICT(DispositivoID) DO UPDATE SET LastPing = excluded.LastPing, "
+            "IsOnline = excluded.IsOnline, LastError = excluded.LastError, "
+            "FaceCount = COALESCE(?, FaceCount)",
+            [dispositivo_id, datetime.now().isoformat(), int(is_online), last_error, face_count, face_count]
+        )
+    
+    def get_device_status(self, dispositivo_id: str = None) -> List[Dict[str, Any]]:
+        rows = self.execute_query(
+            "SELECT DispositivoID, LastPing, IsOnline, LastError, ErrorCount, FaceCount, Version FROM device_status"
+        )
+        names = {device['dispositivo_id']: device for device in self.devices}
+        
+        return [{
+            'dispositivo_id': row[0],
+            'nombre': names.get(row[0], {}).get('nombre'),
+            'ip': names.get(row[0], {}).get('ip'),
+            'tipo': names.get(row[0], {}).get('tipo'),
+            'last_ping': row[1],
+            'is_online': bool(row[2]),
+            'last_error': row[3],
+            'error_count': row[4],
+            'last_sync': None,
+            'face_count': row[5],
+            'version': row[6]
+        } for row in rows if dispositivo_id is None or row[0] == dispositivo_id]
+    
+    def update_device_snapshot(self, dispositivo_id: str, version: str, capabilities: str):
+        self.execute_non_query(
+            "INSERT INTO device_status (DispositivoID, Version, Capabilities) VALUES (?, ?, ?) "
+            "ON CONFLICT(DispositivoID) DO UPDATE SET Version = excluded.Version, "
+            "Capabilities = excluded.Capabilities",
+            [dispositivo_id, version, capabilities]
+        )
+    
+    def get_device_snapshots(self) -> Dict[str, str]:
+        rows = self.execute_query(
+            "SELECT DispositivoID, Capabilities FROM device_status WHERE Capabilities IS NOT NULL"
+        )
+        return {row[0]: row[1] for row in rows}
+    
+    def get_device_face_hashes(self, dispositivo_id: str) -> Dict[str, str]:
+        rows = self.execute_query(
+            "SELECT FPID, ContentHash FROM device_face_hash WHERE DispositivoID = ?", [dispositivo_id]
+        )
+        return {row[0]: row[1] for row in rows}
+    
+    def save_device_face_hash(self, dispositivo_id: str, fpid: str, content_hash: str):
+        self.execute_non_query(
+            "INSERT OR REPLACE INTO device_face_hash (DispositivoID, FPID, ContentHash) VALUES (?, ?, ?)",
+            [dispositivo_id, fpid, content_hash]
+        )
+    
+    def delete_device_face_hash(self, dispositivo_id: str, fpid: str = None) -> int:
+        if fpid is None:
+            return self.execute_non_query(
+                "DELETE FROM device_face_hash WHERE DispositivoID = ?", [dispositivo_id]
+            )
+        return self.execute_non_query(
+            "DELETE FROM device_face_hash WHERE DispositivoID = ? AND FPID = ?", [dispositivo_id, fpid]
+        )
+    
+    # ====================================
+    # EVENTOS
+    # ====================================
+    
+    def log_access_event(self, device_ip: str, event_type: str, event_code: str = None,
+                         persona_id: int = None, employee_no: str = None,
+                         person_name: str = None, verify_mode: str = None,
+                         access_result: str = None, event_time: str = None,
+                         raw_data: str = None) -> int:
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT INTO access_events (DeviceIP, EventType, EventCode, PersonaID, EmployeeNo, "
+                "PersonName, VerifyMode, AccessResult, EventTime, RawData, ReceivedAt) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [device_ip, event_type, event_code, persona_id, employee_no, person_name,
+                 verify_mode, access_result, event_time, raw_data, datetime.now().isoformat()]
+            )
+            self.connection.commit()
+            
+            if employee_no:
+                self.event_written_at[employee_no] = time.perf_counter()
+            
+            return cursor.lastrowid
+    
+    def get_recent_access_events(self, limit: int, device_ip: str = None) -> List[Dict[str, Any]]:
+        # EventTime ya es texto ISO en la tabla simulada
+        query = "SELECT DeviceIP, EventType, EventCode, PersonName, AccessResult, EventTime, RawData FROM access_events"
+        params: List[Any] = []
+        if device_ip:
+            query += " WHERE DeviceIP = ?"
+            params.append(device_ip)
+        rows = self.execute_query(query + " ORDER BY EventTime DESC LIMIT ?", params + [int(limit)])
+        
+        fields = ('device_ip', 'event_type', 'event_code', 'person_name', 'access_result', 'event_time', 'raw_data')
+        return [dict(zip(fields, row)) for row in rows]
+    
+    def get_event_minute_counts(self, hours: float = 24) -> List[Tuple]:
+        # EventTime queda como texto ISO: EventAggregator lo convierte y descarta lo que está fuera de la ventana
+        return self.execute_query(
+            "SELECT DeviceIP, AccessResult, EventTime, COUNT(*) FROM access_events "
+            "GROUP BY DeviceIP, AccessResult, EventTime"
+        )
+    
+    def upsert_event_hourly(self, counts: Dict[Tuple[str, str, datetime], int]):
+        with self.lock:
+            self.connection.executemany(
+                "INSERT INTO access_events_hourly (DeviceIP, AccessResult, HourStart, EventCount) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (DeviceIP, AccessResult, HourStart) "
+                "DO UPDATE SET EventCount = EventCount + excluded.EventCount",
+                [(device_ip, result, hour.isoformat(), count) for (device_ip, result, hour), count in counts.items()]
+            )
+            self.connection.commit()
+    
+    def close_all_connections(self):
+        self.connection.close()
@@ -0,0 +1,639 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Simulador de terminales Hikvision ISAPI para Facial Sync Service
+Levanta N dispositivos falsos en puertos separados para pruebas de carga y benchmarks
+"""
+
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+import http.client
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Tuple, Any
+
+DEVICE_INFO_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<DeviceInfo version="2.0" xmlns="http://www.isapi.org/ver20/XMLSchema">
+<deviceName>{name}</deviceName>
+<deviceID>{device_id}</deviceID>
+<model>{model}</model>
+<serialNumber>{serial}</serialNumber>
+<macAddress>{mac}</macAddress>
+<firmwareVersion>{firmware}</firmwareVersion>
+<firmwareReleasedDate>{firmware_build}</firmwareReleasedDate>
+<deviceType>ACS</deviceType>
+</DeviceInfo>
+"""
+
+CAPABILITIES_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<DeviceCap version="2.0" xmlns="http://www.isapi.org/ver20/XMLSchema">
+<isSupportFDLib>true</isSupportFDLib>
+<isSupportAcsEvent>true</isSupportAcsEvent>
+<FDLibCap><maxFDNum>{max_faces}</maxFDNum></FDLibCap>
+</DeviceCap>
+"""
+
+# JPEG mínimo para los eventos con imagen
+FAKE_JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 256 + b'\xff\xd9'
+
+def _md5(text: str) -> str:
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+def encode_event(event: Dict[str, Any], event_format: str = 'json',
+                 picture: bytes = FAKE_JPEG) -> Tuple[bytes, str]:
+    """Serializa un evento como lo envía el terminal: JSON o multipart con imagen"""
+    payload = json.dumps(event).encode('utf-8')
+    
+    if event_format != 'multipart':
+        return payload, 'application/json'
+    
+    boundary = 'MIME_boundary'
+    body = (f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="AccessControllerEvent"\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(payload)}\r\n\r\n').encode('utf-8') + payload
+    body += (f'\r\n--{boundary}\r\n'
+             f'Content-Disposition: form-data; name="Picture"; filename="Picture.jpg"\r\n'
+             f'Content-Type: image/jpeg\r\n'
+             f'Content-Length: {len(picture)}\r\n\r\n').encode('utf-8') + picture
+    body += f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    
+    return body, f'multipart/form-data; boundary={boundary}'
+
+class SimulatedHandler(BaseHTTPRequestHandler):
+    """Manejador HTTP de un terminal simulado"""
+    
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        """Suprimir logs HTTP automáticos"""
+        pass
+    
+    def do_GET(self):
+        self._handle('GET')
+    
+    def do_POST(self):
+        self._handle('POST')
+    
+    def do_PUT(self):
+        self._handle('PUT')
+    
+    def _handle(self, method: str):
+        """Autentica, aplica latencia/errores simulados y despacha el endpoint"""
+        device = self.server.device
+        content_length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(content_length) if content_length > 0 else b''
+        
+        if device.digest_auth and not device.check_digest(method, self.headers.get('Authorization', '')):
+            device.count('auth_challenges')
+            self._send(401, {'statusCode': 4, 'statusString': 'Unauthorized'},
+                       {'WWW-Authenticate': device.digest_challenge()})
+            return
+        
+        device.simulate_latency()
+        
+        if device.should_fail():
+            device.count('errors_injected')
+            self._send(503, {'statusCode': 3, 'statusString': 'Device Busy', 'subStatusCode': 'deviceBusy'})
+            return
+        
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        
+        try:
+            status, payload = device.dispatch(method, url.path, query, body,
+                                              self.headers.get('Content-Type', ''))
+        except Exception as e:
+            logging.error(f"Error en dispositivo simulado {device.device_id}: {e}")
+            status, payload = 500, {'statusCode': 6, 'statusString': 'Invalid Content', 'errorMsg': str(e)}
+        
+        self._send(status, payload)
+    
+    def _send(self, status: int, payload: Any, headers: Dict[str, str] = None):
+        """Envía respuesta JSON o XML con Content-Length (keep-alive)"""
+        if isinstance(payload, str):
+            data = payload.encode('utf-8')
+            content_type = 'application/xml'
+        else:
+            data = json.dumps(payload).encode('utf-8')
+            content_type = 'application/json'
+        
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+class SimulatedDevice:
+    """Terminal Hikvision simulado: deviceInfo, FDLib, FaceDataRecord y httpHosts"""
+    
+    def __init__(self, device_id: str, host: str = '127.0.0.1', port: int = 18000,
+                 username: str = 'admin', password: str = 'admin12345',
+                 latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+                 digest_auth: bool = True, max_faces: int = 10000,
+                 event_target: str = None, event_format: str = 'json'):
+        self.device_id = device_id
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.digest_auth = digest_auth
+        self.max_faces = max_faces
+        self.event_target = event_target
+        self.event_format = event_format
+        
+        self.realm = 'DS-SIM'
+        self.opaque = os.urandom(8).hex()
+        self.nonces = set()
+        
+        # Estado del dispositivo
+        self.libraries: Dict[str, Dict[str, Any]] = {}
+        self.faces: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.http_hosts: List[Dict[str, Any]] = []
+        self.event_serial = 0
+        self.lock = threading.Lock()
+        
+        self.http_server = None
+        self.server_thread = None
+        self.event_thread = None
+        self.is_running = False
+        
+        self.stats = {
+            'requests': 0,
+            'auth_challenges': 0,
+            'errors_injected': 0,
+            'faces_uploaded': 0,
+            'faces_deleted': 0,
+            'events_pushed': 0,
+            'events_failed': 0
+        }
+    
+    def start(self):
+        """Levanta el servidor HTTP del dispositivo"""
+        self.http_server = ThreadingHTTPServer((self.host, self.port), SimulatedHandler)
+        self.http_server.daemon_threads = True
+        self.http_server.device = self
+        
+        self.server_thread = threading.Thread(target=self.http_server.serve_forever, daemon=True)
+        self.server_thread.start()
+        self.is_running = True
+        
+        logging.info(f"🎭 Dispositivo simulado {self.device_id} en {self.host}:{self.port}")
+    
+    def stop(self):
+        """Detiene servidor y generador de eventos"""
+        self.is_running = False
+        
+        if self.http_server:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+        
+        if self.event_thread and self.event_thread.is_alive():
+            self.event_thread.join(timeout=5)
+    
+    def count(self, key: str, amount: int = 1):
+        with self.lock:
+            self.stats[key] += amount
+    
+    # ====================================
+    # AUTENTICACIÓN Y FALLOS SIMULADOS
+    # ====================================
+    
+    def digest_challenge(self) -> str:
+        """Genera cabecera WWW-Authenticate Digest (RFC 2617, qop=auth)"""
+        nonce = os.urandom(16).hex()
+        with self.lock:
+            if len(self.nonces) > 10000:
+                self.nonces.clear()
+            self.nonces.add(nonce)
+        
+        return (f'Digest realm="{self.realm}", qop="auth", nonce="{nonce}", '
+                f'opaque="{self.opaque}", algorithm=MD5, stale=FALSE')
+    
+    def check_digest(self, method: str, authorization: str) -> bool:
+        """Valida la cabecera Authorization Digest de un request"""
+        if not authorization.startswith('Digest '):
+            return False
+        
+        fields = {
+            key: quoted if quoted else plain
+            for key, quoted, plain in re.findall(r'(\w+)=(?:"([^"]*)"|([^\s,]*))', authorization[7:])
+        }
+        
+        if fields.get('username') != self.username or fields.get('nonce') not in self.nonces:
+            return False
+        
+        ha1 = _md5(f"{self.username}:{self.realm}:{self.password}")
+        ha2 = _md5(f"{method}:{fields.get('uri', '')}")
+        
+        if fields.get('qop'):
+            expected = _md5(f"{ha1}:{fields['nonce']}:{fields.get('nc', '')}:"
+                            f"{fields.get('cnonce', '')}:{fields['qop']}:{ha2}")
+        else:
+            expected = _md5(f"{ha1}:{fields['nonce']}:{ha2}")
+        
+        return fields.get('response') == expected
+    
+    def simulate_latency(self):
+        """Duerme la latencia configurada (media + jitter gaussiano)"""
+        if self.latency_ms <= 0 and self.jitter_ms <= 0:
+            return
+        delay = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        time.sleep(delay)
+    
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+    
+    # ====================================
+    # ENDPOINTS ISAPI
+    # ====================================
+    
+    def dispatch(self, method: str, path: str, query: Dict[str, str], body: bytes,
+                 content_type: str):
+        """Resuelve el endpoint ISAPI y devuelve (status, payload)"""
+        self.count('requests')
+        
+        routes = {
+            ('GET', '/ISAPI/System/deviceInfo'): self._device_info,
+            ('GET', '/ISAPI/System/capabilities'): self._capabilities,
+            ('GET', '/ISAPI/Intelligent/FDLib'): self._list_libraries,
+            ('POST', '/ISAPI/Intelligent/FDLib'): self._create_library,
+            ('POST', '/ISAPI/Intelligent/FDLib/FaceDataRecord'): self._upload_face,
+            ('PUT', '/ISAPI/Intelligent/FDLib/FaceDataRecord/Delete'): self._delete_face,
+            ('GET', '/ISAPI/Intelligent/FDLib/FaceDataRecord/Count'): self._count_faces,
+            ('POST', '/ISAPI/Intelligent/FDLib/FDSearch'): self._search_faces,
+            ('GET', '/ISAPI/Event/notification/httpHosts'): self._get_http_hosts,
+            ('PUT', '/ISAPI/Event/notification/httpHosts'): self._set_http_hosts,
+            ('PUT', '/ISAPI/Event/triggers/AccessControllerEvent'): self._set_event_trigger
+        }
+        
+        handler = routes.get((method, path))
+        if not handler:
+            return 404, {'statusCode': 4, 'statusString': 'Invalid Operation', 'subStatusCode': 'notSupport'}
+        
+        return handler(query, body, content_type)
+    
+    def _ok(self, **extra) -> Dict[str, Any]:
+        result = {'statusCode': 1, 'statusString': 'OK', 'subStatusCode': 'ok'}
+        result.update(extra)
+        return result
+    
+    def _device_info(self, query, body, content_type):
+        info = {
+            'name': f"Simulado {self.device_id}",
+            'device_id': self.device_id,
+            'model': 'DS-K1T341AM-SIM',
+            'serial': f"SIM{self.port}",
+            'mac': 'ac:cb:51:%02x:%02x:%02x' % (self.port >> 8 & 0xff, self.port & 0xff, 0x01),
+            'firmware': 'V3.2.30',
+            'firmware_build': 'build 230101'
+        }
+        
+        if query.get('format') == 'json':
+            return 200, {'DeviceInfo': {
+                'deviceName': info['name'], 'deviceID': info['device_id'], 'model': info['model'],
+                'serialNumber': info['serial'], 'macAddress': info['mac'],
+                'firmwareVersion': info['firmware'], 'firmwareReleasedDate': info['firmware_build'],
+                'deviceType': 'ACS'
+            }}
+        
+        return 200, DEVICE_INFO_XML.format(**info)
+    
+    def _capabilities(self, query, body, content_type):
+        return 200, CAPABILITIES_XML.format(max_faces=self.max_faces)
+    
+    def _list_libraries(self, query, body, content_type):
+        with self.lock:
+            libraries = list(self.libraries.values())
+        return 200, self._ok(FPLibListInfo={'FPLib': libraries})
+    
+    def _create_library(self, query, body, content_type):
+        info = json.loads(body or b'{}').get('FPLibInfo', {})
+        
+        with self.lock:
+            fdid = str(len(self.libraries) + 1)
+            self.libraries[fdid] = {
+                'FDID': fdid,
+                'faceLibType': info.get('faceLibType', 'blackFD'),
+                'name': info.get('name', ''),
+                'customInfo': info.get('customInfo', '')
+            }
+            self.faces[fdid] = {}
+        
+        return 200, self._ok(FPLibInfo={'FDID': fdid})
+    
+    def _upload_face(self, query, body, content_type):
+        """Alta/actualización de FaceDataRecord (multipart JSON + imagen)"""
+        match = re.search(r'boundary=([^;]+)', content_type)
+        if not match:
+            return 400, {'statusCode': 6, 'statusString': 'Invalid Content', 'subStatusCode': 'badMultipart'}
+        
+        record, image = None, b''
+        for part in body.split(b'--' + match.group(1).strip().encode()):
+            if b'\r\n\r\n' not in part:
+                continue
+            headers, content = part.split(b'\r\n\r\n', 1)
+            if content.endswith(b'\r\n'):
+                content = content[:-2]
+            if b'name="FaceDataRecord"' in headers:
+                record = json.loads(content.decode('utf-8'))
+            elif b'name="FaceImage"' in headers:
+                image = content
+        
+        if not record or not image:
+            return 400, {'statusCode': 6, 'statusString': 'Invalid Content', 'subStatusCode': 'badParameters'}
+        
+        fdid = str(record.get('FDID', '1'))
+        fpid = str(record.get('FPID', ''))
+        
+        with self.lock:
+            if fdid not in self.libraries:
+                return 400, {'statusCode': 6, 'statusString': 'Invalid Content', 'subStatusCode': 'badFDID'}
+            
+            library = self.faces[fdid]
+            if fpid not in library and len(library) >= self.max_faces:
+                return 400, {'statusCode': 6, 'statusString': 'Invalid Content', 'subStatusCode': 'faceLibFull'}
+            
+            library[fpid] = {
+                'FPID': fpid,
+                'name': record.get('name', ''),
+                'image_size': len(image),
+                'image_hash': hashlib.sha1(image).hexdigest()
+            }
+            self.stats['faces_uploaded'] += 1
+        
+        return 200, self._ok(FPID=fpid)
+    
+    def _delete_face(self, query, body, content_type):
+        fdid = query.get('FDID', '1')
+        fpid = query.get('FPID', '')
+        
+        with self.lock:
+            library = self.faces.get(fdid, {})
+            if fpid not in library:
+                return 400, {'statusCode': 6, 'statusString': 'Invalid Content', 'subStatusCode': 'noSuchFace'}
+            del library[fpid]
+            self.stats['faces_deleted'] += 1
+        
+        return 200, self._ok()
+    
+    def _count_faces(self, query, body, content_type):
+        with self.lock:
+            count = len(self.faces.get(query.get('FDID', '1'), {}))
+        return 200, self._ok(FDID=query.get('FDID', '1'), numOfMatches=count)
+    
+    def _search_faces(self, query, body, content_type):
+        """Búsqueda paginada de FaceDataRecord (FDSearch)"""
+        search = json.loads(body or b'{}')
+        position = int(search.get('searchResultPosition', 0))
+        max_results = int(search.get('maxResults', 30))
+        
+        with self.lock:
+            fpids = sorted(self.faces.get(str(search.get('FDID', '1')), {}))
+        
+        page = fpids[position:position + max_results]
+        if not page:
+            return 200, {'responseStatusStrg': 'NO MATCH', 'numOfMatches': 0, 'totalMatches': len(fpids)}
+        
+        return 200, {
+            'responseStatusStrg': 'MORE' if position + len(page) < len(fpids) else 'OK',
+            'numOfMatches': len(page),
+            'totalMatches': len(fpids),
+            'MatchList': [{'FPID': fpid} for fpid in page]
+        }
+    
+    def _get_http_hosts(self, query, body, content_type):
+        with self.lock:
+            hosts = list(self.http_hosts)
+        return 200, {'HttpHostNotificationList': {'HttpHostNotification': hosts}}
+    
+    def _set_http_hosts(self, query, body, content_type):
+        data = json.loads(body or b'{}')
+        hosts = data.get('HttpHostNotificationList', {}).get('HttpHostNotification', [])
+        
+        with self.lock:
+            self.http_hosts = hosts
+            if hosts and hosts[0].get('url'):
+                self.event_target = hosts[0]['url']
+        
+        return 200, self._ok()
+    
+    def _set_event_trigger(self, query, body, content_type):
+        return 200, self._ok()
+    
+    # ====================================
+    # EVENTOS DE CONTROL DE ACCESO
+    # ====================================
+    
+    def build_event(self, employee_no: str = None, success: bool = True) -> Dict[str, Any]:
+        """Construye un AccessControllerEvent como lo envía el terminal"""
+        with self.lock:
+            self.event_serial += 1
+            serial = self.event_serial
+            if employee_no is None:
+                known = [fpid for library in self.faces.values() for fpid in library]
+                employee_no = random.choice(known) if known else f"SIM{random.randint(1, 9999):04d}"
+        
+        return {
+            'ipAddress': self.host,
+            'portNo': self.port,
+            'protocol': 'HTTP',
+            'channelID': 1,
+            'dateTime': datetime.now().astimezone().isoformat(timespec='seconds'),
+            'activePostCount': 1,
+            'eventType': 'AccessControllerEvent',
+            'eventState': 'active',
+            'eventDescription': 'Access Controller Event',
+            'AccessControllerEvent': {
+                'deviceName': f"Simulado {self.device_id}",
+                'majorEventType': 5,
+                'subEventType': 75 if success else 76,
+                'name': f"Usuario {employee_no}" if success else '',
+                'cardReaderNo': 1,
+                'employeeNoString': employee_no if success else '',
+                'serialNo': serial,
+                'userType': 'normal',
+                'currentVerifyMode': 'face',
+                'mask': 'no',
+                'picturesNumber': 1 if self.event_format == 'multipart' else 0
+            }
+        }
+    
+    def push_event(self, employee_no: str = None, success: bool = True) -> bool:
+        """Envía un AccessControllerEvent al destino configurado en httpHosts"""
+        if not self.event_target:
+            return False
+        
+        event = self.build_event(employee_no, success)
+        body, content_type = encode_event(event, self.event_format)
+        
+        target = urlsplit(self.event_target)
+        try:
+            # Origen = IP del dispositivo, así EventProcessor lo identifica por client_address
+            connection = http.client.HTTPConnection(
+                target.hostname, target.port or 80, timeout=5, source_address=(self.host, 0)
+            )
+            connection.request('POST', target.path or '/', body=body, headers={
+                'Content-Type': content_type,
+                'Content-Length': str(len(body))
+            })
+            response = connection.getresponse()
+            response.read()
+            connection.close()
+            
+            success = response.status == 200
+        except Exception as e:
+            logging.debug(f"Error enviando evento desde {self.device_id}: {e}")
+            success = False
+        
+        self.count('events_pushed' if success else 'events_failed')
+        return success
+    
+    def start_event_generator(self, events_per_second: float, success_ratio: float = 0.9):
+        """Genera eventos de acceso a ritmo constante (Poisson) mientras el dispositivo corre"""
+        def run():
+            while self.is_running:
+                time.sleep(random.expovariate(events_per_second))
+                if self.is_running:
+                    self.push_event(success=random.random() < success_ratio)
+        
+        self.event_thread = threading.Thread(target=run, daemon=True)
+        self.event_thread.start()
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Estado y contadores del dispositivo simulado"""
+        with self.lock:
+            face_count = sum(len(library) for library in self.faces.values())
+            stats = self.stats.copy()
+        
+        return {
+            'device_id': self.device_id,
+            'address': f"{self.host}:{self.port}",
+            'is_running': self.is_running,
+            'face_count': face_count,
+            'event_target': self.event_target,
+            'stats': stats
+        }
+
+class SimulatedFleet:
+    """Conjunto de N terminales simulados en puertos (y opcionalmente IPs) consecutivos"""
+    
+    def __init__(self, count: int, base_port: int = 18000, host: str = '127.0.0.1',
+                 distinct_hosts: bool = False, **device_options):
+        self.devices: List[SimulatedDevice] = []
+        
+        for index in range(count):
+            # En Linux todo 127.0.0.0/8 es loopback: una IP por dispositivo
+            device_host = f"127.0.0.{10 + index}" if distinct_hosts else host
+            self.devices.append(SimulatedDevice(
+                device_id=f"SIM{index + 1:03d}",
+                host=device_host,
+                port=base_port + index,
+                **device_options
+            ))
+    
+    def start(self):
+        for device in self.devices:
+            device.start()
+        logging.info(f"✅ Flota simulada iniciada: {len(self.devices)} dispositivos")
+    
+    def stop(self):
+        for device in self.devices:
+            device.stop()
+        logging.info("✅ Flota simulada detenida")
+    
+    def start_event_generators(self, events_per_second: float, success_ratio: float = 0.9):
+        """Inicia generadores de eventos repartiendo la tasa total entre los dispositivos"""
+        per_device = events_per_second / max(1, len(self.devices))
+        for device in self.devices:
+            device.start_event_generator(per_device, success_ratio)
+    
+    def set_event_target(self, url: str):
+        for device in self.devices:
+            device.event_target = url
+    
+    def device_rows(self) -> List[Dict[str, Any]]:
+        """Dispositivos con el formato de DatabaseManager.get_active_devices()"""
+        return [{
+            'dispositivo_id': device.device_id,
+            'nombre': f"Simulado {device.device_id}",
+            'ip': device.host,
+            'usuario': device.username,
+            'password': device.password,
+            'puerto_http': device.port,
+            'puerto_svr': device.port,
+            'puerto_https': None,
+            'puerto_rtsp': None,
+            'tipo': 'Terminal',
+            'modelo': 'DS-K1T341AM-SIM',
+            'activo': True
+        } for device in self.devices]
+    
+    def get_status(self) -> List[Dict[str, Any]]:
+        return [device.get_status() for device in self.devices]
+
+def main():
+    """Levanta una flota simulada desde línea de comandos"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Simulador de terminales Hikvision ISAPI')
+    parser.add_argument('--devices', type=int, default=5, help='Cantidad de dispositivos')
+    parser.add_argument('--base-port', type=int, default=18000, help='Puerto del primer dispositivo')
+    parser.add_argument('--host', default='127.0.0.1', help='IP de escucha')
+    parser.add_argument('--distinct-hosts', action='store_true',
+                        help='Una IP loopback por dispositivo (127.0.0.10, .11, ...)')
+    parser.add_argument('--latency-ms', type=float, default=20, help='Latencia media por request')
+    parser.add_argument('--jitter-ms', type=float, default=5, help='Desviación de la latencia')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fracción de requests con error 503')
+    parser.add_argument('--no-auth', action='store_true', help='Deshabilitar autenticación digest')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin12345')
+    parser.add_argument('--event-target', help='URL del EventProcessor (ej. http://127.0.0.1:8080/)')
+    parser.add_argument('--event-format', choices=['json', 'multipart'], default='json')
+    parser.add_argument('--events-per-second', type=float, default=0,
+                        help='Tasa total de eventos generados por la flota')
+    
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    
+    fleet = SimulatedFleet(
+        args.devices, args.base_port, args.host, args.distinct_hosts,
+        username=args.username, password=args.password,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        digest_auth=not args.no_auth, event_target=args.event_target,
+        event_format=args.event_format
+    )
+    fleet.start()
+    
+    if args.events_per_second > 0:
+        fleet.start_event_generators(args.events_per_second)
+    
+    print(json.dumps(fleet.device_rows(), indent=2))
+    
+    try:
+        while True:
+            time.sleep(10)
+            for status in fleet.get_status():
+                logging.info(f"📊 {status['device_id']} - Rostros: {status['face_count']} - "
+                             f"Requests: {status['stats']['requests']} - "
+                             f"Eventos: {status['stats']['events_pushed']}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fleet.stop()
+
+if __name__ == "__main__":
+    main()
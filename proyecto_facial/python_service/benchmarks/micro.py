@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks de rutas calientes de Facial Sync Service
+Parseo de eventos, serialización y cola de tareas: ops/s y memoria por operación
+"""
+
+import os
+import sys
+import gc
+import heapq
+import random
+import timeit
+import logging
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Any, Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from benchmarks.isapi_simulator import SimulatedDevice, encode_event
+from benchmarks.common import environment_info, write_results, compare_results
+
+# Tamaños típicos de Hikvision: captura de evento 30-60 KB, foto de alta ~60 KB (MAX_FACE_SIZE_KB=200)
+EVENT_PICTURE_SIZE = 48 * 1024
+FACE_IMAGE_SIZE = 60 * 1024
+HEAP_SIZE = 1000
+
+BENCHMARKS: Dict[str, Callable] = {}
+
+def benchmark(name: str):
+    """Registra una función de preparación que devuelve la operación a medir"""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+class NullDatabase:
+    """BD vacía: aísla el costo de parseo del costo de escritura"""
+    
+    def get_active_devices(self) -> List[Dict[str, Any]]:
+        return []
+    
+    def log_access_event(self, **kwargs):
+        return None
+
+def _random_bytes(size: int, seed: int = 42) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+def _sample_event() -> Dict[str, Any]:
+    return SimulatedDevice('SIM001', host='192.168.1.100', port=80).build_event('1042', success=True)
+
+def _event_processor(config: Config):
+    from event_processor import EventProcessor
+    return EventProcessor(NullDatabase(), config)
+
+@benchmark('extract_json_from_multipart')
+def setup_extract_multipart(config: Config, args) -> Callable:
+    processor = _event_processor(config)
+    data, content_type = encode_event(_sample_event(), 'multipart', _random_bytes(args.picture_size))
+    return lambda: processor._extract_json_from_multipart(data, content_type)
+
+@benchmark('extract_json_from_binary')
+def setup_extract_binary(config: Config, args) -> Callable:
+    processor = _event_processor(config)
+    payload, _ = encode_event(_sample_event(), 'json')
+    # Cabecera binaria + JSON + imagen, como llegan los eventos sin Content-Type válido
+    header = bytes(range(1, 64)).replace(b'{', b'\x00')
+    data = header + payload + _random_bytes(args.picture_size)
+    return lambda: processor._extract_json_from_binary(data)
+
+@benchmark('process_access_control_event')
+def setup_process_access_event(config: Config, args) -> Callable:
+    processor = _event_processor(config)
+    event = _sample_event()
+    event['_device_ip'] = '192.168.1.100'
+    event['_received_at'] = datetime.now().isoformat()
+    event['_format'] = 'json'
+    return lambda: processor._process_access_control_event(event)
+
+@benchmark('format_event_for_websocket')
+def setup_format_websocket(config: Config, args) -> Callable:
+    from websocket_server import WebSocketServer
+    server = WebSocketServer(None, config)
+    acc = _sample_event()['AccessControllerEvent']
+    event = {
+        'device_ip': '192.168.1.100',
+        'event_type': 'ACCESS_CONTROL',
+        'event_code': '5-75',
+        'person_id': acc['employeeNoString'],
+        'employee_no': acc['employeeNoString'],
+        'person_name': acc['name'],
+        'verify_mode': acc['currentVerifyMode'],
+        'access_result': 'SUCCESS',
+        'event_time': '2024-01-01T08:00:00-03:00'
+    }
+    return lambda: server._format_event_for_websocket(event)
+
+@benchmark('build_face_multipart')
+def setup_build_multipart(config: Config, args) -> Callable:
+    from device_manager import DeviceManager
+    device_manager = DeviceManager(NullDatabase(), config)
+    face_data = {
+        'faceLibType': 'blackFD',
+        'FDID': '1',
+        'FPID': '1042',
+        'name': 'Nombre Apellido'
+    }
+    image = b'\xff\xd8' + _random_bytes(args.face_size - 4) + b'\xff\xd9'
+    return lambda: device_manager._build_face_multipart(face_data, image)
+
+@benchmark('taskitem_heap')
+def setup_taskitem_heap(config: Config, args) -> Callable:
+    from task_queue import TaskItem
+    rng = random.Random(7)
+    heap = [TaskItem(rng.randint(1, 3), task_id, {'task_type': 'CREATE', 'facial_id': task_id})
+            for task_id in range(HEAP_SIZE)]
+    heapq.heapify(heap)
+    counter = [HEAP_SIZE]
+    
+    def op():
+        # Push + pop con la cola en régimen estable de HEAP_SIZE tareas
+        counter[0] += 1
+        heapq.heappush(heap, TaskItem(rng.randint(1, 3), counter[0], {'task_type': 'CREATE'}))
+        heapq.heappop(heap)
+    
+    return op
+
+@benchmark('taskitem_priority_queue')
+def setup_taskitem_priority_queue(config: Config, args) -> Callable:
+    from queue import PriorityQueue
+    from task_queue import TaskItem
+    rng = random.Random(7)
+    priority_queue = PriorityQueue()
+    for task_id in range(HEAP_SIZE):
+        priority_queue.put(TaskItem(rng.randint(1, 3), task_id, {'task_type': 'CREATE'}))
+    counter = [HEAP_SIZE]
+    
+    def op():
+        counter[0] += 1
+        priority_queue.put(TaskItem(rng.randint(1, 3), counter[0], {'task_type': 'CREATE'}))
+        priority_queue.get_nowait()
+    
+    return op
+
+def measure(op: Callable, repeat: int, min_time: float) -> Dict[str, Any]:
+    """Mide ops/s (mejor de N rondas) y memoria asignada por operación"""
+    for _ in range(10):
+        op()
+    
+    timer = timeit.Timer(op)
+    number, _ = timer.autorange()
+    number = max(number, int(number * min_time / 0.2))
+    best = min(timer.repeat(repeat=repeat, number=number))
+    
+    # Memoria: pico transitorio de una operación y bytes retenidos tras muchas
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    op()
+    _, peak = tracemalloc.get_traced_memory()
+    
+    retained_ops = min(number, 1000)
+    before, _ = tracemalloc.get_traced_memory()
+    blocks_before = sys.getallocatedblocks()
+    for _ in range(retained_ops):
+        op()
+    after, _ = tracemalloc.get_traced_memory()
+    blocks_after = sys.getallocatedblocks()
+    tracemalloc.stop()
+    
+    return {
+        'ops_per_second': round(number / best, 1),
+        'ns_per_op': round(best / number * 1e9, 1),
+        'peak_bytes_per_op': max(0, peak - baseline),
+        'retained_bytes_per_op': round(max(0, after - before) / retained_ops, 1),
+        'retained_blocks_per_op': round(max(0, blocks_after - blocks_before) / retained_ops, 2)
+    }
+
+def main():
+    """Ejecuta los micro-benchmarks y guarda los resultados en JSON"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Micro-benchmarks de Facial Sync Service')
+    parser.add_argument('--filter', help='Ejecutar solo benchmarks cuyo nombre contenga este texto')
+    parser.add_argument('--repeat', type=int, default=5, help='Rondas por benchmark')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Duración mínima por ronda (s)')
+    parser.add_argument('--picture-size', type=int, default=EVENT_PICTURE_SIZE, help='Bytes de imagen en eventos')
+    parser.add_argument('--face-size', type=int, default=FACE_IMAGE_SIZE, help='Bytes de imagen facial')
+    parser.add_argument('--output', help='Archivo JSON de resultados')
+    parser.add_argument('--compare', help='Resultado anterior para detectar regresiones')
+    
+    args = parser.parse_args()
+    
+    # Los logs de INFO de las rutas medidas no deben escribirse, pero sí formatearse
+    logging.basicConfig(level=logging.WARNING)
+    config = Config()
+    
+    results = {
+        'environment': environment_info(),
+        'parameters': vars(args).copy(),
+        'benchmarks': {}
+    }
+    
+    for name, setup in BENCHMARKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        
+        op = setup(config, args)
+        result = measure(op, args.repeat, args.min_time)
+        results['benchmarks'][name] = result
+        
+        print(f"{name:32s} {result['ops_per_second']:>14,.0f} ops/s "
+              f"{result['ns_per_op']:>12,.0f} ns/op "
+              f"{result['peak_bytes_per_op']:>10,} B pico")
+    
+    path = write_results('micro', results, args.output)
+    print(f"📊 Resultados guardados en {path}")
+    
+    if args.compare:
+        changes = compare_results(args.compare, results)
+        print("\n".join(changes) if changes else "Sin variaciones significativas")
+
+if __name__ == "__main__":
+    main()
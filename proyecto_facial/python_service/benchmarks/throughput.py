@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de throughput de punta a punta para Facial Sync Service
+Sync: API -> TaskQueue -> DeviceManager -> terminales simulados
+Eventos: terminal -> EventProcessor -> BD -> difusión WebSocket
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import websockets
+
+from config import Config
+from device_manager import DeviceManager
+from task_queue import TaskQueue
+from event_processor import EventProcessor
+from websocket_server import WebSocketServer
+from api_server import APIServer
+from benchmarks.isapi_simulator import SimulatedFleet
+from benchmarks.fake_db import BenchmarkDatabase
+from benchmarks.common import percentiles, environment_info, write_results, compare_results
+
+def build_config(args) -> Config:
+    """Configuración por defecto del servicio con puertos locales para el benchmark"""
+    config = Config()
+    overrides = {
+        'EVENT_LISTEN_PORT': args.event_port,
+        'WEBSOCKET_HOST': '127.0.0.1',
+        'WEBSOCKET_PORT': args.ws_port,
+        'RETRY_DELAY_SECONDS': 1
+    }
+    for key, value in overrides.items():
+        config.set(key, value, save_to_db=False)
+    return config
+
+def wait_until(condition, timeout: float, interval: float = 0.05) -> bool:
+    """Espera activa hasta que se cumpla la condición o se agote el tiempo"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return condition()
+
+def run_sync_benchmark(args, fleet: SimulatedFleet, config: Config) -> Dict[str, Any]:
+    """Encola rostros por la API y mide hasta que TaskQueue los sube a todos los terminales"""
+    db = BenchmarkDatabase(fleet.device_rows())
+    db.seed_faces(args.faces, args.template_size)
+    
+    device_manager = DeviceManager(db, config)
+    task_queue = TaskQueue(db, config)
+    task_queue.set_device_manager(device_manager)
+    api_client = APIServer(db, device_manager, task_queue, config).app.test_client()
+    
+    uploads_before = sum(device.stats['faces_uploaded'] for device in fleet.devices)
+    task_queue.start()
+    
+    enqueue_latencies = []
+    start_time = time.perf_counter()
+    
+    for facial_id in range(1, args.faces + 1):
+        request_start = time.perf_counter()
+        response = api_client.post('/api/face/create', json={
+            'facial_id': facial_id,
+            'persona_id': facial_id,
+            'priority': 1
+        })
+        enqueue_latencies.append(time.perf_counter() - request_start)
+        if response.status_code != 200:
+            logging.warning(f"Encolado rechazado para {facial_id}: {response.status_code}")
+    
+    enqueue_duration = time.perf_counter() - start_time
+    completed = wait_until(lambda: len(db.task_finished_at) >= args.faces, args.timeout)
+    
+    task_queue.stop()
+    device_manager.cleanup_sessions()
+    
+    finished = db.task_finished_at
+    duration = (max(finished.values()) - start_time) if finished else None
+    task_latencies = [finished[task_id] - db.task_enqueued_at[task_id]
+                      for task_id in finished if task_id in db.task_enqueued_at]
+    uploads = sum(device.stats['faces_uploaded'] for device in fleet.devices) - uploads_before
+    statuses = list(db.task_final_status.values())
+    
+    return {
+        'tasks': args.faces,
+        'completed': statuses.count('COMPLETED'),
+        'failed': statuses.count('FAILED'),
+        'timed_out': not completed,
+        'duration_seconds': round(duration, 3) if duration else None,
+        'enqueue_per_second': round(args.faces / enqueue_duration, 2) if enqueue_duration else None,
+        'tasks_per_second': round(len(finished) / duration, 2) if duration else None,
+        'face_uploads_per_second': round(uploads / duration, 2) if duration else None,
+        'enqueue_latency_ms': percentiles(enqueue_latencies),
+        'task_latency_ms': percentiles(task_latencies),
+        'device_latency': device_manager.get_latency_statistics()
+    }
+
+async def _subscriber(url: str, expected: int, idle_timeout: float, lags: List[float],
+                      ready: threading.Semaphore):
+    """Cliente WebSocket que registra el retardo de cada evento recibido"""
+    async with websockets.connect(url, max_size=None) as websocket:
+        await websocket.recv()  # Bienvenida
+        ready.release()
+        
+        received = 0
+        while received < expected:
+            try:
+                message = await asyncio.wait_for(websocket.recv(), timeout=idle_timeout)
+            except asyncio.TimeoutError:
+                break
+            
+            data = json.loads(message)
+            if data.get('type') == 'access_event':
+                sent_at = datetime.fromisoformat(data['timestamp'])
+                lags.append((datetime.now() - sent_at).total_seconds())
+                received += 1
+
+def run_event_benchmark(args, fleet: SimulatedFleet, config: Config) -> Dict[str, Any]:
+    """Envía eventos desde los terminales simulados y mide BD y difusión WebSocket"""
+    db = BenchmarkDatabase(fleet.device_rows())
+    
+    event_processor = EventProcessor(db, config)
+    websocket_server = WebSocketServer(event_processor, config)
+    event_processor.register_event_callback(websocket_server.broadcast_event)
+    
+    event_processor.start()
+    websocket_server.start()
+    
+    # Suscriptores WebSocket en su propio loop
+    total_events = args.events_per_device * len(fleet.devices)
+    ws_lags: List[float] = []
+    ready = threading.Semaphore(0)
+    ws_url = f"ws://127.0.0.1:{args.ws_port}"
+    
+    def run_subscribers():
+        async def main():
+            await asyncio.gather(*[
+                _subscriber(ws_url, total_events, args.idle_timeout, ws_lags, ready)
+                for _ in range(args.subscribers)
+            ], return_exceptions=True)
+        asyncio.run(main())
+    
+    subscriber_thread = threading.Thread(target=run_subscribers, daemon=True)
+    subscriber_thread.start()
+    for _ in range(args.subscribers):
+        ready.acquire(timeout=10)
+    
+    fleet.set_event_target(f"http://127.0.0.1:{args.event_port}/")
+    
+    sent_at: Dict[str, float] = {}
+    ack_latencies: List[float] = []
+    ack_lock = threading.Lock()
+    
+    def push_from(index: int):
+        device = fleet.devices[index]
+        for sequence in range(args.events_per_device):
+            employee_no = f"B{index:03d}{sequence:06d}"
+            push_start = time.perf_counter()
+            sent_at[employee_no] = push_start
+            device.push_event(employee_no=employee_no, success=True)
+            with ack_lock:
+                ack_latencies.append(time.perf_counter() - push_start)
+    
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(fleet.devices)) as executor:
+        list(executor.map(push_from, range(len(fleet.devices))))
+    push_duration = time.perf_counter() - start_time
+    
+    written_all = wait_until(lambda: len(db.event_written_at) >= total_events, args.timeout)
+    subscriber_thread.join(timeout=args.timeout)
+    
+    event_processor.stop()
+    websocket_server.stop()
+    
+    written = db.event_written_at
+    duration = (max(written.values()) - start_time) if written else None
+    db_latencies = [written[key] - sent_at[key] for key in written if key in sent_at]
+    processor_stats = event_processor.get_statistics()['stats']
+    
+    return {
+        'events': total_events,
+        'written': len(written),
+        'dropped': processor_stats['events_dropped'],
+        'timed_out': not written_all,
+        'duration_seconds': round(duration, 3) if duration else None,
+        'push_per_second': round(total_events / push_duration, 2) if push_duration else None,
+        'events_per_second': round(len(written) / duration, 2) if duration else None,
+        'ack_latency_ms': percentiles(ack_latencies),
+        'db_latency_ms': percentiles(db_latencies),
+        'websocket': {
+            'subscribers': args.subscribers,
+            'messages': len(ws_lags),
+            'messages_per_second': round(len(ws_lags) / duration, 2) if duration else None,
+            'fanout_latency_ms': percentiles(ws_lags)
+        }
+    }
+
+def main():
+    """Ejecuta el benchmark y guarda los resultados en JSON"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Benchmark de throughput de Facial Sync Service')
+    parser.add_argument('--devices', type=int, default=5, help='Terminales simulados')
+    parser.add_argument('--faces', type=int, default=200, help='Rostros a sincronizar')
+    parser.add_argument('--template-size', type=int, default=20000, help='Bytes por imagen facial')
+    parser.add_argument('--events-per-device', type=int, default=400, help='Eventos por terminal')
+    parser.add_argument('--subscribers', type=int, default=3, help='Clientes WebSocket')
+    parser.add_argument('--latency-ms', type=float, default=10, help='Latencia simulada de los terminales')
+    parser.add_argument('--jitter-ms', type=float, default=2)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--distinct-hosts', action='store_true',
+                        help='Una IP loopback por terminal (solo Linux)')
+    parser.add_argument('--base-port', type=int, default=18000)
+    parser.add_argument('--event-port', type=int, default=18080)
+    parser.add_argument('--ws-port', type=int, default=18765)
+    parser.add_argument('--timeout', type=float, default=300, help='Espera máxima por etapa (s)')
+    parser.add_argument('--idle-timeout', type=float, default=10, help='Espera máxima sin mensajes WebSocket (s)')
+    parser.add_argument('--skip-sync', action='store_true')
+    parser.add_argument('--skip-events', action='store_true')
+    parser.add_argument('--output', help='Archivo JSON de resultados')
+    parser.add_argument('--compare', help='Resultado anterior para detectar regresiones')
+    parser.add_argument('--log-level', default='WARNING')
+    
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING),
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    
+    config = build_config(args)
+    fleet = SimulatedFleet(
+        args.devices, args.base_port, distinct_hosts=args.distinct_hosts,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate
+    )
+    fleet.start()
+    
+    results = {
+        'environment': environment_info(),
+        'parameters': vars(args).copy()
+    }
+    
+    try:
+        if not args.skip_sync:
+            print(f"⚙️  Sync: {args.faces} rostros -> {args.devices} terminales...")
+            results['sync'] = run_sync_benchmark(args, fleet, config)
+            print(f"   {results['sync']['tasks_per_second']} tareas/s - "
+                  f"p95 {results['sync']['task_latency_ms']['p95']} ms")
+        
+        if not args.skip_events:
+            print(f"📨 Eventos: {args.events_per_device * args.devices} eventos, "
+                  f"{args.subscribers} suscriptores WebSocket...")
+            results['events'] = run_event_benchmark(args, fleet, config)
+            print(f"   {results['events']['events_per_second']} eventos/s - "
+                  f"p95 BD {results['events']['db_latency_ms']['p95']} ms")
+    finally:
+        fleet.stop()
+    
+    path = write_results('throughput', results, args.output)
+    print(f"📊 Resultados guardados en {path}")
+    
+    if args.compare:
+        changes = compare_results(args.compare, results)
+        print("\n".join(changes) if changes else "Sin variaciones significativas")
+
+if __name__ == "__main__":
+    main()
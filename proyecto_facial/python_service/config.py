@@ -7,10 +7,77 @@ Maneja configuración desde base de datos y archivos
 
 import os
 import json
+import queue
+import atexit
 import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
 from typing import Dict, Any, Optional
 from pathlib import Path
 
+from metrics import registry
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Handler que solo encola el record: formateo y escritura ocurren en el QueueListener"""
+    
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Mismo proceso: el listener formatea el record original (args y exc_info incluidos)
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Con la cola llena se descartan DEBUG/INFO; WARNING+ espera brevemente
+            if record.levelno >= logging.WARNING:
+                try:
+                    self.queue.put(record, timeout=0.5)
+                    return
+                except queue.Full:
+                    pass
+            self.dropped += 1
+
+class LogSampler(logging.Filter):
+    """Deja pasar una fracción de los DEBUG/INFO de un logger; WARNING+ siempre pasa"""
+    
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.count = 0
+        self.lock = threading.Lock()
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate >= 1:
+            return True
+        if self.rate <= 0:
+            return False
+        
+        # Determinístico: con rate=0.1 pasa 1 de cada 10
+        with self.lock:
+            self.count += 1
+            return int(self.count * self.rate) != int((self.count - 1) * self.rate)
+
+class JsonLogFormatter(logging.Formatter):
+    """Un registro por línea en JSON (ts y level primero, ver log_reader)"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
 class Config:
     """Gestión centralizada de configuración"""
     
@@ -34,7 +101,18 @@ class Config:
             # Database Configuration
             "DB_UDL_PATH": str(self.udl_file),
             "DB_CONNECTION_TIMEOUT": 30,
+            "DB_CONNECTION_TIMEOUT_OFFLINE": 3,  # Con el outbox pendiente o tras un connect fallido
             "DB_RETRY_ATTEMPTS": 3,
+            "DB_SLOW_QUERY_MS": 500,
+            "DB_SLOW_QUERY_LOG": "slow_queries.log",
+            "DB_QUERY_STATS_MAX": 500,
+            "DB_OUTBOX_ENABLED": True,  # Sin conexión, eventos y tareas se guardan en SQLite local
+            "DB_OUTBOX_PATH": "outbox.db",
+            "DB_OUTBOX_SYNCHRONOUS": "NORMAL",  # FULL: fsync por escritura; NORMAL: por checkpoint WAL
+            "DB_OUTBOX_REPLAY_INTERVAL": 5.0,
+            "DB_OUTBOX_BATCH_SIZE": 500,
+            "DB_OUTBOX_MAX_ATTEMPTS": 5,  # Reintentos de una escritura rechazada por SQL Server
+            "DB_OUTBOX_RETRY_MAX_DELAY": 300.0,  # Tope del backoff entre reintentos de una escritura rechazada
             
             # Synchronization Configuration
             "SYNC_INTERVAL": 30,
@@ -42,11 +120,31 @@ class Config:
             "MAX_RETRY_ATTEMPTS": 3,
             "BATCH_SIZE": 10,
             "SYNC_TIMEOUT": 60,
+            "RECONCILE_ENABLED": True,
+            "RECONCILE_INTERVAL": 3600,
+            "RECONCILE_PAGE_SIZE": 50,
+            "RECONCILE_PAGE_WORKERS": 4,
+            "PROVISION_CONCURRENCY": 4,
+            "PROVISION_MAX_CONCURRENCY": 16,  # Tope del concurrency pedido por la API
+            "PROVISION_CHUNK_SIZE": 200,
+            "PROVISION_CHECKPOINT_DIR": "provisioning",
             
             # Device Monitoring
             "DEVICE_PING_INTERVAL": 60,
             "DEVICE_TIMEOUT": 10,
             "DEVICE_RETRY_COUNT": 2,
+            "DEVICE_UPLOAD_TIMEOUT": 30,
+            "DEVICE_TIMEOUT_ADAPTIVE": True,
+            "DEVICE_CONNECT_TIMEOUT_MIN": 0.3,
+            "DEVICE_CONNECT_TIMEOUT_MAX": 5.0,
+            "DEVICE_CONNECT_TIMEOUT_INITIAL": 1.0,  # Sin muestras de connect (LAN); subirlo para equipos por WAN
+            "DEVICE_CONNECT_PROBE_INTERVAL": 60,
+            "DEVICE_READ_TIMEOUT_MIN": 2.0,
+            "DEVICE_READ_TIMEOUT_MAX": 120.0,
+            "DEVICE_LATENCY_ALPHA": 0.2,
+            "DEVICE_LATENCY_WINDOW": 200,
+            "DEVICE_LATENCY_MIN_SAMPLES": 5,  # Muestras antes de derivar el timeout de la latencia
+            "DEVICE_INFO_REFRESH_INTERVAL": 86400,
             "HEALTH_CHECK_INTERVAL": 300,
             
             # Facial Recognition
@@ -54,20 +152,58 @@ class Config:
             "FACE_QUALITY_THRESHOLD": 80,
             "FACE_LIBRARY_ID": "1",
             "MAX_FACE_SIZE_KB": 200,
+            "FACE_HASH_SKIP_ENABLED": True,
             
             # Event Processing
             "EVENT_BUFFER_SIZE": 1000,
             "EVENT_BATCH_SIZE": 50,
+            "EVENT_WORKERS": 4,  # Workers de procesamiento; los eventos de un dispositivo siempre van al mismo
+            "EVENT_SPILL_ENABLED": True,  # Con la cola llena los eventos van a disco en vez de descartarse
+            "EVENT_SPILL_DIR": "spill",
+            "EVENT_SPILL_SEGMENT_MB": 16,
+            "EVENT_SPILL_MAX_MB": 512,  # Total entre todos los shards; superado, se descarta
+            "EVENT_SPILL_FSYNC": "interval",  # always | interval | never
+            "EVENT_SPILL_FSYNC_INTERVAL": 1.0,
+            "EVENT_DEDUP_WINDOW": 60,  # Segundos en que un reenvío del mismo evento se descarta (0 = sin dedup)
+            "EVENT_DEDUP_MAX_KEYS": 10000,
+            "EVENT_CALLBACK_QUEUE_SIZE": 1000,  # Cola por suscriptor de eventos (WebSocket, integraciones)
+            "EVENT_CALLBACK_POLICY": "drop_oldest",  # drop_oldest | drop_newest | block
+            "EVENT_CALLBACK_BLOCK_TIMEOUT": 1.0,  # Con 'block', espera máxima del worker antes de descartar
+            "EVENT_RECENT_BUFFER_SIZE": 2000,  # Eventos recientes en memoria (get_recent_events)
+            "EVENT_RECENT_PER_DEVICE": 500,
+            "EVENT_STATS_WINDOW_HOURS": 24,  # Ventana de conteos por minuto en memoria
+            "PERSONA_CACHE_REFRESH_INTERVAL": 300,  # employee_no -> PersonaID: rostros nuevos y desconocidos
+            "PERSONA_CACHE_FULL_RELOAD_INTERVAL": 3600,
+            "PERSONA_CACHE_NEGATIVE_TTL": 600,  # Segundos antes de volver a buscar un employee_no desconocido
+            "PERSONA_CACHE_NEGATIVE_MAX": 10000,
+            "EVENT_ROLLUP_ENABLED": True,  # Conteos por hora en access_events_hourly
+            "EVENT_ROLLUP_BACKFILLED": False,  # Lo marca RollupWorker al completar el histórico
+            "EVENT_ROLLUP_BACKFILL_CHUNK_HOURS": 24,
+            "EVENT_ROLLUP_BACKFILL_PAUSE": 1.0,  # Segundos entre bloques del backfill
+            "EVENT_ROLLUP_CLOSE_MARGIN": 60,  # Segundos tras el cierre de la hora de arranque antes de recalcularla
             "EVENT_RETENTION_DAYS": 30,
+            "TASK_RETENTION_DAYS": 7,  # Tareas COMPLETED/FAILED en sync_queue
+            "RETENTION_ENABLED": True,
+            "RETENTION_WINDOW_START": "01:00",  # Ventana de baja carga para la limpieza
+            "RETENTION_WINDOW_END": "05:00",
+            "RETENTION_CHUNK_SIZE": 1000,  # Filas por DELETE (evita escalar a lock de tabla)
+            "RETENTION_CHUNK_PAUSE": 0.5,  # Segundos entre bloques
+            "RETENTION_CHECK_INTERVAL": 300,
+            "EVENT_ARCHIVE_ENABLED": True,  # Archiva access_events en disco antes de borrarlos
+            "EVENT_ARCHIVE_DIR": "archive",
             "ENABLE_WEBSOCKET_EVENTS": True,
             
             # Logging Configuration
             "LOG_LEVEL": "INFO",
             "LOG_DIR": "logs",
             "LOG_FILE": "service.log",
+            "LOG_FORMAT": "text",  # text | json (una línea JSON por registro)
             "LOG_MAX_SIZE_MB": 10,
             "LOG_BACKUP_COUNT": 5,
             "LOG_RETENTION_DAYS": 30,
+            "LOG_ASYNC": True,
+            "LOG_QUEUE_SIZE": 10000,
+            "LOG_EVENT_SAMPLE_RATE": 1.0,  # Fracción de líneas INFO por evento de acceso
             
             # Service Configuration
             "SERVICE_NAME": "FacialSyncService",
@@ -109,12 +245,25 @@ class Config:
             # Development
             "DEBUG_MODE": False,
             "VERBOSE_LOGGING": False,
-            "ENABLE_PROFILING": False
+            "ENABLE_PROFILING": False,
+            "WATCHDOG_ENABLED": True,
+            "WATCHDOG_INTERVAL": 5,
+            "WATCHDOG_STALL_SECONDS": 120,
+            "WATCHDOG_LOOP_LAG_SECONDS": 1.0,
+            "WATCHDOG_LOOP_PROBE_INTERVAL": 0.5,
+            "PROFILING_SAMPLE_RATE": 50,  # Hz
+            "PROFILING_MAX_DEPTH": 64,
+            "PROFILING_MAX_STACKS": 20000,
+            "PROFILING_INCLUDE_IDLE": False  # True: incluye threads en espera (colas, sockets, sleep)
         }
         
         self._config = self.defaults.copy()
         self._db_manager = None
         
+        # Logging asíncrono (ver setup_logging)
+        self._log_listener = None
+        self._log_handler = None
+        
     def initialize(self, db_manager=None):
         """Inicializa la configuración cargando desde archivos y BD"""
         self._db_manager = db_manager
@@ -261,6 +410,8 @@ class Config:
             'ping_interval': self.get('DEVICE_PING_INTERVAL'),
             'timeout': self.get('DEVICE_TIMEOUT'),
             'retry_count': self.get('DEVICE_RETRY_COUNT'),
+            'upload_timeout': self.get('DEVICE_UPLOAD_TIMEOUT'),
+            'adaptive_timeout': self.get('DEVICE_TIMEOUT_ADAPTIVE'),
             'max_concurrent': self.get('MAX_CONCURRENT_DEVICES')
         }
     
@@ -293,6 +444,9 @@ class Config:
             datefmt='%Y-%m-%d %H:%M:%S'
         )
         
+        # Archivos en JSON-lines si LOG_FORMAT=json; la consola siempre en texto
+        file_formatter = JsonLogFormatter() if self.get('LOG_FORMAT', 'text') == 'json' else formatter
+        
         # File handler con rotación
         file_handler = RotatingFileHandler(
             log_file,
@@ -300,19 +454,67 @@ class Config:
             backupCount=self.get('LOG_BACKUP_COUNT'),
             encoding='utf-8'
         )
-        file_handler.setFormatter(formatter)
+        file_handler.setFormatter(file_formatter)
         
         # Console handler
         console_handler = logging.StreamHandler()
         console_handler.setFormatter(formatter)
         
+        # Consultas lentas en archivo propio (ver DatabaseManager)
+        slow_query_handler = RotatingFileHandler(
+            log_dir / self.get('DB_SLOW_QUERY_LOG'),
+            maxBytes=self.get('LOG_MAX_SIZE_MB') * 1024 * 1024,
+            backupCount=self.get('LOG_BACKUP_COUNT'),
+            encoding='utf-8'
+        )
+        slow_query_handler.setFormatter(file_formatter)
+        slow_query_logger = logging.getLogger('facial_sync.slow_queries')
+        slow_query_logger.addHandler(slow_query_handler)
+        slow_query_logger.propagate = False
+        
+        # Líneas INFO por evento de acceso (EventProcessor), opcionalmente muestreadas
+        event_logger = logging.getLogger('facial_sync.events')
+        for existing in [f for f in event_logger.filters if isinstance(f, LogSampler)]:
+            event_logger.removeFilter(existing)
+        event_logger.addFilter(LogSampler(self.get('LOG_EVENT_SAMPLE_RATE')))
+        
         # Root logger
         root_logger = logging.getLogger()
         root_logger.setLevel(log_level)
-        root_logger.addHandler(file_handler)
         
+        handlers = [file_handler]
         if self.get('DEBUG_MODE'):
-            root_logger.addHandler(console_handler)
+            handlers.append(console_handler)
+        
+        if self.get('LOG_ASYNC'):
+            # El thread que loguea solo encola; el QueueListener formatea y escribe a disco
+            self.shutdown_logging()
+            log_queue = queue.Queue(maxsize=self.get('LOG_QUEUE_SIZE'))
+            self._log_handler = NonBlockingQueueHandler(log_queue)
+            self._log_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+            self._log_listener.start()
+            root_logger.addHandler(self._log_handler)
+            atexit.register(self.shutdown_logging)
+            
+            registry.gauge('facial_sync_log_queue_depth', 'Registros de log pendientes de escribir',
+                           function=log_queue.qsize)
+            registry.gauge('facial_sync_log_records_dropped', 'Registros de log descartados por cola llena',
+                           function=lambda: self._log_handler.dropped if self._log_handler else 0)
+        else:
+            for handler in handlers:
+                root_logger.addHandler(handler)
+    
+    def shutdown_logging(self):
+        """Escribe los registros pendientes y detiene el thread de logging"""
+        listener, self._log_listener = self._log_listener, None
+        if not listener:
+            return
+        
+        logging.getLogger().removeHandler(self._log_handler)
+        try:
+            listener.stop()
+        except Exception:
+            pass
     
     def validate_config(self) -> tuple[bool, list]:
         """Valida la configuración actual"""
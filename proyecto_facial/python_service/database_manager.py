@@ -8,22 +8,150 @@ Maneja conexiones MSSQL usando videoman.udl
 import pyodbc
 import logging
 import json
+import re
 from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 import threading
 import time
 from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from config import get_config
+from metrics import registry, DEFAULT_BUCKETS
+from event_stats import get_event_aggregator
+from db_outbox import DatabaseOutbox
+
+DB_QUERY_SECONDS = registry.histogram(
+    'facial_sync_db_query_seconds', 'Duración de operaciones de base de datos', ['operation']
+)
+DB_POOL_WAIT_SECONDS = registry.histogram(
+    'facial_sync_db_pool_wait_seconds', 'Espera para obtener una conexión del pool'
+)
+DB_ERRORS = registry.counter(
+    'facial_sync_db_errors_total', 'Errores en operaciones de base de datos', ['operation']
+)
+
+# Consultas lentas con parámetros redactados (handler en Config.setup_logging)
+slow_query_logger = logging.getLogger('facial_sync.slow_queries')
+
+# Filas por MERGE en access_events_hourly (4 parámetros por fila)
+HOURLY_UPSERT_CHUNK = 500
+
+# Borrado por retención: DELETE TOP (n) acotado para no escalar a lock de tabla
+RETENTION_QUERIES = {
+    'access_events': "DELETE TOP (?) FROM access_events WHERE ReceivedAt < ?",
+    'sync_queue': "DELETE TOP (?) FROM sync_queue WHERE Status IN ('COMPLETED', 'FAILED') AND CompletedAt < ?",
+    'sync_queue_completed': "DELETE TOP (?) FROM sync_queue WHERE Status = 'COMPLETED' AND CompletedAt < ?"
+}
+
+_FINGERPRINT_PATTERNS = [
+    (re.compile(r"N?'(?:[^']|'')*'"), '?'),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b"), '?'),
+    (re.compile(r"(?<![\w@#.])-?\d+(?:\.\d+)?\b"), '?'),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)"), '(?+)'),
+    (re.compile(r"\s+"), ' ')
+]
+
+def fingerprint_query(query: str) -> str:
+    """Normaliza una sentencia SQL: literales -> ?, listas (?, ?, ...) -> (?+), espacios colapsados"""
+    for pattern, replacement in _FINGERPRINT_PATTERNS:
+        query = pattern.sub(replacement, query)
+    return query.strip()
+
+class QueryStats:
+    """Tiempos acumulados de una sentencia normalizada"""
+    
+    def __init__(self, fingerprint: str, operation: str):
+        self.fingerprint = fingerprint
+        self.operation = operation
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(DEFAULT_BUCKETS) + 1)
+        self.last_seen = None
+    
+    def record(self, seconds: float, failed: bool = False):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.buckets[self._bucket_index(seconds)] += 1
+        self.last_seen = time.time()
+        if failed:
+            self.errors += 1
+    
+    @staticmethod
+    def _bucket_index(seconds: float) -> int:
+        for index, bound in enumerate(DEFAULT_BUCKETS):
+            if seconds <= bound:
+                return index
+        return len(DEFAULT_BUCKETS)
+    
+    def percentile_ms(self, pct: float) -> Optional[float]:
+        """Percentil aproximado: límite superior del bucket que lo contiene"""
+        if not self.count:
+            return None
+        
+        target = self.count * pct / 100
+        seen = 0
+        for bound, count in zip(DEFAULT_BUCKETS, self.buckets):
+            seen += count
+            if seen >= target:
+                return bound * 1000
+        return round(self.max_seconds * 1000, 1)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"{bound * 1000:g}" for bound in DEFAULT_BUCKETS] + ['+Inf']
+        return {
+            'fingerprint': self.fingerprint,
+            'operation': self.operation,
+            'count': self.count,
+            'errors': self.errors,
+            'total_ms': round(self.total_seconds * 1000, 1),
+            'mean_ms': round(self.total_seconds / self.count * 1000, 2) if self.count else None,
+            'max_ms': round(self.max_seconds * 1000, 1),
+            'p95_ms': self.percentile_ms(95),
+            'histogram_ms': dict(zip(labels, self.buckets)),
+            'last_seen': datetime.fromtimestamp(self.last_seen).isoformat() if self.last_seen else None
+        }
 
 class DatabaseManager:
     """Gestor de conexiones y operaciones de base de datos"""
     
-    def __init__(self, udl_path: str):
+    def __init__(self, udl_path: str, config=None):
         self.udl_path = Path(udl_path)
+        self.config = config or get_config()
         self.connection_string = None
         self.connection_pool = []
         self.pool_lock = threading.Lock()
         self.max_pool_size = 10
         self.current_pool_size = 0
+        self.connect_timeout = self.config.get('DB_CONNECTION_TIMEOUT', 30)
+        self.offline_connect_timeout = self.config.get('DB_CONNECTION_TIMEOUT_OFFLINE', 3)
+        # Sin conexión los lectores fallan rápido en vez de esperar el timeout completo
+        self.last_connect_failed = False
+        
+        registry.gauge('facial_sync_db_pool_connections', 'Conexiones abiertas por el pool',
+                       function=lambda: self.current_pool_size)
+        registry.gauge('facial_sync_db_pool_idle', 'Conexiones libres en el pool',
+                       function=lambda: len(self.connection_pool))
+        
+        # Tiempos por sentencia normalizada (ver get_query_statistics)
+        self.query_stats: Dict[str, QueryStats] = {}
+        self.query_fingerprints: Dict[str, str] = {}
+        self.query_stats_lock = threading.Lock()
+        
+        # Escrituras de eventos y tareas mientras SQL Server no responde (ver start_outbox)
+        self.outbox = None
+        if self.config.get('DB_OUTBOX_ENABLED', True):
+            self.outbox = DatabaseOutbox(
+                self.config.get('DB_OUTBOX_PATH', 'outbox.db'),
+                synchronous=self.config.get('DB_OUTBOX_SYNCHRONOUS', 'NORMAL'),
+                replay_interval=self.config.get('DB_OUTBOX_REPLAY_INTERVAL', 5.0),
+                batch_size=self.config.get('DB_OUTBOX_BATCH_SIZE', 500),
+                max_attempts=self.config.get('DB_OUTBOX_MAX_ATTEMPTS', 5),
+                retry_max_delay=self.config.get('DB_OUTBOX_RETRY_MAX_DELAY', 300.0)
+            )
         
         self._parse_udl_file()
     
@@ -55,28 +183,43 @@ class DatabaseManager:
     
     def get_connection(self) -> pyodbc.Connection:
         """Obtiene una conexión de la base de datos"""
+        start_time = time.perf_counter()
         with self.pool_lock:
-            # Intentar reutilizar conexión del pool
-            if self.connection_pool:
-                conn = self.connection_pool.pop()
+            conn = self.connection_pool.pop() if self.connection_pool else None
+        
+        # Intentar reutilizar conexión del pool (fuera del lock: no se serializa a los demás)
+        if conn is not None:
+            try:
+                # Verificar si la conexión sigue activa
+                conn.execute("SELECT 1")
+                DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start_time)
+                return conn
+            except:
+                # Conexión inválida, crear nueva
                 try:
-                    # Verificar si la conexión sigue activa
-                    conn.execute("SELECT 1")
-                    return conn
+                    conn.close()
                 except:
-                    # Conexión inválida, crear nueva
                     pass
-            
-            # Crear nueva conexión
-            try:
-                conn = pyodbc.connect(self.connection_string, timeout=30)
-                conn.autocommit = True
-                self.current_pool_size += 1
-                logging.debug("Nueva conexión creada")
-                return conn
-            except Exception as e:
-                logging.error(f"Error creando conexión: {e}")
-                raise
+                with self.pool_lock:
+                    self.current_pool_size -= 1
+        
+        # Crear nueva conexión, con timeout corto si la BD ya estaba caída
+        offline = self.last_connect_failed or bool(self.outbox and self.outbox.pending)
+        timeout = self.offline_connect_timeout if offline else self.connect_timeout
+        try:
+            conn = pyodbc.connect(self.connection_string, timeout=timeout)
+            conn.autocommit = True
+        except Exception as e:
+            self.last_connect_failed = True
+            logging.error(f"Error creando conexión: {e}")
+            raise
+        
+        self.last_connect_failed = False
+        with self.pool_lock:
+            self.current_pool_size += 1
+        logging.debug("Nueva conexión creada")
+        DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start_time)
+        return conn
     
     def return_connection(self, conn: pyodbc.Connection):
         """Devuelve una conexión al pool"""
@@ -119,6 +262,8 @@ class DatabaseManager:
         """Ejecuta una consulta SELECT y retorna resultados"""
         with self.get_connection_context() as conn:
             cursor = conn.cursor()
+            start_time = time.perf_counter()
+            failed = False
             try:
                 if params:
                     cursor.execute(query, params)
@@ -129,17 +274,22 @@ class DatabaseManager:
                 logging.debug(f"Query ejecutado: {len(results)} filas")
                 return results
             except Exception as e:
+                failed = True
+                DB_ERRORS.labels('query').inc()
                 logging.error(f"Error ejecutando query: {e}")
                 logging.error(f"Query: {query}")
                 logging.error(f"Params: {params}")
                 raise
             finally:
+                self._record_query('query', query, params, time.perf_counter() - start_time, failed)
                 cursor.close()
     
     def execute_non_query(self, query: str, params: List = None) -> int:
         """Ejecuta INSERT, UPDATE o DELETE y retorna filas afectadas"""
         with self.get_connection_context() as conn:
             cursor = conn.cursor()
+            start_time = time.perf_counter()
+            failed = False
             try:
                 if params:
                     cursor.execute(query, params)
@@ -151,18 +301,23 @@ class DatabaseManager:
                 logging.debug(f"Non-query ejecutado: {affected_rows} filas afectadas")
                 return affected_rows
             except Exception as e:
+                failed = True
+                DB_ERRORS.labels('non_query').inc()
                 conn.rollback()
                 logging.error(f"Error ejecutando non-query: {e}")
                 logging.error(f"Query: {query}")
                 logging.error(f"Params: {params}")
                 raise
             finally:
+                self._record_query('non_query', query, params, time.perf_counter() - start_time, failed)
                 cursor.close()
     
     def execute_scalar(self, query: str, params: List = None) -> Any:
         """Ejecuta consulta y retorna un solo valor"""
         with self.get_connection_context() as conn:
             cursor = conn.cursor()
+            start_time = time.perf_counter()
+            failed = False
             try:
                 if params:
                     cursor.execute(query, params)
@@ -172,15 +327,20 @@ class DatabaseManager:
                 result = cursor.fetchone()
                 return result[0] if result else None
             except Exception as e:
+                failed = True
+                DB_ERRORS.labels('scalar').inc()
                 logging.error(f"Error ejecutando scalar: {e}")
                 raise
             finally:
+                self._record_query('scalar', query, params, time.perf_counter() - start_time, failed)
                 cursor.close()
     
     def execute_procedure(self, proc_name: str, params: List = None) -> List[Tuple]:
         """Ejecuta un procedimiento almacenado"""
         with self.get_connection_context() as conn:
             cursor = conn.cursor()
+            start_time = time.perf_counter()
+            failed = False
             try:
                 if params:
                     cursor.execute(f"EXEC {proc_name} {','.join(['?' for _ in params])}", params)
@@ -191,12 +351,94 @@ class DatabaseManager:
                 conn.commit()
                 return results
             except Exception as e:
+                failed = True
+                DB_ERRORS.labels('procedure').inc()
                 conn.rollback()
                 logging.error(f"Error ejecutando procedimiento {proc_name}: {e}")
                 raise
             finally:
+                self._record_query('procedure', f"EXEC {proc_name}", params, time.perf_counter() - start_time, failed)
                 cursor.close()
     
+    def execute_many(self, query: str, params_list: List[List]) -> int:
+        """Ejecuta una sentencia para muchas filas en una sola transacción"""
+        with self.get_connection_context() as conn:
+            cursor = conn.cursor()
+            cursor.fast_executemany = True
+            start_time = time.perf_counter()
+            failed = False
+            conn.autocommit = False
+            try:
+                cursor.executemany(query, params_list)
+                conn.commit()
+                logging.debug(f"Executemany: {len(params_list)} filas")
+                return len(params_list)
+            except Exception as e:
+                failed = True
+                DB_ERRORS.labels('many').inc()
+                conn.rollback()
+                logging.error(f"Error ejecutando executemany ({len(params_list)} filas): {e}")
+                logging.error(f"Query: {query}")
+                raise
+            finally:
+                conn.autocommit = True
+                self._record_query('many', query, None, time.perf_counter() - start_time, failed)
+                cursor.close()
+    
+    def _record_query(self, operation: str, query: str, params: Optional[List],
+                      seconds: float, failed: bool):
+        """Acumula el tiempo de la sentencia y la envía al log de lentas si supera el umbral"""
+        DB_QUERY_SECONDS.labels(operation).observe(seconds)
+        
+        fingerprint = self.query_fingerprints.get(query)
+        if fingerprint is None:
+            fingerprint = fingerprint_query(query)
+            if len(self.query_fingerprints) >= 4 * self.config.get('DB_QUERY_STATS_MAX', 500):
+                self.query_fingerprints.clear()
+            self.query_fingerprints[query] = fingerprint
+        
+        with self.query_stats_lock:
+            stats = self.query_stats.get(fingerprint)
+            if stats is None:
+                if len(self.query_stats) >= self.config.get('DB_QUERY_STATS_MAX', 500):
+                    # Sentencias generadas dinámicamente: se agrupan para acotar memoria
+                    fingerprint = '<otras>'
+                    stats = self.query_stats.get(fingerprint)
+                if stats is None:
+                    stats = self.query_stats[fingerprint] = QueryStats(fingerprint, operation)
+            stats.record(seconds, failed)
+        
+        if seconds * 1000 >= self.config.get('DB_SLOW_QUERY_MS', 500):
+            # Solo se registran los tipos de los parámetros, nunca sus valores
+            param_types = ', '.join(type(param).__name__ for param in params) if params else ''
+            slow_query_logger.warning(
+                f"{seconds * 1000:.0f} ms [{operation}]{' ERROR' if failed else ''} "
+                f"{fingerprint} -- params({param_types})"
+            )
+    
+    def get_query_statistics(self, sort_by: str = 'total_ms', limit: int = 50) -> Dict[str, Any]:
+        """Tiempos agregados por sentencia normalizada, ordenados por sort_by"""
+        with self.query_stats_lock:
+            entries = [stats.to_dict() for stats in self.query_stats.values()]
+        
+        if sort_by not in ('total_ms', 'mean_ms', 'max_ms', 'p95_ms', 'count', 'errors'):
+            sort_by = 'total_ms'
+        entries.sort(key=lambda entry: entry[sort_by] or 0, reverse=True)
+        
+        return {
+            'slow_query_threshold_ms': self.config.get('DB_SLOW_QUERY_MS', 500),
+            'fingerprints': len(entries),
+            'total_queries': sum(entry['count'] for entry in entries),
+            'total_ms': round(sum(entry['total_ms'] for entry in entries), 1),
+            'sort_by': sort_by,
+            'queries': entries[:limit]
+        }
+    
+    def reset_query_statistics(self):
+        """Descarta los tiempos acumulados por sentencia"""
+        with self.query_stats_lock:
+            self.query_stats.clear()
+    
     def test_connection(self) -> bool:
         """Prueba la conexión a la base de datos"""
         try:
@@ -248,10 +490,105 @@ class DatabaseManager:
         
         return devices
     
+    # ------------------------------------
+    # Outbox local
+    # ------------------------------------
+    
+    @staticmethod
+    def is_connection_error(error: Exception) -> bool:
+        """True si el error es de conexión con SQL Server (no de datos ni de sentencia)"""
+        if isinstance(error, (pyodbc.OperationalError, pyodbc.InterfaceError)):
+            return True
+        sqlstate = error.args[0] if isinstance(error, pyodbc.Error) and error.args else ''
+        return isinstance(sqlstate, str) and (sqlstate.startswith('08') or sqlstate in ('HYT00', 'HYT01'))
+    
+    def _write_or_outbox(self, operation: str, params: Dict[str, Any], write):
+        """Ejecuta la escritura o la deja en el outbox si SQL Server no responde (resultado None)"""
+        if not self.outbox:
+            return write()
+        
+        # Con escrituras pendientes todo pasa por el outbox para conservar el orden
+        if self.outbox.pending:
+            self.outbox.add(operation, params)
+            return None
+        
+        try:
+            return write()
+        except Exception as e:
+            if not self.is_connection_error(e):
+                raise
+            self.outbox.add(operation, params, error=e)
+            return None
+    
+    def _replay_outbox(self, operation: str, params_list: List[Dict[str, Any]]) -> List[Any]:
+        """Aplica escrituras del outbox; los eventos van en una carga masiva con su hora de recepción"""
+        if operation == 'log_access_event':
+            self._insert_access_events(params_list)
+            return [None] * len(params_list)
+        
+        handlers = {
+            'enqueue_sync_task': self._enqueue_sync_task,
+            'update_task_status': self._update_task_status
+        }
+        return [
+            handlers[operation](**{key: value for key, value in params.items() if key != '_created_at'})
+            for params in params_list
+        ]
+    
+    def _insert_access_events(self, params_list: List[Dict[str, Any]]) -> int:
+        """INSERT masivo equivalente a SP_LogAccessEvent, con ReceivedAt del momento en que llegó el evento"""
+        query = """
+        INSERT INTO access_events (
+            DeviceIP, EventType, EventCode, PersonaID, EmployeeNo,
+            PersonName, VerifyMode, AccessResult, EventTime, RawData, ProcessedBy, ReceivedAt
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'FacialSyncService', ?)
+        """
+        
+        rows = [
+            [
+                params['device_ip'], params['event_type'], params.get('event_code'), params.get('persona_id'),
+                params.get('employee_no'), params.get('person_name'), params.get('verify_mode'),
+                params.get('access_result'), params.get('event_time'), params.get('raw_data'),
+                datetime.fromisoformat(params['_created_at'])
+            ]
+            for params in params_list
+        ]
+        
+        return self.execute_many(query, rows)
+    
+    def start_outbox(self):
+        """Inicia el reenvío del outbox local (las escrituras pendientes de una ejecución anterior primero)"""
+        if self.outbox:
+            self.outbox.start(self._replay_outbox, self.is_connection_error, bulk_operations=('log_access_event',))
+            if self.outbox.pending:
+                self.outbox.replay_now()
+    
+    def stop_outbox(self):
+        if self.outbox:
+            self.outbox.close()
+    
+    def get_outbox_status(self) -> Dict[str, Any]:
+        if not self.outbox:
+            return {'enabled': False}
+        return {'enabled': True, **self.outbox.get_status()}
+    
+    # ------------------------------------
+    # Tareas y eventos
+    # ------------------------------------
+    
     def enqueue_sync_task(self, task_type: str, facial_id: int = None, 
                          persona_id: int = None, task_data: Dict = None, 
                          priority: int = 1) -> int:
-        """Encola una tarea de sincronización"""
+        """Encola una tarea de sincronización (None si quedó en el outbox local)"""
+        params = {
+            'task_type': task_type, 'facial_id': facial_id, 'persona_id': persona_id,
+            'task_data': task_data, 'priority': priority
+        }
+        return self._write_or_outbox('enqueue_sync_task', params, lambda: self._enqueue_sync_task(**params))
+    
+    def _enqueue_sync_task(self, task_type: str, facial_id: int = None, 
+                          persona_id: int = None, task_data: Dict = None, 
+                          priority: int = 1) -> int:
         task_data_json = json.dumps(task_data) if task_data else None
         
         results = self.execute_procedure('SP_EnqueueSyncTask', [
@@ -282,6 +619,10 @@ class DatabaseManager:
     
     def update_task_status(self, task_id: int, status: str, error: str = None):
         """Actualiza el estado de una tarea"""
+        params = {'task_id': task_id, 'status': status, 'error': error}
+        self._write_or_outbox('update_task_status', params, lambda: self._update_task_status(**params))
+    
+    def _update_task_status(self, task_id: int, status: str, error: str = None):
         self.execute_procedure('SP_UpdateTaskStatus', [task_id, status, error])
     
     def log_access_event(self, device_ip: str, event_type: str, event_code: str = None,
@@ -289,7 +630,20 @@ class DatabaseManager:
                         person_name: str = None, verify_mode: str = None,
                         access_result: str = None, event_time: str = None,
                         raw_data: str = None) -> int:
-        """Registra un evento de acceso"""
+        """Registra un evento de acceso (None si quedó en el outbox local)"""
+        params = {
+            'device_ip': device_ip, 'event_type': event_type, 'event_code': event_code,
+            'persona_id': persona_id, 'employee_no': employee_no, 'person_name': person_name,
+            'verify_mode': verify_mode, 'access_result': access_result, 'event_time': event_time,
+            'raw_data': raw_data
+        }
+        return self._write_or_outbox('log_access_event', params, lambda: self._log_access_event(**params))
+    
+    def _log_access_event(self, device_ip: str, event_type: str, event_code: str = None,
+                         persona_id: int = None, employee_no: str = None, 
+                         person_name: str = None, verify_mode: str = None,
+                         access_result: str = None, event_time: str = None,
+                         raw_data: str = None) -> int:
         results = self.execute_procedure('SP_LogAccessEvent', [
             device_ip, event_type, event_code, persona_id, employee_no,
             person_name, verify_mode, access_result, event_time, raw_data
@@ -352,6 +706,77 @@ class DatabaseManager:
         
         return None
     
+    def get_active_faces_chunk(self, after_facial_id: int = 0, chunk_size: int = 100) -> List[Dict[str, Any]]:
+        """Obtiene un bloque de rostros activos ordenados por FacialID (paginación por clave)"""
+        query = """
+        SELECT TOP (?) f.FacialID, f.TemplateData, f.Activo,
+               p.PersonaID, p.Nombre, p.Apellido
+        FROM face f
+        LEFT JOIN perface pf ON f.FacialID = pf.FacialID
+        LEFT JOIN per p ON pf.PersonaID = p.PersonaID
+        WHERE f.Activo = 1 AND f.FacialID > ?
+        ORDER BY f.FacialID
+        """
+        
+        results = self.execute_query(query, [chunk_size, after_facial_id])
+        
+        faces = []
+        seen_ids = set()
+        for row in results:
+            # Un rostro vinculado a varias personas aparece repetido
+            if row[0] in seen_ids:
+                continue
+            seen_ids.add(row[0])
+            
+            faces.append({
+                'facial_id': row[0],
+                'template_data': row[1],
+                'activo': row[2],
+                'persona_id': row[3],
+                'nombre': row[4],
+                'apellido': row[5]
+            })
+        
+        return faces
+    
+    def get_facial_persona_links(self, after_facial_id: int = 0, facial_ids: List[int] = None) -> List[Tuple[int, int]]:
+        """Pares (FacialID, PersonaID) de perface: FacialID > after_facial_id, o los de facial_ids"""
+        query = "SELECT FacialID, PersonaID FROM perface WHERE PersonaID IS NOT NULL"
+        
+        if facial_ids:
+            query += f" AND FacialID IN ({', '.join('?' for _ in facial_ids)})"
+            params = list(facial_ids)
+        else:
+            query += " AND FacialID > ?"
+            params = [after_facial_id]
+        
+        query += " ORDER BY FacialID, PersonaID"
+        
+        return [(row[0], row[1]) for row in self.execute_query(query, params)]
+    
+    def count_active_faces(self, after_facial_id: int = 0) -> int:
+        """Cuenta rostros activos con FacialID mayor al indicado"""
+        query = "SELECT COUNT(*) FROM face WHERE Activo = 1 AND FacialID > ?"
+        return self.execute_scalar(query, [after_facial_id]) or 0
+    
+    def get_open_task_keys(self) -> set:
+        """Obtiene (TaskType, FacialID, DispositivoID) de tareas pendientes o en proceso (None = todos)"""
+        query = """
+        SELECT TaskType, FacialID, TaskData
+        FROM sync_queue
+        WHERE Status IN ('PENDING', 'PROCESSING')
+        """
+        
+        keys = set()
+        for task_type, facial_id, task_data in self.execute_query(query):
+            try:
+                device_ids = (json.loads(task_data) if task_data else {}).get('device_ids')
+            except (ValueError, AttributeError):
+                device_ids = None
+            for device_id in device_ids or [None]:
+                keys.add((task_type, facial_id, device_id))
+        return keys
+    
     def update_device_status(self, dispositivo_id: str, is_online: bool, 
                            last_error: str = None, face_count: int = None):
         """Actualiza el estado de un dispositivo"""
@@ -416,17 +841,120 @@ class DatabaseManager:
         
         return devices
     
+    def update_device_snapshot(self, dispositivo_id: str, version: str, capabilities: str):
+        """Guarda versión de firmware y snapshot de capacidades (JSON) de un dispositivo"""
+        query = """
+        IF EXISTS (SELECT 1 FROM device_status WHERE DispositivoID = ?)
+            UPDATE device_status
+            SET Version = ?, Capabilities = ?, UpdatedAt = GETDATE()
+            WHERE DispositivoID = ?
+        ELSE
+            INSERT INTO device_status (DispositivoID, Version, Capabilities)
+            VALUES (?, ?, ?)
+        """
+        
+        self.execute_non_query(query, [
+            dispositivo_id, version, capabilities, dispositivo_id,
+            dispositivo_id, version, capabilities
+        ])
+    
+    def get_device_snapshots(self) -> Dict[str, str]:
+        """Obtiene los snapshots de capacidades guardados por dispositivo"""
+        query = """
+        SELECT DispositivoID, Capabilities FROM device_status
+        WHERE Capabilities IS NOT NULL
+        """
+        results = self.execute_query(query)
+        
+        return {row[0]: row[1] for row in results}
+    
+    def get_device_face_hashes(self, dispositivo_id: str) -> Dict[str, str]:
+        """Obtiene los hashes de contenido de rostros subidos a un dispositivo"""
+        query = "SELECT FPID, ContentHash FROM device_face_hash WHERE DispositivoID = ?"
+        results = self.execute_query(query, [dispositivo_id])
+        
+        return {row[0]: row[1] for row in results}
+    
+    def save_device_face_hash(self, dispositivo_id: str, fpid: str, content_hash: str):
+        """Registra el hash de contenido de un rostro subido a un dispositivo"""
+        query = """
+        IF EXISTS (SELECT 1 FROM device_face_hash WHERE DispositivoID = ? AND FPID = ?)
+            UPDATE device_face_hash
+            SET ContentHash = ?, UpdatedAt = GETDATE()
+            WHERE DispositivoID = ? AND FPID = ?
+        ELSE
+            INSERT INTO device_face_hash (DispositivoID, FPID, ContentHash)
+            VALUES (?, ?, ?)
+        """
+        
+        self.execute_non_query(query, [
+            dispositivo_id, fpid, content_hash, dispositivo_id, fpid,
+            dispositivo_id, fpid, content_hash
+        ])
+    
+    def delete_device_face_hash(self, dispositivo_id: str, fpid: str = None) -> int:
+        """Elimina hashes registrados de un dispositivo (uno o todos)"""
+        if fpid is not None:
+            query = "DELETE FROM device_face_hash WHERE DispositivoID = ? AND FPID = ?"
+            return self.execute_non_query(query, [dispositivo_id, fpid])
+        
+        query = "DELETE FROM device_face_hash WHERE DispositivoID = ?"
+        return self.execute_non_query(query, [dispositivo_id])
+    
+    def delete_expired_chunk(self, target: str, cutoff: datetime, chunk_size: int = 1000) -> int:
+        """Borra hasta chunk_size filas vencidas (anteriores a cutoff) de un destino de RETENTION_QUERIES"""
+        return self.execute_non_query(RETENTION_QUERIES[target], [int(chunk_size), cutoff])
+    
+    def get_expired_events_chunk(self, cutoff: datetime, chunk_size: int = 1000, min_id: int = None,
+                                 max_id: int = None) -> List[Dict[str, Any]]:
+        """Próximas chunk_size filas de access_events vencidas (mismo criterio que RETENTION_QUERIES), por ID"""
+        query = """
+        SELECT TOP (?) ID, DeviceIP, EventType, EventCode, PersonaID, EmployeeNo, PersonName,
+               VerifyMode, AccessResult, EventTime, ReceivedAt, RawData, ProcessedBy
+        FROM access_events
+        WHERE ReceivedAt < ?
+        """
+        params = [int(chunk_size), cutoff]
+        
+        if min_id is not None:
+            query += " AND ID >= ?"
+            params.append(min_id)
+        if max_id is not None:
+            query += " AND ID <= ?"
+            params.append(max_id)
+        query += " ORDER BY ID"
+        
+        columns = ['id', 'device_ip', 'event_type', 'event_code', 'persona_id', 'employee_no', 'person_name',
+                   'verify_mode', 'access_result', 'event_time', 'received_at', 'raw_data', 'processed_by']
+        return [dict(zip(columns, row)) for row in self.execute_query(query, params)]
+    
+    def delete_events_range(self, min_id: int, max_id: int, cutoff: datetime) -> int:
+        """Borra las filas vencidas con ID en [min_id, max_id] (exactamente las de get_expired_events_chunk)"""
+        query = "DELETE FROM access_events WHERE ID BETWEEN ? AND ? AND ReceivedAt < ?"
+        return self.execute_non_query(query, [min_id, max_id, cutoff])
+    
+    def purge_expired(self, target: str, days_old: int, chunk_size: int = 1000, pause: float = 0.1) -> int:
+        """Borra en bloques todas las filas vencidas de un destino, con pausa entre bloques"""
+        cutoff = datetime.now() - timedelta(days=days_old)
+        total = 0
+        
+        while True:
+            deleted = self.delete_expired_chunk(target, cutoff, chunk_size)
+            total += max(deleted, 0)
+            if deleted < chunk_size:
+                return total
+            time.sleep(pause)
+    
     def cleanup_old_data(self, days_old: int = 30):
-        """Limpia datos antiguos de logs y eventos"""
+        """Limpia datos antiguos de logs y eventos (en bloques, ver RetentionWorker)"""
         try:
             # Limpiar tareas completadas
-            self.execute_procedure('SP_CleanupCompletedTasks', [days_old])
+            tasks = self.purge_expired('sync_queue', days_old)
             
             # Limpiar eventos antiguos
-            query = "DELETE FROM access_events WHERE ReceivedAt < DATEADD(DAY, -?, GETDATE())"
-            self.execute_non_query(query, [days_old])
+            events = self.purge_expired('access_events', days_old)
             
-            logging.info(f"Limpieza de datos antiguos completada ({days_old} días)")
+            logging.info(f"Limpieza de datos antiguos completada ({days_old} días): {tasks} tareas, {events} eventos")
             
         except Exception as e:
             logging.error(f"Error en limpieza de datos: {e}")
@@ -456,7 +984,11 @@ class DatabaseManager:
         return stats
     
     def get_event_statistics(self) -> Dict[str, Any]:
-        """Obtiene estadísticas de eventos"""
+        """Obtiene estadísticas de eventos (de los agregados del EventProcessor si están cargados)"""
+        stats = get_event_aggregator().get_statistics(24)
+        if stats is not None:
+            return stats
+        
         query = """
         SELECT 
             DeviceIP,
@@ -483,6 +1015,134 @@ class DatabaseManager:
         
         return stats
     
+    def get_recent_access_events(self, limit: int, device_ip: str = None) -> List[Dict[str, Any]]:
+        """Eventos más recientes de access_events (por EventTime), opcionalmente de un dispositivo"""
+        query = """
+        SELECT TOP (?) DeviceIP, EventType, EventCode, PersonName, AccessResult, EventTime, RawData
+        FROM access_events
+        """
+        params = [int(limit)]
+        
+        if device_ip:
+            query += " WHERE DeviceIP = ?"
+            params.append(device_ip)
+        
+        query += " ORDER BY EventTime DESC"
+        
+        return [{
+            'device_ip': row[0],
+            'event_type': row[1],
+            'event_code': row[2],
+            'person_name': row[3],
+            'access_result': row[4],
+            'event_time': row[5].isoformat() if row[5] else None,
+            'raw_data': row[6]
+        } for row in self.execute_query(query, params)]
+    
+    def get_event_minute_counts(self, hours: float = 24) -> List[Tuple]:
+        """Conteos por (DeviceIP, AccessResult, minuto desde 1970) de las últimas horas, para EventAggregator"""
+        query = """
+        SELECT 
+            DeviceIP,
+            AccessResult,
+            DATEDIFF(MINUTE, '19700101', EventTime) as EventMinute,
+            COUNT(*) as Count
+        FROM access_events 
+        WHERE EventTime >= DATEADD(MINUTE, -?, GETDATE())
+        GROUP BY DeviceIP, AccessResult, DATEDIFF(MINUTE, '19700101', EventTime)
+        """
+        
+        return [tuple(row) for row in self.execute_query(query, [int(hours * 60)])]
+    
+    def upsert_event_hourly(self, counts: Dict[Tuple[str, str, datetime], int]):
+        """Suma conteos (DeviceIP, AccessResult, HourStart) -> cantidad en access_events_hourly"""
+        items = list(counts.items())
+        
+        # Un MERGE por bloque (límite de 2100 parámetros por sentencia en SQL Server)
+        for start in range(0, len(items), HOURLY_UPSERT_CHUNK):
+            chunk = items[start:start + HOURLY_UPSERT_CHUNK]
+            values = ', '.join(['(?, ?, ?, ?)'] * len(chunk))
+            query = f"""
+            MERGE access_events_hourly AS target
+            USING (VALUES {values}) AS source (DeviceIP, AccessResult, HourStart, EventCount)
+            ON target.DeviceIP = source.DeviceIP
+               AND target.AccessResult = source.AccessResult
+               AND target.HourStart = source.HourStart
+            WHEN MATCHED THEN
+                UPDATE SET EventCount = target.EventCount + source.EventCount, UpdatedAt = GETDATE()
+            WHEN NOT MATCHED THEN
+                INSERT (DeviceIP, AccessResult, HourStart, EventCount)
+                VALUES (source.DeviceIP, source.AccessResult, source.HourStart, source.EventCount);
+            """
+            
+            params = []
+            for (device_ip, access_result, hour_start), count in chunk:
+                params.extend([device_ip, access_result, hour_start, count])
+            
+            self.execute_non_query(query, params)
+    
+    def rebuild_event_hourly(self, start: datetime, end: datetime) -> int:
+        """Recalcula access_events_hourly desde access_events para las horas en [start, end)"""
+        query = """
+        DELETE FROM access_events_hourly WHERE HourStart >= ? AND HourStart < ?;
+        
+        INSERT INTO access_events_hourly (DeviceIP, AccessResult, HourStart, EventCount)
+        SELECT 
+            DeviceIP,
+            ISNULL(AccessResult, 'UNKNOWN'),
+            DATEADD(HOUR, DATEDIFF(HOUR, 0, EventTime), 0),
+            COUNT(*)
+        FROM access_events
+        WHERE EventTime >= ? AND EventTime < ?
+        GROUP BY DeviceIP, ISNULL(AccessResult, 'UNKNOWN'), DATEADD(HOUR, DATEDIFF(HOUR, 0, EventTime), 0);
+        """
+        
+        return self.execute_non_query(query, [start, end, start, end])
+    
+    def get_oldest_event_time(self) -> Optional[datetime]:
+        """EventTime más antiguo de access_events (None si está vacía)"""
+        return self.execute_scalar("SELECT MIN(EventTime) FROM access_events")
+    
+    def get_event_counts(self, since: datetime, until: datetime = None, device_ip: str = None,
+                         group_by: str = None, use_rollup: bool = True) -> List[Tuple]:
+        """Conteos (DeviceIP, AccessResult[, período], cantidad) en [since, until), de access_events_hourly o access_events"""
+        if group_by not in (None, 'hour', 'day'):
+            raise ValueError(f"Agrupación no soportada: {group_by}")
+        
+        if use_rollup:
+            table, time_column, count = 'access_events_hourly', 'HourStart', 'SUM(EventCount)'
+            result_column = 'AccessResult'
+        else:
+            table, time_column, count = 'access_events', 'EventTime', 'COUNT(*)'
+            result_column = "ISNULL(AccessResult, 'UNKNOWN')"
+        
+        periods = {
+            'hour': f"DATEADD(HOUR, DATEDIFF(HOUR, 0, {time_column}), 0)",
+            'day': f"CAST({time_column} AS DATE)"
+        }
+        group_columns = ['DeviceIP', result_column]
+        if group_by:
+            group_columns.insert(0, periods[group_by])
+        
+        conditions = [f"{time_column} >= ?"]
+        params: List[Any] = [since]
+        if until:
+            conditions.append(f"{time_column} < ?")
+            params.append(until)
+        if device_ip:
+            conditions.append("DeviceIP = ?")
+            params.append(device_ip)
+        
+        query = f"""
+        SELECT {', '.join(group_columns)}, {count}
+        FROM {table}
+        WHERE {' AND '.join(conditions)}
+        GROUP BY {', '.join(group_columns)}
+        ORDER BY {', '.join(group_columns)}
+        """
+        
+        return [tuple(row) for row in self.execute_query(query, params)]
+    
     def close_all_connections(self):
         """Cierra todas las conexiones del pool"""
         with self.pool_lock:
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Outbox local para Facial Sync Service
+Guarda en SQLite las escrituras a SQL Server mientras la BD no responde y las reenvía en orden al volver
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple, Any, Callable
+
+from metrics import registry
+
+OUTBOX_WRITES = registry.counter(
+    'facial_sync_outbox_writes_total', 'Escrituras guardadas en el outbox local por operación', ['operation']
+)
+OUTBOX_REPLAYED = registry.counter(
+    'facial_sync_outbox_replayed_total', 'Escrituras del outbox aplicadas en SQL Server por operación', ['operation']
+)
+OUTBOX_FAILED = registry.counter(
+    'facial_sync_outbox_failed_total', 'Escrituras del outbox descartadas tras agotar reintentos', ['operation']
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    ID          INTEGER PRIMARY KEY AUTOINCREMENT,
+    Operation   TEXT NOT NULL,
+    Params      TEXT NOT NULL,
+    CreatedAt   TEXT NOT NULL,
+    Status      TEXT NOT NULL DEFAULT 'PENDING',
+    Attempts    INTEGER NOT NULL DEFAULT 0,
+    LastError   TEXT,
+    NextAttemptAt REAL
+);
+CREATE INDEX IF NOT EXISTS IX_Outbox_Status ON outbox (Status, ID);
+"""
+
+def _json_default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+class DatabaseOutbox:
+    """Cola FIFO durable (SQLite en modo WAL) de escrituras pendientes para SQL Server"""
+    
+    def __init__(self, path: str = 'outbox.db', synchronous: str = 'NORMAL', replay_interval: float = 5.0,
+                 batch_size: int = 500, max_attempts: int = 5, retry_max_delay: float = 300.0):
+        self.path = Path(path)
+        self.replay_interval = replay_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_max_delay = retry_max_delay
+        
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(f"PRAGMA synchronous={synchronous}")
+        self.connection.executescript(SCHEMA)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(outbox)")]
+        if 'NextAttemptAt' not in columns:
+            # Outbox creado por una versión anterior
+            self.connection.execute("ALTER TABLE outbox ADD COLUMN NextAttemptAt REAL")
+        self.lock = threading.Lock()
+        
+        # Pendientes en memoria: el camino normal consulta pending sin tocar el archivo
+        self.pending = self.connection.execute("SELECT COUNT(*) FROM outbox WHERE Status = 'PENDING'").fetchone()[0]
+        
+        # Callbacks por operación con el resultado del reenvío (p.ej. ID real de una tarea)
+        self.replayed_callbacks: Dict[str, List[Callable]] = {}
+        
+        # Replayer
+        self.is_running = False
+        self.replay_thread = None
+        self.wake_event = threading.Event()
+        
+        self.stats = {
+            'written': 0,
+            'replayed': 0,
+            'failed': 0,
+            'replay_batches': 0,
+            'offline_since': None,
+            'last_replay': None,
+            'last_error': None
+        }
+        
+        registry.gauge('facial_sync_outbox_pending', 'Escrituras en el outbox local pendientes de reenviar',
+                       function=lambda: self.pending)
+        
+        if self.pending:
+            logging.warning(f"📮 {self.pending} escrituras pendientes en el outbox local ({self.path})")
+    
+    # ------------------------------------
+    # Escritura
+    # ------------------------------------
+    
+    def add(self, operation: str, params: Dict[str, Any], error: Exception = None):
+        """Guarda una escritura al final del outbox"""
+        payload = json.dumps(params, ensure_ascii=False, default=_json_default)
+        
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO outbox (Operation, Params, CreatedAt) VALUES (?, ?, ?)",
+                [operation, payload, datetime.now().isoformat()]
+            )
+            self.pending += 1
+        
+        self.stats['written'] += 1
+        OUTBOX_WRITES.labels(operation).inc()
+        
+        if error is not None and self.stats['offline_since'] is None:
+            self.stats['offline_since'] = datetime.now()
+            self.stats['last_error'] = str(error)
+            logging.warning(f"📮 SQL Server no disponible, escrituras al outbox local: {error}")
+    
+    def on_replayed(self, operation: str, callback: Callable[[Dict[str, Any], Any], None]):
+        """Registra callback(params, resultado) para cada escritura reenviada de una operación"""
+        self.replayed_callbacks.setdefault(operation, []).append(callback)
+    
+    # ------------------------------------
+    # Reenvío
+    # ------------------------------------
+    
+    def start(self, replay: Callable[[str, List[Dict[str, Any]]], List[Any]],
+              is_connection_error: Callable[[Exception], bool], bulk_operations: Tuple[str, ...] = ()):
+        """Inicia el replayer: replay(operación, [params...]) devuelve un resultado por escritura"""
+        if self.is_running:
+            return
+        
+        self.replay = replay
+        self.is_connection_error = is_connection_error
+        # Solo estas se agrupan: el resto se aplica de a una (un reintento no duplica lo ya aplicado)
+        self.bulk_operations = set(bulk_operations)
+        self.is_running = True
+        self.replay_thread = threading.Thread(target=self._replay_loop, name='OutboxReplayer', daemon=True)
+        self.replay_thread.start()
+    
+    def stop(self):
+        if not self.is_running:
+            return
+        
+        self.is_running = False
+        self.wake_event.set()
+        if self.replay_thread and self.replay_thread.is_alive():
+            self.replay_thread.join(timeout=10)
+    
+    def _replay_loop(self):
+        while self.is_running:
+            self.wake_event.wait(self.replay_interval)
+            self.wake_event.clear()
+            if not self.is_running:
+                break
+            
+            try:
+                # Mientras haya lotes completos se sigue sin esperar
+                while self.is_running and self.pending and self.replay_pending():
+                    pass
+            except Exception as e:
+                self.stats['last_error'] = str(e)
+                logging.error(f"Error reenviando outbox: {e}")
+    
+    def replay_now(self):
+        """Despierta al replayer (p.ej. al detectar que la BD volvió)"""
+        self.wake_event.set()
+    
+    def _peek(self) -> List[Tuple[int, str, Dict[str, Any], str, int]]:
+        """Próximo lote en orden, sin las escrituras rechazadas que todavía esperan su reintento"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT ID, Operation, Params, CreatedAt, Attempts FROM outbox "
+                "WHERE Status = 'PENDING' AND (NextAttemptAt IS NULL OR NextAttemptAt <= ?) ORDER BY ID LIMIT ?",
+                [time.time(), self.batch_size]
+            ).fetchall()
+        return [(row[0], row[1], json.loads(row[2]), row[3], row[4]) for row in rows]
+    
+    def replay_pending(self) -> bool:
+        """Reenvía un lote en orden; True si se aplicó completo y puede haber más"""
+        entries = self._peek()
+        if not entries:
+            return False
+        
+        # Escrituras consecutivas de una operación masiva van juntas
+        groups: List[List[Tuple]] = []
+        for entry in entries:
+            if groups and groups[-1][0][1] == entry[1] and entry[1] in self.bulk_operations:
+                groups[-1].append(entry)
+            else:
+                groups.append([entry])
+        
+        for group in groups:
+            if not self._replay_group(group):
+                return False
+        
+        self.stats['replay_batches'] += 1
+        self.stats['last_replay'] = datetime.now()
+        if self.stats['offline_since'] is not None and not self.pending:
+            logging.info(f"✅ Outbox local vaciado (SQL Server sin conexión desde {self.stats['offline_since']:%H:%M:%S})")
+            self.stats['offline_since'] = None
+        return len(entries) == self.batch_size
+    
+    def _replay_group(self, group: List[Tuple]) -> bool:
+        """Aplica un grupo; False si la BD sigue sin conexión (se reintenta en el próximo ciclo)"""
+        operation = group[0][1]
+        try:
+            results = self.replay(operation, [self._with_created_at(entry) for entry in group])
+        
+        except Exception as e:
+            if self.is_connection_error(e):
+                self.stats['last_error'] = str(e)
+                return False
+            if len(group) > 1:
+                # Un error de datos en la carga masiva: se aíslan de a una para no trabar el resto
+                return all(self._replay_group([entry]) for entry in group)
+            self._record_failure(group[0], e)
+            return True
+        
+        self._delete([entry[0] for entry in group])
+        self.stats['replayed'] += len(group)
+        OUTBOX_REPLAYED.labels(operation).inc(len(group))
+        
+        for entry, result in zip(group, results):
+            for callback in self.replayed_callbacks.get(operation, []):
+                try:
+                    callback(entry[2], result)
+                except Exception as e:
+                    logging.error(f"Error en callback de outbox ({operation}): {e}")
+        return True
+    
+    @staticmethod
+    def _with_created_at(entry: Tuple) -> Dict[str, Any]:
+        params = dict(entry[2])
+        params['_created_at'] = entry[3]
+        return params
+    
+    def _delete(self, ids: List[int]):
+        with self.lock:
+            self.connection.executemany("DELETE FROM outbox WHERE ID = ?", [(entry_id,) for entry_id in ids])
+            self.pending -= len(ids)
+    
+    def _record_failure(self, entry: Tuple, error: Exception):
+        entry_id, operation, _, _, attempts = entry
+        attempts += 1
+        failed = attempts >= self.max_attempts
+        # Backoff exponencial: sin él, el lote siguiente la vuelve a tomar y agota los intentos en ms
+        delay = min(self.replay_interval * (2 ** (attempts - 1)), self.retry_max_delay)
+        
+        with self.lock:
+            self.connection.execute(
+                "UPDATE outbox SET Attempts = ?, LastError = ?, Status = ?, NextAttemptAt = ? WHERE ID = ?",
+                [attempts, str(error), 'FAILED' if failed else 'PENDING', time.time() + delay, entry_id]
+            )
+            if failed:
+                self.pending -= 1
+        
+        self.stats['last_error'] = str(error)
+        if failed:
+            self.stats['failed'] += 1
+            OUTBOX_FAILED.labels(operation).inc()
+            logging.error(f"❌ Escritura {operation} del outbox descartada tras {attempts} intentos: {error}")
+        else:
+            logging.warning(f"Error reenviando {operation} del outbox (intento {attempts}, "
+                            f"reintento en {delay:.0f}s): {error}")
+    
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            by_operation = dict(self.connection.execute(
+                "SELECT Operation, COUNT(*) FROM outbox WHERE Status = 'PENDING' GROUP BY Operation"
+            ).fetchall())
+            failed = self.connection.execute("SELECT COUNT(*) FROM outbox WHERE Status = 'FAILED'").fetchone()[0]
+        
+        stats = self.stats.copy()
+        for key in ('offline_since', 'last_replay'):
+            stats[key] = stats[key].isoformat() if stats[key] else None
+        
+        return {
+            'path': str(self.path),
+            'is_running': self.is_running,
+            'pending': self.pending,
+            'pending_by_operation': by_operation,
+            'failed': failed,
+            'stats': stats
+        }
+    
+    def close(self):
+        self.stop()
+        with self.lock:
+            self.connection.close()
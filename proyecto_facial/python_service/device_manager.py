@@ -10,16 +10,97 @@ import logging
 import time
 import json
 import base64
-from typing import Dict, List, Tuple, Any, Optional
+import hashlib
+import re
+import socket
+from typing import Dict, List, Set, Tuple, Any, Optional
 from requests.auth import HTTPDigestAuth
 import urllib3
 from datetime import datetime
+from urllib.parse import urlsplit
+from collections import deque
 import threading
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import registry
 
 # Deshabilitar warnings SSL
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+DEVICE_REQUEST_SECONDS = registry.histogram(
+    'facial_sync_device_request_seconds', 'Duración de requests ISAPI por dispositivo', ['device', 'kind']
+)
+DEVICE_REQUEST_FAILURES = registry.counter(
+    'facial_sync_device_request_failures_total', 'Requests ISAPI fallidos (red/timeout)', ['device', 'kind']
+)
+
+class DeviceLatency:
+    """Latencia observada de un dispositivo: EWMA, desviación y percentiles recientes"""
+    
+    def __init__(self, alpha: float = 0.2, window: int = 200):
+        self.alpha = alpha
+        self.ewma: Optional[float] = None
+        self.deviation = 0.0
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.lock = threading.Lock()
+    
+    def record(self, seconds: float):
+        """Registra la duración de un request completado"""
+        with self.lock:
+            if self.ewma is None:
+                self.ewma = seconds
+                self.deviation = seconds / 2
+            else:
+                # Igual que el RTO de TCP: la desviación se actualiza antes que la media
+                self.deviation += self.alpha * (abs(seconds - self.ewma) - self.deviation)
+                self.ewma += self.alpha * (seconds - self.ewma)
+            
+            self.samples.append(seconds)
+            self.count += 1
+            self.consecutive_failures = 0
+    
+    def record_failure(self):
+        """Registra un request sin respuesta (timeout o error de conexión)"""
+        with self.lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+    
+    def percentile(self, pct: float) -> Optional[float]:
+        """Percentil de las muestras recientes"""
+        with self.lock:
+            if not self.samples:
+                return None
+            ordered = sorted(self.samples)
+        
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+    
+    def estimate(self) -> Optional[float]:
+        """Peor latencia esperable: max(p99, EWMA + 4 desviaciones)"""
+        if self.ewma is None:
+            return None
+        return max(self.percentile(99), self.ewma + 4 * self.deviation)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Resumen en milisegundos"""
+        def ms(value):
+            return round(value * 1000, 1) if value is not None else None
+        
+        return {
+            'samples': self.count,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'ewma_ms': ms(self.ewma),
+            'deviation_ms': ms(self.deviation) if self.ewma is not None else None,
+            'p50_ms': ms(self.percentile(50)),
+            'p95_ms': ms(self.percentile(95)),
+            'p99_ms': ms(self.percentile(99))
+        }
+
 class DeviceManager:
     """Gestor de dispositivos Hikvision"""
     
@@ -30,6 +111,31 @@ class DeviceManager:
         # Configuración de timeouts
         self.timeout = config.get('DEVICE_TIMEOUT', 10)
         self.retry_count = config.get('DEVICE_RETRY_COUNT', 2)
+        self.upload_timeout = config.get('DEVICE_UPLOAD_TIMEOUT', 30)
+        
+        # Timeouts adaptativos según la latencia observada de cada dispositivo
+        self.adaptive_timeout = config.get('DEVICE_TIMEOUT_ADAPTIVE', True)
+        self.connect_timeout_min = config.get('DEVICE_CONNECT_TIMEOUT_MIN', 0.3)
+        self.connect_timeout_max = config.get('DEVICE_CONNECT_TIMEOUT_MAX', 5.0)
+        self.connect_timeout_initial = config.get('DEVICE_CONNECT_TIMEOUT_INITIAL', 1.0)
+        self.connect_probe_interval = config.get('DEVICE_CONNECT_PROBE_INTERVAL', 60)
+        self.read_timeout_min = config.get('DEVICE_READ_TIMEOUT_MIN', 2.0)
+        self.read_timeout_max = config.get('DEVICE_READ_TIMEOUT_MAX', 120.0)
+        self.latency_alpha = config.get('DEVICE_LATENCY_ALPHA', 0.2)
+        self.latency_window = config.get('DEVICE_LATENCY_WINDOW', 200)
+        self.min_latency_samples = config.get('DEVICE_LATENCY_MIN_SAMPLES', 5)
+        
+        # Snapshot de info/capacidades por dispositivo (persistido en device_status)
+        self.info_refresh_interval = config.get('DEVICE_INFO_REFRESH_INTERVAL', 86400)
+        self.device_snapshots: Dict[str, Dict[str, Any]] = {}
+        self.snapshots_loaded = False
+        self.snapshot_lock = threading.Lock()
+        
+        # Latencias por (device_id, tipo de request)
+        self.device_latency: Dict[Tuple[str, str], DeviceLatency] = {}
+        self.latency_lock = threading.Lock()
+        # Último sondeo TCP por dispositivo (monotonic), para medir el connect aparte
+        self.connect_probes: Dict[str, float] = {}
         
         # Cache de sesiones por dispositivo
         self.device_sessions = {}
@@ -38,6 +144,12 @@ class DeviceManager:
         # Configuración Hikvision
         self.hik_config = config.get_hikvision_config()
         
+        # Registro de hashes de rostros ya subidos: {device_id: {fpid: hash}}
+        self.hash_skip_enabled = config.get('FACE_HASH_SKIP_ENABLED', True)
+        self.face_hashes: Dict[str, Dict[str, str]] = {}
+        self.hash_lock = threading.Lock()
+        self.uploads_skipped = 0
+        
         logging.info("DeviceManager inicializado")
     
     def get_device_session(self, device: Dict[str, Any]) -> requests.Session:
@@ -63,11 +175,131 @@ class DeviceManager:
             
             return self.device_sessions[device_id]
     
+    def _get_latency(self, device_id: str, kind: str) -> DeviceLatency:
+        """Obtiene o crea el registro de latencia de un dispositivo para un tipo de request"""
+        key = (device_id, kind)
+        with self.latency_lock:
+            if key not in self.device_latency:
+                self.device_latency[key] = DeviceLatency(self.latency_alpha, self.latency_window)
+            return self.device_latency[key]
+    
+    def _derive_timeout(self, latency: DeviceLatency, initial: float,
+                        floor: float, cap: float, backoff: bool = True) -> float:
+        """Calcula un timeout a partir de la latencia observada, acotado por piso y techo"""
+        estimate = latency.estimate()
+        if estimate is None or latency.count < self.min_latency_samples:
+            return max(floor, min(initial, cap))
+        
+        # Margen x2 sobre la peor latencia esperable y backoff ante fallos consecutivos
+        timeout = 2 * estimate
+        if backoff:
+            timeout *= 2 ** min(latency.consecutive_failures, 3)
+        return round(max(floor, min(timeout, cap)), 3)
+    
+    def get_device_timeout(self, device: Dict[str, Any], kind: str = 'request') -> Tuple[float, float]:
+        """Obtiene (connect, read) timeout para un dispositivo según su latencia"""
+        initial_read = self.upload_timeout if kind == 'upload' else self.timeout
+        
+        if not self.adaptive_timeout:
+            return initial_read, initial_read
+        
+        device_id = device['dispositivo_id']
+        
+        # El connect se deriva del handshake TCP medido aparte (el request incluye el
+        # procesamiento del equipo) y sin backoff: un equipo caído debe fallar rápido.
+        # Sin muestras (p.ej. caído desde el arranque) se usa un valor de LAN, no DEVICE_TIMEOUT,
+        # que se reduce a la mitad con cada connect fallido hasta el mínimo
+        connect_latency = self._get_latency(device_id, 'connect')
+        connect = self._derive_timeout(
+            connect_latency,
+            self.connect_timeout_initial / (2 ** min(connect_latency.consecutive_failures, 3)),
+            self.connect_timeout_min, self.connect_timeout_max, backoff=False
+        )
+        read = self._derive_timeout(
+            self._get_latency(device_id, kind),
+            initial_read, self.read_timeout_min, self.read_timeout_max
+        )
+        
+        return connect, read
+    
+    def _request(self, device: Dict[str, Any], method: str, url: str,
+                 kind: str = 'request', **kwargs) -> requests.Response:
+        """Ejecuta un request ISAPI con timeout adaptativo y registra su latencia"""
+        session = self.get_device_session(device)
+        latency = self._get_latency(device['dispositivo_id'], kind)
+        timeout = self.get_device_timeout(device, kind)
+        
+        if self.adaptive_timeout and self._connect_probe_due(device['dispositivo_id']):
+            try:
+                self._probe_connect(device, url, timeout[0])
+            except OSError as e:
+                # Sin handshake el request fallaría igual en el connect: se corta acá
+                latency.record_failure()
+                DEVICE_REQUEST_FAILURES.labels(device['dispositivo_id'], kind).inc()
+                raise requests.exceptions.ConnectionError(e)
+        
+        start_time = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except requests.exceptions.RequestException:
+            latency.record_failure()
+            DEVICE_REQUEST_FAILURES.labels(device['dispositivo_id'], kind).inc()
+            raise
+        
+        elapsed = time.perf_counter() - start_time
+        latency.record(elapsed)
+        DEVICE_REQUEST_SECONDS.labels(device['dispositivo_id'], kind).observe(elapsed)
+        return response
+    
+    def _connect_probe_due(self, device_id: str) -> bool:
+        """Indica si hay que volver a medir el connect (hasta calibrar, luego cada intervalo)"""
+        if self._get_latency(device_id, 'connect').count < self.min_latency_samples:
+            return True
+        
+        with self.latency_lock:
+            last_probe = self.connect_probes.get(device_id, 0.0)
+        return time.monotonic() - last_probe >= self.connect_probe_interval
+    
+    def _probe_connect(self, device: Dict[str, Any], url: str, timeout: float):
+        """Mide el handshake TCP contra el host:puerto del request"""
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        latency = self._get_latency(device['dispositivo_id'], 'connect')
+        
+        with self.latency_lock:
+            self.connect_probes[device['dispositivo_id']] = time.monotonic()
+        
+        start_time = time.perf_counter()
+        try:
+            sock = socket.create_connection((parts.hostname, port), timeout=timeout)
+        except OSError:
+            latency.record_failure()
+            DEVICE_REQUEST_FAILURES.labels(device['dispositivo_id'], 'connect').inc()
+            raise
+        
+        elapsed = time.perf_counter() - start_time
+        sock.close()
+        latency.record(elapsed)
+        DEVICE_REQUEST_SECONDS.labels(device['dispositivo_id'], 'connect').observe(elapsed)
+    
+    def get_latency_statistics(self) -> Dict[str, Any]:
+        """Latencias y timeouts actuales por dispositivo"""
+        with self.latency_lock:
+            entries = list(self.device_latency.items())
+        
+        result = {}
+        for (device_id, kind), latency in entries:
+            device_stats = result.setdefault(device_id, {})
+            device_stats[kind] = latency.to_dict()
+            timeout = self.get_device_timeout({'dispositivo_id': device_id}, kind)
+            # Para 'connect' solo aplica el timeout de conexión
+            device_stats[kind]['timeout'] = timeout[0] if kind == 'connect' else timeout
+        
+        return result
+    
     def test_device_connection(self, device: Dict[str, Any]) -> Tuple[bool, str]:
         """Prueba conexión a un dispositivo Hikvision"""
         try:
-            session = self.get_device_session(device)
-            
             # Probar con puerto SVR primero, luego HTTP
             ports_to_try = [
                 device.get('puerto_svr', 8000),
@@ -78,8 +310,10 @@ class DeviceManager:
                 url = f"http://{device['ip']}:{port}/ISAPI/System/deviceInfo"
                 
                 try:
-                    response = session.get(url, timeout=self.timeout)
+                    response = self._request(device, 'GET', url)
                     if response.status_code == 200:
+                        self._check_firmware_version(device, response)
+                        
                         # Actualizar estado en BD
                         self.db_manager.update_device_status(
                             device['dispositivo_id'], 
@@ -115,12 +349,11 @@ class DeviceManager:
     def ensure_face_library_exists(self, device: Dict[str, Any]) -> Tuple[bool, str, str]:
         """Verifica y crea biblioteca facial por defecto si no existe"""
         try:
-            session = self.get_device_session(device)
             port = device.get('puerto_svr', 8000)
             
             # Verificar bibliotecas existentes
             url = f"http://{device['ip']}:{port}/ISAPI/Intelligent/FDLib?format=json"
-            response = session.get(url, timeout=self.timeout)
+            response = self._request(device, 'GET', url)
             
             if response.status_code == 200:
                 data = response.json()
@@ -130,11 +363,11 @@ class DeviceManager:
                 for lib in libraries:
                     if lib.get('faceLibType') == 'blackFD':
                         fdid = lib.get('FDID', '1')
-                        logging.debug(f"Biblioteca facial encontrada: {fdid}")
+                        logging.debug("Biblioteca facial encontrada: %s", fdid)
                         return True, fdid, "Biblioteca existente encontrada"
             
             # Si no existe, crear biblioteca por defecto
-            logging.info(f"Creando biblioteca facial en dispositivo {device['dispositivo_id']}")
+            logging.info("Creando biblioteca facial en dispositivo %s", device['dispositivo_id'])
             
             create_data = {
                 "FPLibInfo": {
@@ -145,30 +378,132 @@ class DeviceManager:
                 }
             }
             
-            response = session.post(url, json=create_data, timeout=self.timeout)
+            response = self._request(device, 'POST', url, json=create_data)
             if response.status_code in [200, 201]:
                 result = response.json()
                 fdid = result.get('FPLibInfo', {}).get('FDID', '1')
-                logging.info(f"Biblioteca facial creada: {fdid}")
+                self.invalidate_device_info(device['dispositivo_id'])
+                logging.info("Biblioteca facial creada: %s", fdid)
                 return True, fdid, "Biblioteca creada correctamente"
             else:
                 # Usar ID por defecto si falla
-                logging.warning(f"Error creando biblioteca, usando ID por defecto")
+                logging.warning("Error creando biblioteca, usando ID por defecto")
                 return True, '1', "Usando biblioteca por defecto"
                 
         except Exception as e:
-            logging.error(f"Error verificando biblioteca facial: {e}")
+            logging.error("Error verificando biblioteca facial: %s", e)
             return True, '1', f"Error: {e} - Usando biblioteca por defecto"
     
-    def upload_face_to_device(self, device: Dict[str, Any], facial_data: Dict[str, Any]) -> Tuple[bool, str]:
+    def compute_face_hash(self, facial_data: Dict[str, Any]) -> Optional[str]:
+        """Calcula hash SHA-1 del contenido que se sube al dispositivo (imagen + nombre)"""
+        image_data = facial_data.get('template_data')
+        if not image_data:
+            return None
+        
+        name = f"{facial_data.get('nombre', '')} {facial_data.get('apellido', '')}".strip()
+        
+        digest = hashlib.sha1(bytes(image_data))
+        digest.update(name.encode('utf-8'))
+        return digest.hexdigest()
+    
+    def get_device_face_hashes_cached(self, device_id: str) -> Dict[str, str]:
+        """Obtiene (cargando desde BD la primera vez) los hashes registrados de un dispositivo"""
+        with self.hash_lock:
+            hashes = self.face_hashes.get(device_id)
+            if hashes is not None:
+                return hashes
+        
+        try:
+            loaded = self.db_manager.get_device_face_hashes(device_id)
+        except Exception as e:
+            logging.warning(f"No se pudieron cargar hashes de rostros de {device_id}: {e}")
+            loaded = {}
+        
+        with self.hash_lock:
+            return self.face_hashes.setdefault(device_id, loaded)
+    
+    def _remember_face_hash(self, device_id: str, fpid: str, content_hash: str):
+        """Registra el hash de un rostro subido correctamente"""
+        hashes = self.get_device_face_hashes_cached(device_id)
+        with self.hash_lock:
+            hashes[fpid] = content_hash
+        
+        try:
+            self.db_manager.save_device_face_hash(device_id, fpid, content_hash)
+        except Exception as e:
+            logging.warning("No se pudo persistir hash de rostro %s en %s: %s", fpid, device_id, e)
+    
+    def record_face_hash_baseline(self, device_id: str, hashes: Dict[str, str]):
+        """Registra como base los hashes de rostros ya presentes en el dispositivo sin hash conocido"""
+        for fpid, content_hash in hashes.items():
+            self._remember_face_hash(device_id, fpid, content_hash)
+        logging.info(f"🧾 {len(hashes)} hashes de rostros registrados como base para {device_id}")
+    
+    def _forget_face_hash(self, device_id: str, fpid: str = None):
+        """Olvida el hash de un rostro (o de todos los rostros si fpid es None)"""
+        with self.hash_lock:
+            if fpid is None:
+                self.face_hashes[device_id] = {}
+            elif device_id in self.face_hashes:
+                self.face_hashes[device_id].pop(fpid, None)
+        
+        try:
+            self.db_manager.delete_device_face_hash(device_id, fpid)
+        except Exception as e:
+            logging.warning("No se pudo eliminar hash de rostro en %s: %s", device_id, e)
+    
+    def clear_face_hash_registry(self, device: Dict[str, Any]):
+        """Invalida el registro de hashes de un dispositivo (ej: tras reset de fábrica)"""
+        self._forget_face_hash(device['dispositivo_id'])
+        logging.info(f"🧹 Registro de hashes limpiado para {device['dispositivo_id']}")
+    
+    def _build_face_multipart(self, face_data: Dict[str, Any], image_data: bytes) -> Tuple[bytes, Dict[str, str]]:
+        """Arma el cuerpo multipart (FaceDataRecord JSON + FaceImage) para ISAPI"""
+        boundary = '---------------------------FacialSyncService'
+        
+        body = f'--{boundary}\r\n'
+        body += 'Content-Disposition: form-data; name="FaceDataRecord"\r\n'
+        body += 'Content-Type: application/json\r\n'
+        body += f'Content-Length: {len(json.dumps(face_data))}\r\n'
+        body += '\r\n'
+        body += json.dumps(face_data)
+        body += f'\r\n--{boundary}\r\n'
+        body += 'Content-Disposition: form-data; name="FaceImage"\r\n'
+        body += 'Content-Type: image/jpeg\r\n'
+        body += f'Content-Length: {len(image_data)}\r\n'
+        body += '\r\n'
+        
+        # Convertir a bytes y agregar imagen
+        body_bytes = body.encode('utf-8') + image_data + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+        
+        headers = {
+            'Content-Type': f'multipart/form-data; boundary={boundary}',
+            'Content-Length': str(len(body_bytes))
+        }
+        
+        return body_bytes, headers
+    
+    def upload_face_to_device(self, device: Dict[str, Any], facial_data: Dict[str, Any],
+                              force: bool = False, fdid: str = None) -> Tuple[bool, str]:
         """Sube imagen facial a un dispositivo Hikvision"""
         try:
-            # Verificar biblioteca facial
-            lib_success, fdid, lib_msg = self.ensure_face_library_exists(device)
-            if not lib_success:
-                return False, f"Error en biblioteca facial: {lib_msg}"
+            device_id = device['dispositivo_id']
+            fpid = str(facial_data['facial_id'])
+            content_hash = self.compute_face_hash(facial_data)
+            
+            # Omitir si el dispositivo ya tiene exactamente este contenido
+            if self.hash_skip_enabled and not force and content_hash:
+                if self.get_device_face_hashes_cached(device_id).get(fpid) == content_hash:
+                    self.uploads_skipped += 1
+                    logging.debug("⏭️ Rostro %s sin cambios en %s, se omite subida", fpid, device_id)
+                    return True, "Rostro sin cambios en dispositivo (omitido)"
+            
+            # Verificar biblioteca facial (salvo que el llamador ya conozca el FDID)
+            if not fdid:
+                lib_success, fdid, lib_msg = self.ensure_face_library_exists(device)
+                if not lib_success:
+                    return False, f"Error en biblioteca facial: {lib_msg}"
             
-            session = self.get_device_session(device)
             port = device.get('puerto_svr', 8000)
             
             url = f"http://{device['ip']}:{port}/ISAPI/Intelligent/FDLib/FaceDataRecord?format=json"
@@ -186,34 +521,16 @@ class DeviceManager:
             if not image_data:
                 return False, "No hay datos de imagen"
             
-            # Crear multipart manualmente
-            boundary = '---------------------------FacialSyncService'
-            
-            body = f'--{boundary}\r\n'
-            body += 'Content-Disposition: form-data; name="FaceDataRecord"\r\n'
-            body += 'Content-Type: application/json\r\n'
-            body += f'Content-Length: {len(json.dumps(face_data))}\r\n'
-            body += '\r\n'
-            body += json.dumps(face_data)
-            body += f'\r\n--{boundary}\r\n'
-            body += 'Content-Disposition: form-data; name="FaceImage"\r\n'
-            body += 'Content-Type: image/jpeg\r\n'
-            body += f'Content-Length: {len(image_data)}\r\n'
-            body += '\r\n'
-            
-            # Convertir a bytes y agregar imagen
-            body_bytes = body.encode('utf-8') + image_data + f'\r\n--{boundary}--\r\n'.encode('utf-8')
-            
-            headers = {
-                'Content-Type': f'multipart/form-data; boundary={boundary}',
-                'Content-Length': str(len(body_bytes))
-            }
+            body_bytes, headers = self._build_face_multipart(face_data, image_data)
             
             # Enviar request
-            response = session.post(url, data=body_bytes, headers=headers, timeout=30)
+            response = self._request(device, 'POST', url, kind='upload', data=body_bytes, headers=headers)
             
             if response.status_code in [200, 201]:
-                logging.info(f"✅ Rostro {facial_data['facial_id']} subido a {device['dispositivo_id']}")
+                if content_hash:
+                    self._remember_face_hash(device_id, fpid, content_hash)
+                
+                logging.info("✅ Rostro %s subido a %s", facial_data['facial_id'], device['dispositivo_id'])
                 return True, "Imagen facial subida correctamente"
             else:
                 error_msg = f"Error HTTP {response.status_code}"
@@ -224,12 +541,12 @@ class DeviceManager:
                 except:
                     error_msg += f": {response.text[:200]}"
                 
-                logging.error(f"❌ Error subiendo rostro a {device['dispositivo_id']}: {error_msg}")
+                logging.error("❌ Error subiendo rostro a %s: %s", device['dispositivo_id'], error_msg)
                 return False, error_msg
                 
         except Exception as e:
             error_msg = f"Excepción subiendo rostro: {str(e)}"
-            logging.error(f"❌ {error_msg}")
+            logging.error("❌ %s", error_msg)
             return False, error_msg
     
     def update_face_on_device(self, device: Dict[str, Any], facial_data: Dict[str, Any]) -> Tuple[bool, str]:
@@ -240,7 +557,6 @@ class DeviceManager:
     def delete_face_from_device(self, device: Dict[str, Any], facial_id: int) -> Tuple[bool, str]:
         """Elimina imagen facial de un dispositivo"""
         try:
-            session = self.get_device_session(device)
             port = device.get('puerto_svr', 8000)
             
             # Primero obtener FDID de la biblioteca
@@ -249,10 +565,12 @@ class DeviceManager:
             # URL para eliminar cara específica
             url = f"http://{device['ip']}:{port}/ISAPI/Intelligent/FDLib/FaceDataRecord/Delete?format=json&FDID={fdid}&FPID={facial_id}"
             
-            response = session.put(url, timeout=self.timeout)
+            response = self._request(device, 'PUT', url)
             
             if response.status_code in [200, 201]:
-                logging.info(f"✅ Rostro {facial_id} eliminado de {device['dispositivo_id']}")
+                self._forget_face_hash(device['dispositivo_id'], str(facial_id))
+                
+                logging.info("✅ Rostro %s eliminado de %s", facial_id, device['dispositivo_id'])
                 return True, "Rostro eliminado correctamente"
             else:
                 error_msg = f"Error HTTP {response.status_code}"
@@ -263,16 +581,17 @@ class DeviceManager:
                 except:
                     pass
                 
-                logging.warning(f"⚠️ Error eliminando rostro de {device['dispositivo_id']}: {error_msg}")
+                logging.warning("⚠️ Error eliminando rostro de %s: %s", device['dispositivo_id'], error_msg)
                 return False, error_msg
                 
         except Exception as e:
             error_msg = f"Excepción eliminando rostro: {str(e)}"
-            logging.error(f"❌ {error_msg}")
+            logging.error("❌ %s", error_msg)
             return False, error_msg
     
-    def sync_face_to_all_devices(self, facial_data: Dict[str, Any], action: str = 'create') -> Dict[str, Any]:
-        """Sincroniza rostro facial con todos los dispositivos activos"""
+    def sync_face_to_all_devices(self, facial_data: Dict[str, Any], action: str = 'create',
+                                 device_ids: List[str] = None) -> Dict[str, Any]:
+        """Sincroniza rostro facial con todos los dispositivos activos (o solo los indicados)"""
         results = {
             'total_devices': 0,
             'successful': 0,
@@ -283,13 +602,15 @@ class DeviceManager:
         try:
             # Obtener dispositivos activos
             devices = self.db_manager.get_active_devices()
+            if device_ids:
+                devices = [d for d in devices if d['dispositivo_id'] in device_ids]
             results['total_devices'] = len(devices)
             
             if not devices:
                 logging.warning("No hay dispositivos activos para sincronizar")
                 return results
             
-            logging.info(f"🔄 Sincronizando rostro {facial_data['facial_id']} - Acción: {action} - Dispositivos: {len(devices)}")
+            logging.info("🔄 Sincronizando rostro %s - Acción: %s - Dispositivos: %s", facial_data['facial_id'], action, len(devices))
             
             for device in devices:
                 device_result = {
@@ -329,7 +650,7 @@ class DeviceManager:
                     device_result['message'] = f"Excepción: {str(e)}"
                     results['failed'] += 1
                     
-                    logging.error(f"Error sincronizando con {device['dispositivo_id']}: {e}")
+                    logging.error("Error sincronizando con %s: %s", device['dispositivo_id'], e)
                     self.db_manager.update_device_status(device['dispositivo_id'], False, str(e))
                 
                 results['details'].append(device_result)
@@ -339,10 +660,10 @@ class DeviceManager:
             
             # Log resumen
             success_rate = (results['successful'] / results['total_devices']) * 100 if results['total_devices'] > 0 else 0
-            logging.info(f"📊 Sincronización completada - Éxito: {results['successful']}/{results['total_devices']} ({success_rate:.1f}%)")
+            logging.info("📊 Sincronización completada - Éxito: %s/%s (%.1f%%)", results['successful'], results['total_devices'], success_rate)
             
         except Exception as e:
-            logging.error(f"Error en sincronización masiva: {e}")
+            logging.error("Error en sincronización masiva: %s", e)
             results['error'] = str(e)
         
         return results
@@ -350,12 +671,11 @@ class DeviceManager:
     def get_device_face_count(self, device: Dict[str, Any]) -> Tuple[bool, int, str]:
         """Obtiene el número de rostros almacenados en un dispositivo"""
         try:
-            session = self.get_device_session(device)
             port = device.get('puerto_svr', 8000)
             
             # Obtener información de la biblioteca facial
             url = f"http://{device['ip']}:{port}/ISAPI/Intelligent/FDLib?format=json"
-            response = session.get(url, timeout=self.timeout)
+            response = self._request(device, 'GET', url)
             
             if response.status_code == 200:
                 data = response.json()
@@ -368,7 +688,7 @@ class DeviceManager:
                         fdid = lib.get('FDID', '1')
                         count_url = f"http://{device['ip']}:{port}/ISAPI/Intelligent/FDLib/FaceDataRecord/Count?format=json&FDID={fdid}"
                         
-                        count_response = session.get(count_url, timeout=self.timeout)
+                        count_response = self._request(device, 'GET', count_url)
                         if count_response.status_code == 200:
                             count_data = count_response.json()
                             face_count = count_data.get('numOfMatches', 0)
@@ -382,6 +702,61 @@ class DeviceManager:
             logging.error(f"Error obteniendo conteo de rostros de {device['dispositivo_id']}: {e}")
             return False, 0, str(e)
     
+    def _search_face_page(self, device: Dict[str, Any], fdid: str, position: int, 
+                          page_size: int) -> Dict[str, Any]:
+        """Obtiene una página de FaceDataRecord de la biblioteca facial"""
+        port = device.get('puerto_svr', 8000)
+        
+        url = f"http://{device['ip']}:{port}/ISAPI/Intelligent/FDLib/FDSearch?format=json"
+        search_data = {
+            "searchResultPosition": position,
+            "maxResults": page_size,
+            "faceLibType": "blackFD",
+            "FDID": fdid
+        }
+        
+        response = self._request(device, 'POST', url, json=search_data)
+        if response.status_code != 200:
+            raise Exception(f"Error HTTP {response.status_code} en página {position}")
+        
+        return response.json()
+    
+    def get_device_face_ids(self, device: Dict[str, Any], page_size: int = 50, 
+                            max_workers: int = 4) -> Tuple[bool, Set[str], str]:
+        """Obtiene el conjunto de FPIDs almacenados en un dispositivo (paginación concurrente)"""
+        try:
+            _, fdid, _ = self.ensure_face_library_exists(device)
+            
+            # Primera página: determina el total de registros
+            first_page = self._search_face_page(device, fdid, 0, page_size)
+            if first_page.get('responseStatusStrg') == 'NO MATCH':
+                return True, set(), "Biblioteca vacía"
+            
+            total = first_page.get('totalMatches', 0)
+            pages = [first_page]
+            
+            # Resto de páginas en paralelo
+            positions = list(range(page_size, total, page_size))
+            if positions:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    pages.extend(executor.map(
+                        lambda pos: self._search_face_page(device, fdid, pos, page_size),
+                        positions
+                    ))
+            
+            face_ids = set()
+            for page in pages:
+                for match in page.get('MatchList', []):
+                    if match.get('FPID'):
+                        face_ids.add(str(match['FPID']))
+            
+            logging.debug(f"{len(face_ids)}/{total} FPIDs leídos de {device['dispositivo_id']} en {len(pages)} páginas")
+            return True, face_ids, f"{len(face_ids)} rostros en dispositivo"
+        
+        except Exception as e:
+            logging.error(f"Error listando rostros de {device['dispositivo_id']}: {e}")
+            return False, set(), str(e)
+    
     def ping_all_devices(self) -> Dict[str, Any]:
         """Verifica conectividad de todos los dispositivos"""
         results = {
@@ -447,7 +822,6 @@ class DeviceManager:
     def configure_event_notification(self, device: Dict[str, Any], callback_url: str) -> Tuple[bool, str]:
         """Configura notificación de eventos en un dispositivo"""
         try:
-            session = self.get_device_session(device)
             port = device.get('puerto_svr', 8000)
             
             # Configurar notificación HTTP
@@ -466,7 +840,7 @@ class DeviceManager:
                 }
             }
             
-            response = session.put(url, json=config_data, timeout=self.timeout)
+            response = self._request(device, 'PUT', url, json=config_data)
             
             if response.status_code in [200, 201]:
                 # Activar eventos de control de acceso
@@ -479,7 +853,7 @@ class DeviceManager:
                     }
                 }
                 
-                event_response = session.put(event_url, json=event_config, timeout=self.timeout)
+                event_response = self._request(device, 'PUT', event_url, json=event_config)
                 
                 if event_response.status_code in [200, 201]:
                     return True, "Eventos configurados correctamente"
@@ -491,15 +865,114 @@ class DeviceManager:
         except Exception as e:
             return False, f"Error configurando eventos: {str(e)}"
     
-    def get_device_info(self, device: Dict[str, Any]) -> Dict[str, Any]:
-        """Obtiene información detallada de un dispositivo"""
+    def _parse_firmware_version(self, response: requests.Response) -> Optional[str]:
+        """Extrae la versión de firmware de una respuesta deviceInfo (JSON o XML)"""
+        try:
+            info = response.json()
+            info = info.get('DeviceInfo', info)
+            version = info.get('firmwareVersion')
+            build = info.get('firmwareReleasedDate')
+        except ValueError:
+            version_match = re.search(r'<firmwareVersion>([^<]*)<', response.text)
+            build_match = re.search(r'<firmwareReleasedDate>([^<]*)<', response.text)
+            version = version_match.group(1) if version_match else None
+            build = build_match.group(1) if build_match else None
+        
+        if not version:
+            return None
+        return f"{version} {build}".strip() if build else version
+    
+    def _load_device_snapshots(self):
+        """Carga una vez los snapshots guardados en device_status"""
+        if self.snapshots_loaded:
+            return
+        
+        try:
+            for device_id, capabilities in self.db_manager.get_device_snapshots().items():
+                try:
+                    snapshot = json.loads(capabilities)
+                except ValueError:
+                    continue
+                if isinstance(snapshot, dict) and 'fetched_at' in snapshot:
+                    self.device_snapshots[device_id] = snapshot
+            
+            logging.debug(f"{len(self.device_snapshots)} snapshots de dispositivos cargados")
+        except Exception as e:
+            logging.warning(f"No se pudieron cargar snapshots de dispositivos: {e}")
+        
+        self.snapshots_loaded = True
+    
+    def _check_firmware_version(self, device: Dict[str, Any], response: requests.Response):
+        """Invalida el snapshot si la versión de firmware cambió desde la última lectura"""
+        device_id = device['dispositivo_id']
+        
+        with self.snapshot_lock:
+            self._load_device_snapshots()
+            snapshot = self.device_snapshots.get(device_id)
+        
+        if not snapshot:
+            return
+        
+        version = self._parse_firmware_version(response)
+        if version and version != snapshot.get('version'):
+            logging.info(f"🔄 Firmware de {device_id} cambió ({snapshot.get('version')} -> {version})")
+            self.invalidate_device_info(device_id)
+    
+    def invalidate_device_info(self, device_id: str):
+        """Fuerza la relectura del snapshot en la próxima consulta"""
+        with self.snapshot_lock:
+            snapshot = self.device_snapshots.get(device_id)
+            if snapshot:
+                snapshot['fetched_at'] = 0
+    
+    def get_device_info(self, device: Dict[str, Any], refresh: bool = False) -> Dict[str, Any]:
+        """Obtiene información detallada de un dispositivo (desde el snapshot si está vigente)"""
+        device_id = device['dispositivo_id']
+        
+        with self.snapshot_lock:
+            self._load_device_snapshots()
+            snapshot = self.device_snapshots.get(device_id)
+        
+        if (snapshot and not refresh and
+                time.time() - snapshot['fetched_at'] < self.info_refresh_interval):
+            device_info = dict(snapshot)
+            device_info['cached'] = True
+            return device_info
+        
+        device_info = self._fetch_device_info(device)
+        if not device_info.get('online'):
+            # Sin conexión: mejor el último snapshot conocido que nada
+            if snapshot:
+                device_info = dict(snapshot)
+                device_info.update({'online': False, 'cached': True})
+            return device_info
+        
+        device_info['fetched_at'] = time.time()
+        
+        with self.snapshot_lock:
+            self.device_snapshots[device_id] = device_info
+        
+        try:
+            self.db_manager.update_device_snapshot(
+                device_id, device_info['version'], json.dumps(device_info, default=str)
+            )
+        except Exception as e:
+            logging.warning(f"No se pudo guardar snapshot de {device_id}: {e}")
+        
+        logging.info(f"📋 Snapshot de {device_id} actualizado (firmware {device_info['version']})")
+        
+        device_info = dict(device_info)
+        device_info['cached'] = False
+        return device_info
+    
+    def _fetch_device_info(self, device: Dict[str, Any]) -> Dict[str, Any]:
+        """Lee deviceInfo, capacidades y bibliotecas faciales desde el dispositivo"""
         try:
-            session = self.get_device_session(device)
             port = device.get('puerto_svr', 8000)
             
             # Información básica del dispositivo
             info_url = f"http://{device['ip']}:{port}/ISAPI/System/deviceInfo"
-            response = session.get(info_url, timeout=self.timeout)
+            response = self._request(device, 'GET', info_url)
             
             device_info = {
                 'device_id': device['dispositivo_id'],
@@ -508,6 +981,7 @@ class DeviceManager:
                 'model': device.get('modelo', 'Unknown'),
                 'type': device.get('tipo', 'Unknown'),
                 'online': False,
+                'version': None,
                 'device_info': {},
                 'capabilities': {},
                 'face_libraries': []
@@ -515,6 +989,7 @@ class DeviceManager:
             
             if response.status_code == 200:
                 device_info['online'] = True
+                device_info['version'] = self._parse_firmware_version(response)
                 try:
                     device_info['device_info'] = response.json()
                 except:
@@ -523,7 +998,7 @@ class DeviceManager:
                 # Obtener capacidades
                 try:
                     cap_url = f"http://{device['ip']}:{port}/ISAPI/System/capabilities"
-                    cap_response = session.get(cap_url, timeout=self.timeout)
+                    cap_response = self._request(device, 'GET', cap_url)
                     if cap_response.status_code == 200:
                         device_info['capabilities'] = cap_response.json()
                 except:
@@ -532,7 +1007,7 @@ class DeviceManager:
                 # Obtener bibliotecas faciales
                 try:
                     lib_url = f"http://{device['ip']}:{port}/ISAPI/Intelligent/FDLib?format=json"
-                    lib_response = session.get(lib_url, timeout=self.timeout)
+                    lib_response = self._request(device, 'GET', lib_url)
                     if lib_response.status_code == 200:
                         lib_data = lib_response.json()
                         device_info['face_libraries'] = lib_data.get('FPLibListInfo', {}).get('FPLib', [])
@@ -570,6 +1045,8 @@ class DeviceManager:
             stats = {
                 'total_devices': len(devices),
                 'active_sessions': len(self.device_sessions),
+                'uploads_skipped': self.uploads_skipped,
+                'latency': self.get_latency_statistics(),
                 'online_devices': len([d for d in device_status if d.get('is_online')]),
                 'offline_devices': len([d for d in device_status if not d.get('is_online')]),
                 'total_faces': sum([d.get('face_count', 0) for d in device_status]),
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Archivo de eventos para Facial Sync Service
+Guarda los access_events vencidos en archivos locales comprimidos (uno por día) con un índice por bloque
+"""
+
+import os
+import gzip
+import json
+import threading
+import logging
+from datetime import datetime, date, timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple, Any, Optional, Iterator
+
+# Un archivo por día: bloques gzip concatenados, cada uno con filas JSON (una por línea)
+DATA_SUFFIX = '.jsonl.gz'
+INDEX_SUFFIX = '.idx.json'
+FILE_PREFIX = 'access_events_'
+STATE_FILE = 'archive_state.json'
+
+# Nivel de compresión: se escribe en la ventana de limpieza y se lee poco
+COMPRESS_LEVEL = 6
+
+def _to_datetime(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None) if value.tzinfo else value
+    if isinstance(value, str):
+        try:
+            return _to_datetime(datetime.fromisoformat(value.replace('Z', '+00:00')))
+        except ValueError:
+            return None
+    return None
+
+def _json_default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+def _write_json(path: Path, data: Dict[str, Any]):
+    """Escritura atómica: archivo temporal + os.replace"""
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class EventArchive:
+    """Archivos diarios de eventos con índice de bloques (offset, rango de tiempo, empleados)"""
+    
+    def __init__(self, archive_dir: str = 'archive'):
+        self.archive_dir = Path(archive_dir)
+        self.lock = threading.Lock()
+        
+        self.stats = {
+            'rows_archived': 0,
+            'blocks_written': 0,
+            'bytes_written': 0,
+            'blocks_read': 0,
+            'blocks_skipped': 0,
+            'last_archive': None
+        }
+    
+    def _data_path(self, day: date) -> Path:
+        return self.archive_dir / f"{FILE_PREFIX}{day.isoformat()}{DATA_SUFFIX}"
+    
+    def _index_path(self, day: date) -> Path:
+        return self.archive_dir / f"{FILE_PREFIX}{day.isoformat()}{INDEX_SUFFIX}"
+    
+    def _load_index(self, day: date) -> Optional[Dict[str, Any]]:
+        path = self._index_path(day)
+        if not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    # ------------------------------------
+    # Escritura
+    # ------------------------------------
+    
+    def append(self, rows: List[Dict[str, Any]], id_range: Tuple[int, int] = None) -> int:
+        """Agrega filas de access_events (un bloque por día); devuelve la cantidad archivada
+        
+        Con id_range se omiten los días que ya tienen un bloque de ese rango (reintento tras un corte)
+        """
+        by_day: Dict[date, List[Dict[str, Any]]] = {}
+        for row in rows:
+            event_time = _to_datetime(row.get('event_time')) or _to_datetime(row.get('received_at'))
+            day = event_time.date() if event_time else date(1970, 1, 1)
+            by_day.setdefault(day, []).append(row)
+        
+        archived = 0
+        with self.lock:
+            self.archive_dir.mkdir(parents=True, exist_ok=True)
+            for day, day_rows in sorted(by_day.items()):
+                if id_range and self._has_block(day, id_range):
+                    logging.info(f"🗄️ Bloque de IDs {id_range[0]}-{id_range[1]} ya archivado en {day}")
+                    continue
+                self._append_block(day, day_rows)
+                archived += len(day_rows)
+            
+            self.stats['rows_archived'] += archived
+            self.stats['last_archive'] = datetime.now()
+        
+        return archived
+    
+    def _has_block(self, day: date, id_range: Tuple[int, int]) -> bool:
+        """True si el índice del día tiene un bloque con IDs dentro de id_range"""
+        index = self._load_index(day)
+        if not index:
+            return False
+        return any(
+            block['min_id'] is not None and id_range[0] <= block['min_id'] and block['max_id'] <= id_range[1]
+            for block in index['blocks']
+        )
+    
+    def _append_block(self, day: date, rows: List[Dict[str, Any]]):
+        """Escribe un miembro gzip al final del archivo del día y lo registra en el índice"""
+        index = self._load_index(day) or {'day': day.isoformat(), 'rows': 0, 'size': 0, 'blocks': []}
+        
+        payload = ''.join(
+            json.dumps(row, ensure_ascii=False, default=_json_default, separators=(',', ':')) + '\n'
+            for row in rows
+        ).encode('utf-8')
+        block = gzip.compress(payload, compresslevel=COMPRESS_LEVEL)
+        
+        data_path = self._data_path(day)
+        with open(data_path, 'r+b' if data_path.exists() else 'w+b') as f:
+            # Bytes después del tamaño indexado son de una escritura interrumpida: se descartan
+            f.truncate(index['size'])
+            f.seek(index['size'])
+            f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+        
+        times = [t for t in (_to_datetime(row.get('event_time')) for row in rows) if t]
+        ids = [row['id'] for row in rows if row.get('id') is not None]
+        employees = sorted({str(row['employee_no']) for row in rows if row.get('employee_no')})
+        
+        index['blocks'].append({
+            'offset': index['size'],
+            'length': len(block),
+            'rows': len(rows),
+            'min_time': min(times).isoformat() if times else None,
+            'max_time': max(times).isoformat() if times else None,
+            'min_id': min(ids) if ids else None,
+            'max_id': max(ids) if ids else None,
+            'employees': employees
+        })
+        index['rows'] += len(rows)
+        index['size'] += len(block)
+        
+        # El índice se reemplaza después del fsync de los datos: un bloque no indexado no existe
+        _write_json(self._index_path(day), index)
+        
+        self.stats['blocks_written'] += 1
+        self.stats['bytes_written'] += len(block)
+    
+    def load_state(self) -> Dict[str, Any]:
+        """Estado persistente del archivador (bloque archivado pendiente de borrar en la BD)"""
+        path = self.archive_dir / STATE_FILE
+        if not path.exists():
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Estado de archivo ilegible ({path}): {e}")
+            return {}
+    
+    def save_state(self, state: Dict[str, Any]):
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        _write_json(self.archive_dir / STATE_FILE, state)
+    
+    # ------------------------------------
+    # Consulta
+    # ------------------------------------
+    
+    def days(self) -> List[date]:
+        """Días con archivo, en orden"""
+        if not self.archive_dir.exists():
+            return []
+        
+        result = []
+        for path in self.archive_dir.glob(f"{FILE_PREFIX}*{INDEX_SUFFIX}"):
+            try:
+                result.append(date.fromisoformat(path.name[len(FILE_PREFIX):-len(INDEX_SUFFIX)]))
+            except ValueError:
+                continue
+        return sorted(result)
+    
+    def iter_events(self, start: datetime, end: datetime, employee_no: str = None,
+                    device_ip: str = None) -> Iterator[Dict[str, Any]]:
+        """Eventos archivados con start <= event_time < end; solo se descomprimen los bloques que pueden coincidir"""
+        start = _to_datetime(start)
+        end = _to_datetime(end)
+        employee_no = str(employee_no) if employee_no else None
+        
+        for day in self.days():
+            if day < start.date() or day > end.date():
+                continue
+            
+            index = self._load_index(day)
+            if not index or not index['blocks']:
+                continue
+            
+            with open(self._data_path(day), 'rb') as f:
+                for block in index['blocks']:
+                    if not self._block_matches(block, start, end, employee_no):
+                        self.stats['blocks_skipped'] += 1
+                        continue
+                    
+                    f.seek(block['offset'])
+                    payload = gzip.decompress(f.read(block['length']))
+                    self.stats['blocks_read'] += 1
+                    
+                    for line in payload.splitlines():
+                        row = json.loads(line)
+                        event_time = _to_datetime(row.get('event_time'))
+                        if event_time is None or not (start <= event_time < end):
+                            continue
+                        if employee_no and str(row.get('employee_no') or '') != employee_no:
+                            continue
+                        if device_ip and row.get('device_ip') != device_ip:
+                            continue
+                        yield row
+    
+    @staticmethod
+    def _block_matches(block: Dict[str, Any], start: datetime, end: datetime, employee_no: Optional[str]) -> bool:
+        if block['min_time'] and block['max_time']:
+            if datetime.fromisoformat(block['max_time']) < start or datetime.fromisoformat(block['min_time']) >= end:
+                return False
+        if employee_no and employee_no not in block['employees']:
+            return False
+        return True
+    
+    def query(self, start: datetime, end: datetime = None, employee_no: str = None,
+              device_ip: str = None, limit: int = 1000) -> Dict[str, Any]:
+        """Eventos archivados de un rango (end por defecto: fin del día de start), hasta limit"""
+        start = _to_datetime(start)
+        if start is None:
+            raise ValueError("start inválido")
+        end = _to_datetime(end) if end else datetime.combine(start.date(), datetime.min.time()) + timedelta(days=1)
+        if end <= start:
+            raise ValueError("end debe ser posterior a start")
+        
+        events = []
+        truncated = False
+        for row in self.iter_events(start, end, employee_no, device_ip):
+            if len(events) >= limit:
+                truncated = True
+                break
+            events.append(row)
+        
+        return {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'employee_no': employee_no,
+            'device_ip': device_ip,
+            'events': events,
+            'count': len(events),
+            'truncated': truncated
+        }
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Días archivados, filas y tamaño en disco"""
+        days = self.days()
+        rows = size = 0
+        for day in days:
+            index = self._load_index(day)
+            if index:
+                rows += index['rows']
+                size += index['size']
+        
+        stats = self.stats.copy()
+        stats['last_archive'] = stats['last_archive'].isoformat() if stats['last_archive'] else None
+        
+        return {
+            'archive_dir': str(self.archive_dir),
+            'days': len(days),
+            'first_day': days[0].isoformat() if days else None,
+            'last_day': days[-1].isoformat() if days else None,
+            'rows': rows,
+            'size_bytes': size,
+            'stats': stats
+        }
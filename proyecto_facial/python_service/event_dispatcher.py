@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dispatcher de eventos para Facial Sync Service
+Entrega los eventos procesados a cada suscriptor desde su propia cola y thread, sin frenar la ingesta
+"""
+
+import time
+import queue
+import threading
+import logging
+from typing import Dict, List, Any, Callable, Optional
+
+from metrics import registry, DEFAULT_BUCKETS
+
+CALLBACK_SECONDS = registry.histogram(
+    'facial_sync_event_callback_seconds', 'Duración de cada callback de eventos', ['subscriber']
+)
+CALLBACK_QUEUE_SECONDS = registry.histogram(
+    'facial_sync_event_callback_queue_seconds', 'Espera en la cola del suscriptor antes del callback', ['subscriber']
+)
+CALLBACK_DROPPED = registry.counter(
+    'facial_sync_event_callback_dropped_total', 'Eventos descartados por cola de suscriptor llena', ['subscriber']
+)
+
+# drop_oldest: se descarta el más viejo de la cola; drop_newest: el que llega;
+# block: el worker espera hasta block_timeout (backpressure) y después descarta el que llega.
+# block frena la ingesta de eventos al ritmo del suscriptor; se le entrega después que al resto
+POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+_STOP = object()
+
+def callback_name(callback: Callable) -> str:
+    """Nombre legible del callback (Clase.método o función)"""
+    return getattr(callback, '__qualname__', None) or repr(callback)
+
+class LatencyStats:
+    """Duraciones acumuladas con histograma para percentiles aproximados"""
+    
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(DEFAULT_BUCKETS) + 1)
+    
+    def record(self, seconds: float):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        for index, bound in enumerate(DEFAULT_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+    
+    def percentile_ms(self, pct: float) -> Optional[float]:
+        """Límite superior del bucket que contiene el percentil (nunca mayor que el máximo observado)"""
+        if not self.count:
+            return None
+        
+        max_ms = round(self.max_seconds * 1000, 1)
+        target = self.count * pct / 100
+        seen = 0
+        for bound, count in zip(DEFAULT_BUCKETS, self.buckets):
+            seen += count
+            if seen >= target:
+                return min(bound * 1000, max_ms)
+        return max_ms
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'mean_ms': round(self.total_seconds / self.count * 1000, 2) if self.count else None,
+            'max_ms': round(self.max_seconds * 1000, 1),
+            'p50_ms': self.percentile_ms(50),
+            'p95_ms': self.percentile_ms(95),
+            'p99_ms': self.percentile_ms(99)
+        }
+
+class Subscriber:
+    """Un callback con su cola acotada y su thread de entrega (los eventos le llegan en orden)"""
+    
+    def __init__(self, callback: Callable[[Dict[str, Any]], None], name: str, queue_size: int,
+                 policy: str, block_timeout: float):
+        if policy not in POLICIES:
+            raise ValueError(f"Política de suscriptor inválida: {policy} (opciones: {', '.join(POLICIES)})")
+        
+        self.callback = callback
+        self.name = name
+        self.policy = policy
+        self.block_timeout = block_timeout
+        # (perf_counter al encolar, evento)
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        
+        self.is_running = False
+        self.thread = None
+        # perf_counter del inicio del callback en curso (un suscriptor trabado se ve en get_status)
+        self.busy_since: Optional[float] = None
+        
+        self.latency = LatencyStats()
+        self.queue_wait = LatencyStats()
+        self.stats = {
+            'delivered': 0,
+            'dropped': 0,
+            'errors': 0,
+            'blocked_seconds': 0.0,
+            'last_error': None
+        }
+        self.stats_lock = threading.Lock()
+    
+    def start(self):
+        if self.is_running:
+            return
+        
+        self.is_running = True
+        self.thread = threading.Thread(target=self._run, name=f'EventCallback-{self.name}', daemon=True)
+        self.thread.start()
+    
+    def stop(self, timeout: float = 5.0):
+        """Entrega lo que ya estaba en cola (hasta timeout) y detiene el thread"""
+        if not self.is_running:
+            return
+        
+        self.is_running = False
+        try:
+            self.queue.put_nowait(_STOP)
+        except queue.Full:
+            pass  # El thread sale al vaciar la cola
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+    
+    def offer(self, event: Dict[str, Any]):
+        """Encola un evento según la política del suscriptor"""
+        item = (time.perf_counter(), event)
+        try:
+            self.queue.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        
+        if self.policy == 'block':
+            start_time = time.perf_counter()
+            try:
+                self.queue.put(item, timeout=self.block_timeout)
+                return
+            except queue.Full:
+                pass
+            finally:
+                with self.stats_lock:
+                    self.stats['blocked_seconds'] += time.perf_counter() - start_time
+        
+        elif self.policy == 'drop_oldest':
+            # Otro worker puede llenar el lugar liberado: en ese caso se descarta el que llega
+            try:
+                self.queue.get_nowait()
+                self._record_drop()
+                self.queue.put_nowait(item)
+                return
+            except (queue.Empty, queue.Full):
+                pass
+        
+        self._record_drop()
+    
+    def _record_drop(self):
+        with self.stats_lock:
+            self.stats['dropped'] += 1
+            dropped = self.stats['dropped']
+        CALLBACK_DROPPED.labels(self.name).inc()
+        
+        # Un aviso por potencia de 10 para no inundar el log con un suscriptor lento
+        if dropped in (1, 10, 100, 1000) or dropped % 10000 == 0:
+            logging.warning(f"⚠️ Suscriptor de eventos {self.name} no da abasto: {dropped} eventos descartados")
+    
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=1.0)
+            except queue.Empty:
+                if not self.is_running:
+                    break
+                continue
+            
+            if item is _STOP:
+                break
+            
+            enqueued_at, event = item
+            start_time = time.perf_counter()
+            self.busy_since = start_time
+            try:
+                self.callback(event)
+                failed = None
+            except Exception as e:
+                failed = e
+            finally:
+                self.busy_since = None
+            
+            elapsed = time.perf_counter() - start_time
+            waited = start_time - enqueued_at
+            CALLBACK_SECONDS.labels(self.name).observe(elapsed)
+            CALLBACK_QUEUE_SECONDS.labels(self.name).observe(waited)
+            
+            with self.stats_lock:
+                self.latency.record(elapsed)
+                self.queue_wait.record(waited)
+                if failed is None:
+                    self.stats['delivered'] += 1
+                else:
+                    self.stats['errors'] += 1
+                    self.stats['last_error'] = str(failed)
+            
+            if failed is not None:
+                logging.error(f"Error en callback de evento {self.name}: {failed}")
+    
+    def get_status(self) -> Dict[str, Any]:
+        busy_since = self.busy_since
+        with self.stats_lock:
+            stats = self.stats.copy()
+            stats['blocked_seconds'] = round(stats['blocked_seconds'], 3)
+            return {
+                'name': self.name,
+                'policy': self.policy,
+                'is_running': self.is_running,
+                'queue_size': self.queue.qsize(),
+                'queue_max_size': self.queue.maxsize,
+                'busy_seconds': round(time.perf_counter() - busy_since, 3) if busy_since else None,
+                'latency': self.latency.to_dict(),
+                'queue_wait': self.queue_wait.to_dict(),
+                'stats': stats
+            }
+
+class EventDispatcher:
+    """Distribuye cada evento a las colas de los suscriptores; un callback lento solo se atrasa a sí mismo"""
+    
+    def __init__(self, config):
+        self.queue_size = config.get('EVENT_CALLBACK_QUEUE_SIZE', 1000)
+        self.default_policy = config.get('EVENT_CALLBACK_POLICY', 'drop_oldest')
+        self.block_timeout = config.get('EVENT_CALLBACK_BLOCK_TIMEOUT', 1.0)
+        
+        # Copia al modificar: dispatch recorre la lista sin lock
+        self.subscribers: List[Subscriber] = []
+        self.lock = threading.Lock()
+        self.is_running = False
+    
+    def start(self):
+        with self.lock:
+            self.is_running = True
+            for subscriber in self.subscribers:
+                subscriber.start()
+    
+    def stop(self):
+        with self.lock:
+            self.is_running = False
+            subscribers = self.subscribers
+        for subscriber in subscribers:
+            subscriber.stop()
+    
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None], policy: str = None,
+                  queue_size: int = None, name: str = None) -> Subscriber:
+        """Agrega un suscriptor (si el dispatcher está activo, su thread arranca ya)"""
+        subscriber = Subscriber(
+            callback,
+            name or callback_name(callback),
+            queue_size or self.queue_size,
+            policy or self.default_policy,
+            self.block_timeout
+        )
+        
+        with self.lock:
+            # Los de política block al final: su espera no atrasa la entrega a los demás
+            self.subscribers = sorted(self.subscribers + [subscriber], key=lambda s: s.policy == 'block')
+            if self.is_running:
+                subscriber.start()
+        return subscriber
+    
+    def unsubscribe(self, callback: Callable) -> bool:
+        """Quita el suscriptor del callback (se entregan antes los eventos ya encolados)"""
+        with self.lock:
+            subscriber = next((s for s in self.subscribers if s.callback == callback), None)
+            if subscriber is None:
+                return False
+            self.subscribers = [s for s in self.subscribers if s is not subscriber]
+        
+        subscriber.stop()
+        return True
+    
+    def dispatch(self, event: Dict[str, Any]):
+        """Encola el evento para cada suscriptor (no ejecuta callbacks en el thread que llama)"""
+        # Un suscriptor block con la cola llena retiene al thread que llama hasta block_timeout
+        for subscriber in self.subscribers:
+            subscriber.offer(event)
+    
+    def __len__(self) -> int:
+        return len(self.subscribers)
+    
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'is_running': self.is_running,
+            'default_policy': self.default_policy,
+            'queue_size': self.queue_size,
+            'subscribers': [subscriber.get_status() for subscriber in self.subscribers]
+        }
@@ -10,11 +10,171 @@ import time
 import logging
 import json
 import queue
+import hashlib
+import zlib
+from collections import deque, OrderedDict
+from itertools import islice
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Callable
+from pathlib import Path
+from typing import Dict, List, Tuple, Optional, Any, Callable
 from http.server import HTTPServer, BaseHTTPRequestHandler
 import socket
 
+from metrics import registry
+from stall_watchdog import get_watchdog
+from event_stats import get_event_aggregator, hour_start
+from persona_cache import PersonaCache
+from event_spill import EventSpill
+from event_dispatcher import EventDispatcher
+
+# Una línea INFO por evento: muestreable con LOG_EVENT_SAMPLE_RATE (ver Config.setup_logging)
+event_logger = logging.getLogger('facial_sync.events')
+
+EVENTS_RECEIVED = registry.counter('facial_sync_events_received_total', 'Eventos recibidos de dispositivos')
+EVENTS_DROPPED = registry.counter('facial_sync_events_dropped_total', 'Eventos descartados por cola llena')
+EVENTS_DUPLICATED = registry.counter('facial_sync_events_duplicated_total', 'Retransmisiones de eventos descartadas')
+EVENTS_SPILLED = registry.counter('facial_sync_events_spilled_total', 'Eventos desbordados a disco por cola llena')
+EVENT_INGEST_SECONDS = registry.histogram(
+    'facial_sync_event_ingest_seconds', 'Desde la recepción del evento hasta su persistencia y distribución'
+)
+RECENT_EVENT_QUERIES = registry.counter(
+    'facial_sync_recent_event_queries_total', 'Consultas de eventos recientes por origen', ['source']
+)
+
+# Columnas de access_events que devuelve get_recent_events
+RECENT_EVENT_FIELDS = ('device_ip', 'event_type', 'event_code', 'person_name', 'access_result', 'event_time', 'raw_data')
+
+# Campos que cambian entre reenvíos del mismo evento (activePostCount cuenta los intentos)
+VOLATILE_EVENT_FIELDS = ('activePostCount',)
+
+# Identidad del terminal en el payload: la IP de origen la comparten los terminales detrás de NAT/VPN
+DEVICE_IDENTITY_FIELDS = ('macAddress', 'deviceID', 'ipAddress', 'portNo')
+
+class EventDeduplicator:
+    """Claves de eventos vistos en los últimos window segundos (LRU acotado) para descartar retransmisiones"""
+    
+    def __init__(self, window: float, max_keys: int):
+        self.window = window
+        self.max_keys = max_keys
+        self.seen: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def event_key(event: Dict[str, Any]) -> str:
+        """Identidad del terminal (payload) + serialNo; si falta alguno, hash de los campos estables del payload"""
+        device_ip = event.get('_device_ip')
+        acc_event = event.get('AccessControllerEvent')
+        serial = acc_event.get('serialNo') if isinstance(acc_event, dict) else None
+        identity = '/'.join(str(event[field]) for field in DEVICE_IDENTITY_FIELDS if event.get(field) is not None)
+        if serial is not None and identity:
+            return f"{identity}#{serial}#{event.get('dateTime')}"
+        
+        stable = {key: value for key, value in event.items()
+                  if not key.startswith('_') and key not in VOLATILE_EVENT_FIELDS}
+        payload = json.dumps(stable, sort_keys=True, default=str).encode('utf-8')
+        return f"{device_ip}@{hashlib.blake2b(payload, digest_size=16).hexdigest()}"
+    
+    def is_duplicate(self, event: Dict[str, Any]) -> bool:
+        """True si la clave del evento ya se vio dentro de la ventana (si no, la registra)"""
+        if self.window <= 0:
+            return False
+        
+        key = self.event_key(event)
+        now = time.monotonic()
+        
+        with self.lock:
+            # Vencidos y excedentes salen por el lado más antiguo
+            while self.seen:
+                oldest_seen = next(iter(self.seen.values()))
+                if now - oldest_seen < self.window and len(self.seen) < self.max_keys:
+                    break
+                self.seen.popitem(last=False)
+            
+            # La ventana cuenta desde la primera vez: no se renueva con cada reenvío
+            if key in self.seen:
+                return True
+            self.seen[key] = now
+            return False
+    
+    def forget(self, event: Dict[str, Any]):
+        """Olvida la clave de un evento que no se pudo encolar (su reenvío no es duplicado)"""
+        if self.window <= 0:
+            return
+        
+        key = self.event_key(event)
+        with self.lock:
+            self.seen.pop(key, None)
+    
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'window_seconds': self.window,
+                'keys': len(self.seen),
+                'max_keys': self.max_keys
+            }
+
+class RecentEventBuffer:
+    """Últimos eventos procesados, en total y por dispositivo, para no consultar access_events"""
+    
+    def __init__(self, capacity: int, per_device: int):
+        self.capacity = capacity
+        self.per_device = per_device
+        self.events = deque(maxlen=capacity)
+        self.by_device: Dict[str, deque] = {}
+        self.lock = threading.Lock()
+        
+        # Exhaustivo: contiene todo lo que hay en access_events (BD con menos filas que la capacidad)
+        self.seeded = False
+        self.exhaustive = False
+        # Claves (None = total) que ya descartaron eventos por capacidad
+        self.truncated = set()
+    
+    def add(self, event: Dict[str, Any]):
+        """Agrega un evento (el más reciente)"""
+        entry = {field: event.get(field) for field in RECENT_EVENT_FIELDS}
+        device_ip = entry['device_ip']
+        
+        with self.lock:
+            if len(self.events) == self.capacity:
+                self.truncated.add(None)
+            self.events.append(entry)
+            
+            device_events = self.by_device.get(device_ip)
+            if device_events is None:
+                device_events = self.by_device[device_ip] = deque(maxlen=self.per_device)
+            if len(device_events) == self.per_device:
+                self.truncated.add(device_ip)
+            device_events.append(entry)
+    
+    def seed(self, events: List[Dict[str, Any]]):
+        """Carga inicial desde BD (más recientes primero, como ORDER BY EventTime DESC)"""
+        for event in reversed(events):
+            self.add(event)
+        self.seeded = True
+        self.exhaustive = len(events) < self.capacity
+    
+    def get(self, limit: int, device_ip: str = None) -> Optional[List[Dict[str, Any]]]:
+        """Hasta limit eventos, más recientes primero; None si el buffer no alcanza a cubrirlos"""
+        key = device_ip or None
+        with self.lock:
+            entries = self.by_device.get(device_ip, ()) if key else self.events
+            complete = self.exhaustive and key not in self.truncated
+            
+            if not self.seeded or (len(entries) < limit and not complete):
+                return None
+            return [dict(entry) for entry in islice(reversed(entries), limit)]
+    
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'events': len(self.events),
+                'capacity': self.capacity,
+                'devices': len(self.by_device),
+                'per_device': self.per_device,
+                'seeded': self.seeded,
+                'exhaustive': self.exhaustive
+            }
+
 class EventHandler(BaseHTTPRequestHandler):
     """Manejador HTTP para recibir eventos de dispositivos Hikvision"""
     
@@ -53,474 +213,289 @@ class EventHandler(BaseHTTPRequestHandler):
             self.wfile.write(b'{"status": "OK"}')
             
         except Exception as e:
-            self.log_error(f"Error procesando evento de control de acceso: {e}")
+            self.event_processor.log_error("Error en EventHandler: %s", e)
+            self.send_response(500)
+            self.end_headers()
     
-    def _process_generic_event(self, event_data: Dict[str, Any]):
-        """Procesa evento genérico"""
+    def log_message(self, format, *args):
+        """Suprimir logs HTTP automáticos"""
+        pass
+
+class EventProcessor:
+    """Procesador de eventos de acceso facial"""
+    
+    def __init__(self, db_manager, config):
+        self.db_manager = db_manager
+        self.config = config
+        
+        # Configuración
+        self.listen_port = config.get('EVENT_LISTEN_PORT', 8080)
+        self.buffer_size = config.get('EVENT_BUFFER_SIZE', 1000)
+        self.batch_size = config.get('EVENT_BATCH_SIZE', 50)
+        self.worker_count = max(1, int(config.get('EVENT_WORKERS', 4)))
+        
+        # Estado del procesador
+        self.is_running = False
+        self.http_server = None
+        self.server_thread = None
+        
+        # Una cola por worker: (perf_counter de recepción, evento); cada dispositivo va siempre al mismo shard
+        shard_size = max(1, self.buffer_size // self.worker_count)
+        self.event_shards = [queue.Queue(maxsize=shard_size) for _ in range(self.worker_count)]
+        self.shard_processed = [0] * self.worker_count
+        self.processor_threads: List[threading.Thread] = []
+        
+        registry.gauge('facial_sync_event_queue_depth', 'Eventos pendientes de procesar',
+                       function=self.queue_size)
+        
+        # Desborde a disco cuando un shard está lleno (un directorio por shard, se drena en orden)
+        self.spill_dir = Path(config.get('EVENT_SPILL_DIR', 'spill'))
+        self.spills: Optional[List[EventSpill]] = None
+        if config.get('EVENT_SPILL_ENABLED', True):
+            self.spills = [self._open_spill(self.spill_dir / f'shard_{index}') for index in range(self.worker_count)]
+            registry.gauge('facial_sync_event_spill_pending', 'Eventos desbordados a disco pendientes de procesar',
+                           function=self.spill_pending)
+        
+        # Reenvíos del terminal cuando la respuesta tarda (se descartan antes de encolar)
+        self.deduplicator = EventDeduplicator(
+            config.get('EVENT_DEDUP_WINDOW', 60),
+            config.get('EVENT_DEDUP_MAX_KEYS', 10000)
+        )
+        
+        # Últimos eventos en memoria (get_recent_events / API)
+        self.recent_events = RecentEventBuffer(
+            config.get('EVENT_RECENT_BUFFER_SIZE', 2000),
+            config.get('EVENT_RECENT_PER_DEVICE', 500)
+        )
+        
+        # Conteos por minuto para resúmenes (compartidos con DatabaseManager.get_event_statistics)
+        self.event_aggregator = get_event_aggregator()
+        window_hours = config.get('EVENT_STATS_WINDOW_HOURS', 24)
+        if self.event_aggregator.window_hours != window_hours:
+            self.event_aggregator.configure(window_hours)
+        
+        # employee_no -> PersonaID para access_events (sin consulta por evento)
+        self.persona_cache = PersonaCache(db_manager, config)
+        
+        # Conteos por hora pendientes de sumar a access_events_hourly (se escriben por lote)
+        self.rollup_enabled = config.get('EVENT_ROLLUP_ENABLED', True)
+        self.hourly_counts: Dict[Tuple[str, str, datetime], int] = {}
+        self.hourly_lock = threading.Lock()
+        # Un solo MERGE a la vez aunque varios workers terminen lote juntos
+        self.rollup_flush_lock = threading.Lock()
+        
+        # Callbacks para distribución: cada uno con su cola y thread (no frenan a los workers)
+        self.dispatcher = EventDispatcher(config)
+        
+        # Estadísticas
+        self.stats = {
+            'events_received': 0,
+            'events_processed': 0,
+            'events_dropped': 0,
+            'events_duplicated': 0,
+            'events_spilled': 0,
+            'events_errors': 0,
+            'rollup_errors': 0,
+            'start_time': None
+        }
+        self.stats_lock = threading.Lock()
+        
+        # Cache de dispositivos conocidos
+        self.known_devices = {}
+        self._load_known_devices()
+        
+        logging.info("EventProcessor inicializado")
+    
+    def start(self):
+        """Inicia el procesador de eventos"""
+        if self.is_running:
+            logging.warning("EventProcessor ya está ejecutándose")
+            return
+        
         try:
-            device_ip = event_data.get('_device_ip')
-            event_type = event_data.get('eventType', 'UNKNOWN')
+            self.is_running = True
+            self.stats['start_time'] = datetime.now()
             
-            processed_event = {
-                'device_ip': device_ip,
-                'event_type': event_type,
-                'event_code': '',
-                'person_id': '',
-                'employee_no': '',
-                'person_name': '',
-                'verify_mode': '',
-                'access_result': 'UNKNOWN',
-                'event_time': event_data.get('dateTime', datetime.now().isoformat()),
-                'raw_data': json.dumps(event_data)
-            }
+            # Cargar eventos recientes, conteos y personas antes de recibir nuevos
+            self._seed_recent_events()
+            self._seed_event_aggregates()
+            self.persona_cache.start()
+            self.dispatcher.start()
             
-            # Guardar eventos genéricos también
-            self._save_event_to_database(processed_event)
+            # Eventos desbordados con otra cantidad de workers vuelven a los shards actuales
+            if self.spills:
+                self._recover_orphan_spills()
+            
+            # Iniciar servidor HTTP para recibir eventos
+            self._start_http_server()
             
-            logging.debug(f"📨 Evento genérico - {self._get_device_name(device_ip)} ({device_ip}) - Tipo: {event_type}")
+            # Iniciar workers de procesamiento (uno por shard)
+            self.processor_threads = [
+                threading.Thread(target=self._process_events_loop, args=(index,),
+                                 name=f'EventWorker-{index}', daemon=True)
+                for index in range(self.worker_count)
+            ]
+            for thread in self.processor_threads:
+                thread.start()
+            
+            logging.info(f"✅ EventProcessor iniciado en puerto {self.listen_port} ({self.worker_count} workers)")
             
         except Exception as e:
-            self.log_error(f"Error procesando evento genérico: {e}")
+            self.is_running = False
+            logging.error(f"❌ Error iniciando EventProcessor: {e}")
+            raise
     
-    def _save_event_to_database(self, event_data: Dict[str, Any]):
-        """Guarda evento en la base de datos"""
+    def stop(self):
+        """Detiene el procesador de eventos"""
+        if not self.is_running:
+            return
+        
         try:
-            self.db_manager.log_access_event(
-                device_ip=event_data['device_ip'],
-                event_type=event_data['event_type'],
-                event_code=event_data.get('event_code'),
-                persona_id=None,  # Se podría mapear usando employee_no
-                employee_no=event_data.get('employee_no'),
-                person_name=event_data.get('person_name'),
-                verify_mode=event_data.get('verify_mode'),
-                access_result=event_data.get('access_result'),
-                event_time=event_data['event_time'],
-                raw_data=event_data.get('raw_data')
-            )
+            logging.info("🛑 Deteniendo EventProcessor...")
+            self.is_running = False
+            
+            # Detener servidor HTTP
+            if self.http_server:
+                self.http_server.shutdown()
+                self.http_server = None
+            
+            # Esperar threads
+            if self.server_thread and self.server_thread.is_alive():
+                self.server_thread.join(timeout=5)
+            
+            for thread in self.processor_threads:
+                if thread.is_alive():
+                    thread.join(timeout=5)
+            
+            # Lo que quedó en memoria se guarda en disco para la próxima ejecución
+            if self.spills:
+                self._spill_remaining()
+            
+            # Conteos por hora del último lote
+            self._flush_hourly_rollup()
+            
+            # Los suscriptores terminan de entregar lo que tienen en cola
+            self.dispatcher.stop()
+            self.persona_cache.stop()
+            
+            logging.info("✅ EventProcessor detenido")
             
         except Exception as e:
-            self.log_error(f"Error guardando evento en BD: {e}")
-    
-    def _distribute_event(self, event_data: Dict[str, Any]):
-        """Distribuye evento a todos los callbacks registrados"""
-        for callback in self.event_callbacks:
-            try:
-                callback(event_data)
-            except Exception as e:
-                self.log_error(f"Error en callback de evento: {e}")
-    
-    def _get_device_name(self, device_ip: str) -> str:
-        """Obtiene nombre del dispositivo por IP"""
-        device_info = self.known_devices.get(device_ip)
-        if device_info:
-            return device_info['nombre']
-        return f"Device_{device_ip}"
-    
-    def register_event_callback(self, callback: Callable[[Dict[str, Any]], None]):
-        """Registra callback para recibir eventos procesados"""
-        self.event_callbacks.append(callback)
-        logging.info(f"📡 Callback de eventos registrado ({len(self.event_callbacks)} total)")
+            logging.error(f"❌ Error deteniendo EventProcessor: {e}")
     
-    def unregister_event_callback(self, callback: Callable):
-        """Desregistra callback de eventos"""
-        if callback in self.event_callbacks:
-            self.event_callbacks.remove(callback)
-            logging.info(f"📡 Callback de eventos desregistrado ({len(self.event_callbacks)} total)")
+    def _open_spill(self, directory: Path) -> EventSpill:
+        return EventSpill(
+            directory,
+            segment_bytes=int(self.config.get('EVENT_SPILL_SEGMENT_MB', 16) * 1024 * 1024),
+            max_bytes=int(self.config.get('EVENT_SPILL_MAX_MB', 512) * 1024 * 1024 / self.worker_count),
+            fsync=self.config.get('EVENT_SPILL_FSYNC', 'interval'),
+            fsync_interval=self.config.get('EVENT_SPILL_FSYNC_INTERVAL', 1.0)
+        )
     
-    def simulate_event(self, device_ip: str = "192.168.1.100", event_type: str = "SUCCESS"):
-        """Simula un evento para testing"""
-        try:
-            if event_type == "SUCCESS":
-                event_data = {
-                    "AccessControllerEvent": {
-                        "majorEventType": 5,
-                        "subEventType": 75,
-                        "employeeNoString": "EMP001",
-                        "name": "Usuario Prueba",
-                        "currentVerifyMode": "Face"
-                    },
-                    "dateTime": datetime.now().isoformat(),
-                    "_device_ip": device_ip,
-                    "_received_at": datetime.now().isoformat(),
-                    "_format": "simulated"
-                }
-            else:
-                event_data = {
-                    "AccessControllerEvent": {
-                        "majorEventType": 5,
-                        "subEventType": 76,
-                        "employeeNoString": "",
-                        "name": "",
-                        "currentVerifyMode": "Face"
-                    },
-                    "dateTime": datetime.now().isoformat(),
-                    "_device_ip": device_ip,
-                    "_received_at": datetime.now().isoformat(),
-                    "_format": "simulated"
-                }
+    def _recover_orphan_spills(self):
+        """Reparte los eventos de directorios shard_N que ya no tienen worker (EVENT_WORKERS cambió)"""
+        if not self.spill_dir.exists():
+            return
+        
+        for directory in sorted(self.spill_dir.glob('shard_*')):
+            try:
+                index = int(directory.name[len('shard_'):])
+            except ValueError:
+                continue
+            if index < self.worker_count:
+                continue
             
-            self._enqueue_event(event_data)
-            logging.info(f"🎭 Evento simulado: {event_type} desde {device_ip}")
+            spill = self._open_spill(directory)
+            recovered = 0
+            while True:
+                records = spill.pop(500)
+                if not records:
+                    break
+                for record in records:
+                    self._put_event(self._shard_for(record['event'].get('_device_ip')), self._spilled_item(record))
+                    recovered += 1
+            spill.close()
             
-        except Exception as e:
-            self.log_error(f"Error simulando evento: {e}")
+            if recovered:
+                logging.info(f"💾 {recovered} eventos desbordados recuperados de {directory}")
     
-    def get_statistics(self) -> Dict[str, Any]:
-        """Obtiene estadísticas del procesador"""
-        uptime = None
-        if self.stats['start_time']:
-            uptime = (datetime.now() - self.stats['start_time']).total_seconds()
+    def _spill_remaining(self):
+        """Pasa a disco los eventos que siguen en las colas en memoria al detener"""
+        saved = 0
+        for index, shard in enumerate(self.event_shards):
+            spill = self.spills[index]
+            with spill.lock:
+                while True:
+                    try:
+                        enqueued_at, event = shard.get_nowait()
+                    except queue.Empty:
+                        break
+                    # Quedan detrás de los ya desbordados: se conserva el evento aunque no el orden
+                    if spill.append(self._spill_record(enqueued_at, event)):
+                        saved += 1
+                spill.close()
         
-        return {
-            'is_running': self.is_running,
-            'listen_port': self.listen_port,
-            'queue_size': self.event_queue.qsize(),
-            'known_devices': len(self.known_devices),
-            'registered_callbacks': len(self.event_callbacks),
-            'stats': self.stats.copy(),
-            'uptime_seconds': uptime
-        }
+        if saved:
+            logging.info(f"💾 {saved} eventos en cola guardados en disco")
     
-    def get_recent_events(self, limit: int = 50, device_ip: str = None) -> List[Dict[str, Any]]:
-        """Obtiene eventos recientes de la base de datos"""
+    @staticmethod
+    def _spill_record(enqueued_at: float, event: Dict[str, Any]) -> Dict[str, Any]:
+        # perf_counter no sobrevive al reinicio: se guarda la hora de recepción
+        return {'received': time.time() - (time.perf_counter() - enqueued_at), 'event': event}
+    
+    @staticmethod
+    def _spilled_item(record: Dict[str, Any]) -> Tuple[float, Dict[str, Any]]:
+        waited = max(0.0, time.time() - record.get('received', time.time()))
+        return time.perf_counter() - waited, record['event']
+    
+    def spill_pending(self) -> int:
+        """Eventos desbordados a disco en todos los shards"""
+        return sum(spill.pending for spill in self.spills) if self.spills else 0
+    
+    def _start_http_server(self):
+        """Inicia el servidor HTTP para recibir eventos"""
         try:
-            query = f"SELECT TOP {limit} DeviceIP, EventType, EventCode, PersonName, AccessResult, EventTime, RawData FROM access_events"
-            params = []
-            
-            if device_ip:
-                query += " WHERE DeviceIP = ?"
-                params.append(device_ip)
-            
-            query += " ORDER BY EventTime DESC"
+            # Crear handler con referencia a este procesador
+            def handler(*args, **kwargs):
+                EventHandler(self, *args, **kwargs)
             
-            results = self.db_manager.execute_query(query, params)
+            self.http_server = HTTPServer(('', self.listen_port), handler)
             
-            events = []
-            for row in results:
-                event = {
-                    'device_ip': row[0],
-                    'event_type': row[1],
-                    'event_code': row[2],
-                    'person_name': row[3],
-                    'access_result': row[4],
-                    'event_time': row[5].isoformat() if row[5] else None,
-                    'raw_data': row[6]
-                }
-                events.append(event)
+            def run_server():
+                logging.info(f"🌐 Servidor de eventos escuchando en puerto {self.listen_port}")
+                self.http_server.serve_forever()
             
-            return events
+            self.server_thread = threading.Thread(target=run_server, daemon=True)
+            self.server_thread.start()
             
         except Exception as e:
-            self.log_error(f"Error obteniendo eventos recientes: {e}")
-            return []
+            logging.error(f"Error iniciando servidor HTTP: {e}")
+            raise
     
-    def clear_old_events(self, days_old: int = 30) -> int:
-        """Limpia eventos antiguos de la base de datos"""
+    def _seed_recent_events(self):
+        """Carga el buffer de eventos recientes desde access_events"""
         try:
-            query = "DELETE FROM access_events WHERE ReceivedAt < DATEADD(DAY, -?, GETDATE())"
-            deleted_count = self.db_manager.execute_non_query(query, [days_old])
-            
-            logging.info(f"🧹 {deleted_count} eventos antiguos eliminados")
-            return deleted_count
+            events = self._query_recent_events(self.recent_events.capacity)
+            self.recent_events.seed(events)
+            logging.info(f"📋 {len(events)} eventos recientes cargados en memoria")
             
         except Exception as e:
-            self.log_error(f"Error limpiando eventos antiguos: {e}")
-            return 0
+            # Sin carga inicial get_recent_events sigue consultando la BD
+            logging.warning(f"No se pudieron cargar eventos recientes: {e}")
     
-    def get_event_summary(self, hours: int = 24) -> Dict[str, Any]:
-        """Obtiene resumen de eventos de las últimas horas"""
+    def _seed_event_aggregates(self):
+        """Carga los conteos por minuto de la ventana desde access_events (una sola vez)"""
+        if self.event_aggregator.seeded:
+            return
+        
         try:
-            query = """
-            SELECT 
-                DeviceIP,
-                AccessResult,
-                COUNT(*) as EventCount
-            FROM access_events 
-            WHERE EventTime >= DATEADD(HOUR, -?, GETDATE())
-            GROUP BY DeviceIP, AccessResult
-            ORDER BY DeviceIP, AccessResult
-            """
-            
-            results = self.db_manager.execute_query(query, [hours])
-            
-            summary = {
-                'period_hours': hours,
-                'total_events': 0,
-                'by_device': {},
-                'by_result': {'SUCCESS': 0, 'FAILED': 0, 'UNKNOWN': 0}
-            }
-            
-            for row in results:
-                device_ip = row[0]
-                result = row[1] or 'UNKNOWN'
-                count = row[2]
-                
-                summary['total_events'] += count
-                summary['by_result'][result] = summary['by_result'].get(result, 0) + count
-                
-                if device_ip not in summary['by_device']:
-                    summary['by_device'][device_ip] = {
-                        'device_name': self._get_device_name(device_ip),
-                        'total': 0,
-                        'SUCCESS': 0,
-                        'FAILED': 0,
-                        'UNKNOWN': 0
-                    }
-                
-                summary['by_device'][device_ip]['total'] += count
-                summary['by_device'][device_ip][result] = count
-            
-            return summary
-            
-        except Exception as e:
-            self.log_error(f"Error obteniendo resumen de eventos: {e}")
-            return {'error': str(e)}
-    
-    def refresh_known_devices(self):
-        """Recarga dispositivos conocidos desde la base de datos"""
-        self._load_known_devices()
-        logging.info("🔄 Dispositivos conocidos actualizados")
-    
-    def log_error(self, message: str):
-        """Log de errores con conteo"""
-        logging.error(message)
-        self.stats['events_errors'] += 1
-    
-    def get_queue_status(self) -> Dict[str, Any]:
-        """Obtiene estado de la cola de eventos"""
-        return {
-            'queue_size': self.event_queue.qsize(),
-            'queue_max_size': self.buffer_size,
-            'queue_full': self.event_queue.full(),
-            'batch_size': self.batch_size,
-            'events_in_queue_percent': (self.event_queue.qsize() / self.buffer_size) * 100
-        }
-
-def main():
-    """Función principal para testing"""
-    import sys
-    import os
-    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-    
-    from config import get_config
-    from database_manager import DatabaseManager
-    
-    # Configuración de prueba
-    config = get_config()
-    config.initialize()
-    
-    # Database manager
-    db_manager = DatabaseManager(config.get('DB_UDL_PATH'))
-    
-    # Crear event processor
-    event_processor = EventProcessor(db_manager, config)
-    
-    # Callback de ejemplo
-    def example_callback(event_data):
-        print(f"📨 Evento recibido: {event_data.get('event_type')} desde {event_data.get('_device_ip')}")
-    
-    event_processor.register_event_callback(example_callback)
-    
-    print(f"Event Processor iniciado en puerto {event_processor.listen_port}")
-    print("Comandos disponibles:")
-    print("  start - Iniciar procesador")
-    print("  stop - Detener procesador")
-    print("  stats - Ver estadísticas")
-    print("  simulate <type> - Simular evento (SUCCESS/FAILED)")
-    print("  recent - Ver eventos recientes")
-    print("  summary - Resumen de eventos (24h)")
-    print("  queue - Estado de la cola")
-    print("  quit - Salir")
-    
-    try:
-        while True:
-            try:
-                command = input("\nevent> ").strip().split()
-                
-                if not command:
-                    continue
-                
-                cmd = command[0].lower()
-                
-                if cmd == "start":
-                    event_processor.start()
-                    print("Event Processor iniciado")
-                
-                elif cmd == "stop":
-                    event_processor.stop()
-                    print("Event Processor detenido")
-                
-                elif cmd == "stats":
-                    stats = event_processor.get_statistics()
-                    print("Estadísticas:")
-                    for key, value in stats.items():
-                        print(f"  {key}: {value}")
-                
-                elif cmd == "simulate":
-                    event_type = command[1] if len(command) > 1 else "SUCCESS"
-                    event_processor.simulate_event(event_type=event_type)
-                    print(f"Evento {event_type} simulado")
-                
-                elif cmd == "recent":
-                    events = event_processor.get_recent_events(10)
-                    print(f"Últimos {len(events)} eventos:")
-                    for event in events:
-                        result_emoji = "✅" if event['access_result'] == 'SUCCESS' else "❌" if event['access_result'] == 'FAILED' else "❓"
-                        print(f"  {result_emoji} {event['device_ip']} - {event['person_name']} - {event['event_time']}")
-                
-                elif cmd == "summary":
-                    summary = event_processor.get_event_summary(24)
-                    print("Resumen (24h):")
-                    print(f"  Total eventos: {summary['total_events']}")
-                    print(f"  Exitosos: {summary['by_result']['SUCCESS']}")
-                    print(f"  Fallidos: {summary['by_result']['FAILED']}")
-                    print(f"  Dispositivos activos: {len(summary['by_device'])}")
-                
-                elif cmd == "queue":
-                    queue_status = event_processor.get_queue_status()
-                    print("Estado de la cola:")
-                    for key, value in queue_status.items():
-                        print(f"  {key}: {value}")
-                
-                elif cmd in ["quit", "exit"]:
-                    break
-                
-                elif cmd == "help":
-                    print("Comandos: start, stop, stats, simulate <type>, recent, summary, queue, quit")
-                
-                else:
-                    print(f"Comando desconocido: {cmd}")
-                    
-            except EOFError:
-                break
-            except KeyboardInterrupt:
-                break
-            except IndexError:
-                print("Parámetros insuficientes")
-    
-    except KeyboardInterrupt:
-        pass
-    finally:
-        print("\nCerrando Event Processor...")
-        event_processor.stop()
-
-if __name__ == "__main__":
-    main()event_processor.log_error(f"Error en EventHandler: {e}")
-            self.send_response(500)
-            self.end_headers()
-    
-    def log_message(self, format, *args):
-        """Suprimir logs HTTP automáticos"""
-        pass
-
-class EventProcessor:
-    """Procesador de eventos de acceso facial"""
-    
-    def __init__(self, db_manager, config):
-        self.db_manager = db_manager
-        self.config = config
-        
-        # Configuración
-        self.listen_port = config.get('EVENT_LISTEN_PORT', 8080)
-        self.buffer_size = config.get('EVENT_BUFFER_SIZE', 1000)
-        self.batch_size = config.get('EVENT_BATCH_SIZE', 50)
-        
-        # Estado del procesador
-        self.is_running = False
-        self.http_server = None
-        self.server_thread = None
-        
-        # Cola de eventos
-        self.event_queue = queue.Queue(maxsize=self.buffer_size)
-        self.processor_thread = None
-        
-        # Callbacks para distribución
-        self.event_callbacks: List[Callable] = []
-        
-        # Estadísticas
-        self.stats = {
-            'events_received': 0,
-            'events_processed': 0,
-            'events_dropped': 0,
-            'events_errors': 0,
-            'start_time': None
-        }
-        
-        # Cache de dispositivos conocidos
-        self.known_devices = {}
-        self._load_known_devices()
-        
-        logging.info("EventProcessor inicializado")
-    
-    def start(self):
-        """Inicia el procesador de eventos"""
-        if self.is_running:
-            logging.warning("EventProcessor ya está ejecutándose")
-            return
-        
-        try:
-            self.is_running = True
-            self.stats['start_time'] = datetime.now()
-            
-            # Iniciar servidor HTTP para recibir eventos
-            self._start_http_server()
-            
-            # Iniciar procesador de cola
-            self.processor_thread = threading.Thread(target=self._process_events_loop, daemon=True)
-            self.processor_thread.start()
-            
-            logging.info(f"✅ EventProcessor iniciado en puerto {self.listen_port}")
-            
-        except Exception as e:
-            self.is_running = False
-            logging.error(f"❌ Error iniciando EventProcessor: {e}")
-            raise
-    
-    def stop(self):
-        """Detiene el procesador de eventos"""
-        if not self.is_running:
-            return
-        
-        try:
-            logging.info("🛑 Deteniendo EventProcessor...")
-            self.is_running = False
-            
-            # Detener servidor HTTP
-            if self.http_server:
-                self.http_server.shutdown()
-                self.http_server = None
-            
-            # Esperar threads
-            if self.server_thread and self.server_thread.is_alive():
-                self.server_thread.join(timeout=5)
-            
-            if self.processor_thread and self.processor_thread.is_alive():
-                self.processor_thread.join(timeout=5)
-            
-            logging.info("✅ EventProcessor detenido")
-            
-        except Exception as e:
-            logging.error(f"❌ Error deteniendo EventProcessor: {e}")
-    
-    def _start_http_server(self):
-        """Inicia el servidor HTTP para recibir eventos"""
-        try:
-            # Crear handler con referencia a este procesador
-            def handler(*args, **kwargs):
-                EventHandler(self, *args, **kwargs)
-            
-            self.http_server = HTTPServer(('', self.listen_port), handler)
-            
-            def run_server():
-                logging.info(f"🌐 Servidor de eventos escuchando en puerto {self.listen_port}")
-                self.http_server.serve_forever()
-            
-            self.server_thread = threading.Thread(target=run_server, daemon=True)
-            self.server_thread.start()
+            rows = self.db_manager.get_event_minute_counts(self.event_aggregator.window_hours)
+            self.event_aggregator.seed(rows)
+            logging.info(f"📊 Agregados de eventos cargados ({len(rows)} buckets)")
             
         except Exception as e:
-            logging.error(f"Error iniciando servidor HTTP: {e}")
-            raise
+            # Sin carga inicial los resúmenes siguen consultando la BD
+            logging.warning(f"No se pudieron cargar agregados de eventos: {e}")
     
     def _load_known_devices(self):
         """Carga dispositivos conocidos desde la base de datos"""
@@ -551,7 +526,7 @@ class EventProcessor:
             self._enqueue_event(event_data)
             
         except Exception as e:
-            self.log_error(f"Error procesando evento JSON: {e}")
+            self.log_error("Error procesando evento JSON: %s", e)
     
     def process_multipart_event(self, data: bytes, content_type: str, device_ip: str):
         """Procesa evento en formato multipart (con imagen)"""
@@ -570,7 +545,7 @@ class EventProcessor:
                 self.log_error("No se pudo extraer JSON de evento multipart")
                 
         except Exception as e:
-            self.log_error(f"Error procesando evento multipart: {e}")
+            self.log_error("Error procesando evento multipart: %s", e)
     
     def process_binary_event(self, data: bytes, device_ip: str):
         """Procesa evento en formato binario"""
@@ -586,10 +561,10 @@ class EventProcessor:
                 self._enqueue_event(json_data)
             else:
                 # Log evento no procesable
-                self.log_error(f"Evento binario no procesable de {device_ip}")
+                self.log_error("Evento binario no procesable de %s", device_ip)
                 
         except Exception as e:
-            self.log_error(f"Error procesando evento binario: {e}")
+            self.log_error("Error procesando evento binario: %s", e)
     
     def _extract_json_from_multipart(self, data: bytes, content_type: str) -> Optional[Dict[str, Any]]:
         """Extrae JSON de datos multipart"""
@@ -628,7 +603,7 @@ class EventProcessor:
             return None
             
         except Exception as e:
-            self.log_error(f"Error extrayendo JSON de multipart: {e}")
+            self.log_error("Error extrayendo JSON de multipart: %s", e)
             return None
     
     def _extract_json_from_binary(self, data: bytes) -> Optional[Dict[str, Any]]:
@@ -689,56 +664,129 @@ class EventProcessor:
             return None
             
         except Exception as e:
-            self.log_error(f"Error extrayendo JSON de binario: {e}")
+            self.log_error("Error extrayendo JSON de binario: %s", e)
             return None
     
+    def _shard_for(self, device_ip: Optional[str]) -> int:
+        """Shard de un dispositivo (estable entre reinicios, a diferencia de hash())"""
+        return zlib.crc32(str(device_ip).encode('utf-8')) % self.worker_count
+    
+    def queue_size(self) -> int:
+        """Eventos pendientes en todos los shards"""
+        return sum(shard.qsize() for shard in self.event_shards)
+    
     def _enqueue_event(self, event_data: Dict[str, Any]):
-        """Encola evento para procesamiento"""
-        try:
-            self.event_queue.put_nowait(event_data)
+        """Encola evento para procesamiento (las retransmisiones se descartan)"""
+        if self.deduplicator.is_duplicate(event_data):
+            self.stats['events_duplicated'] += 1
+            EVENTS_DUPLICATED.inc()
+            logging.debug("Evento duplicado de %s descartado", event_data.get('_device_ip'))
+            return
+        
+        if self._put_event(self._shard_for(event_data.get('_device_ip')), (time.perf_counter(), event_data)):
             self.stats['events_received'] += 1
-            
-        except queue.Full:
+            EVENTS_RECEIVED.inc()
+        else:
+            # El terminal reintenta: la retransmisión de este evento debe poder entrar
+            self.deduplicator.forget(event_data)
             self.stats['events_dropped'] += 1
+            EVENTS_DROPPED.inc()
             self.log_error("Cola de eventos llena, descartando evento")
     
-    def _process_events_loop(self):
-        """Loop principal de procesamiento de eventos"""
-        logging.info("🔄 Procesador de eventos iniciado")
-        
-        while self.is_running:
+    def _put_event(self, index: int, item: Tuple[float, Dict[str, Any]]) -> bool:
+        """Encola en el shard o, si está lleno, al final del desborde a disco; False si no hay lugar"""
+        shard = self.event_shards[index]
+        if not self.spills:
             try:
-                # Procesar eventos en lotes
-                events_batch = []
-                
-                # Recoger lote de eventos
-                for _ in range(self.batch_size):
+                shard.put_nowait(item)
+                return True
+            except queue.Full:
+                return False
+        
+        spill = self.spills[index]
+        with spill.lock:
+            # Con eventos en disco los nuevos van detrás, para conservar el orden por dispositivo
+            if not spill.pending:
+                try:
+                    shard.put_nowait(item)
+                    return True
+                except queue.Full:
+                    pass
+            
+            if spill.append(self._spill_record(*item)):
+                self.stats['events_spilled'] += 1
+                EVENTS_SPILLED.inc()
+                return True
+        
+        # Desborde lleno (EVENT_SPILL_MAX_MB)
+        return False
+    
+    def _drain_spill(self, index: int):
+        """Devuelve a la cola del shard los eventos desbordados que entran, en orden"""
+        spill = self.spills[index]
+        if not spill.pending:
+            return
+        
+        shard = self.event_shards[index]
+        with spill.lock:
+            room = shard.maxsize - shard.qsize()
+            if room <= 0:
+                return
+            for record in spill.pop(room):
+                shard.put_nowait(self._spilled_item(record))
+    
+    def _process_events_loop(self, shard_index: int):
+        """Loop de un worker: procesa en orden los eventos de los dispositivos de su shard"""
+        logging.info(f"🔄 Procesador de eventos {shard_index} iniciado")
+        shard = self.event_shards[shard_index]
+        heartbeat_name = f'event_processor_{shard_index}'
+        heartbeat = get_watchdog().register(heartbeat_name)
+        
+        while self.is_running:
+            heartbeat.beat()
+            try:
+                if self.spills:
+                    self._drain_spill(shard_index)
+                
+                # Espera solo por el primer evento; el resto del lote es lo que ya está en cola
+                try:
+                    events_batch = [shard.get(timeout=1.0)]
+                except queue.Empty:
+                    continue
+                
+                while len(events_batch) < self.batch_size:
                     try:
-                        event = self.event_queue.get(timeout=1.0)
-                        events_batch.append(event)
+                        events_batch.append(shard.get_nowait())
                     except queue.Empty:
                         break
                 
-                # Procesar lote si hay eventos
-                if events_batch:
-                    self._process_events_batch(events_batch)
+                self._process_events_batch(events_batch)
+                self.shard_processed[shard_index] += len(events_batch)
                 
             except Exception as e:
-                self.log_error(f"Error en loop de procesamiento: {e}")
+                self.log_error("Error en loop de procesamiento: %s", e)
                 time.sleep(1)
         
-        logging.info("🔄 Procesador de eventos finalizado")
+        get_watchdog().unregister(heartbeat_name)
+        logging.info(f"🔄 Procesador de eventos {shard_index} finalizado")
     
-    def _process_events_batch(self, events: List[Dict[str, Any]]):
+    def _process_events_batch(self, events: List[Tuple[float, Dict[str, Any]]]):
         """Procesa un lote de eventos"""
-        for event in events:
+        processed = 0
+        for enqueued_at, event in events:
             try:
                 self._process_single_event(event)
-                self.stats['events_processed'] += 1
+                processed += 1
+                EVENT_INGEST_SECONDS.observe(time.perf_counter() - enqueued_at)
                 
             except Exception as e:
-                self.stats['events_errors'] += 1
-                self.log_error(f"Error procesando evento: {e}")
+                self.log_error("Error procesando evento: %s", e)
+        
+        with self.stats_lock:
+            self.stats['events_processed'] += processed
+        
+        # Si otro worker está escribiendo los conteos, estos salen con su próximo lote
+        self._flush_hourly_rollup(wait=False)
     
     def _process_single_event(self, event_data: Dict[str, Any]):
         """Procesa un evento individual"""
@@ -751,13 +799,13 @@ class EventProcessor:
             elif 'eventType' in event_data:
                 self._process_generic_event(event_data)
             else:
-                logging.debug(f"Evento no reconocido de {device_ip}")
+                logging.debug("Evento no reconocido de %s", device_ip)
             
             # Distribuir a callbacks registrados
             self._distribute_event(event_data)
             
         except Exception as e:
-            self.log_error(f"Error procesando evento individual: {e}")
+            self.log_error("Error procesando evento individual: %s", e)
     
     def _process_access_control_event(self, event_data: Dict[str, Any]):
         """Procesa evento específico de control de acceso"""
@@ -787,14 +835,483 @@ class EventProcessor:
                 
                 # Guardar en base de datos
                 self._save_event_to_database(processed_event)
+                self._remember_event(processed_event)
+                
+                # Log del evento (formateo diferido al thread de logging)
+                if event_logger.isEnabledFor(logging.INFO):
+                    event_logger.info("%s Evento facial - %s (%s) - Usuario: %s (%s) - Resultado: %s",
+                                      "✅" if minor_type == 75 else "❌", self._get_device_name(device_ip),
+                                      device_ip, processed_event['person_name'],
+                                      processed_event['employee_no'], processed_event['access_result'])
+            
+        except Exception as e:
+            self.log_error("Error procesando evento de control de acceso: %s", e)
+    
+    def _process_generic_event(self, event_data: Dict[str, Any]):
+        """Procesa evento genérico"""
+        try:
+            device_ip = event_data.get('_device_ip')
+            event_type = event_data.get('eventType', 'UNKNOWN')
+            
+            processed_event = {
+                'device_ip': device_ip,
+                'event_type': event_type,
+                'event_code': '',
+                'person_id': '',
+                'employee_no': '',
+                'person_name': '',
+                'verify_mode': '',
+                'access_result': 'UNKNOWN',
+                'event_time': event_data.get('dateTime', datetime.now().isoformat()),
+                'raw_data': json.dumps(event_data)
+            }
+            
+            # Guardar eventos genéricos también
+            self._save_event_to_database(processed_event)
+            self._remember_event(processed_event)
+            
+            if event_logger.isEnabledFor(logging.DEBUG):
+                event_logger.debug("📨 Evento genérico - %s (%s) - Tipo: %s",
+                                   self._get_device_name(device_ip), device_ip, event_type)
+            
+        except Exception as e:
+            self.log_error("Error procesando evento genérico: %s", e)
+    
+    def _save_event_to_database(self, event_data: Dict[str, Any]):
+        """Guarda evento en la base de datos"""
+        try:
+            self.db_manager.log_access_event(
+                device_ip=event_data['device_ip'],
+                event_type=event_data['event_type'],
+                event_code=event_data.get('event_code'),
+                persona_id=self.persona_cache.resolve(event_data.get('employee_no')),
+                employee_no=event_data.get('employee_no'),
+                person_name=event_data.get('person_name'),
+                verify_mode=event_data.get('verify_mode'),
+                access_result=event_data.get('access_result'),
+                event_time=event_data['event_time'],
+                raw_data=event_data.get('raw_data')
+            )
+            
+        except Exception as e:
+            self.log_error("Error guardando evento en BD: %s", e)
+    
+    def _remember_event(self, processed_event: Dict[str, Any]):
+        """Registra el evento guardado en el buffer de recientes y en los conteos por minuto"""
+        self.recent_events.add(processed_event)
+        self.event_aggregator.add(
+            processed_event['device_ip'],
+            processed_event['access_result'],
+            processed_event['event_time']
+        )
+        
+        if self.rollup_enabled:
+            key = (
+                processed_event['device_ip'],
+                processed_event['access_result'] or 'UNKNOWN',
+                hour_start(processed_event['event_time']) or hour_start(datetime.now())
+            )
+            with self.hourly_lock:
+                self.hourly_counts[key] = self.hourly_counts.get(key, 0) + 1
+    
+    def _flush_hourly_rollup(self, wait: bool = True):
+        """Suma a access_events_hourly los conteos acumulados; si falla se reintentan con el próximo lote"""
+        if not self.rollup_flush_lock.acquire(blocking=wait):
+            return
+        
+        try:
+            self._write_hourly_counts()
+        finally:
+            self.rollup_flush_lock.release()
+    
+    def _write_hourly_counts(self):
+        """MERGE de los conteos pendientes (con rollup_flush_lock tomado)"""
+        with self.hourly_lock:
+            counts, self.hourly_counts = self.hourly_counts, {}
+        if not counts:
+            return
+        
+        try:
+            self.db_manager.upsert_event_hourly(counts)
+            
+        except Exception as e:
+            with self.hourly_lock:
+                for key, count in counts.items():
+                    self.hourly_counts[key] = self.hourly_counts.get(key, 0) + count
+            self.stats['rollup_errors'] += 1
+            logging.warning("No se pudo actualizar access_events_hourly (%s filas pendientes): %s", len(counts), e)
+    
+    def rebuild_hourly_rollup(self, start: datetime, end: datetime) -> int:
+        """Recalcula access_events_hourly en [start, end) sin sumar dos veces los conteos pendientes"""
+        with self.rollup_flush_lock:
+            # Los eventos de esas horas ya están en access_events: el recálculo los cuenta
+            with self.hourly_lock:
+                for key in [key for key in self.hourly_counts if start <= key[2] < end]:
+                    del self.hourly_counts[key]
+            self._write_hourly_counts()
+            
+            return self.db_manager.rebuild_event_hourly(start, end)
+    
+    def _distribute_event(self, event_data: Dict[str, Any]):
+        """Encola el evento para cada callback registrado (se ejecutan en los threads del dispatcher)"""
+        self.dispatcher.dispatch(event_data)
+    
+    def _get_device_name(self, device_ip: str) -> str:
+        """Obtiene nombre del dispositivo por IP"""
+        device_info = self.known_devices.get(device_ip)
+        if device_info:
+            return device_info['nombre']
+        return f"Device_{device_ip}"
+    
+    def register_event_callback(self, callback: Callable[[Dict[str, Any]], None], policy: str = None,
+                                queue_size: int = None):
+        """Registra callback para recibir eventos procesados (policy: drop_oldest | drop_newest | block)"""
+        subscriber = self.dispatcher.subscribe(callback, policy=policy, queue_size=queue_size)
+        logging.info(f"📡 Callback de eventos registrado: {subscriber.name} "
+                     f"({subscriber.policy}, {len(self.dispatcher)} total)")
+    
+    def unregister_event_callback(self, callback: Callable):
+        """Desregistra callback de eventos"""
+        if self.dispatcher.unsubscribe(callback):
+            logging.info(f"📡 Callback de eventos desregistrado ({len(self.dispatcher)} total)")
+    
+    def simulate_event(self, device_ip: str = "192.168.1.100", event_type: str = "SUCCESS"):
+        """Simula un evento para testing"""
+        try:
+            if event_type == "SUCCESS":
+                event_data = {
+                    "AccessControllerEvent": {
+                        "majorEventType": 5,
+                        "subEventType": 75,
+                        "employeeNoString": "EMP001",
+                        "name": "Usuario Prueba",
+                        "currentVerifyMode": "Face"
+                    },
+                    "dateTime": datetime.now().isoformat(),
+                    "_device_ip": device_ip,
+                    "_received_at": datetime.now().isoformat(),
+                    "_format": "simulated"
+                }
+            else:
+                event_data = {
+                    "AccessControllerEvent": {
+                        "majorEventType": 5,
+                        "subEventType": 76,
+                        "employeeNoString": "",
+                        "name": "",
+                        "currentVerifyMode": "Face"
+                    },
+                    "dateTime": datetime.now().isoformat(),
+                    "_device_ip": device_ip,
+                    "_received_at": datetime.now().isoformat(),
+                    "_format": "simulated"
+                }
+            
+            self._enqueue_event(event_data)
+            logging.info("🎭 Evento simulado: %s desde %s", event_type, device_ip)
+            
+        except Exception as e:
+            self.log_error("Error simulando evento: %s", e)
+    
+    def get_statistics(self) -> Dict[str, Any]:
+        """Obtiene estadísticas del procesador"""
+        uptime = None
+        if self.stats['start_time']:
+            uptime = (datetime.now() - self.stats['start_time']).total_seconds()
+        
+        return {
+            'is_running': self.is_running,
+            'listen_port': self.listen_port,
+            'queue_size': self.queue_size(),
+            'workers': self.worker_count,
+            'known_devices': len(self.known_devices),
+            'registered_callbacks': len(self.dispatcher),
+            'callbacks': self.dispatcher.get_status(),
+            'recent_events': self.recent_events.get_status(),
+            'event_aggregates': self.event_aggregator.get_status(),
+            'persona_cache': self.persona_cache.get_status(),
+            'dedup': self.deduplicator.get_status(),
+            'stats': self.stats.copy(),
+            'uptime_seconds': uptime
+        }
+    
+    def get_recent_events(self, limit: int = 50, device_ip: str = None) -> List[Dict[str, Any]]:
+        """Obtiene eventos recientes (del buffer en memoria; de la BD si exceden lo que contiene)"""
+        try:
+            events = self.recent_events.get(limit, device_ip)
+            if events is not None:
+                RECENT_EVENT_QUERIES.labels('memory').inc()
+                return events
+            
+            RECENT_EVENT_QUERIES.labels('sql').inc()
+            return self._query_recent_events(limit, device_ip)
+            
+        except Exception as e:
+            self.log_error(f"Error obteniendo eventos recientes: {e}")
+            return []
+    
+    def _query_recent_events(self, limit: int, device_ip: str = None) -> List[Dict[str, Any]]:
+        """Eventos más recientes de access_events"""
+        return self.db_manager.get_recent_access_events(limit, device_ip)
+    
+    def clear_old_events(self, days_old: int = 30) -> int:
+        """Limpia eventos antiguos de la base de datos (en bloques, sin bloquear al writer)"""
+        try:
+            deleted_count = self.db_manager.purge_expired(
+                'access_events', days_old, self.config.get('RETENTION_CHUNK_SIZE', 1000)
+            )
+            
+            logging.info(f"🧹 {deleted_count} eventos antiguos eliminados")
+            return deleted_count
+            
+        except Exception as e:
+            self.log_error(f"Error limpiando eventos antiguos: {e}")
+            return 0
+    
+    def get_event_summary(self, hours: int = 24) -> Dict[str, Any]:
+        """Obtiene resumen de eventos de las últimas horas (de los agregados en memoria si cubren el período)"""
+        try:
+            counts = self.event_aggregator.counts(hours)
+            if counts is not None:
+                results = [(device_ip, result, count) for (device_ip, result), count in sorted(
+                    counts.items(), key=lambda item: (str(item[0][0]), str(item[0][1])))]
+            elif self.rollup_available():
+                # Por horas completas: la hora actual más las (hours - 1) anteriores
+                since = hour_start(datetime.now()) - timedelta(hours=hours - 1)
+                results = self.db_manager.get_event_counts(since)
+            else:
+                query = """
+                SELECT 
+                    DeviceIP,
+                    AccessResult,
+                    COUNT(*) as EventCount
+                FROM access_events 
+                WHERE EventTime >= DATEADD(HOUR, -?, GETDATE())
+                GROUP BY DeviceIP, AccessResult
+                ORDER BY DeviceIP, AccessResult
+                """
                 
-                # Log del evento
-                device_name = self._get_device_name(device_ip)
-                status_emoji = "✅" if minor_type == 75 else "❌"
+                results = self.db_manager.execute_query(query, [hours])
+            
+            summary = {
+                'period_hours': hours,
+                'total_events': 0,
+                'by_device': {},
+                'by_result': {'SUCCESS': 0, 'FAILED': 0, 'UNKNOWN': 0}
+            }
+            
+            for row in results:
+                device_ip = row[0]
+                result = row[1] or 'UNKNOWN'
+                count = row[2]
                 
-                logging.info(f"{status_emoji} Evento facial - {device_name} ({device_ip}) - "
-                           f"Usuario: {processed_event['person_name']} ({processed_event['employee_no']}) - "
-                           f"Resultado: {processed_event['access_result']}")
+                summary['total_events'] += count
+                summary['by_result'][result] = summary['by_result'].get(result, 0) + count
+                
+                if device_ip not in summary['by_device']:
+                    summary['by_device'][device_ip] = {
+                        'device_name': self._get_device_name(device_ip),
+                        'total': 0,
+                        'SUCCESS': 0,
+                        'FAILED': 0,
+                        'UNKNOWN': 0
+                    }
+                
+                summary['by_device'][device_ip]['total'] += count
+                summary['by_device'][device_ip][result] = count
+            
+            return summary
             
         except Exception as e:
-            self.
\ No newline at end of file
+            self.log_error(f"Error obteniendo resumen de eventos: {e}")
+            return {'error': str(e)}
+    
+    def rollup_available(self) -> bool:
+        """access_events_hourly cubre todo el histórico (RollupWorker completó el backfill)"""
+        return self.rollup_enabled and bool(self.config.get('EVENT_ROLLUP_BACKFILLED', False))
+    
+    def get_event_report(self, start: datetime, end: datetime = None, device_ip: str = None,
+                         group_by: str = 'day') -> Dict[str, Any]:
+        """Conteos por período, dispositivo y resultado en [start, end) (de access_events_hourly si está completa)"""
+        use_rollup = self.rollup_available()
+        if use_rollup:
+            # La tabla agregada tiene resolución de una hora
+            start = hour_start(start)
+        
+        rows = self.db_manager.get_event_counts(start, end, device_ip, group_by, use_rollup=use_rollup)
+        
+        report = {
+            'start': start.isoformat(),
+            'end': end.isoformat() if end else None,
+            'group_by': group_by,
+            'source': 'rollup' if use_rollup else 'access_events',
+            'total_events': 0,
+            'rows': []
+        }
+        
+        for row in rows:
+            period = row[0] if group_by else None
+            row_device_ip, result, count = row[-3], row[-2], row[-1]
+            
+            report['total_events'] += count
+            report['rows'].append({
+                'period': period.isoformat() if hasattr(period, 'isoformat') else period,
+                'device_ip': row_device_ip,
+                'device_name': self._get_device_name(row_device_ip),
+                'access_result': result,
+                'count': count
+            })
+        
+        return report
+    
+    def refresh_known_devices(self):
+        """Recarga dispositivos conocidos desde la base de datos"""
+        self._load_known_devices()
+        logging.info("🔄 Dispositivos conocidos actualizados")
+    
+    def log_error(self, message: str, *args):
+        """Log de errores con conteo (args %-style: se formatea en el listener de logging)"""
+        logging.error(message, *args)
+        with self.stats_lock:
+            self.stats['events_errors'] += 1
+    
+    def get_queue_status(self) -> Dict[str, Any]:
+        """Obtiene estado de la cola de eventos"""
+        queue_size = self.queue_size()
+        queue_max_size = sum(shard.maxsize for shard in self.event_shards)
+        
+        return {
+            'queue_size': queue_size,
+            'queue_max_size': queue_max_size,
+            'queue_full': any(shard.full() for shard in self.event_shards),
+            'batch_size': self.batch_size,
+            'events_in_queue_percent': (queue_size / queue_max_size) * 100,
+            'workers': self.worker_count,
+            'spill': {
+                'enabled': bool(self.spills),
+                'pending': self.spill_pending(),
+                'size_bytes': sum(spill.size_bytes for spill in self.spills) if self.spills else 0
+            },
+            'shards': [
+                {
+                    'shard': index,
+                    'queue_size': shard.qsize(),
+                    'queue_max_size': shard.maxsize,
+                    'queue_full': shard.full(),
+                    'spilled': self.spills[index].pending if self.spills else 0,
+                    'events_processed': self.shard_processed[index]
+                }
+                for index, shard in enumerate(self.event_shards)
+            ]
+        }
+
+def main():
+    """Función principal para testing"""
+    import sys
+    import os
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    
+    from config import get_config
+    from database_manager import DatabaseManager
+    
+    # Configuración de prueba
+    config = get_config()
+    config.initialize()
+    
+    # Database manager
+    db_manager = DatabaseManager(config.get('DB_UDL_PATH'))
+    
+    # Crear event processor
+    event_processor = EventProcessor(db_manager, config)
+    
+    # Callback de ejemplo
+    def example_callback(event_data):
+        print(f"📨 Evento recibido: {event_data.get('event_type')} desde {event_data.get('_device_ip')}")
+    
+    event_processor.register_event_callback(example_callback)
+    
+    print(f"Event Processor iniciado en puerto {event_processor.listen_port}")
+    print("Comandos disponibles:")
+    print("  start - Iniciar procesador")
+    print("  stop - Detener procesador")
+    print("  stats - Ver estadísticas")
+    print("  simulate <type> - Simular evento (SUCCESS/FAILED)")
+    print("  recent - Ver eventos recientes")
+    print("  summary - Resumen de eventos (24h)")
+    print("  queue - Estado de la cola")
+    print("  quit - Salir")
+    
+    try:
+        while True:
+            try:
+                command = input("\nevent> ").strip().split()
+                
+                if not command:
+                    continue
+                
+                cmd = command[0].lower()
+                
+                if cmd == "start":
+                    event_processor.start()
+                    print("Event Processor iniciado")
+                
+                elif cmd == "stop":
+                    event_processor.stop()
+                    print("Event Processor detenido")
+                
+                elif cmd == "stats":
+                    stats = event_processor.get_statistics()
+                    print("Estadísticas:")
+                    for key, value in stats.items():
+                        print(f"  {key}: {value}")
+                
+                elif cmd == "simulate":
+                    event_type = command[1] if len(command) > 1 else "SUCCESS"
+                    event_processor.simulate_event(event_type=event_type)
+                    print(f"Evento {event_type} simulado")
+                
+                elif cmd == "recent":
+                    events = event_processor.get_recent_events(10)
+                    print(f"Últimos {len(events)} eventos:")
+                    for event in events:
+                        result_emoji = "✅" if event['access_result'] == 'SUCCESS' else "❌" if event['access_result'] == 'FAILED' else "❓"
+                        print(f"  {result_emoji} {event['device_ip']} - {event['person_name']} - {event['event_time']}")
+                
+                elif cmd == "summary":
+                    summary = event_processor.get_event_summary(24)
+                    print("Resumen (24h):")
+                    print(f"  Total eventos: {summary['total_events']}")
+                    print(f"  Exitosos: {summary['by_result']['SUCCESS']}")
+                    print(f"  Fallidos: {summary['by_result']['FAILED']}")
+                    print(f"  Dispositivos activos: {len(summary['by_device'])}")
+                
+                elif cmd == "queue":
+                    queue_status = event_processor.get_queue_status()
+                    print("Estado de la cola:")
+                    for key, value in queue_status.items():
+                        print(f"  {key}: {value}")
+                
+                elif cmd in ["quit", "exit"]:
+                    break
+                
+                elif cmd == "help":
+                    print("Comandos: start, stop, stats, simulate <type>, recent, summary, queue, quit")
+                
+                else:
+                    print(f"Comando desconocido: {cmd}")
+                    
+            except EOFError:
+                break
+            except KeyboardInterrupt:
+                break
+            except IndexError:
+                print("Parámetros insuficientes")
+    
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("\nCerrando Event Processor...")
+        event_processor.stop()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
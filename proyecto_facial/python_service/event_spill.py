@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Desborde a disco para Facial Sync Service
+Cola FIFO en segmentos append-only (JSON por línea) para eventos que no entran en la cola en memoria
+"""
+
+import os
+import json
+import time
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+SEGMENT_PREFIX = 'segment_'
+SEGMENT_SUFFIX = '.spill'
+CURSOR_FILE = 'cursor.json'
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+class EventSpill:
+    """Segmentos append-only con cursor de lectura persistente; sobrevive a reinicios del servicio"""
+    
+    def __init__(self, directory: str, segment_bytes: int = 16 * 1024 * 1024, max_bytes: int = 512 * 1024 * 1024,
+                 fsync: str = 'interval', fsync_interval: float = 1.0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Política de fsync inválida: {fsync} (opciones: {', '.join(FSYNC_POLICIES)})")
+        
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        
+        # El llamador toma el lock para decidir cola/disco y encolar en el mismo paso (orden FIFO)
+        self.lock = threading.RLock()
+        
+        self.write_file = None
+        self.write_bytes = 0
+        self.last_fsync = time.monotonic()
+        
+        self.stats = {
+            'appended': 0,
+            'drained': 0,
+            'rejected': 0,
+            'corrupt': 0
+        }
+        
+        self._recover()
+    
+    def _segment_path(self, number: int) -> Path:
+        return self.directory / f"{SEGMENT_PREFIX}{number:08d}{SEGMENT_SUFFIX}"
+    
+    def _segments(self) -> List[int]:
+        if not self.directory.exists():
+            return []
+        numbers = []
+        for path in self.directory.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"):
+            try:
+                numbers.append(int(path.name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+            except ValueError:
+                continue
+        return sorted(numbers)
+    
+    def _recover(self):
+        """Retoma segmentos de una ejecución anterior desde el cursor guardado"""
+        segments = self._segments()
+        
+        cursor = {}
+        cursor_path = self.directory / CURSOR_FILE
+        if cursor_path.exists():
+            try:
+                with open(cursor_path, 'r', encoding='utf-8') as f:
+                    cursor = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Cursor de desborde ilegible ({cursor_path}): {e}")
+        
+        # Segmentos anteriores al cursor ya se leyeron completos
+        for number in [n for n in segments if n < cursor.get('segment', 0)]:
+            try:
+                os.remove(self._segment_path(number))
+            except OSError as e:
+                logging.warning(f"No se pudo borrar segmento de desborde {number}: {e}")
+            segments.remove(number)
+        
+        self.read_segment = segments[0] if segments else 0
+        self.read_offset = cursor.get('offset', 0) if segments and cursor.get('segment') == self.read_segment else 0
+        
+        # Nunca se escribe en un segmento anterior: una línea cortada por un corte queda al final del suyo
+        self.write_segment = (segments[-1] + 1) if segments else 0
+        
+        self.size_bytes = sum(self._segment_path(n).stat().st_size for n in segments)
+        self.pending = 0
+        for number in segments:
+            offset = self.read_offset if number == self.read_segment else 0
+            with open(self._segment_path(number), 'rb') as f:
+                f.seek(offset)
+                self.pending += sum(1 for line in f if line.endswith(b'\n'))
+        
+        if self.pending:
+            logging.info(f"💾 {self.pending} eventos desbordados pendientes en {self.directory}")
+    
+    def _remove_segment(self, number: int):
+        path = self._segment_path(number)
+        try:
+            self.size_bytes -= path.stat().st_size
+            os.remove(path)
+        except OSError as e:
+            logging.warning(f"No se pudo borrar segmento de desborde {path}: {e}")
+    
+    def append(self, record: Dict[str, Any]) -> bool:
+        """Agrega un registro al final; False si se alcanzó max_bytes"""
+        line = (json.dumps(record, ensure_ascii=False, default=str, separators=(',', ':')) + '\n').encode('utf-8')
+        
+        with self.lock:
+            if self.size_bytes + len(line) > self.max_bytes:
+                self.stats['rejected'] += 1
+                return False
+            
+            if self.write_file is None or self.write_bytes >= self.segment_bytes:
+                self._rotate()
+            
+            self.write_file.write(line)
+            self.write_file.flush()
+            self.write_bytes += len(line)
+            self.size_bytes += len(line)
+            self.pending += 1
+            self.stats['appended'] += 1
+            
+            now = time.monotonic()
+            if self.fsync == 'always' or (self.fsync == 'interval' and now - self.last_fsync >= self.fsync_interval):
+                os.fsync(self.write_file.fileno())
+                self.last_fsync = now
+            
+            return True
+    
+    def _rotate(self):
+        """Cierra el segmento de escritura y abre el siguiente"""
+        if self.write_file is not None:
+            self._close_write_file()
+            self.write_segment += 1
+        
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.write_file = open(self._segment_path(self.write_segment), 'ab')
+        self.write_bytes = self.write_file.tell()
+    
+    def _close_write_file(self):
+        if self.fsync != 'never':
+            os.fsync(self.write_file.fileno())
+        self.write_file.close()
+        self.write_file = None
+    
+    def pop(self, limit: int) -> List[Dict[str, Any]]:
+        """Hasta limit registros en orden de llegada (se consumen y el cursor avanza)"""
+        records: List[Dict[str, Any]] = []
+        
+        with self.lock:
+            while len(records) < limit and self.pending > 0:
+                path = self._segment_path(self.read_segment)
+                is_write_segment = self.write_file is not None and self.read_segment == self.write_segment
+                
+                if path.exists():
+                    with open(path, 'rb') as f:
+                        f.seek(self.read_offset)
+                        while len(records) < limit:
+                            line = f.readline()
+                            if not line.endswith(b'\n'):
+                                break
+                            self.read_offset += len(line)
+                            self.pending -= 1
+                            record = self._decode(line)
+                            if record is not None:
+                                records.append(record)
+                    
+                    if len(records) >= limit:
+                        break
+                
+                if is_write_segment:
+                    break
+                
+                # Segmento leído completo (o una línea cortada al final): se borra y se pasa al siguiente
+                if self.read_segment >= self.write_segment and self.write_file is None:
+                    break
+                self._remove_segment(self.read_segment)
+                self.read_segment += 1
+                self.read_offset = 0
+            
+            # Todo leído: los segmentos cerrados no siguen ocupando max_bytes
+            if self.pending == 0:
+                while self.read_segment < self.write_segment:
+                    self._remove_segment(self.read_segment)
+                    self.read_segment += 1
+                    self.read_offset = 0
+            
+            if records:
+                self.stats['drained'] += len(records)
+                self._save_cursor()
+        
+        return records
+    
+    def _decode(self, line: bytes) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(line)
+        except ValueError:
+            self.stats['corrupt'] += 1
+            logging.warning(f"Registro de desborde ilegible descartado en {self.directory}")
+            return None
+    
+    def _save_cursor(self):
+        tmp_path = self.directory / (CURSOR_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'segment': self.read_segment, 'offset': self.read_offset}, f)
+        os.replace(tmp_path, self.directory / CURSOR_FILE)
+    
+    def close(self):
+        """Cierra el segmento de escritura (con fsync salvo política 'never')"""
+        with self.lock:
+            if self.write_file is not None:
+                self._close_write_file()
+                self.write_segment += 1
+    
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'pending': self.pending,
+                'size_bytes': self.size_bytes,
+                'max_bytes': self.max_bytes,
+                'segments': self.write_segment - self.read_segment + (1 if self.write_file else 0),
+                'fsync': self.fsync,
+                'stats': self.stats.copy()
+            }
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Agregados de eventos para Facial Sync Service
+Conteos por dispositivo y resultado en buckets de un minuto sobre una ventana deslizante
+"""
+
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple, Any, Optional
+
+# Minutos se cuentan sobre hora local sin zona, igual que EventTime en access_events
+EPOCH = datetime(1970, 1, 1)
+
+def minute_of(value: Any) -> Optional[int]:
+    """Minuto (desde 1970, hora local) de un datetime o string ISO; None si no se puede interpretar"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    
+    # SQL Server guarda la hora del dispositivo descartando el offset: se hace lo mismo
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None)
+    return int((value - EPOCH).total_seconds() // 60)
+
+def hour_start(value: Any) -> Optional[datetime]:
+    """Inicio de la hora (hora local sin zona) de un datetime o string ISO"""
+    minute = minute_of(value)
+    if minute is None:
+        return None
+    return EPOCH + timedelta(minutes=minute - minute % 60)
+
+class EventAggregator:
+    """Conteos de eventos por minuto en un anillo de buckets; los totales de la ventana se mantienen al día"""
+    
+    def __init__(self, window_hours: int = 24):
+        self.lock = threading.Lock()
+        self.configure(window_hours)
+    
+    def configure(self, window_hours: int):
+        """Fija el tamaño de la ventana (descarta los conteos)"""
+        with self.lock:
+            self.window_minutes = int(window_hours * 60)
+            self.bucket_minutes: List[Optional[int]] = [None] * self.window_minutes
+            self.buckets: List[Dict[Tuple[str, str], int]] = [{} for _ in range(self.window_minutes)]
+            self.totals: Dict[Tuple[str, str], int] = {}
+            self.expired_through = None
+            self.seeded = False
+            
+            self.stats = {
+                'events_added': 0,
+                'events_out_of_window': 0,
+                'seeded_at': None
+            }
+    
+    @property
+    def window_hours(self) -> float:
+        return self.window_minutes / 60
+    
+    def _now_minute(self) -> int:
+        return minute_of(datetime.now())
+    
+    def _expire(self, now_minute: int):
+        """Descuenta de los totales los buckets que salieron de la ventana"""
+        cutoff = now_minute - self.window_minutes
+        if self.expired_through is not None and cutoff <= self.expired_through:
+            return
+        
+        if self.expired_through is None or cutoff - self.expired_through >= self.window_minutes:
+            # Primera vez o más de una vuelta sin actividad: se revisa todo el anillo
+            slots = range(self.window_minutes)
+        else:
+            slots = (minute % self.window_minutes for minute in range(self.expired_through + 1, cutoff + 1))
+        
+        for slot in slots:
+            minute = self.bucket_minutes[slot]
+            if minute is not None and minute <= cutoff:
+                self._clear_slot(slot)
+        self.expired_through = cutoff
+    
+    def _clear_slot(self, slot: int):
+        for key, count in self.buckets[slot].items():
+            remaining = self.totals.get(key, 0) - count
+            if remaining > 0:
+                self.totals[key] = remaining
+            else:
+                self.totals.pop(key, None)
+        self.buckets[slot] = {}
+        self.bucket_minutes[slot] = None
+    
+    def _add(self, minute: int, key: Tuple[str, str], count: int, now_minute: int) -> bool:
+        # Relojes adelantados se cuentan en el minuto actual
+        minute = min(minute, now_minute)
+        if minute <= now_minute - self.window_minutes:
+            self.stats['events_out_of_window'] += count
+            return False
+        
+        slot = minute % self.window_minutes
+        if self.bucket_minutes[slot] != minute:
+            self._clear_slot(slot)
+            self.bucket_minutes[slot] = minute
+        
+        bucket = self.buckets[slot]
+        bucket[key] = bucket.get(key, 0) + count
+        self.totals[key] = self.totals.get(key, 0) + count
+        return True
+    
+    def add(self, device_ip: str, access_result: str, event_time: Any = None):
+        """Cuenta un evento procesado (event_time del dispositivo; si no se interpreta, ahora)"""
+        now_minute = self._now_minute()
+        minute = minute_of(event_time) if event_time is not None else None
+        
+        with self.lock:
+            self._expire(now_minute)
+            if self._add(now_minute if minute is None else minute, (device_ip, access_result), 1, now_minute):
+                self.stats['events_added'] += 1
+    
+    def seed(self, rows: List[Tuple[str, str, Any, int]]):
+        """Carga inicial con filas (DeviceIP, AccessResult, minuto o datetime, cantidad) de la BD"""
+        now_minute = self._now_minute()
+        
+        with self.lock:
+            self._expire(now_minute)
+            for device_ip, access_result, minute, count in rows:
+                if not isinstance(minute, int):
+                    minute = minute_of(minute)
+                if minute is not None:
+                    self._add(minute, (device_ip, access_result), int(count), now_minute)
+            
+            self.seeded = True
+            self.stats['seeded_at'] = datetime.now()
+    
+    def counts(self, hours: float = None) -> Optional[Dict[Tuple[str, str], int]]:
+        """Conteos por (dispositivo, resultado) de las últimas horas; None si no hay carga inicial o excede la ventana"""
+        if not self.seeded:
+            return None
+        
+        minutes = self.window_minutes if hours is None else int(hours * 60)
+        if minutes > self.window_minutes:
+            return None
+        
+        now_minute = self._now_minute()
+        with self.lock:
+            self._expire(now_minute)
+            if minutes == self.window_minutes:
+                return dict(self.totals)
+            
+            # Ventana parcial: se suman solo los buckets dentro del rango
+            counts: Dict[Tuple[str, str], int] = {}
+            for minute in range(now_minute - minutes + 1, now_minute + 1):
+                slot = minute % self.window_minutes
+                if self.bucket_minutes[slot] != minute:
+                    continue
+                for key, count in self.buckets[slot].items():
+                    counts[key] = counts.get(key, 0) + count
+            return counts
+    
+    def get_statistics(self, hours: float = None) -> Optional[Dict[str, Dict[str, int]]]:
+        """Conteos como {device_ip: {access_result: cantidad}} (formato de DatabaseManager.get_event_statistics)"""
+        counts = self.counts(hours)
+        if counts is None:
+            return None
+        
+        stats: Dict[str, Dict[str, int]] = {}
+        for (device_ip, access_result), count in sorted(counts.items(), key=lambda item: (str(item[0][0]), str(item[0][1]))):
+            stats.setdefault(device_ip, {})[access_result] = count
+        return stats
+    
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            active_buckets = sum(1 for minute in self.bucket_minutes if minute is not None)
+            return {
+                'window_hours': self.window_hours,
+                'seeded': self.seeded,
+                'active_buckets': active_buckets,
+                'series': len(self.totals),
+                'events_in_window': sum(self.totals.values()),
+                'events_added': self.stats['events_added'],
+                'events_out_of_window': self.stats['events_out_of_window'],
+                'seeded_at': self.stats['seeded_at'].isoformat() if self.stats['seeded_at'] else None
+            }
+
+# Instancia global de agregados de eventos
+event_aggregator = EventAggregator()
+
+def get_event_aggregator() -> EventAggregator:
+    """Obtiene la instancia global de agregados de eventos"""
+    return event_aggregator
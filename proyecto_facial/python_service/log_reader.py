@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lector de logs para Facial Sync Service
+Lectura desde el final del archivo e índice de offsets por nivel y hora, para texto y JSON-lines
+"""
+
+import os
+import re
+import json
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+LEVEL_CODES = {level: code for code, level in enumerate(LEVELS)}
+
+# Bloques de lectura: hacia atrás para tail, hacia adelante para indexar
+TAIL_BLOCK_SIZE = 64 * 1024
+INDEX_CHUNK_SIZE = 1024 * 1024
+
+# Formato texto de Config.setup_logging: "2024-01-01 08:00:00 - logger - LEVEL - mensaje"
+TEXT_RECORD = re.compile(rb'(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:[.,]\d+)? - (.+?) - ([A-Z]+) - ')
+# Formato JSON de JsonLogFormatter: ts y level siempre primero
+JSON_RECORD = re.compile(rb'\{"ts": ?"(\d{4}-\d\d-\d\d[T ]\d\d:\d\d:\d\d)[^"]*", ?"level": ?"([A-Z]+)"')
+
+def _parse_record(raw: bytes, offset: int = None) -> Dict[str, Any]:
+    """Convierte un registro (una línea más sus continuaciones) en dict"""
+    text = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+    record = {'offset': offset, 'time': None, 'level': None, 'logger': None, 'message': text}
+    
+    if text.startswith('{'):
+        first_line, _, rest = text.partition('\n')
+        try:
+            data = json.loads(first_line)
+            record.update({
+                'time': data.get('ts'),
+                'level': data.get('level'),
+                'logger': data.get('logger'),
+                'thread': data.get('thread'),
+                'message': data.get('msg', '')
+            })
+            if data.get('exc'):
+                record['exc'] = data['exc']
+            if rest:
+                record['message'] += '\n' + rest
+            return record
+        except ValueError:
+            pass
+    
+    match = TEXT_RECORD.match(raw)
+    if match:
+        record.update({
+            'time': match.group(1).decode('ascii').replace(' ', 'T'),
+            'level': match.group(3).decode('ascii'),
+            'logger': match.group(2).decode('utf-8', errors='replace'),
+            'message': text.split(' - ', 3)[-1]
+        })
+    return record
+
+def format_record(record: Dict[str, Any]) -> str:
+    """Línea legible con el mismo formato para registros de texto y JSON"""
+    if not record.get('level'):
+        return record['message'] + '\n'
+    
+    line = f"{(record['time'] or '').replace('T', ' ')[:19]} - {record['logger']} - {record['level']} - {record['message']}"
+    if record.get('exc'):
+        line += '\n' + record['exc']
+    return line + '\n'
+
+def tail(path: str, limit: int = 1000) -> List[Dict[str, Any]]:
+    """Últimos registros del archivo leyendo bloques desde el final (costo proporcional a lo leído)"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        
+        # Se lee hasta tener limit+1 inicios de registro o llegar al comienzo
+        while position > 0:
+            read_size = min(TAIL_BLOCK_SIZE, position)
+            position -= read_size
+            f.seek(position)
+            data = f.read(read_size) + data
+            
+            if data.count(b'\n') > limit and len(_record_starts(data, position)) > limit:
+                break
+    
+    starts = _record_starts(data, position)[-limit:]
+    
+    records = []
+    for index, start in enumerate(starts):
+        end = starts[index + 1] if index + 1 < len(starts) else len(data)
+        records.append(_parse_record(data[start:end], position + start))
+    return records
+
+def _record_starts(data: bytes, position: int) -> List[int]:
+    """Offsets (relativos a data) de las líneas que inician un registro"""
+    starts = []
+    line_start = 0
+    if position > 0:
+        # Sin llegar al inicio del archivo la primera línea está cortada
+        line_start = data.find(b'\n') + 1
+        if line_start == 0:
+            return starts
+    
+    while line_start < len(data):
+        line_end = data.find(b'\n', line_start)
+        if line_end < 0:
+            line_end = len(data)
+        if TEXT_RECORD.match(data, line_start, line_end) or JSON_RECORD.match(data, line_start, line_end):
+            starts.append(line_start)
+        line_start = line_end + 1
+    return starts
+
+class LogIndex:
+    """Índice incremental de un archivo de log: offset, nivel y hora de cada registro"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self._reset()
+    
+    def _reset(self):
+        self.offsets = array('q')
+        self.times = array('d')
+        # Posiciones (en offsets) de los registros de cada nivel
+        self.by_level: Dict[int, array] = {code: array('q') for code in range(len(LEVELS))}
+        self.indexed_size = 0
+        self.head = b''
+        self.last_second: Tuple[bytes, float] = (b'', 0.0)
+    
+    def refresh(self) -> int:
+        """Indexa lo agregado desde la última llamada; reconstruye si el archivo rotó"""
+        with self.lock:
+            with open(self.path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                head = f.read(256)
+                
+                # Rotación: el archivo se achicó o su inicio cambió
+                if size < self.indexed_size or (self.head and not head.startswith(self.head)):
+                    self._reset()
+                if not self.head:
+                    self.head = head
+                
+                f.seek(self.indexed_size)
+                pending = b''
+                position = self.indexed_size
+                while True:
+                    chunk = f.read(INDEX_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    data = pending + chunk
+                    # Solo líneas completas; la última queda para el próximo refresh
+                    complete = data.rfind(b'\n') + 1
+                    self._index_lines(data[:complete], position)
+                    position += complete
+                    pending = data[complete:]
+                
+                self.indexed_size = position
+            return len(self.offsets)
+    
+    def _index_lines(self, data: bytes, base: int):
+        line_start = 0
+        end = len(data)
+        while line_start < end:
+            line_end = data.find(b'\n', line_start)
+            if line_end < 0:
+                line_end = end
+            
+            match = TEXT_RECORD.match(data, line_start, line_end)
+            if match:
+                timestamp, level = match.group(1), match.group(3)
+            else:
+                match = JSON_RECORD.match(data, line_start, line_end)
+                timestamp, level = (match.group(1), match.group(2)) if match else (None, None)
+            
+            if match:
+                code = LEVEL_CODES.get(level.decode('ascii'), LEVEL_CODES['INFO'])
+                self.by_level[code].append(len(self.offsets))
+                self.offsets.append(base + line_start)
+                self.times.append(self._epoch(timestamp))
+            
+            line_start = line_end + 1
+    
+    def _epoch(self, timestamp: bytes) -> float:
+        # Registros consecutivos comparten segundo: se evita reparsear la fecha
+        if timestamp == self.last_second[0]:
+            return self.last_second[1]
+        try:
+            value = datetime.strptime(timestamp.decode('ascii').replace('T', ' '), '%Y-%m-%d %H:%M:%S').timestamp()
+        except ValueError:
+            value = self.last_second[1]
+        self.last_second = (timestamp, value)
+        return value
+    
+    def _positions(self, levels: Optional[List[str]]) -> Any:
+        """Posiciones de registros (ordenadas) para los niveles pedidos"""
+        if not levels:
+            return range(len(self.offsets))
+        codes = [LEVEL_CODES[level] for level in levels if level in LEVEL_CODES]
+        if len(codes) == 1:
+            return self.by_level[codes[0]]
+        return sorted(position for code in codes for position in self.by_level[code])
+    
+    def query(self, levels: Optional[List[str]] = None, since: float = None, until: float = None,
+              before: int = None, limit: int = 200) -> Dict[str, Any]:
+        """Página de registros más recientes que cumplen el filtro (before = offset del registro más antiguo ya mostrado)"""
+        with self.lock:
+            positions = self._positions(levels)
+            
+            # Hora: los registros están (casi) ordenados, se acota por búsqueda binaria
+            low, high = 0, len(positions)
+            if since is not None:
+                low = bisect_left(positions, bisect_left(self.times, since))
+            if until is not None:
+                high = bisect_left(positions, bisect_right(self.times, until))
+            total = max(0, high - low)
+            if before is not None:
+                high = min(high, bisect_left(positions, bisect_left(self.offsets, before)))
+            
+            page_start = max(low, high - limit)
+            ranges = []
+            for i in range(page_start, high):
+                position = positions[i]
+                end = self.offsets[position + 1] if position + 1 < len(self.offsets) else self.indexed_size
+                ranges.append((self.offsets[position], end))
+        
+        records = []
+        if ranges:
+            # Sin mmap persistente: en Windows impediría la rotación del RotatingFileHandler
+            with open(self.path, 'rb') as f:
+                for start, end in ranges:
+                    f.seek(start)
+                    records.append(_parse_record(f.read(end - start), start))
+        
+        return {
+            'records': records,
+            'total': total,
+            'next_before': ranges[0][0] if ranges and page_start > low else None
+        }
+
+# Índices por archivo, reutilizados entre consultas
+_indexes: Dict[str, LogIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_index(path: str) -> LogIndex:
+    """Índice (actualizado) del archivo de log"""
+    key = os.path.abspath(path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = LogIndex(key)
+            _indexes[key] = index
+    index.refresh()
+    return index
+
+def read_log(path: str, level: str = None, since: str = None, until: str = None,
+             before: int = None, limit: int = 1000) -> Dict[str, Any]:
+    """Registros de un archivo de log; sin filtros lee solo el final, con filtros o paginando usa el índice"""
+    levels = [item.strip().upper() for item in level.split(',')] if level and level.upper() != 'ALL' else None
+    
+    if not levels and not since and not until and before is None:
+        records = tail(path, limit)
+        return {
+            'records': records,
+            'total': None,
+            'next_before': records[0]['offset'] if records and records[0]['offset'] > 0 else None
+        }
+    
+    return get_index(path).query(
+        levels=levels,
+        since=_to_epoch(since),
+        until=_to_epoch(until),
+        before=before,
+        limit=limit
+    )
+
+def _to_epoch(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
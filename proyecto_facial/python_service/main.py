@@ -26,8 +26,13 @@ from websocket_server import WebSocketServer
 from device_manager import DeviceManager
 from task_queue import TaskQueue
 from workers.sync_worker import SyncWorker
+from workers.provision_worker import ProvisionWorker
 from workers.health_worker import HealthWorker
+from workers.rollup_worker import RollupWorker
+from workers.retention_worker import RetentionWorker
 from event_processor import EventProcessor
+from event_archive import EventArchive
+from profiler import SamplingProfiler
 
 class FacialSyncService:
     """Servicio principal de sincronización facial"""
@@ -44,8 +49,13 @@ class FacialSyncService:
         self.device_manager = None
         self.task_queue = None
         self.sync_worker = None
+        self.provision_worker = None
         self.health_worker = None
+        self.rollup_worker = None
+        self.retention_worker = None
+        self.event_archive = None
         self.event_processor = None
+        self.profiler = None
         self.tray_service = None
         
         # Threads
@@ -103,12 +113,15 @@ class FacialSyncService:
             udl_path = self.config.get('DB_UDL_PATH')
             logging.info(f"Inicializando base de datos: {udl_path}")
             
-            self.db_manager = DatabaseManager(udl_path)
+            self.db_manager = DatabaseManager(udl_path, self.config)
             
             # Probar conexión
             if not self.db_manager.test_connection():
                 raise Exception("No se pudo conectar a la base de datos")
             
+            # Reenvío de escrituras guardadas localmente mientras la BD no respondía
+            self.db_manager.start_outbox()
+            
             logging.info("Base de datos inicializada correctamente")
             
         except Exception as e:
@@ -124,6 +137,7 @@ class FacialSyncService:
             
             # Device Manager
             self.device_manager = DeviceManager(self.db_manager, self.config)
+            self.task_queue.set_device_manager(self.device_manager)
             logging.info("DeviceManager inicializado")
             
             # Event Processor
@@ -137,6 +151,7 @@ class FacialSyncService:
                 self.task_queue, 
                 self.config
             )
+            self.api_server.set_event_processor(self.event_processor)
             logging.info("APIServer inicializado")
             
             # WebSocket Server
@@ -154,8 +169,17 @@ class FacialSyncService:
                 self.task_queue,
                 self.config
             )
+            self.api_server.set_sync_worker(self.sync_worker)
             logging.info("SyncWorker inicializado")
             
+            self.provision_worker = ProvisionWorker(
+                self.db_manager,
+                self.device_manager,
+                self.config
+            )
+            self.api_server.set_provision_worker(self.provision_worker)
+            logging.info("ProvisionWorker inicializado")
+            
             self.health_worker = HealthWorker(
                 self.db_manager,
                 self.device_manager,
@@ -163,6 +187,33 @@ class FacialSyncService:
             )
             logging.info("HealthWorker inicializado")
             
+            self.rollup_worker = RollupWorker(
+                self.db_manager,
+                self.config,
+                self.event_processor
+            )
+            self.api_server.set_rollup_worker(self.rollup_worker)
+            logging.info("RollupWorker inicializado")
+            
+            # Archivo en disco de los eventos que borra la retención
+            if self.config.get('EVENT_ARCHIVE_ENABLED', True):
+                self.event_archive = EventArchive(self.config.get('EVENT_ARCHIVE_DIR', 'archive'))
+                self.api_server.set_event_archive(self.event_archive)
+            
+            self.retention_worker = RetentionWorker(
+                self.db_manager,
+                self.config,
+                self.event_archive
+            )
+            self.api_server.set_retention_worker(self.retention_worker)
+            logging.info("RetentionWorker inicializado")
+            
+            # Profiler (solo disponible con ENABLE_PROFILING; se activa desde la API)
+            if self.config.get('ENABLE_PROFILING'):
+                self.profiler = SamplingProfiler(self.config)
+                self.api_server.set_profiler(self.profiler)
+                logging.info("SamplingProfiler inicializado")
+            
             # Tray Service
             self.tray_service = TrayService(self)
             logging.info("TrayService inicializado")
@@ -203,6 +254,11 @@ class FacialSyncService:
                 self.threads.append(ws_thread)
                 logging.info("✅ WebSocket Server iniciado")
             
+            # Iniciar Task Queue
+            if self.task_queue:
+                self.task_queue.start()
+                logging.info("✅ Task Queue iniciado")
+            
             # Iniciar Workers
             if self.sync_worker:
                 sync_thread = threading.Thread(target=self.sync_worker.start, daemon=True)
@@ -210,12 +266,22 @@ class FacialSyncService:
                 self.threads.append(sync_thread)
                 logging.info("✅ Sync Worker iniciado")
             
+            if self.provision_worker:
+                self.provision_worker.start()
+                logging.info("✅ Provision Worker iniciado")
+            
             if self.health_worker:
                 health_thread = threading.Thread(target=self.health_worker.start, daemon=True)
                 health_thread.start()
                 self.threads.append(health_thread)
                 logging.info("✅ Health Worker iniciado")
             
+            if self.rollup_worker:
+                self.rollup_worker.start()
+            
+            if self.retention_worker:
+                self.retention_worker.start()
+            
             # Iniciar Event Processor
             if self.event_processor:
                 event_thread = threading.Thread(target=self.event_processor.start, daemon=True)
@@ -247,14 +313,34 @@ class FacialSyncService:
                 self.sync_worker.stop()
                 logging.info("🔄 Sync Worker detenido")
             
+            if self.provision_worker:
+                self.provision_worker.stop()
+                logging.info("📦 Provision Worker detenido")
+            
             if self.health_worker:
                 self.health_worker.stop()
                 logging.info("💓 Health Worker detenido")
             
+            if self.rollup_worker:
+                self.rollup_worker.stop()
+                logging.info("📊 Rollup Worker detenido")
+            
+            if self.retention_worker:
+                self.retention_worker.stop()
+                logging.info("🧹 Retention Worker detenido")
+            
+            if self.task_queue:
+                self.task_queue.stop()
+                logging.info("📋 Task Queue detenido")
+            
             if self.event_processor:
                 self.event_processor.stop()
                 logging.info("📨 Event Processor detenido")
             
+            if self.profiler:
+                self.profiler.stop()
+                logging.info("🔬 Profiler detenido")
+            
             if self.websocket_server:
                 self.websocket_server.stop()
                 logging.info("🔌 WebSocket Server detenido")
@@ -265,6 +351,7 @@ class FacialSyncService:
             
             # Cerrar conexiones de BD
             if self.db_manager:
+                self.db_manager.stop_outbox()
                 self.db_manager.close_all_connections()
                 logging.info("🗄️ Conexiones BD cerradas")
             
@@ -303,8 +390,12 @@ class FacialSyncService:
                 'websocket_server': self.websocket_server is not None and self.config.get('WEBSOCKET_ENABLED'),
                 'device_manager': self.device_manager is not None,
                 'sync_worker': self.sync_worker is not None,
+                'provision_worker': self.provision_worker is not None,
                 'health_worker': self.health_worker is not None,
-                'event_processor': self.event_processor is not None
+                'rollup_worker': self.rollup_worker is not None and self.rollup_worker.is_running,
+                'retention_worker': self.retention_worker is not None and self.retention_worker.is_running,
+                'event_processor': self.event_processor is not None,
+                'profiler': self.profiler is not None and self.profiler.is_running
             }
         
         return status
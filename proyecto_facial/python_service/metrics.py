@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Métricas para Facial Sync Service
+Contadores, gauges e histogramas thread-safe con exposición en formato texto de Prometheus
+"""
+
+import math
+import time
+import logging
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Tuple, Callable, Optional, Sequence
+
+# Segundos: de 1 ms a 60 s, cubre consultas SQL, requests ISAPI y envíos WebSocket
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Celdas por encima de las cuales se consolidan las de threads terminados
+MAX_LIVE_CELLS = 64
+
+class _ShardedValues:
+    """Valores repartidos en una celda por thread: el camino caliente no toma locks"""
+    
+    def __init__(self, size: int):
+        self.size = size
+        self.local = threading.local()
+        self.cells: List[Tuple[threading.Thread, List[float]]] = []
+        self.retired = [0.0] * size
+        self.lock = threading.Lock()
+    
+    def cell(self) -> List[float]:
+        """Celda del thread actual (se crea en el primer uso)"""
+        try:
+            return self.local.cell
+        except AttributeError:
+            cell = [0.0] * self.size
+            with self.lock:
+                if len(self.cells) >= MAX_LIVE_CELLS:
+                    self._retire_dead_cells()
+                self.cells.append((threading.current_thread(), cell))
+            self.local.cell = cell
+            return cell
+    
+    def _retire_dead_cells(self):
+        # Threads de request de Flask/HTTPServer: sus celdas se suman a 'retired'
+        alive = []
+        for thread, cell in self.cells:
+            if thread.is_alive():
+                alive.append((thread, cell))
+            else:
+                for index, value in enumerate(cell):
+                    self.retired[index] += value
+        self.cells = alive
+    
+    def totals(self) -> List[float]:
+        """Suma de todas las celdas"""
+        with self.lock:
+            totals = list(self.retired)
+            cells = [cell for _, cell in self.cells]
+        
+        for cell in cells:
+            for index, value in enumerate(cell):
+                totals[index] += value
+        return totals
+
+class _Timer:
+    """Context manager que observa la duración del bloque en un histograma"""
+    
+    def __init__(self, child):
+        self.child = child
+        self.start_time = None
+    
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.child.observe(time.perf_counter() - self.start_time)
+        return False
+
+class CounterChild:
+    """Valor de un contador para una combinación de labels"""
+    
+    def __init__(self):
+        self.values = _ShardedValues(1)
+    
+    def inc(self, amount: float = 1):
+        self.values.cell()[0] += amount
+    
+    def get(self) -> float:
+        return self.values.totals()[0]
+
+class GaugeChild:
+    """Valor de un gauge para una combinación de labels"""
+    
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+    
+    def set(self, value: float):
+        self.value = value
+    
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+    
+    def dec(self, amount: float = 1):
+        with self.lock:
+            self.value -= amount
+    
+    def get(self) -> float:
+        return self.value
+
+class HistogramChild:
+    """Buckets, suma y cantidad de observaciones para una combinación de labels"""
+    
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        # Un contador por bucket, uno para +Inf y la suma al final
+        self.values = _ShardedValues(len(buckets) + 2)
+    
+    def observe(self, value: float):
+        cell = self.values.cell()
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+    
+    def time(self) -> _Timer:
+        return _Timer(self)
+    
+    def get(self) -> Dict[str, float]:
+        totals = self.values.totals()
+        return {'count': sum(totals[:-1]), 'sum': totals[-1]}
+
+class Metric:
+    """Métrica con nombre, ayuda y labels opcionales"""
+    
+    type_name = 'untyped'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[Tuple[str, ...], object] = {}
+        self.lock = threading.Lock()
+        
+        # Series sin labels: se exponen en 0 desde el inicio
+        if not self.labelnames:
+            self.children[()] = self._new_child()
+    
+    def _new_child(self):
+        raise NotImplementedError
+    
+    def labels(self, *values):
+        """Obtiene (o crea) la serie para los valores de labels dados"""
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} espera labels {self.labelnames}, recibió {key}")
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+    
+    def _default(self):
+        return self.labels()
+    
+    def collect(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """Muestras (sufijo, labels, valor) para la exposición"""
+        with self.lock:
+            children = list(self.children.items())
+        
+        samples = []
+        for key, child in children:
+            samples.extend(self._child_samples(dict(zip(self.labelnames, key)), child))
+        return samples
+    
+    def _child_samples(self, labels: Dict[str, str], child) -> List[Tuple[str, Dict[str, str], float]]:
+        return [('', labels, child.get())]
+
+class Counter(Metric):
+    """Contador monótono"""
+    
+    type_name = 'counter'
+    
+    def _new_child(self):
+        return CounterChild()
+    
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+class Gauge(Metric):
+    """Valor instantáneo, fijado explícitamente o leído de una función al exponer"""
+    
+    type_name = 'gauge'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Callable[[], float] = None):
+        self.function = function
+        super().__init__(name, documentation, labelnames)
+    
+    def _new_child(self):
+        return GaugeChild()
+    
+    def set_function(self, function: Callable[[], float]):
+        """Lee el valor de la función en cada exposición (p.ej. tamaño de cola)"""
+        self.function = function
+    
+    def set(self, value: float):
+        self._default().set(value)
+    
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+    
+    def dec(self, amount: float = 1):
+        self._default().dec(amount)
+    
+    def collect(self) -> List[Tuple[str, Dict[str, str], float]]:
+        if self.function is None:
+            return super().collect()
+        
+        try:
+            return [('', {}, float(self.function()))]
+        except Exception as e:
+            logging.debug(f"Error leyendo gauge {self.name}: {e}")
+            return []
+
+class Histogram(Metric):
+    """Distribución de valores (duraciones en segundos) por buckets acumulativos"""
+    
+    type_name = 'histogram'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+    
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+    
+    def observe(self, value: float):
+        self._default().observe(value)
+    
+    def time(self) -> _Timer:
+        return self._default().time()
+    
+    def _child_samples(self, labels: Dict[str, str], child) -> List[Tuple[str, Dict[str, str], float]]:
+        totals = child.values.totals()
+        samples = []
+        cumulative = 0.0
+        
+        for bound, count in zip(self.buckets + (math.inf,), totals[:-1]):
+            cumulative += count
+            samples.append(('_bucket', dict(labels, le=_format_value(bound)), cumulative))
+        
+        samples.append(('_sum', labels, totals[-1]))
+        samples.append(('_count', labels, cumulative))
+        return samples
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if value != value:
+        return 'NaN'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+class MetricsRegistry:
+    """Registro de métricas del servicio"""
+    
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+    
+    def _register(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs) -> Metric:
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labelnames, **kwargs)
+                self.metrics[name] = metric
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Métrica {name} ya registrada con otro tipo o labels")
+            return metric
+    
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Registra (o devuelve) un contador"""
+        return self._register(Counter, name, documentation, labelnames)
+    
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              function: Callable[[], float] = None) -> Gauge:
+        """Registra (o devuelve) un gauge; con function se reemplaza la fuente del valor"""
+        metric = self._register(Gauge, name, documentation, labelnames)
+        if function is not None:
+            metric.set_function(function)
+        return metric
+    
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Registra (o devuelve) un histograma"""
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+    
+    def get(self, name: str) -> Optional[Metric]:
+        """Obtiene una métrica registrada por nombre"""
+        return self.metrics.get(name)
+    
+    def render(self) -> str:
+        """Todas las métricas en formato de exposición de texto de Prometheus (0.0.4)"""
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            
+            for suffix, labels, value in metric.collect():
+                if labels:
+                    label_text = ','.join(f'{key}="{_escape_label(str(val))}"' for key, val in labels.items())
+                    lines.append(f"{metric.name}{suffix}{{{label_text}}} {_format_value(value)}")
+                else:
+                    lines.append(f"{metric.name}{suffix} {_format_value(value)}")
+        
+        return '\n'.join(lines) + '\n'
+
+# Instancia global de métricas
+registry = MetricsRegistry()
+
+def get_registry() -> MetricsRegistry:
+    """Obtiene la instancia global de métricas"""
+    return registry
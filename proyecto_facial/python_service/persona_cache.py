@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache de personas para Facial Sync Service
+Resuelve employee_no (FPID = FacialID en el dispositivo) a PersonaID sin consultar la BD por evento
+"""
+
+import time
+import threading
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from metrics import registry
+
+PERSONA_LOOKUPS = registry.counter(
+    'facial_sync_persona_lookups_total', 'Resoluciones employee_no -> PersonaID por resultado', ['result']
+)
+
+# IN (...) por consulta al revisar desconocidos
+RECHECK_CHUNK = 500
+
+class PersonaCache:
+    """employee_no -> PersonaID desde perface; carga completa al inicio, incremental por FacialID y cache negativo"""
+    
+    def __init__(self, db_manager, config):
+        self.db_manager = db_manager
+        
+        # Configuración
+        self.refresh_interval = config.get('PERSONA_CACHE_REFRESH_INTERVAL', 300)
+        self.full_reload_interval = config.get('PERSONA_CACHE_FULL_RELOAD_INTERVAL', 3600)
+        self.negative_ttl = config.get('PERSONA_CACHE_NEGATIVE_TTL', 600)
+        self.negative_max = config.get('PERSONA_CACHE_NEGATIVE_MAX', 10000)
+        
+        # employee_no -> PersonaID y employee_no desconocido -> monotonic de la última revisión
+        self.personas: Dict[str, int] = {}
+        self.unknown: Dict[str, float] = {}
+        self.max_facial_id = 0
+        self.lock = threading.Lock()
+        
+        # Estado
+        self.loaded = False
+        self.last_full_load = 0.0
+        self.is_running = False
+        self.refresh_thread = None
+        self.stop_event = threading.Event()
+        
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'negative_hits': 0,
+            'full_loads': 0,
+            'refreshes': 0,
+            'resolved_after_miss': 0,
+            'last_refresh': None,
+            'last_error': None
+        }
+    
+    def start(self):
+        """Carga completa y thread de refresco incremental"""
+        if self.is_running:
+            return
+        
+        try:
+            self.load()
+        except Exception as e:
+            # Sin carga los eventos se guardan con PersonaID NULL hasta el próximo refresco
+            self.stats['last_error'] = str(e)
+            logging.warning(f"No se pudo cargar el cache de personas: {e}")
+        
+        self.is_running = True
+        self.stop_event.clear()
+        self.refresh_thread = threading.Thread(target=self._refresh_loop, name='PersonaCache', daemon=True)
+        self.refresh_thread.start()
+    
+    def stop(self):
+        if not self.is_running:
+            return
+        
+        self.is_running = False
+        self.stop_event.set()
+        if self.refresh_thread and self.refresh_thread.is_alive():
+            self.refresh_thread.join(timeout=5)
+    
+    def load(self):
+        """Carga completa de perface (reemplaza el cache)"""
+        rows = self.db_manager.get_facial_persona_links()
+        personas = {}
+        max_facial_id = 0
+        for facial_id, persona_id in rows:
+            # Un rostro vinculado a varias personas: se toma la primera (ORDER BY FacialID, PersonaID)
+            personas.setdefault(str(facial_id), persona_id)
+            max_facial_id = max(max_facial_id, facial_id)
+        
+        with self.lock:
+            self.personas = personas
+            self.max_facial_id = max_facial_id
+            # Los desconocidos que ahora existen dejan de serlo
+            for employee_no in [key for key in self.unknown if key in personas]:
+                del self.unknown[employee_no]
+            self.loaded = True
+        
+        self.last_full_load = time.monotonic()
+        self.stats['full_loads'] += 1
+        self.stats['last_refresh'] = datetime.now()
+        logging.info(f"👤 Cache de personas cargado ({len(personas)} rostros)")
+    
+    def refresh(self):
+        """Agrega rostros nuevos (FacialID mayor al último conocido) y revisa desconocidos vencidos"""
+        rows = self.db_manager.get_facial_persona_links(after_facial_id=self.max_facial_id)
+        
+        now = time.monotonic()
+        with self.lock:
+            recheck = [
+                employee_no for employee_no, checked_at in self.unknown.items()
+                if now - checked_at >= self.negative_ttl and employee_no.isdigit()
+            ]
+        
+        for start in range(0, len(recheck), RECHECK_CHUNK):
+            rows.extend(self.db_manager.get_facial_persona_links(
+                facial_ids=[int(employee_no) for employee_no in recheck[start:start + RECHECK_CHUNK]]
+            ))
+        
+        with self.lock:
+            for facial_id, persona_id in rows:
+                key = str(facial_id)
+                self.personas.setdefault(key, persona_id)
+                self.max_facial_id = max(self.max_facial_id, facial_id)
+                if self.unknown.pop(key, None) is not None:
+                    self.stats['resolved_after_miss'] += 1
+            
+            # Los que siguen sin existir esperan otro negative_ttl
+            for employee_no in recheck:
+                if employee_no in self.unknown:
+                    self.unknown[employee_no] = now
+        
+        self.stats['refreshes'] += 1
+        self.stats['last_refresh'] = datetime.now()
+    
+    def _refresh_loop(self):
+        while self.is_running:
+            self.stop_event.wait(self.refresh_interval)
+            if not self.is_running:
+                break
+            
+            try:
+                if not self.loaded or time.monotonic() - self.last_full_load >= self.full_reload_interval:
+                    # Recarga completa: toma cambios de vínculos en perface de rostros ya conocidos
+                    self.load()
+                else:
+                    self.refresh()
+                self.stats['last_error'] = None
+            
+            except Exception as e:
+                self.stats['last_error'] = str(e)
+                logging.warning(f"Error refrescando cache de personas: {e}")
+    
+    def resolve(self, employee_no: Any) -> Optional[int]:
+        """PersonaID de un employee_no, o None (los desconocidos quedan en el cache negativo)"""
+        if not employee_no:
+            return None
+        
+        key = str(employee_no).strip()
+        with self.lock:
+            persona_id = self.personas.get(key)
+            if persona_id is not None:
+                self.stats['hits'] += 1
+                PERSONA_LOOKUPS.labels('hit').inc()
+                return persona_id
+            
+            if key in self.unknown:
+                self.stats['negative_hits'] += 1
+                PERSONA_LOOKUPS.labels('negative').inc()
+                return None
+            
+            # Primera vez que aparece: se revisa en la BD en el próximo refresco
+            self.unknown[key] = time.monotonic() - self.negative_ttl
+            if len(self.unknown) > self.negative_max:
+                del self.unknown[next(iter(self.unknown))]
+            self.stats['misses'] += 1
+            PERSONA_LOOKUPS.labels('miss').inc()
+            return None
+    
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = self.stats.copy()
+            stats['last_refresh'] = stats['last_refresh'].isoformat() if stats['last_refresh'] else None
+            return {
+                'loaded': self.loaded,
+                'personas': len(self.personas),
+                'unknown': len(self.unknown),
+                'max_facial_id': self.max_facial_id,
+                'refresh_interval': self.refresh_interval,
+                'stats': stats
+            }
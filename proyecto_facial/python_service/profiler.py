@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Profiler por muestreo para Facial Sync Service
+Toma stacks de todos los threads a intervalos fijos y los agrega en formato colapsado (flame graph)
+"""
+
+import re
+import sys
+import dis
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+# Funciones Python en las que un thread está esperando, no usando CPU (archivo, función)
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('selectors.py', 'select'),
+    ('socket.py', 'accept'),
+    ('socket.py', 'readinto'),
+    ('ssl.py', 'read'),
+    ('ssl.py', 'recv_into')
+}
+
+# Llamadas a C bloqueantes: no dejan frame propio, se reconocen por el nombre llamado desde la hoja
+IDLE_CALLS = {
+    'sleep', 'select', 'poll', 'accept', '_accept', 'recv', 'recv_into', 'recvfrom',
+    'acquire', 'wait', 'readinto', 'getaddrinfo'
+}
+
+# Marca de stack cortado por max_depth (se conservan raíz y punto de entrada)
+TRUNCATED_LABEL = '[truncado]'
+
+class SamplingProfiler:
+    """Profiler de muestreo de tiempo de pared sobre todos los threads del servicio"""
+    
+    def __init__(self, config):
+        self.config = config
+        
+        # Configuración
+        self.sample_rate = config.get('PROFILING_SAMPLE_RATE', 50)
+        self.max_depth = config.get('PROFILING_MAX_DEPTH', 64)
+        self.max_stacks = config.get('PROFILING_MAX_STACKS', 20000)
+        # False: se omiten los threads parados en esperas (colas, eventos, sockets, sleep)
+        self.include_idle = config.get('PROFILING_INCLUDE_IDLE', False)
+        
+        # Estado
+        self.is_running = False
+        self.sampler_thread = None
+        self.stop_event = threading.Event()
+        self.stop_at = None
+        
+        # Stacks colapsados -> cantidad de muestras
+        self.stacks: Dict[str, int] = {}
+        self.stacks_lock = threading.Lock()
+        
+        # Cache de etiquetas por objeto de código y de hojas en espera por (código, instrucción)
+        self.code_labels: Dict[Any, str] = {}
+        self.idle_leaves: Dict[Any, bool] = {}
+        
+        # Estadísticas
+        self.stats = {
+            'samples': 0,
+            'thread_samples': 0,
+            'idle_samples': 0,
+            'dropped_stacks': 0,
+            'sampling_seconds': 0.0,
+            'start_time': None,
+            'stop_time': None
+        }
+    
+    def start(self, sample_rate: float = None, duration: float = None, reset: bool = False,
+              idle: Optional[bool] = None) -> bool:
+        """Inicia el muestreo (duration en segundos detiene automáticamente; idle incluye threads en espera)"""
+        if self.is_running:
+            logging.warning("Profiler ya está ejecutándose")
+            return False
+        
+        if reset:
+            self.reset()
+        
+        if idle is not None:
+            self.include_idle = bool(idle)
+        
+        if sample_rate:
+            self.sample_rate = max(1.0, min(float(sample_rate), 1000.0))
+        self.stop_at = time.monotonic() + duration if duration else None
+        
+        self.is_running = True
+        self.stop_event.clear()
+        self.stats['start_time'] = datetime.now()
+        self.stats['stop_time'] = None
+        
+        self.sampler_thread = threading.Thread(target=self._sample_loop, name='SamplingProfiler', daemon=True)
+        self.sampler_thread.start()
+        
+        logging.info(f"🔬 Profiler iniciado a {self.sample_rate} Hz"
+                     + (f" durante {duration}s" if duration else ""))
+        return True
+    
+    def stop(self):
+        """Detiene el muestreo conservando los stacks acumulados"""
+        if not self.is_running:
+            return
+        
+        self.is_running = False
+        self.stop_event.set()
+        
+        if self.sampler_thread and self.sampler_thread.is_alive() and self.sampler_thread is not threading.current_thread():
+            self.sampler_thread.join(timeout=5)
+        
+        logging.info(f"🔬 Profiler detenido ({self.stats['samples']} muestras)")
+    
+    def reset(self):
+        """Descarta los stacks acumulados"""
+        with self.stacks_lock:
+            self.stacks.clear()
+            self.stats['samples'] = 0
+            self.stats['thread_samples'] = 0
+            self.stats['idle_samples'] = 0
+            self.stats['dropped_stacks'] = 0
+            self.stats['sampling_seconds'] = 0.0
+    
+    def _sample_loop(self):
+        """Muestrea a intervalos fijos; si un muestreo se atrasa no se acumulan ticks"""
+        interval = 1.0 / self.sample_rate
+        next_time = time.perf_counter()
+        
+        while self.is_running:
+            if self.stop_at and time.monotonic() >= self.stop_at:
+                self.stats['stop_time'] = datetime.now()
+                self.stop()
+                break
+            
+            sample_start = time.perf_counter()
+            try:
+                self._take_sample()
+            except Exception as e:
+                logging.debug(f"Error tomando muestra de profiler: {e}")
+            now = time.perf_counter()
+            self.stats['sampling_seconds'] += now - sample_start
+            
+            next_time += interval
+            if next_time < now:
+                next_time = now
+            self.stop_event.wait(next_time - now)
+        
+        if not self.stats['stop_time']:
+            self.stats['stop_time'] = datetime.now()
+    
+    def _take_sample(self):
+        """Registra el stack actual de cada thread (excepto el del profiler)"""
+        frames = sys._current_frames()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own_ident = threading.get_ident()
+        
+        collapsed = []
+        idle = 0
+        for ident, frame in frames.items():
+            if ident == own_ident:
+                continue
+            
+            if not self.include_idle and self._is_idle(frame):
+                idle += 1
+                continue
+            
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            codes.reverse()
+            
+            # Se corta del lado de la hoja: el thread y el punto de entrada quedan en el flame graph
+            labels = [self._thread_label(names.get(ident, f"thread-{ident}"))]
+            labels.extend(self._frame_label(code) for code in codes[:self.max_depth])
+            if len(codes) > self.max_depth:
+                labels.append(TRUNCATED_LABEL)
+            collapsed.append(';'.join(labels))
+        
+        with self.stacks_lock:
+            self.stats['samples'] += 1
+            self.stats['idle_samples'] += idle
+            for stack in collapsed:
+                self.stats['thread_samples'] += 1
+                if stack in self.stacks:
+                    self.stacks[stack] += 1
+                elif len(self.stacks) < self.max_stacks:
+                    self.stacks[stack] = 1
+                else:
+                    self.stats['dropped_stacks'] += 1
+    
+    def _is_idle(self, frame) -> bool:
+        """True si la hoja del stack es una espera (función de IDLE_FRAMES o llamada a C de IDLE_CALLS)"""
+        key = (frame.f_code, frame.f_lasti)
+        idle = self.idle_leaves.get(key)
+        if idle is None:
+            code = frame.f_code
+            filename = code.co_filename.replace('\\', '/').rsplit('/', 1)[-1]
+            idle = (filename, code.co_name) in IDLE_FRAMES or self._called_name(code, frame.f_lasti) in IDLE_CALLS
+            self.idle_leaves[key] = idle
+        return idle
+    
+    @staticmethod
+    def _called_name(code, lasti: int) -> Optional[str]:
+        """Último nombre cargado antes de la instrucción en curso (la función que se está llamando)"""
+        name = None
+        for instruction in dis.get_instructions(code):
+            if instruction.offset > lasti:
+                break
+            if instruction.opname in ('LOAD_ATTR', 'LOAD_METHOD', 'LOAD_GLOBAL', 'LOAD_NAME'):
+                name = instruction.argval
+        return name
+    
+    def _frame_label(self, code) -> str:
+        label = self.code_labels.get(code)
+        if label is None:
+            filename = code.co_filename.replace('\\', '/').rsplit('/', 1)[-1]
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+            self.code_labels[code] = label
+        return label
+    
+    @staticmethod
+    def _thread_label(name: str) -> str:
+        # Threads efímeros (requests Flask, pools) se agrupan: "Thread-12 (run)" -> "Thread (run)"
+        return re.sub(r'[-_]\d+', '', name).replace(';', ':')
+    
+    def get_collapsed(self, thread: str = None) -> str:
+        """Stacks en formato colapsado ('thread;func;func N'), listo para flamegraph.pl/speedscope"""
+        with self.stacks_lock:
+            items = list(self.stacks.items())
+        
+        if thread:
+            items = [(stack, count) for stack, count in items if stack.split(';', 1)[0] == thread]
+        
+        items.sort(key=lambda item: item[1], reverse=True)
+        return ''.join(f"{stack} {count}\n" for stack, count in items)
+    
+    def get_top_functions(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Funciones con más muestras propias (hoja del stack)"""
+        with self.stacks_lock:
+            items = list(self.stacks.items())
+            total = self.stats['thread_samples']
+        
+        leaves: Dict[str, int] = {}
+        for stack, count in items:
+            leaf = stack.rsplit(';', 1)[-1]
+            leaves[leaf] = leaves.get(leaf, 0) + count
+        
+        top = sorted(leaves.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [{
+            'function': function,
+            'samples': count,
+            'percent': round(count / total * 100, 2) if total else 0
+        } for function, count in top]
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Estado del profiler y costo del muestreo"""
+        elapsed = None
+        if self.stats['start_time']:
+            end_time = self.stats['stop_time'] or datetime.now()
+            elapsed = (end_time - self.stats['start_time']).total_seconds()
+        
+        with self.stacks_lock:
+            distinct_stacks = len(self.stacks)
+        
+        return {
+            'is_running': self.is_running,
+            'sample_rate': self.sample_rate,
+            'max_depth': self.max_depth,
+            'distinct_stacks': distinct_stacks,
+            'samples': self.stats['samples'],
+            'thread_samples': self.stats['thread_samples'],
+            'include_idle': self.include_idle,
+            'idle_samples': self.stats['idle_samples'],
+            'dropped_stacks': self.stats['dropped_stacks'],
+            'elapsed_seconds': round(elapsed, 1) if elapsed is not None else None,
+            'overhead_percent': round(self.stats['sampling_seconds'] / elapsed * 100, 3) if elapsed else None,
+            'start_time': self.stats['start_time'].isoformat() if self.stats['start_time'] else None,
+            'stop_time': self.stats['stop_time'].isoformat() if self.stats['stop_time'] else None
+        }
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Watchdog de bloqueos para Facial Sync Service
+Heartbeats de workers, requests en curso y lag de loops asyncio; vuelca el stack del thread bloqueado
+"""
+
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from metrics import registry
+
+LOOP_LAG_SECONDS = registry.histogram(
+    'facial_sync_event_loop_lag_seconds', 'Retraso del loop asyncio respecto del tick esperado', ['loop'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+LOOP_LAG_CURRENT = registry.gauge(
+    'facial_sync_event_loop_lag_current_seconds', 'Último retraso medido (o en curso) del loop asyncio', ['loop']
+)
+HEARTBEAT_AGE = registry.gauge(
+    'facial_sync_heartbeat_age_seconds', 'Antigüedad del último heartbeat de cada worker', ['worker']
+)
+STALLS = registry.counter(
+    'facial_sync_stalls_total', 'Bloqueos detectados por el watchdog', ['component']
+)
+
+class Heartbeat:
+    """Latido de un worker o request ligado al thread que lo registró"""
+    
+    def __init__(self, name: str, stall_seconds: float, transient: bool = False):
+        self.name = name
+        self.stall_seconds = stall_seconds
+        self.transient = transient
+        self.thread_ident = threading.get_ident()
+        self.thread_name = threading.current_thread().name
+        self.last_beat = time.monotonic()
+        self.idle = False
+        self.stalled = False
+        self.stall_count = 0
+    
+    def beat(self):
+        """Marca progreso; el worker está activo"""
+        self.last_beat = time.monotonic()
+        self.idle = False
+    
+    def set_idle(self):
+        """El worker espera trabajo a propósito: no cuenta como bloqueo"""
+        self.last_beat = time.monotonic()
+        self.idle = True
+    
+    def age(self) -> float:
+        return time.monotonic() - self.last_beat
+
+class LoopMonitor:
+    """Sonda de lag de un loop asyncio"""
+    
+    def __init__(self, name: str, loop: asyncio.AbstractEventLoop, interval: float, threshold: float):
+        self.name = name
+        self.loop = loop
+        self.interval = interval
+        self.threshold = threshold
+        self.active = True
+        self.thread_ident = None
+        self.last_tick = time.monotonic()
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalled = False
+        self.stall_count = 0
+    
+    async def probe(self):
+        self.thread_ident = threading.get_ident()
+        while self.active:
+            expected = self.loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, self.loop.time() - expected)
+            
+            self.last_tick = time.monotonic()
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG_SECONDS.labels(self.name).observe(lag)
+    
+    def pending_lag(self) -> float:
+        """Lag actual: incluye el tick que todavía no llegó si el loop está bloqueado"""
+        return max(self.last_lag, time.monotonic() - self.last_tick - self.interval)
+
+class Watchdog:
+    """Registro de heartbeats y loops vigilados; HealthWorker llama a check() periódicamente"""
+    
+    def __init__(self):
+        self.heartbeats: Dict[Any, Heartbeat] = {}
+        self.loops: Dict[str, LoopMonitor] = {}
+        self.lock = threading.Lock()
+        
+        # Últimos bloqueos detectados (con stack)
+        self.recent_stalls: List[Dict[str, Any]] = []
+        
+        # Umbrales por defecto (HealthWorker los toma de la configuración)
+        self.stall_seconds = 120.0
+        self.loop_lag_threshold = 1.0
+        self.loop_probe_interval = 0.5
+        
+        self.stats = {
+            'checks': 0,
+            'stalls_detected': 0,
+            'last_stall': None,
+            'last_check': None
+        }
+    
+    def configure(self, stall_seconds: float = None, loop_lag_threshold: float = None,
+                  loop_probe_interval: float = None):
+        """Ajusta umbrales por defecto"""
+        if stall_seconds:
+            self.stall_seconds = stall_seconds
+        if loop_lag_threshold:
+            self.loop_lag_threshold = loop_lag_threshold
+        if loop_probe_interval:
+            self.loop_probe_interval = loop_probe_interval
+    
+    # ====================================
+    # HEARTBEATS
+    # ====================================
+    
+    def register(self, name: str, stall_seconds: float = None) -> Heartbeat:
+        """Registra un worker desde su propio thread; llamar beat() en cada iteración"""
+        heartbeat = Heartbeat(name, stall_seconds or self.stall_seconds)
+        with self.lock:
+            self.heartbeats[name] = heartbeat
+        return heartbeat
+    
+    def unregister(self, name: Any):
+        with self.lock:
+            self.heartbeats.pop(name, None)
+    
+    def track(self, name: str, stall_seconds: float = None) -> Any:
+        """Vigila una operación puntual (p.ej. un request Flask) hasta untrack()"""
+        heartbeat = Heartbeat(name, stall_seconds or self.stall_seconds, transient=True)
+        key = id(heartbeat)
+        with self.lock:
+            self.heartbeats[key] = heartbeat
+        return key
+    
+    def untrack(self, key: Any):
+        self.unregister(key)
+    
+    # ====================================
+    # LOOPS ASYNCIO
+    # ====================================
+    
+    def watch_loop(self, name: str, loop: asyncio.AbstractEventLoop, threshold: float = None):
+        """Inicia la sonda de lag en el loop (puede llamarse antes de run_forever)"""
+        monitor = LoopMonitor(name, loop, self.loop_probe_interval, threshold or self.loop_lag_threshold)
+        with self.lock:
+            previous = self.loops.get(name)
+            if previous:
+                previous.active = False
+            self.loops[name] = monitor
+        asyncio.run_coroutine_threadsafe(monitor.probe(), loop)
+    
+    def unwatch_loop(self, name: str):
+        with self.lock:
+            monitor = self.loops.pop(name, None)
+        if monitor:
+            monitor.active = False
+    
+    # ====================================
+    # VERIFICACIÓN
+    # ====================================
+    
+    def check(self) -> List[Dict[str, Any]]:
+        """Revisa heartbeats y loops; vuelca el stack de cada bloqueo nuevo"""
+        with self.lock:
+            heartbeats = list(self.heartbeats.values())
+            loops = list(self.loops.values())
+        
+        frames = None
+        stalls = []
+        
+        for heartbeat in heartbeats:
+            age = 0.0 if heartbeat.idle else heartbeat.age()
+            if not heartbeat.transient:
+                HEARTBEAT_AGE.labels(heartbeat.name).set(round(age, 3))
+            
+            if age >= heartbeat.stall_seconds:
+                if not heartbeat.stalled:
+                    heartbeat.stalled = True
+                    heartbeat.stall_count += 1
+                    frames = frames if frames is not None else sys._current_frames()
+                    stalls.append(self._report_stall(
+                        heartbeat.name, 'api_request' if heartbeat.transient else heartbeat.name,
+                        heartbeat.thread_ident, heartbeat.thread_name,
+                        f"sin heartbeat hace {age:.1f}s", frames
+                    ))
+            elif heartbeat.stalled:
+                heartbeat.stalled = False
+                logging.info(f"💓 {heartbeat.name} se recuperó")
+        
+        for monitor in loops:
+            lag = monitor.pending_lag()
+            LOOP_LAG_CURRENT.labels(monitor.name).set(round(lag, 4))
+            
+            if lag >= monitor.threshold:
+                if not monitor.stalled:
+                    monitor.stalled = True
+                    monitor.stall_count += 1
+                    frames = frames if frames is not None else sys._current_frames()
+                    stalls.append(self._report_stall(
+                        f"loop {monitor.name}", f"loop_{monitor.name}",
+                        monitor.thread_ident, f"loop {monitor.name}",
+                        f"lag de {lag * 1000:.0f} ms", frames
+                    ))
+            elif monitor.stalled:
+                monitor.stalled = False
+                logging.info(f"💓 Loop {monitor.name} se recuperó")
+        
+        self.stats['checks'] += 1
+        self.stats['last_check'] = datetime.now()
+        return stalls
+    
+    def _report_stall(self, component: str, metric_label: str, thread_ident: Optional[int],
+                      thread_name: str, reason: str, frames: Dict[int, Any]) -> Dict[str, Any]:
+        frame = frames.get(thread_ident) if thread_ident else None
+        stack = ''.join(traceback.format_stack(frame)) if frame is not None else '(stack no disponible)'
+        
+        STALLS.labels(metric_label).inc()
+        self.stats['stalls_detected'] += 1
+        self.stats['last_stall'] = datetime.now()
+        
+        logging.error(f"🐢 Bloqueo detectado en {component} ({thread_name}): {reason}\n{stack}")
+        
+        stall = {
+            'component': component,
+            'thread': thread_name,
+            'reason': reason,
+            'stack': stack,
+            'detected_at': datetime.now().isoformat()
+        }
+        self.recent_stalls = (self.recent_stalls + [stall])[-20:]
+        return stall
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Heartbeats, loops y bloqueos detectados"""
+        with self.lock:
+            heartbeats = list(self.heartbeats.values())
+            loops = list(self.loops.values())
+        
+        return {
+            'workers': {
+                heartbeat.name: {
+                    'thread': heartbeat.thread_name,
+                    'age_seconds': round(heartbeat.age(), 3),
+                    'idle': heartbeat.idle,
+                    'stalled': heartbeat.stalled,
+                    'stall_seconds': heartbeat.stall_seconds,
+                    'stall_count': heartbeat.stall_count
+                } for heartbeat in heartbeats if not heartbeat.transient
+            },
+            'requests_in_flight': [{
+                'name': heartbeat.name,
+                'thread': heartbeat.thread_name,
+                'age_seconds': round(heartbeat.age(), 3),
+                'stalled': heartbeat.stalled
+            } for heartbeat in heartbeats if heartbeat.transient],
+            'loops': {
+                monitor.name: {
+                    'lag_ms': round(monitor.pending_lag() * 1000, 2),
+                    'max_lag_ms': round(monitor.max_lag * 1000, 2),
+                    'threshold_ms': monitor.threshold * 1000,
+                    'stalled': monitor.stalled,
+                    'stall_count': monitor.stall_count
+                } for monitor in loops
+            },
+            'checks': self.stats['checks'],
+            'stalls_detected': self.stats['stalls_detected'],
+            'last_stall': self.stats['last_stall'].isoformat() if self.stats['last_stall'] else None,
+            'last_check': self.stats['last_check'].isoformat() if self.stats['last_check'] else None,
+            'recent_stalls': self.recent_stalls
+        }
+
+# Instancia global del watchdog
+watchdog = Watchdog()
+
+def get_watchdog() -> Watchdog:
+    """Obtiene la instancia global del watchdog"""
+    return watchdog
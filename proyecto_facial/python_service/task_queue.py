@@ -14,6 +14,16 @@ from typing import Dict, List, Optional, Any
 from queue import PriorityQueue, Empty
 import heapq
 
+from metrics import registry
+from stall_watchdog import get_watchdog
+
+TASK_WAIT_SECONDS = registry.histogram(
+    'facial_sync_task_queue_wait_seconds', 'Espera de una tarea en cola hasta su procesamiento'
+)
+TASK_SECONDS = registry.histogram(
+    'facial_sync_task_seconds', 'Duración del procesamiento de tareas de sincronización', ['task_type']
+)
+
 class TaskItem:
     """Item de tarea con prioridad para la cola"""
     
@@ -65,6 +75,18 @@ class TaskQueue:
         # Cache de tareas en proceso
         self.processing_tasks = {}
         
+        # DeviceManager para sincronización real (ver set_device_manager)
+        self.device_manager = None
+        
+        # Tareas encoladas sin conexión: entran a la cola en memoria con el ID que asigna la BD al reenviarlas
+        if getattr(db_manager, 'outbox', None):
+            db_manager.outbox.on_replayed('enqueue_sync_task', self._on_task_replayed)
+        
+        registry.gauge('facial_sync_task_queue_depth', 'Tareas en la cola en memoria',
+                       function=self.priority_queue.qsize)
+        registry.gauge('facial_sync_tasks_in_progress', 'Tareas en procesamiento',
+                       function=lambda: len(self.processing_tasks))
+        
         logging.info("TaskQueue inicializado")
     
     def start(self):
@@ -114,19 +136,253 @@ class TaskQueue:
             )
             
             if task_id:
-                # Agregar a cola en memoria
-                full_task_data = {
-                    'id': task_id,
-                    'task_type': task_type,
-                    'facial_id': facial_id,
-                    'persona_id': persona_id,
-                    'task_data': task_data or {},
-                    'priority': priority,
-                    'attempts': 0
+                self._queue_in_memory(task_id, task_type, facial_id, persona_id, task_data, priority)
+                logging.info("📋 Tarea %s encolada: %s (prioridad %s)", task_id, task_type, priority)
+                return task_id
+            elif getattr(self.db_manager, 'outbox', None) and self.db_manager.outbox.pending:
+                # Se agrega a la cola en memoria cuando el outbox la aplique (ver _on_task_replayed)
+                logging.info("📮 Tarea %s guardada en el outbox local (BD sin conexión)", task_type)
+                return None
+            else:
+                logging.error("Error: No se pudo guardar tarea en BD")
+                return None
+                
+        except Exception as e:
+            logging.error("Error encolando tarea: %s", e)
+            return None
+    
+    def _queue_in_memory(self, task_id: int, task_type: str, facial_id: int, persona_id: int,
+                         task_data: Dict, priority: int):
+        """Agrega a la cola en memoria una tarea ya guardada en BD"""
+        full_task_data = {
+            'id': task_id,
+            'task_type': task_type,
+            'facial_id': facial_id,
+            'persona_id': persona_id,
+            'task_data': task_data or {},
+            'priority': priority,
+            'attempts': 0
+        }
+        
+        task_item = TaskItem(priority, task_id, full_task_data)
+        
+        with self.queue_lock:
+            self.priority_queue.put(task_item)
+    
+    def _on_task_replayed(self, params: Dict[str, Any], task_id: int):
+        """Callback del outbox: la tarea guardada sin conexión ya tiene ID en la BD"""
+        if not task_id:
+            return
+        self._queue_in_memory(task_id, params['task_type'], params.get('facial_id'), params.get('persona_id'),
+                              params.get('task_data'), params.get('priority', 1))
+        logging.info("📋 Tarea %s encolada desde el outbox: %s", task_id, params['task_type'])
+    
+    def get_pending_count(self) -> int:
+        """Obtiene número de tareas pendientes"""
+        with self.queue_lock:
+            return self.priority_queue.qsize()
+    
+    def _load_pending_tasks(self):
+        """Carga tareas pendientes desde la base de datos"""
+        try:
+            logging.info("📂 Cargando tareas pendientes desde BD...")
+            
+            # Obtener tareas pendientes ordenadas por prioridad
+            query = """
+            SELECT ID, TaskType, FacialID, PersonaID, TaskData, Priority, Attempts
+            FROM sync_queue 
+            WHERE Status = 'PENDING' AND Attempts < ?
+            ORDER BY Priority ASC, CreatedAt ASC
+            """
+            
+            results = self.db_manager.execute_query(query, [self.max_retries])
+            
+            loaded_count = 0
+            for row in results:
+                task_data = {
+                    'id': row[0],
+                    'task_type': row[1],
+                    'facial_id': row[2],
+                    'persona_id': row[3],
+                    'task_data': json.loads(row[4]) if row[4] else {},
+                    'priority': row[5],
+                    'attempts': row[6]
                 }
                 
-                task_item = TaskItem(priority, task_id, full_task_data)
+                task_item = TaskItem(row[5], row[0], task_data)
+                self.priority_queue.put(task_item)
+                loaded_count += 1
+            
+            logging.info(f"📂 {loaded_count} tareas pendientes cargadas")
+            
+        except Exception as e:
+            logging.error(f"Error cargando tareas pendientes: {e}")
+    
+    def _worker_loop(self):
+        """Loop principal del worker que procesa tareas"""
+        logging.info("🔄 Worker TaskQueue iniciado")
+        heartbeat = get_watchdog().register('task_queue')
+        
+        while self.is_running:
+            heartbeat.beat()
+            try:
+                # Obtener siguiente tarea con timeout
+                try:
+                    with self.queue_lock:
+                        if self.priority_queue.empty():
+                            # No hay tareas, esperar un poco
+                            time.sleep(1)
+                            continue
+                        
+                        task_item = self.priority_queue.get_nowait()
+                
+                except Empty:
+                    time.sleep(1)
+                    continue
+                
+                # Procesar tarea
+                self._process_task(task_item)
+                
+                # Pausa breve entre tareas
+                time.sleep(0.1)
+                
+            except Exception as e:
+                logging.error("Error en worker loop: %s", e)
+                time.sleep(5)  # Pausa más larga en caso de error
+        
+        get_watchdog().unregister('task_queue')
+        logging.info("🔄 Worker TaskQueue finalizado")
+    
+    def _process_task(self, task_item: TaskItem):
+        """Procesa una tarea específica"""
+        task_data = task_item.task_data
+        task_id = task_data['id']
+        
+        TASK_WAIT_SECONDS.observe((datetime.now() - task_item.timestamp).total_seconds())
+        start_time = time.perf_counter()
+        
+        try:
+            # Marcar como en proceso
+            self.processing_tasks[task_id] = {
+                'start_time': datetime.now(),
+                'task_data': task_data
+            }
+            
+            # Actualizar estado en BD
+            self.db_manager.update_task_status(task_id, 'PROCESSING', None)
+            
+            logging.info("⚙️ Procesando tarea %s: %s", task_id, task_data['task_type'])
+            
+            # Aquí se conectaría con el DeviceManager para ejecutar la sincronización
+            # Por ahora simularemos el procesamiento
+            success = self._execute_sync_task(task_data)
+            
+            if success:
+                # Tarea completada exitosamente
+                self.db_manager.update_task_status(task_id, 'COMPLETED', None)
+                self.stats['tasks_completed'] += 1
+                logging.info("✅ Tarea %s completada exitosamente", task_id)
+                
+            else:
+                # Tarea falló, decidir si reintentar
+                attempts = task_data['attempts'] + 1
+                
+                if attempts < self.max_retries:
+                    # Reintentar
+                    self._retry_task(task_item, attempts)
+                else:
+                    # Marcar como fallida definitivamente
+                    self.db_manager.update_task_status(task_id, 'FAILED', "Máximo de reintentos alcanzado")
+                    self.stats['tasks_failed'] += 1
+                    logging.error("❌ Tarea %s falló definitivamente después de %s intentos", task_id, attempts)
+            
+            self.stats['tasks_processed'] += 1
+            
+        except Exception as e:
+            # Error en procesamiento
+            error_msg = f"Error procesando tarea: {str(e)}"
+            logging.error("❌ Error en tarea %s: %s", task_id, e)
+            
+            attempts = task_data.get('attempts', 0) + 1
+            if attempts < self.max_retries:
+                self._retry_task(task_item, attempts, error_msg)
+            else:
+                self.db_manager.update_task_status(task_id, 'FAILED', error_msg)
+                self.stats['tasks_failed'] += 1
+        
+        finally:
+            # Limpiar del cache de procesamiento
+            if task_id in self.processing_tasks:
+                del self.processing_tasks[task_id]
+            
+            TASK_SECONDS.labels(task_data.get('task_type', 'UNKNOWN')).observe(time.perf_counter() - start_time)
+    
+    def _execute_sync_task(self, task_data: Dict[str, Any]) -> bool:
+        """Ejecuta la sincronización real con dispositivos"""
+        try:
+            task_type = task_data['task_type']
+            facial_id = task_data['facial_id']
+            persona_id = task_data['persona_id']
+            
+            # Dispositivos destino (None = todos los activos)
+            device_ids = (task_data.get('task_data') or {}).get('device_ids')
+            
+            if task_type in ('CREATE', 'UPDATE'):
+                # Obtener datos faciales de BD
+                facial_data = self.db_manager.get_facial_data(facial_id)
+                if not facial_data:
+                    logging.error("No se encontraron datos faciales para ID %s", facial_id)
+                    return False
+                
+                if not self.device_manager:
+                    # Simulación (sin DeviceManager conectado)
+                    time.sleep(2)
+                    return True
+                
+                results = self.device_manager.sync_face_to_all_devices(
+                    facial_data, task_type.lower(), device_ids
+                )
+                return results['successful'] > 0
+                
+            elif task_type == 'DELETE':
+                if not self.device_manager:
+                    time.sleep(1)
+                    return True
                 
+                # Eliminar de dispositivos (el rostro puede ya no existir en BD)
+                results = self.device_manager.sync_face_to_all_devices(
+                    {'facial_id': facial_id, 'persona_id': persona_id}, 'delete', device_ids
+                )
+                return results['successful'] > 0
+                
+            else:
+                logging.error("Tipo de tarea desconocido: %s", task_type)
+                return False
+                
+        except Exception as e:
+            logging.error("Error ejecutando sincronización: %s", e)
+            return False
+    
+    def _retry_task(self, task_item: TaskItem, attempts: int, error_msg: str = None):
+        """Programa reintento de una tarea"""
+        task_id = task_item.task_data['id']
+        
+        # Actualizar número de intentos
+        task_item.task_data['attempts'] = attempts
+        
+        # Actualizar en BD
+        self.db_manager.update_task_status(task_id, 'PENDING', error_msg)
+        
+        # Calcular delay para reintento (backoff exponencial)
+        delay = self.retry_delay * (2 ** (attempts - 1))
+        retry_time = datetime.now() + timedelta(seconds=delay)
+        
+        logging.warning("🔄 Tarea %s reintentará en %ss (intento %s/%s)", task_id, delay, attempts, self.max_retries)
+        
+        # Programar reintento
+        def delayed_retry():
+            time.sleep(delay)
+            if self.is_running:
                 with self.queue_lock:
                     self.priority_queue.put(task_item)
                 self.stats['tasks_retried'] += 1
@@ -176,10 +432,11 @@ class TaskQueue:
             return 0
     
     def clear_completed_tasks(self, days_old: int = 7) -> int:
-        """Limpia tareas completadas antiguas"""
+        """Limpia tareas completadas antiguas (en bloques)"""
         try:
-            query = "DELETE FROM sync_queue WHERE Status = 'COMPLETED' AND CompletedAt < DATEADD(DAY, -?, GETDATE())"
-            deleted_count = self.db_manager.execute_non_query(query, [days_old])
+            deleted_count = self.db_manager.purge_expired(
+                'sync_queue_completed', days_old, self.config.get('RETENTION_CHUNK_SIZE', 1000)
+            )
             
             logging.info(f"🧹 {deleted_count} tareas completadas antiguas eliminadas")
             return deleted_count
@@ -262,7 +519,7 @@ class TaskQueue:
             return None
             
         except Exception as e:
-            logging.error(f"Error obteniendo detalles de tarea {task_id}: {e}")
+            logging.error("Error obteniendo detalles de tarea %s: %s", task_id, e)
             return None
     
     def cancel_task(self, task_id: int) -> bool:
@@ -274,7 +531,7 @@ class TaskQueue:
                 return False
             
             if task_details['status'] not in ['PENDING', 'PROCESSING']:
-                logging.warning(f"No se puede cancelar tarea {task_id} con estado {task_details['status']}")
+                logging.warning("No se puede cancelar tarea %s con estado %s", task_id, task_details['status'])
                 return False
             
             # Actualizar estado a CANCELLED
@@ -283,11 +540,11 @@ class TaskQueue:
             # Remover de cola en memoria si está ahí
             # (No hay forma directa de remover de PriorityQueue, pero se ignorará al procesarse)
             
-            logging.info(f"❌ Tarea {task_id} cancelada")
+            logging.info("❌ Tarea %s cancelada", task_id)
             return True
             
         except Exception as e:
-            logging.error(f"Error cancelando tarea {task_id}: {e}")
+            logging.error("Error cancelando tarea %s: %s", task_id, e)
             return False
     
     def pause_queue(self):
@@ -317,7 +574,7 @@ class TaskQueue:
                 return False
             
             if task_details['status'] != 'PENDING':
-                logging.warning(f"Tarea {task_id} no está pendiente (estado: {task_details['status']})")
+                logging.warning("Tarea %s no está pendiente (estado: %s)", task_id, task_details['status'])
                 return False
             
             # Crear TaskItem con prioridad máxima
@@ -327,11 +584,11 @@ class TaskQueue:
             with self.queue_lock:
                 self.priority_queue.put(task_item)
             
-            logging.info(f"⚡ Tarea {task_id} marcada para procesamiento inmediato")
+            logging.info("⚡ Tarea %s marcada para procesamiento inmediato", task_id)
             return True
             
         except Exception as e:
-            logging.error(f"Error forzando procesamiento de tarea {task_id}: {e}")
+            logging.error("Error forzando procesamiento de tarea %s: %s", task_id, e)
             return False
 
 def main():
@@ -445,219 +702,4 @@ def main():
         task_queue.stop()
 
 if __name__ == "__main__":
-    main()queue.put(task_item)
-                
-                logging.info(f"📋 Tarea {task_id} encolada: {task_type} (prioridad {priority})")
-                return task_id
-            else:
-                logging.error("Error: No se pudo guardar tarea en BD")
-                return None
-                
-        except Exception as e:
-            logging.error(f"Error encolando tarea: {e}")
-            return None
-    
-    def get_pending_count(self) -> int:
-        """Obtiene número de tareas pendientes"""
-        with self.queue_lock:
-            return self.priority_queue.qsize()
-    
-    def _load_pending_tasks(self):
-        """Carga tareas pendientes desde la base de datos"""
-        try:
-            logging.info("📂 Cargando tareas pendientes desde BD...")
-            
-            # Obtener tareas pendientes ordenadas por prioridad
-            query = """
-            SELECT ID, TaskType, FacialID, PersonaID, TaskData, Priority, Attempts
-            FROM sync_queue 
-            WHERE Status = 'PENDING' AND Attempts < ?
-            ORDER BY Priority ASC, CreatedAt ASC
-            """
-            
-            results = self.db_manager.execute_query(query, [self.max_retries])
-            
-            loaded_count = 0
-            for row in results:
-                task_data = {
-                    'id': row[0],
-                    'task_type': row[1],
-                    'facial_id': row[2],
-                    'persona_id': row[3],
-                    'task_data': json.loads(row[4]) if row[4] else {},
-                    'priority': row[5],
-                    'attempts': row[6]
-                }
-                
-                task_item = TaskItem(row[5], row[0], task_data)
-                self.priority_queue.put(task_item)
-                loaded_count += 1
-            
-            logging.info(f"📂 {loaded_count} tareas pendientes cargadas")
-            
-        except Exception as e:
-            logging.error(f"Error cargando tareas pendientes: {e}")
-    
-    def _worker_loop(self):
-        """Loop principal del worker que procesa tareas"""
-        logging.info("🔄 Worker TaskQueue iniciado")
-        
-        while self.is_running:
-            try:
-                # Obtener siguiente tarea con timeout
-                try:
-                    with self.queue_lock:
-                        if self.priority_queue.empty():
-                            # No hay tareas, esperar un poco
-                            time.sleep(1)
-                            continue
-                        
-                        task_item = self.priority_queue.get_nowait()
-                
-                except Empty:
-                    time.sleep(1)
-                    continue
-                
-                # Procesar tarea
-                self._process_task(task_item)
-                
-                # Pausa breve entre tareas
-                time.sleep(0.1)
-                
-            except Exception as e:
-                logging.error(f"Error en worker loop: {e}")
-                time.sleep(5)  # Pausa más larga en caso de error
-        
-        logging.info("🔄 Worker TaskQueue finalizado")
-    
-    def _process_task(self, task_item: TaskItem):
-        """Procesa una tarea específica"""
-        task_data = task_item.task_data
-        task_id = task_data['id']
-        
-        try:
-            # Marcar como en proceso
-            self.processing_tasks[task_id] = {
-                'start_time': datetime.now(),
-                'task_data': task_data
-            }
-            
-            # Actualizar estado en BD
-            self.db_manager.update_task_status(task_id, 'PROCESSING', None)
-            
-            logging.info(f"⚙️ Procesando tarea {task_id}: {task_data['task_type']}")
-            
-            # Aquí se conectaría con el DeviceManager para ejecutar la sincronización
-            # Por ahora simularemos el procesamiento
-            success = self._execute_sync_task(task_data)
-            
-            if success:
-                # Tarea completada exitosamente
-                self.db_manager.update_task_status(task_id, 'COMPLETED', None)
-                self.stats['tasks_completed'] += 1
-                logging.info(f"✅ Tarea {task_id} completada exitosamente")
-                
-            else:
-                # Tarea falló, decidir si reintentar
-                attempts = task_data['attempts'] + 1
-                
-                if attempts < self.max_retries:
-                    # Reintentar
-                    self._retry_task(task_item, attempts)
-                else:
-                    # Marcar como fallida definitivamente
-                    self.db_manager.update_task_status(task_id, 'FAILED', "Máximo de reintentos alcanzado")
-                    self.stats['tasks_failed'] += 1
-                    logging.error(f"❌ Tarea {task_id} falló definitivamente después de {attempts} intentos")
-            
-            self.stats['tasks_processed'] += 1
-            
-        except Exception as e:
-            # Error en procesamiento
-            error_msg = f"Error procesando tarea: {str(e)}"
-            logging.error(f"❌ Error en tarea {task_id}: {e}")
-            
-            attempts = task_data.get('attempts', 0) + 1
-            if attempts < self.max_retries:
-                self._retry_task(task_item, attempts, error_msg)
-            else:
-                self.db_manager.update_task_status(task_id, 'FAILED', error_msg)
-                self.stats['tasks_failed'] += 1
-        
-        finally:
-            # Limpiar del cache de procesamiento
-            if task_id in self.processing_tasks:
-                del self.processing_tasks[task_id]
-    
-    def _execute_sync_task(self, task_data: Dict[str, Any]) -> bool:
-        """Ejecuta la sincronización real con dispositivos"""
-        try:
-            task_type = task_data['task_type']
-            facial_id = task_data['facial_id']
-            persona_id = task_data['persona_id']
-            
-            # Aquí se integraría con DeviceManager
-            # Por ahora simulamos el trabajo
-            
-            if task_type == 'CREATE':
-                # Obtener datos faciales de BD
-                facial_data = self.db_manager.get_facial_data(facial_id)
-                if not facial_data:
-                    logging.error(f"No se encontraron datos faciales para ID {facial_id}")
-                    return False
-                
-                # TODO: Usar DeviceManager para sincronizar con dispositivos
-                # results = device_manager.sync_face_to_all_devices(facial_data, 'create')
-                # return results['successful'] > 0
-                
-                # Simulación
-                time.sleep(2)  # Simular trabajo
-                return True
-                
-            elif task_type == 'UPDATE':
-                # Similar a CREATE pero para actualización
-                facial_data = self.db_manager.get_facial_data(facial_id)
-                if not facial_data:
-                    logging.error(f"No se encontraron datos faciales para ID {facial_id}")
-                    return False
-                
-                # TODO: DeviceManager sync
-                time.sleep(2)
-                return True
-                
-            elif task_type == 'DELETE':
-                # Eliminar de dispositivos
-                # TODO: DeviceManager delete
-                time.sleep(1)
-                return True
-                
-            else:
-                logging.error(f"Tipo de tarea desconocido: {task_type}")
-                return False
-                
-        except Exception as e:
-            logging.error(f"Error ejecutando sincronización: {e}")
-            return False
-    
-    def _retry_task(self, task_item: TaskItem, attempts: int, error_msg: str = None):
-        """Programa reintento de una tarea"""
-        task_id = task_item.task_data['id']
-        
-        # Actualizar número de intentos
-        task_item.task_data['attempts'] = attempts
-        
-        # Actualizar en BD
-        self.db_manager.update_task_status(task_id, 'PENDING', error_msg)
-        
-        # Calcular delay para reintento (backoff exponencial)
-        delay = self.retry_delay * (2 ** (attempts - 1))
-        retry_time = datetime.now() + timedelta(seconds=delay)
-        
-        logging.warning(f"🔄 Tarea {task_id} reintentará en {delay}s (intento {attempts}/{self.max_retries})")
-        
-        # Programar reintento
-        def delayed_retry():
-            time.sleep(delay)
-            if self.is_running:
-                with self.queue_lock:
-                    self.priority_
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pruebas del descarte de retransmisiones de EventProcessor
+Ejecutar desde python_service: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_processor import EventDeduplicator
+from benchmarks.isapi_simulator import SimulatedDevice
+
+def _received(event, source_ip='127.0.0.1'):
+    event['_device_ip'] = source_ip
+    return event
+
+class EventDeduplicatorTest(unittest.TestCase):
+
+    def test_two_devices_behind_same_source_ip(self):
+        """Terminales detrás del mismo NAT numeran serialNo igual: no son retransmisiones entre sí"""
+        dedup = EventDeduplicator(window=60, max_keys=1000)
+        device_a = SimulatedDevice('SIM001', host='127.0.0.1', port=18001)
+        device_b = SimulatedDevice('SIM002', host='127.0.0.1', port=18002)
+        
+        for _ in range(20):
+            self.assertFalse(dedup.is_duplicate(_received(device_a.build_event('1001'))))
+            self.assertFalse(dedup.is_duplicate(_received(device_b.build_event('1001'))))
+    
+    def test_retransmission_is_duplicate(self):
+        dedup = EventDeduplicator(window=60, max_keys=1000)
+        event = _received(SimulatedDevice('SIM001', host='127.0.0.1', port=18001).build_event('1001'))
+        retransmission = dict(event, activePostCount=2)
+        
+        self.assertFalse(dedup.is_duplicate(event))
+        self.assertTrue(dedup.is_duplicate(retransmission))
+    
+    def test_forget_allows_retransmission(self):
+        """Un evento descartado por cola llena no bloquea su reenvío"""
+        dedup = EventDeduplicator(window=60, max_keys=1000)
+        event = _received(SimulatedDevice('SIM001', host='127.0.0.1', port=18001).build_event('1001'))
+        
+        self.assertFalse(dedup.is_duplicate(event))
+        dedup.forget(event)
+        self.assertFalse(dedup.is_duplicate(dict(event, activePostCount=2)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,6 +18,11 @@ from pathlib import Path
 import json
 import time
 
+from log_reader import read_log, format_record
+
+# Registros por página en la ventana de logs
+LOG_PAGE_SIZE = 1000
+
 class TrayService:
     """Servicio de icono en bandeja del sistema"""
     
@@ -503,9 +508,17 @@ class TrayService:
                                      values=['ALL', 'ERROR', 'WARNING', 'INFO', 'DEBUG'], width=10)
             level_combo.pack(side=tk.LEFT, padx=(5, 10))
             
+            # Cursor de paginación: offset del registro más antiguo mostrado
+            page = {'before': None}
+            
+            def load_page(before=None):
+                page['before'] = self.load_log_content(log_var.get(), level_var.get(), log_text, before)
+            
             # Botones
             ttk.Button(control_frame, text="Actualizar", 
-                      command=lambda: self.load_log_content(log_var.get(), level_var.get(), log_text)).pack(side=tk.LEFT, padx=5)
+                      command=load_page).pack(side=tk.LEFT, padx=5)
+            ttk.Button(control_frame, text="Anteriores", 
+                      command=lambda: page['before'] is not None and load_page(page['before'])).pack(side=tk.LEFT, padx=5)
             ttk.Button(control_frame, text="Limpiar", 
                       command=lambda: log_text.delete(1.0, tk.END)).pack(side=tk.LEFT, padx=5)
             
@@ -515,7 +528,7 @@ class TrayService:
             
             # Cargar log inicial
             if log_files:
-                self.load_log_content(log_files[0], "ALL", log_text)
+                page['before'] = self.load_log_content(log_files[0], "ALL", log_text)
         
         threading.Thread(target=create_logs_window, daemon=True).start()
     
@@ -531,37 +544,34 @@ class TrayService:
         
         return sorted(log_files, reverse=True)  # Más recientes primero
     
-    def load_log_content(self, log_file: str, level_filter: str, text_widget):
-        """Carga contenido de archivo de log"""
+    def load_log_content(self, log_file: str, level_filter: str, text_widget, before: int = None):
+        """Carga la última página de un archivo de log (o la anterior al offset before)"""
         if not log_file or not os.path.exists(log_file):
             text_widget.insert(tk.END, "Archivo de log no encontrado\n")
-            return
+            return None
         
         try:
             text_widget.delete(1.0, tk.END)
             
-            with open(log_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            # Filtrar por nivel si es necesario
-            filtered_lines = []
-            for line in lines:
-                if level_filter == "ALL" or level_filter in line:
-                    filtered_lines.append(line)
+            # Sin filtro se lee solo el final del archivo; con filtro se usa el índice por nivel
+            page = read_log(log_file, level=level_filter, before=before, limit=LOG_PAGE_SIZE)
+            records = page['records']
             
-            # Mostrar últimas 1000 líneas para performance
-            if len(filtered_lines) > 1000:
-                text_widget.insert(tk.END, f"... mostrando últimas 1000 de {len(filtered_lines)} líneas ...\n\n")
-                filtered_lines = filtered_lines[-1000:]
+            header = ""
+            if page['next_before'] is not None:
+                total = f" de {page['total']}" if page['total'] else ""
+                header = f"... mostrando {len(records)}{total} registros ('Anteriores' para ver más) ...\n\n"
             
-            for line in filtered_lines:
-                text_widget.insert(tk.END, line)
+            # Una sola inserción: Tk redibuja una vez en lugar de una por línea
+            text_widget.insert(tk.END, header + ''.join(format_record(record) for record in records))
             
             # Ir al final
             text_widget.see(tk.END)
+            return page['next_before']
             
         except Exception as e:
             text_widget.insert(tk.END, f"Error leyendo archivo de log: {e}\n")
+            return None
     
     def open_api_web(self, icon, item):
         """Abre la interfaz web de la API"""
@@ -15,6 +15,16 @@ from datetime import datetime
 from typing import Set, Dict, Any, Optional
 import queue
 
+from metrics import registry
+from stall_watchdog import get_watchdog
+
+WS_SEND_SECONDS = registry.histogram(
+    'facial_sync_websocket_send_seconds', 'Duración del envío de un mensaje a un cliente WebSocket', ['format']
+)
+WS_SEND_ERRORS = registry.counter(
+    'facial_sync_websocket_send_errors_total', 'Envíos WebSocket fallidos', ['format']
+)
+
 class WebSocketServer:
     """Servidor WebSocket para eventos en tiempo real"""
     
@@ -47,6 +57,9 @@ class WebSocketServer:
             'errors': 0,
             'start_time': None
         }
+        
+        registry.gauge('facial_sync_websocket_clients', 'Clientes WebSocket conectados',
+                       function=lambda: len(self.clients))
     
     def start(self):
         """Inicia el servidor WebSocket"""
@@ -82,6 +95,7 @@ class WebSocketServer:
         try:
             logging.info("🛑 Deteniendo WebSocket Server...")
             self.is_running = False
+            get_watchdog().unwatch_loop('websocket')
             
             # Cerrar servidor si existe
             if self.loop and self.server:
@@ -114,6 +128,9 @@ class WebSocketServer:
             
             self.server = self.loop.run_until_complete(start_server)
             
+            # Lag del loop: un await bloqueante en _handle_client frena a todos los clientes
+            get_watchdog().watch_loop('websocket', self.loop)
+            
             # Ejecutar loop hasta que se detenga
             self.loop.run_forever()
             
@@ -281,14 +298,18 @@ class WebSocketServer:
         disconnected_clients = set()
         
         for client in self.clients:
+            send_start = time.perf_counter()
             try:
                 await client.send(message)
+                WS_SEND_SECONDS.labels('json').observe(time.perf_counter() - send_start)
                 self.client_info[client]['events_sent'] += 1
                 self.stats['events_sent'] += 1
                 
             except websockets.exceptions.ConnectionClosed:
+                WS_SEND_ERRORS.labels('json').inc()
                 disconnected_clients.add(client)
             except Exception as e:
+                WS_SEND_ERRORS.labels('json').inc()
                 logging.error(f"Error enviando evento a cliente: {e}")
                 disconnected_clients.add(client)
         
@@ -315,14 +336,18 @@ class WebSocketServer:
         disconnected_clients = set()
         
         for client in self.clients:
+            send_start = time.perf_counter()
             try:
                 await client.send(message)
+                WS_SEND_SECONDS.labels('vb6').observe(time.perf_counter() - send_start)
                 self.client_info[client]['events_sent'] += 1
                 self.stats['events_sent'] += 1
                 
             except websockets.exceptions.ConnectionClosed:
+                WS_SEND_ERRORS.labels('vb6').inc()
                 disconnected_clients.add(client)
             except Exception as e:
+                WS_SEND_ERRORS.labels('vb6').inc()
                 logging.error(f"Error enviando texto a cliente VB6: {e}")
                 disconnected_clients.add(client)
         
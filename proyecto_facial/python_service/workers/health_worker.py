@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Health Worker para Facial Sync Service
+Vigila bloqueos de workers, requests y loops asyncio mediante el watchdog
+"""
+
+import threading
+import logging
+from typing import Dict, Any
+
+from stall_watchdog import get_watchdog
+
+class HealthWorker:
+    """Worker que revisa periódicamente heartbeats y lag de loops"""
+    
+    def __init__(self, db_manager, device_manager, config):
+        self.db_manager = db_manager
+        self.device_manager = device_manager
+        self.config = config
+        
+        # Configuración
+        self.enabled = config.get('WATCHDOG_ENABLED', True)
+        self.interval = config.get('WATCHDOG_INTERVAL', 5)
+        
+        self.watchdog = get_watchdog()
+        self.watchdog.configure(
+            stall_seconds=config.get('WATCHDOG_STALL_SECONDS', 120),
+            loop_lag_threshold=config.get('WATCHDOG_LOOP_LAG_SECONDS', 1.0),
+            loop_probe_interval=config.get('WATCHDOG_LOOP_PROBE_INTERVAL', 0.5)
+        )
+        
+        # Estado
+        self.is_running = False
+        self.worker_thread = None
+        self.stop_event = threading.Event()
+        
+        logging.info("HealthWorker inicializado")
+    
+    def start(self):
+        """Inicia la vigilancia periódica"""
+        if self.is_running:
+            logging.warning("HealthWorker ya está ejecutándose")
+            return
+        
+        if not self.enabled:
+            logging.info("HealthWorker deshabilitado por configuración (WATCHDOG_ENABLED)")
+            return
+        
+        self.is_running = True
+        self.stop_event.clear()
+        
+        self.worker_thread = threading.Thread(target=self._worker_loop, name='HealthWorker', daemon=True)
+        self.worker_thread.start()
+        
+        logging.info("✅ HealthWorker iniciado")
+    
+    def stop(self):
+        """Detiene el worker"""
+        if not self.is_running:
+            return
+        
+        logging.info("🛑 Deteniendo HealthWorker...")
+        self.is_running = False
+        self.stop_event.set()
+        
+        if self.worker_thread and self.worker_thread.is_alive():
+            self.worker_thread.join(timeout=5)
+        
+        logging.info("✅ HealthWorker detenido")
+    
+    def _worker_loop(self):
+        """Loop principal: revisa el watchdog cada WATCHDOG_INTERVAL segundos"""
+        while self.is_running:
+            try:
+                self.watchdog.check()
+            except Exception as e:
+                logging.error(f"Error en HealthWorker: {e}")
+            
+            self.stop_event.wait(self.interval)
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Estado del watchdog y últimos bloqueos"""
+        status = self.watchdog.get_status()
+        status['is_running'] = self.is_running
+        status['interval_seconds'] = self.interval
+        return status
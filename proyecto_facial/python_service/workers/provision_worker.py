@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Provision Worker para Facial Sync Service
+Carga masiva de todos los rostros en un dispositivo nuevo o reseteado de fábrica
+"""
+
+import threading
+import time
+import logging
+import json
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Any, Optional
+
+class ProvisionJob:
+    """Trabajo de aprovisionamiento de un único dispositivo con checkpoint"""
+    
+    def __init__(self, device: Dict[str, Any], checkpoint_file: Path, db_manager,
+                 device_manager, concurrency: int, chunk_size: int):
+        self.device = device
+        self.device_id = device['dispositivo_id']
+        self.checkpoint_file = checkpoint_file
+        self.db_manager = db_manager
+        self.device_manager = device_manager
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        
+        # Estado
+        self.status = 'PENDING'  # PENDING, RUNNING, COMPLETED, STOPPED, FAILED
+        self.stop_requested = False
+        self.thread = None
+        self.lock = threading.Lock()
+        
+        # Progreso (persistido en checkpoint)
+        self.last_facial_id = 0   # Todos los FacialID <= este valor ya fueron procesados
+        self.uploaded = 0
+        self.failed = 0
+        self.failed_ids: List[int] = []  # Se reintentan al reanudar (ver _load_retries)
+        self.total = 0
+        self.created_at = datetime.now().isoformat()
+        
+        # Métricas de la ejecución actual
+        self.run_started = None
+        self.run_processed = 0
+        self.error = None
+    
+    def load_checkpoint(self) -> bool:
+        """Carga progreso previo si existe un checkpoint"""
+        if not self.checkpoint_file.exists():
+            return False
+        
+        try:
+            with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            
+            self.last_facial_id = data.get('last_facial_id', 0)
+            self.uploaded = data.get('uploaded', 0)
+            self.failed = data.get('failed', 0)
+            self.failed_ids = data.get('failed_ids', [])
+            self.total = data.get('total', 0)
+            self.created_at = data.get('created_at', self.created_at)
+            self.status = data.get('status', 'PENDING')
+            return True
+        
+        except Exception as e:
+            logging.warning(f"Checkpoint inválido para {self.device_id}, se reinicia: {e}")
+            return False
+    
+    def save_checkpoint(self):
+        """Guarda el progreso actual (escritura atómica)"""
+        data = {
+            'device_id': self.device_id,
+            'status': self.status,
+            'last_facial_id': self.last_facial_id,
+            'uploaded': self.uploaded,
+            'failed': self.failed,
+            'failed_ids': self.failed_ids,
+            'total': self.total,
+            'created_at': self.created_at,
+            'updated_at': datetime.now().isoformat()
+        }
+        
+        try:
+            tmp_file = self.checkpoint_file.with_suffix('.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            tmp_file.replace(self.checkpoint_file)
+        except Exception as e:
+            logging.error(f"Error guardando checkpoint de {self.device_id}: {e}")
+    
+    def start(self):
+        """Inicia (o reanuda) el trabajo en un thread propio"""
+        self.stop_requested = False
+        # RUNNING antes de arrancar el thread: un segundo start_job no debe lanzar otro trabajo
+        self.status = 'RUNNING'
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def is_active(self) -> bool:
+        """True mientras el trabajo corre (o su thread todavía no terminó de detenerse)"""
+        return self.status == 'RUNNING' or (self.thread is not None and self.thread.is_alive())
+    
+    def stop(self, wait_seconds: float = 10):
+        """Solicita detener el trabajo; el checkpoint permite reanudarlo luego"""
+        self.stop_requested = True
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=wait_seconds)
+    
+    def _run(self):
+        """Streaming de rostros desde SQL por bloques con ventana de subidas en paralelo"""
+        self.run_started = time.time()
+        self.run_processed = 0
+        self.error = None
+        
+        try:
+            _, fdid, _ = self.device_manager.ensure_face_library_exists(self.device)
+            
+            # Los que fallaron en ejecuciones anteriores se reintentan antes de seguir
+            retry_faces = self._load_retries()
+            
+            # Total = ya procesados + pendientes desde el checkpoint
+            self.total = (self.uploaded + self.failed +
+                          self.db_manager.count_active_faces(self.last_facial_id))
+            self.save_checkpoint()
+            
+            logging.info(f"📦 Aprovisionando {self.device['nombre']} ({self.device_id}) - "
+                         f"{self.total - self.uploaded - self.failed} rostros pendientes "
+                         f"desde FacialID {self.last_facial_id}, {len(retry_faces)} reintentos")
+            
+            in_flight = {}   # future -> facial_id
+            pending_ids = []  # FacialIDs en vuelo, en orden de envío
+            done_ids = set()
+            retrying = set()  # FacialIDs en vuelo que son reintentos (no mueven el checkpoint)
+            last_save = time.time()
+            cursor_id = self.last_facial_id
+            
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                for face in retry_faces:
+                    if self.stop_requested:
+                        break
+                    
+                    while len(in_flight) >= self.concurrency:
+                        self._collect(in_flight, pending_ids, done_ids, retrying,
+                                      wait(in_flight, return_when=FIRST_COMPLETED).done)
+                    
+                    future = executor.submit(self.device_manager.upload_face_to_device,
+                                             self.device, face, fdid=fdid)
+                    in_flight[future] = face['facial_id']
+                    retrying.add(face['facial_id'])
+                
+                while not self.stop_requested:
+                    faces = self.db_manager.get_active_faces_chunk(cursor_id, self.chunk_size)
+                    if not faces:
+                        break
+                    cursor_id = faces[-1]['facial_id']
+                    
+                    for face in faces:
+                        if self.stop_requested:
+                            break
+                        
+                        # Mantener como máximo `concurrency` subidas en vuelo
+                        while len(in_flight) >= self.concurrency:
+                            self._collect(in_flight, pending_ids, done_ids, retrying,
+                                          wait(in_flight, return_when=FIRST_COMPLETED).done)
+                        
+                        future = executor.submit(self.device_manager.upload_face_to_device,
+                                                 self.device, face, fdid=fdid)
+                        in_flight[future] = face['facial_id']
+                        pending_ids.append(face['facial_id'])
+                        
+                        if time.time() - last_save >= 5:
+                            self.save_checkpoint()
+                            last_save = time.time()
+                
+                # Esperar las subidas en vuelo antes de cerrar
+                if in_flight:
+                    self._collect(in_flight, pending_ids, done_ids, retrying, wait(in_flight).done)
+            
+            self.status = 'STOPPED' if self.stop_requested else 'COMPLETED'
+            self.save_checkpoint()
+            
+            progress = self.get_progress()
+            logging.info(f"📦 Aprovisionamiento {self.status} en {self.device_id} - "
+                         f"Subidos: {self.uploaded}, fallidos: {self.failed}, "
+                         f"{progress['faces_per_second']} rostros/s")
+        
+        except Exception as e:
+            self.status = 'FAILED'
+            self.error = str(e)
+            self.save_checkpoint()
+            logging.error(f"❌ Error aprovisionando {self.device_id}: {e}")
+    
+    def _load_retries(self) -> List[Dict[str, Any]]:
+        """Rostros de failed_ids a reintentar; los que ya no están activos salen de la cuenta"""
+        faces = []
+        for facial_id in list(self.failed_ids):
+            face = self.db_manager.get_facial_data(facial_id)
+            if face and face.get('activo'):
+                faces.append(face)
+            else:
+                self.failed_ids.remove(facial_id)
+                self.failed -= 1
+        return faces
+    
+    def _collect(self, in_flight: Dict, pending_ids: List[int], done_ids: set, retrying: set, finished):
+        """Registra subidas terminadas y avanza el checkpoint hasta el primer FacialID pendiente"""
+        with self.lock:
+            for future in finished:
+                facial_id = in_flight.pop(future)
+                try:
+                    success, message = future.result()
+                except Exception as e:
+                    success, message = False, str(e)
+                
+                self.run_processed += 1
+                
+                if facial_id in retrying:
+                    # Ya contado en failed: si sale bien pasa a uploaded, si no queda para otro intento
+                    retrying.discard(facial_id)
+                    if success:
+                        self.failed -= 1
+                        self.uploaded += 1
+                        self.failed_ids.remove(facial_id)
+                    else:
+                        logging.warning(f"⚠️ Reintento del rostro {facial_id} fallido en {self.device_id}: {message}")
+                    continue
+                
+                if success:
+                    self.uploaded += 1
+                else:
+                    self.failed += 1
+                    self.failed_ids.append(facial_id)
+                    logging.warning(f"⚠️ Rostro {facial_id} no subido a {self.device_id}: {message}")
+                
+                done_ids.add(facial_id)
+            
+            # Solo se avanza sobre un prefijo contiguo de terminados (orden de envío)
+            while pending_ids and pending_ids[0] in done_ids:
+                facial_id = pending_ids.pop(0)
+                done_ids.discard(facial_id)
+                self.last_facial_id = facial_id
+    
+    def get_progress(self) -> Dict[str, Any]:
+        """Progreso, velocidad (rostros/s) y ETA estimado"""
+        processed = self.uploaded + self.failed
+        remaining = max(self.total - processed, 0)
+        
+        elapsed = (time.time() - self.run_started) if self.run_started else 0
+        rate = (self.run_processed / elapsed) if elapsed > 0 else 0
+        eta = (remaining / rate) if rate > 0 else None
+        
+        return {
+            'device_id': self.device_id,
+            'device_name': self.device.get('nombre'),
+            'status': self.status,
+            'total': self.total,
+            'processed': processed,
+            'uploaded': self.uploaded,
+            'failed': self.failed,
+            'remaining': remaining,
+            'percent': round(processed / self.total * 100, 1) if self.total else 0,
+            'last_facial_id': self.last_facial_id,
+            'faces_per_second': round(rate, 2),
+            'eta_seconds': round(eta) if eta is not None else None,
+            'elapsed_seconds': round(elapsed, 1),
+            'concurrency': self.concurrency,
+            'failed_ids': self.failed_ids[-50:],
+            'error': self.error
+        }
+
+class ProvisionWorker:
+    """Gestor de trabajos de aprovisionamiento masivo por dispositivo"""
+    
+    def __init__(self, db_manager, device_manager, config):
+        self.db_manager = db_manager
+        self.device_manager = device_manager
+        self.config = config
+        
+        # Configuración
+        self.concurrency = config.get('PROVISION_CONCURRENCY', 4)
+        self.max_concurrency = config.get('PROVISION_MAX_CONCURRENCY', 16)
+        self.chunk_size = config.get('PROVISION_CHUNK_SIZE', 200)
+        self.checkpoint_dir = Path(config.get('PROVISION_CHECKPOINT_DIR', 'provisioning'))
+        
+        # Trabajos por dispositivo
+        self.jobs: Dict[str, ProvisionJob] = {}
+        self.jobs_lock = threading.Lock()
+        self.is_running = False
+        
+        logging.info("ProvisionWorker inicializado")
+    
+    def start(self):
+        """Inicia el worker y reanuda trabajos interrumpidos"""
+        if self.is_running:
+            return
+        
+        self.is_running = True
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Reanudar trabajos que quedaron a medias (corte de servicio, reinicio...)
+        for checkpoint_file in self.checkpoint_dir.glob('*.json'):
+            try:
+                with open(checkpoint_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                
+                if data.get('status') in ('RUNNING', 'PENDING'):
+                    logging.info(f"📦 Reanudando aprovisionamiento de {data.get('device_id')}")
+                    self.start_job(data.get('device_id'))
+            
+            except Exception as e:
+                logging.warning(f"Checkpoint ilegible {checkpoint_file}: {e}")
+        
+        logging.info("✅ ProvisionWorker iniciado")
+    
+    def stop(self):
+        """Detiene todos los trabajos dejando su checkpoint para reanudar"""
+        if not self.is_running:
+            return
+        
+        self.is_running = False
+        
+        with self.jobs_lock:
+            jobs = list(self.jobs.values())
+        
+        for job in jobs:
+            if job.status == 'RUNNING':
+                job.stop()
+                # Marcar como interrumpido para reanudar al próximo inicio
+                job.status = 'RUNNING'
+                job.save_checkpoint()
+        
+        logging.info("✅ ProvisionWorker detenido")
+    
+    def _checkpoint_path(self, device_id: str) -> Path:
+        safe_id = ''.join(c if c.isalnum() or c in '-_' else '_' for c in str(device_id))
+        return self.checkpoint_dir / f"{safe_id}.json"
+    
+    def start_job(self, device_id: str, restart: bool = False,
+                  concurrency: int = None) -> Optional[Dict[str, Any]]:
+        """Inicia o reanuda el aprovisionamiento de un dispositivo (concurrency acotada a PROVISION_MAX_CONCURRENCY)"""
+        devices = self.db_manager.get_active_devices()
+        device = next((d for d in devices if d['dispositivo_id'] == device_id), None)
+        if not device:
+            return None
+        
+        with self.jobs_lock:
+            job = self.jobs.get(device_id)
+            if job and job.is_active():
+                return job.get_progress()
+            
+            self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+            job = ProvisionJob(
+                device,
+                self._checkpoint_path(device_id),
+                self.db_manager,
+                self.device_manager,
+                min(concurrency or self.concurrency, self.max_concurrency),
+                self.chunk_size
+            )
+            
+            # Un trabajo completo se repite desde cero, salvo que tenga rostros fallidos para reintentar
+            if restart or not job.load_checkpoint() or (job.status == 'COMPLETED' and not job.failed_ids):
+                # Trabajo nuevo: el dispositivo está vacío, el registro de hashes no aplica
+                job = ProvisionJob(device, job.checkpoint_file, self.db_manager,
+                                   self.device_manager, job.concurrency, self.chunk_size)
+                self.device_manager.clear_face_hash_registry(device)
+            
+            self.jobs[device_id] = job
+            job.start()
+        
+        return job.get_progress()
+    
+    def stop_job(self, device_id: str) -> bool:
+        """Detiene (pausa) el aprovisionamiento de un dispositivo"""
+        with self.jobs_lock:
+            job = self.jobs.get(device_id)
+        
+        if not job or job.status != 'RUNNING':
+            return False
+        
+        job.stop()
+        return True
+    
+    def get_job_status(self, device_id: str) -> Optional[Dict[str, Any]]:
+        """Progreso del trabajo de un dispositivo (en memoria o desde checkpoint)"""
+        with self.jobs_lock:
+            job = self.jobs.get(device_id)
+        
+        if job:
+            return job.get_progress()
+        
+        checkpoint_file = self._checkpoint_path(device_id)
+        if checkpoint_file.exists():
+            job = ProvisionJob({'dispositivo_id': device_id}, checkpoint_file, self.db_manager,
+                               self.device_manager, self.concurrency, self.chunk_size)
+            job.load_checkpoint()
+            return job.get_progress()
+        
+        return None
+    
+    def get_all_jobs(self) -> List[Dict[str, Any]]:
+        """Progreso de todos los trabajos conocidos en esta ejecución"""
+        with self.jobs_lock:
+            return [job.get_progress() for job in self.jobs.values()]
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Retention Worker para Facial Sync Service
+Borra eventos, tareas y archivos de log vencidos en bloques pequeños dentro de una ventana de baja carga
+"""
+
+import os
+import time
+import threading
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple, Any
+
+from metrics import registry
+
+RETENTION_DELETED = registry.counter(
+    'facial_sync_retention_deleted_total', 'Filas y archivos borrados por retención', ['target']
+)
+RETENTION_CHUNK_SECONDS = registry.histogram(
+    'facial_sync_retention_chunk_seconds', 'Duración de cada DELETE por bloque', ['target']
+)
+RETENTION_ARCHIVED = registry.counter(
+    'facial_sync_retention_archived_total', 'Eventos archivados en disco antes de borrarlos'
+)
+
+# Bloques entre líneas de progreso en el log
+PROGRESS_LOG_EVERY = 50
+
+class RetentionWorker:
+    """Worker de limpieza por retención (EVENT_RETENTION_DAYS, TASK_RETENTION_DAYS, LOG_RETENTION_DAYS)"""
+    
+    def __init__(self, db_manager, config, event_archive=None):
+        self.db_manager = db_manager
+        self.config = config
+        
+        # Con archivo, cada bloque de access_events se escribe en disco antes del DELETE
+        self.event_archive = event_archive
+        
+        # Configuración
+        self.enabled = config.get('RETENTION_ENABLED', True)
+        self.chunk_size = config.get('RETENTION_CHUNK_SIZE', 1000)
+        self.chunk_pause = config.get('RETENTION_CHUNK_PAUSE', 0.5)
+        self.check_interval = config.get('RETENTION_CHECK_INTERVAL', 300)
+        self.window = (
+            self._parse_time(config.get('RETENTION_WINDOW_START', '01:00')),
+            self._parse_time(config.get('RETENTION_WINDOW_END', '05:00'))
+        )
+        
+        # Destinos en BD: (nombre en RETENTION_QUERIES, días de retención)
+        self.targets: List[Tuple[str, int]] = [
+            ('access_events', config.get('EVENT_RETENTION_DAYS', 30)),
+            ('sync_queue', config.get('TASK_RETENTION_DAYS', 7))
+        ]
+        self.log_retention_days = config.get('LOG_RETENTION_DAYS', 30)
+        
+        # Estado
+        self.is_running = False
+        self.worker_thread = None
+        self.stop_event = threading.Event()
+        self.run_lock = threading.Lock()
+        self.last_completed_date = None
+        
+        # Progreso por destino de la última ejecución
+        self.progress: Dict[str, Dict[str, Any]] = {}
+        self.stats = {
+            'runs': 0,
+            'runs_completed': 0,
+            'last_run_start': None,
+            'last_run_end': None,
+            'last_error': None
+        }
+        
+        logging.info("RetentionWorker inicializado")
+    
+    @staticmethod
+    def _parse_time(value: str):
+        return datetime.strptime(value, '%H:%M').time()
+    
+    def start(self):
+        """Inicia la revisión periódica de la ventana de limpieza"""
+        if self.is_running:
+            logging.warning("RetentionWorker ya está ejecutándose")
+            return
+        
+        if not self.enabled:
+            logging.info("RetentionWorker deshabilitado por configuración (RETENTION_ENABLED)")
+            return
+        
+        self.is_running = True
+        self.stop_event.clear()
+        
+        self.worker_thread = threading.Thread(target=self._worker_loop, name='RetentionWorker', daemon=True)
+        self.worker_thread.start()
+        
+        logging.info(f"✅ RetentionWorker iniciado (ventana {self.window[0]:%H:%M}-{self.window[1]:%H:%M})")
+    
+    def stop(self):
+        """Detiene el worker (un bloque en curso termina normalmente)"""
+        if not self.is_running:
+            return
+        
+        logging.info("🛑 Deteniendo RetentionWorker...")
+        self.is_running = False
+        self.stop_event.set()
+        
+        if self.worker_thread and self.worker_thread.is_alive():
+            self.worker_thread.join(timeout=10)
+        
+        logging.info("✅ RetentionWorker detenido")
+    
+    def in_window(self, now: datetime = None) -> bool:
+        """True si la hora actual está dentro de la ventana de baja carga (admite cruzar medianoche)"""
+        current = (now or datetime.now()).time()
+        start, end = self.window
+        if start <= end:
+            return start <= current < end
+        return current >= start or current < end
+    
+    def _worker_loop(self):
+        """Una ejecución completa por día dentro de la ventana; si la ventana termina se retoma en la siguiente"""
+        while self.is_running:
+            try:
+                if self.in_window() and self.last_completed_date != datetime.now().date():
+                    self.run_once(respect_window=True)
+            except Exception as e:
+                logging.error(f"Error en RetentionWorker: {e}")
+            
+            self.stop_event.wait(self.check_interval)
+    
+    def run_now(self) -> bool:
+        """Ejecuta la limpieza ya, ignorando la ventana (en un thread aparte)"""
+        if self.run_lock.locked():
+            return False
+        
+        threading.Thread(target=self.run_once, kwargs={'respect_window': False},
+                         name='RetentionRun', daemon=True).start()
+        return True
+    
+    def run_once(self, respect_window: bool = True) -> bool:
+        """Limpia todos los destinos; False si se interrumpió (fin de ventana, stop o error)"""
+        if not self.run_lock.acquire(blocking=False):
+            return False
+        
+        try:
+            self.stats['runs'] += 1
+            self.stats['last_run_start'] = datetime.now()
+            self.stats['last_error'] = None
+            logging.info("🧹 Iniciando limpieza por retención")
+            
+            for target, days in self.targets:
+                if days and days > 0 and not self._purge_target(target, days, respect_window):
+                    return False
+            
+            if self.log_retention_days and self.log_retention_days > 0:
+                self._purge_log_files(self.log_retention_days)
+            
+            self.stats['runs_completed'] += 1
+            self.last_completed_date = datetime.now().date()
+            logging.info("✅ Limpieza por retención completada")
+            return True
+        
+        except Exception as e:
+            self.stats['last_error'] = str(e)
+            logging.error(f"Error en limpieza por retención: {e}")
+            return False
+        
+        finally:
+            self.stats['last_run_end'] = datetime.now()
+            self.run_lock.release()
+    
+    def _should_continue(self, respect_window: bool) -> bool:
+        if self.stop_event.is_set():
+            return False
+        return not respect_window or self.in_window()
+    
+    def _purge_target(self, target: str, days: int, respect_window: bool) -> bool:
+        """Borra bloques de chunk_size filas hasta agotar las vencidas"""
+        cutoff = datetime.now() - timedelta(days=days)
+        progress = self.progress[target] = {
+            'status': 'running',
+            'retention_days': days,
+            'cutoff': cutoff.isoformat(),
+            'deleted': 0,
+            'chunks': 0,
+            'last_chunk_ms': None,
+            'started_at': datetime.now().isoformat(),
+            'finished_at': None
+        }
+        
+        while True:
+            if not self._should_continue(respect_window):
+                progress['status'] = 'paused'
+                logging.info(f"⏸️ Limpieza de {target} pausada ({progress['deleted']} filas borradas)")
+                return False
+            
+            start_time = time.perf_counter()
+            if target == 'access_events' and self.event_archive:
+                deleted, more = self._archive_events_chunk(cutoff, progress)
+            else:
+                deleted = max(self.db_manager.delete_expired_chunk(target, cutoff, self.chunk_size), 0)
+                more = deleted >= self.chunk_size
+            elapsed = time.perf_counter() - start_time
+            RETENTION_CHUNK_SECONDS.labels(target).observe(elapsed)
+            RETENTION_DELETED.labels(target).inc(deleted)
+            
+            progress['deleted'] += deleted
+            progress['chunks'] += 1
+            progress['last_chunk_ms'] = round(elapsed * 1000, 1)
+            
+            if progress['chunks'] % PROGRESS_LOG_EVERY == 0:
+                logging.info(f"🧹 {target}: {progress['deleted']} filas borradas en {progress['chunks']} bloques")
+            
+            if not more:
+                break
+            
+            # Pausa entre bloques: el writer de eventos toma los locks que necesita
+            self.stop_event.wait(self.chunk_pause)
+        
+        progress['status'] = 'done'
+        progress['finished_at'] = datetime.now().isoformat()
+        logging.info(f"🧹 {target}: {progress['deleted']} filas anteriores a {cutoff:%Y-%m-%d %H:%M} borradas")
+        return True
+    
+    def _archive_events_chunk(self, cutoff: datetime, progress: Dict[str, Any]) -> Tuple[int, bool]:
+        """Archiva y borra un bloque de access_events; devuelve (filas borradas, quedan más)"""
+        # El rango se registra antes de archivar: tras un corte se retoma el mismo bloque
+        # (los días ya escritos no se archivan de nuevo) y se completa el DELETE
+        pending = self.event_archive.load_state().get('pending')
+        resumed = bool(pending)
+        if resumed:
+            chunk_cutoff = datetime.fromisoformat(pending['cutoff'])
+            rows = self.db_manager.get_expired_events_chunk(
+                chunk_cutoff, pending['max_id'] - pending['min_id'] + 1,
+                min_id=pending['min_id'], max_id=pending['max_id']
+            )
+            logging.info(f"🗄️ Retomando bloque pendiente de archivo (IDs {pending['min_id']}-{pending['max_id']})")
+        else:
+            chunk_cutoff = cutoff
+            rows = self.db_manager.get_expired_events_chunk(cutoff, self.chunk_size)
+            if not rows:
+                return 0, False
+            
+            ids = [row['id'] for row in rows]
+            pending = {'min_id': min(ids), 'max_id': max(ids), 'cutoff': cutoff.isoformat()}
+            self.event_archive.save_state({'pending': pending})
+        
+        archived = self.event_archive.append(rows, id_range=(pending['min_id'], pending['max_id']))
+        RETENTION_ARCHIVED.inc(archived)
+        progress['archived'] = progress.get('archived', 0) + archived
+        
+        deleted = max(self.db_manager.delete_events_range(pending['min_id'], pending['max_id'], chunk_cutoff), 0)
+        self.event_archive.save_state({})
+        
+        # Un bloque retomado no dice nada del resto: se sigue con el próximo
+        return deleted, resumed or len(rows) >= self.chunk_size
+    
+    def _purge_log_files(self, days: int):
+        """Borra archivos de LOG_DIR no modificados en los últimos days días (excepto los abiertos por el servicio)"""
+        log_dir = Path(self.config.get('LOG_DIR', 'logs'))
+        active = {self.config.get('LOG_FILE', 'service.log'), self.config.get('DB_SLOW_QUERY_LOG', 'slow_queries.log')}
+        cutoff = time.time() - days * 86400
+        progress = self.progress['log_files'] = {
+            'status': 'running',
+            'retention_days': days,
+            'deleted': 0,
+            'started_at': datetime.now().isoformat(),
+            'finished_at': None
+        }
+        
+        if log_dir.exists():
+            for file_path in log_dir.glob('*.log*'):
+                try:
+                    if file_path.name in active or not file_path.is_file():
+                        continue
+                    if file_path.stat().st_mtime < cutoff:
+                        os.remove(file_path)
+                        progress['deleted'] += 1
+                        RETENTION_DELETED.labels('log_files').inc()
+                except OSError as e:
+                    logging.warning(f"No se pudo borrar {file_path}: {e}")
+        
+        progress['status'] = 'done'
+        progress['finished_at'] = datetime.now().isoformat()
+        if progress['deleted']:
+            logging.info(f"🧹 {progress['deleted']} archivos de log antiguos borrados")
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Estado, ventana y progreso por destino"""
+        stats = self.stats.copy()
+        for key in ('last_run_start', 'last_run_end'):
+            stats[key] = stats[key].isoformat() if stats[key] else None
+        
+        return {
+            'is_running': self.is_running,
+            'run_in_progress': self.run_lock.locked(),
+            'in_window': self.in_window(),
+            'window': f"{self.window[0]:%H:%M}-{self.window[1]:%H:%M}",
+            'chunk_size': self.chunk_size,
+            'chunk_pause': self.chunk_pause,
+            'targets': {target: days for target, days in self.targets},
+            'log_retention_days': self.log_retention_days,
+            'archive': self.event_archive.get_status() if self.event_archive else None,
+            'last_completed_date': self.last_completed_date.isoformat() if self.last_completed_date else None,
+            'progress': {target: dict(progress) for target, progress in self.progress.items()},
+            'stats': stats
+        }
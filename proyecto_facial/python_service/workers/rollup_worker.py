@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rollup Worker para Facial Sync Service
+Completa access_events_hourly con el histórico de access_events en bloques espaciados
+"""
+
+import threading
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any
+
+from event_stats import hour_start
+
+class RollupWorker:
+    """Worker de backfill de la tabla de eventos agregados por hora"""
+    
+    def __init__(self, db_manager, config, event_processor=None):
+        self.db_manager = db_manager
+        self.config = config
+        # Dueño de los conteos en vivo: el recálculo pasa por él para no contar dos veces
+        self.event_processor = event_processor
+        
+        # Configuración
+        self.enabled = config.get('EVENT_ROLLUP_ENABLED', True)
+        self.chunk_hours = config.get('EVENT_ROLLUP_BACKFILL_CHUNK_HOURS', 24)
+        self.pause = config.get('EVENT_ROLLUP_BACKFILL_PAUSE', 1.0)
+        # Espera tras el cierre de la hora de arranque antes de recalcularla (eventos atrasados)
+        self.close_margin = config.get('EVENT_ROLLUP_CLOSE_MARGIN', 60)
+        
+        # Estado
+        self.is_running = False
+        self.worker_thread = None
+        self.stop_event = threading.Event()
+        
+        # Progreso del backfill
+        self.stats = {
+            'chunks_done': 0,
+            'chunks_total': 0,
+            'range_start': None,
+            'range_end': None,
+            'current_chunk': None,
+            'start_time': None,
+            'finish_time': None,
+            'last_error': None
+        }
+        
+        logging.info("RollupWorker inicializado")
+    
+    def start(self, force: bool = False) -> bool:
+        """Inicia el backfill si el histórico no está completo (force lo rehace)"""
+        if self.is_running:
+            logging.warning("RollupWorker ya está ejecutándose")
+            return False
+        
+        if not self.enabled:
+            logging.info("RollupWorker deshabilitado por configuración (EVENT_ROLLUP_ENABLED)")
+            return False
+        
+        if self.config.get('EVENT_ROLLUP_BACKFILLED', False) and not force:
+            logging.info("📊 access_events_hourly ya tiene el histórico completo")
+            return False
+        
+        self.is_running = True
+        self.stop_event.clear()
+        
+        self.worker_thread = threading.Thread(target=self._backfill, name='RollupWorker', daemon=True)
+        self.worker_thread.start()
+        
+        logging.info("✅ RollupWorker iniciado")
+        return True
+    
+    def stop(self):
+        """Detiene el backfill (se retoma desde el inicio en la próxima ejecución)"""
+        if not self.is_running:
+            return
+        
+        logging.info("🛑 Deteniendo RollupWorker...")
+        self.is_running = False
+        self.stop_event.set()
+        
+        if self.worker_thread and self.worker_thread.is_alive():
+            self.worker_thread.join(timeout=10)
+        
+        logging.info("✅ RollupWorker detenido")
+    
+    def _backfill(self):
+        """Recalcula bloques de chunk_hours horas desde el evento más antiguo hasta la última hora cerrada"""
+        try:
+            self.stats['start_time'] = datetime.now()
+            self.stats['finish_time'] = None
+            self.stats['last_error'] = None
+            self.stats['chunks_done'] = 0
+            
+            # Solo horas cerradas: la hora en curso la lleva el EventProcessor con sus conteos en vivo
+            end = hour_start(datetime.now())
+            oldest = self.db_manager.get_oldest_event_time()
+            start = min(hour_start(oldest), end) if oldest else end
+            
+            chunk = timedelta(hours=self.chunk_hours)
+            self.stats['range_start'] = start.isoformat()
+            self.stats['range_end'] = end.isoformat()
+            self.stats['chunks_total'] = -(-int((end - start).total_seconds()) // int(chunk.total_seconds()))
+            
+            logging.info(f"📊 Backfill de access_events_hourly: {start} a {end} ({self.stats['chunks_total']} bloques)")
+            
+            chunk_start = start
+            while chunk_start < end and self.is_running:
+                chunk_end = min(chunk_start + chunk, end)
+                self.stats['current_chunk'] = chunk_start.isoformat()
+                
+                self._rebuild(chunk_start, chunk_end)
+                self.stats['chunks_done'] += 1
+                chunk_start = chunk_end
+                
+                # Pausa entre bloques para no competir con el writer de eventos
+                if chunk_start < end:
+                    self.stop_event.wait(self.pause)
+            
+            if chunk_start >= end:
+                self.config.set('EVENT_ROLLUP_BACKFILLED', True)
+                self.stats['finish_time'] = datetime.now()
+                logging.info(f"✅ Backfill de access_events_hourly completado ({self.stats['chunks_done']} bloques)")
+                
+                # La hora de arranque puede tener eventos anteriores al servicio: se recalcula una vez cerrada
+                close_wait = (end + timedelta(hours=1) - datetime.now()).total_seconds() + self.close_margin
+                if self.is_running and not self.stop_event.wait(max(0.0, close_wait)):
+                    self.stats['current_chunk'] = end.isoformat()
+                    self._rebuild(end, end + timedelta(hours=1))
+                    logging.info(f"📊 Hora de arranque ({end:%H:%M}) recalculada en access_events_hourly")
+        
+        except Exception as e:
+            self.stats['last_error'] = str(e)
+            logging.error(f"Error en backfill de access_events_hourly: {e}")
+        
+        finally:
+            self.stats['current_chunk'] = None
+            self.is_running = False
+    
+    def _rebuild(self, start: datetime, end: datetime):
+        if self.event_processor:
+            self.event_processor.rebuild_hourly_rollup(start, end)
+        else:
+            self.db_manager.rebuild_event_hourly(start, end)
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Estado y progreso del backfill"""
+        stats = self.stats.copy()
+        for key in ('start_time', 'finish_time'):
+            stats[key] = stats[key].isoformat() if stats[key] else None
+        
+        return {
+            'is_running': self.is_running,
+            'backfilled': bool(self.config.get('EVENT_ROLLUP_BACKFILLED', False)),
+            'chunk_hours': self.chunk_hours,
+            'progress_percent': round(stats['chunks_done'] / stats['chunks_total'] * 100, 1) if stats['chunks_total'] else None,
+            'stats': stats
+        }
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sync Worker para Facial Sync Service
+Reconcilia la biblioteca facial de cada dispositivo con las tablas face/perface
+"""
+
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Dict, List, Any
+
+class SyncWorker:
+    """Worker de reconciliación BD <-> dispositivos"""
+    
+    def __init__(self, db_manager, device_manager, task_queue, config):
+        self.db_manager = db_manager
+        self.device_manager = device_manager
+        self.task_queue = task_queue
+        self.config = config
+        
+        # Configuración
+        self.enabled = config.get('RECONCILE_ENABLED', True)
+        self.interval = config.get('RECONCILE_INTERVAL', 3600)
+        self.page_size = config.get('RECONCILE_PAGE_SIZE', 50)
+        self.page_workers = config.get('RECONCILE_PAGE_WORKERS', 4)
+        self.chunk_size = config.get('BATCH_SIZE', 10) * 10
+        
+        # Estado
+        self.is_running = False
+        self.worker_thread = None
+        self.wake_event = threading.Event()
+        self.reconcile_lock = threading.Lock()
+        
+        # Estadísticas
+        self.stats = {
+            'runs': 0,
+            'devices_reconciled': 0,
+            'devices_failed': 0,
+            'missing_enqueued': 0,
+            'stale_enqueued': 0,
+            'orphaned_enqueued': 0,
+            'last_run': None,
+            'last_duration_seconds': None,
+            'start_time': None
+        }
+        self.last_results: List[Dict[str, Any]] = []
+        
+        logging.info("SyncWorker inicializado")
+    
+    def start(self):
+        """Inicia el worker de reconciliación periódica"""
+        if self.is_running:
+            logging.warning("SyncWorker ya está ejecutándose")
+            return
+        
+        if not self.enabled:
+            logging.info("SyncWorker deshabilitado por configuración (RECONCILE_ENABLED)")
+            return
+        
+        self.is_running = True
+        self.stats['start_time'] = datetime.now()
+        
+        self.worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
+        self.worker_thread.start()
+        
+        logging.info("✅ SyncWorker iniciado")
+    
+    def stop(self):
+        """Detiene el worker"""
+        if not self.is_running:
+            return
+        
+        logging.info("🛑 Deteniendo SyncWorker...")
+        self.is_running = False
+        self.wake_event.set()
+        
+        if self.worker_thread and self.worker_thread.is_alive():
+            self.worker_thread.join(timeout=5)
+        
+        logging.info("✅ SyncWorker detenido")
+    
+    def trigger(self):
+        """Solicita una reconciliación inmediata (asíncrona)"""
+        self.wake_event.set()
+    
+    def _worker_loop(self):
+        """Loop principal: reconcilia todos los dispositivos cada RECONCILE_INTERVAL"""
+        logging.info("🔄 Worker de reconciliación iniciado")
+        
+        while self.is_running:
+            try:
+                self.reconcile_all_devices()
+            except Exception as e:
+                logging.error(f"Error en loop de reconciliación: {e}")
+            
+            self.wake_event.wait(self.interval)
+            self.wake_event.clear()
+        
+        logging.info("🔄 Worker de reconciliación finalizado")
+    
+    def reconcile_all_devices(self, device_id: str = None) -> List[Dict[str, Any]]:
+        """Reconcilia todos los dispositivos activos (o uno solo) contra la BD"""
+        with self.reconcile_lock:
+            start_time = time.time()
+            
+            devices = self.db_manager.get_active_devices()
+            if device_id:
+                devices = [d for d in devices if d['dispositivo_id'] == device_id]
+            
+            if not devices:
+                logging.info("No hay dispositivos activos para reconciliar")
+                return []
+            
+            logging.info(f"🔍 Reconciliando {len(devices)} dispositivos con la BD...")
+            
+            # Estado de la BD: una sola lectura para todos los dispositivos
+            db_hashes = self._load_db_face_hashes()
+            open_tasks = self.db_manager.get_open_task_keys()
+            
+            results = []
+            for device in devices:
+                if device_id is None and not self.is_running:
+                    break
+                results.append(self.reconcile_device(device, db_hashes, open_tasks))
+            
+            self.stats['runs'] += 1
+            self.stats['last_run'] = datetime.now()
+            self.stats['last_duration_seconds'] = round(time.time() - start_time, 2)
+            self.last_results = results
+            
+            logging.info(f"📊 Reconciliación completada en {self.stats['last_duration_seconds']}s")
+            return results
+    
+    def reconcile_device(self, device: Dict[str, Any], db_hashes: Dict[str, str],
+                         open_tasks: set) -> Dict[str, Any]:
+        """Compara la biblioteca de un dispositivo con la BD y encola solo las diferencias"""
+        device_id = device['dispositivo_id']
+        result = {
+            'device_id': device_id,
+            'device_name': device['nombre'],
+            'success': False,
+            'device_faces': 0,
+            'db_faces': len(db_hashes),
+            'missing': 0,
+            'stale': 0,
+            'orphaned': 0,
+            'baselined': 0,
+            'message': '',
+            'timestamp': datetime.now().isoformat()
+        }
+        
+        success, device_fpids, message = self.device_manager.get_device_face_ids(
+            device, self.page_size, self.page_workers
+        )
+        
+        if not success:
+            # Sin lista completa no se puede decidir qué sobra: no se encola nada
+            self.stats['devices_failed'] += 1
+            result['message'] = f"No se pudo leer la biblioteca facial: {message}"
+            logging.warning(f"⚠️ Reconciliación omitida para {device_id}: {message}")
+            return result
+        
+        result['device_faces'] = len(device_fpids)
+        db_fpids = set(db_hashes)
+        known_hashes = self.device_manager.get_device_face_hashes_cached(device_id)
+        
+        missing = db_fpids - device_fpids
+        orphaned = device_fpids - db_fpids
+        
+        # Sin hash registrado (instalación nueva, rostro subido antes del registro) no se sabe qué tiene
+        # el dispositivo: el hash actual de la BD queda como base en vez de re-subir todo
+        unknown = {fpid for fpid in db_fpids & device_fpids if fpid not in known_hashes}
+        if unknown:
+            self.device_manager.record_face_hash_baseline(device_id, {fpid: db_hashes[fpid] for fpid in unknown})
+            result['baselined'] = len(unknown)
+        
+        # Rostros presentes en ambos lados cuyo contenido difiere del último subido
+        stale = {
+            fpid for fpid in db_fpids & device_fpids
+            if fpid not in unknown and known_hashes[fpid] != db_hashes[fpid]
+        }
+        
+        result['missing'] = self._enqueue_diff('CREATE', missing, device_id, open_tasks)
+        result['stale'] = self._enqueue_diff('UPDATE', stale, device_id, open_tasks)
+        result['orphaned'] = self._enqueue_diff('DELETE', orphaned, device_id, open_tasks)
+        
+        self.stats['missing_enqueued'] += result['missing']
+        self.stats['stale_enqueued'] += result['stale']
+        self.stats['orphaned_enqueued'] += result['orphaned']
+        self.stats['devices_reconciled'] += 1
+        
+        result['success'] = True
+        result['message'] = (f"Faltantes: {result['missing']}, desactualizados: {result['stale']}, "
+                             f"huérfanos: {result['orphaned']}")
+        
+        logging.info(f"🔍 {device['nombre']} ({device_id}) - Dispositivo: {len(device_fpids)}, "
+                     f"BD: {len(db_fpids)} - {result['message']}")
+        
+        return result
+    
+    def _load_db_face_hashes(self) -> Dict[str, str]:
+        """Lee los rostros activos por bloques y calcula el hash de contenido de cada uno"""
+        db_hashes = {}
+        last_id = 0
+        
+        while True:
+            faces = self.db_manager.get_active_faces_chunk(last_id, self.chunk_size)
+            if not faces:
+                break
+            
+            for face in faces:
+                content_hash = self.device_manager.compute_face_hash(face)
+                if content_hash:
+                    db_hashes[str(face['facial_id'])] = content_hash
+            
+            last_id = faces[-1]['facial_id']
+        
+        return db_hashes
+    
+    def _enqueue_diff(self, task_type: str, fpids: set, device_id: str, open_tasks: set) -> int:
+        """Encola tareas dirigidas a un único dispositivo para las diferencias encontradas"""
+        enqueued = 0
+        
+        for fpid in sorted(fpids):
+            # Los FPID que no son FacialID numéricos no los gestiona este servicio
+            if not fpid.isdigit():
+                logging.debug(f"FPID no numérico ignorado en {device_id}: {fpid}")
+                continue
+            
+            facial_id = int(fpid)
+            # Una tarea abierta para este dispositivo o para todos ya cubre la diferencia
+            if (task_type, facial_id, device_id) in open_tasks or (task_type, facial_id, None) in open_tasks:
+                continue
+            
+            task_data = {
+                'facial_id': facial_id,
+                'action': task_type.lower(),
+                'device_ids': [device_id],
+                'timestamp': datetime.now().isoformat(),
+                'source': 'reconcile'
+            }
+            
+            task_id = self.task_queue.enqueue_task(
+                task_type=task_type,
+                facial_id=facial_id,
+                task_data=task_data,
+                priority=3  # Menor prioridad que las tareas de usuarios/VB6
+            )
+            
+            if task_id:
+                enqueued += 1
+        
+        return enqueued
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Obtiene estado y resultados de la última reconciliación"""
+        stats = self.stats.copy()
+        for key in ('last_run', 'start_time'):
+            if stats[key]:
+                stats[key] = stats[key].isoformat()
+        
+        return {
+            'is_running': self.is_running,
+            'enabled': self.enabled,
+            'interval_seconds': self.interval,
+            'reconciling': self.reconcile_lock.locked(),
+            'stats': stats,
+            'last_results': list(self.last_results)
+        }